@@ -70,8 +70,11 @@ def create_app():
     from system.webhook.commands import webhook_cli
     app.cli.add_command(webhook_cli)
 
-    from tasks.commands import snapshot_cli
+    from tasks.commands import snapshot_cli, reconcile_cli, reservation_cli, shard_cli
     app.cli.add_command(snapshot_cli)
+    app.cli.add_command(reconcile_cli)
+    app.cli.add_command(reservation_cli)
+    app.cli.add_command(shard_cli)
 
     # 初始化 IP 黑白名单
     # with app.app_context():  # 推送应用上下文
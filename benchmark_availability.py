@@ -0,0 +1,74 @@
+"""可用量查询基准测试
+
+对比 get_inventory（关联加载商品、仓库）与 get_availability（Redis 可用量缓存）的延迟分布。
+需要可用的数据库与 Redis（读取 .env 中的连接配置），库存表中需已有数据。
+
+用法:
+    python benchmark_availability.py [--iterations 2000] [--sample 100]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy.orm import lazyload
+
+from app import create_app
+from extensions import db
+from warehouse.inventory.models import Inventory
+from warehouse.inventory.services import InventoryService
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(label, func, keys, iterations):
+    samples = []
+    for _ in range(iterations):
+        goods_id, warehouse_id = random.choice(keys)
+        start = time.perf_counter()
+        func(goods_id, warehouse_id)
+        samples.append((time.perf_counter() - start) * 1000)
+        # 每次请求结束时 Flask-SQLAlchemy 会移除会话，这里保持一致，避免身份映射命中
+        db.session.remove()
+    print(
+        f"{label:<28} p50={percentile(samples, 50):7.3f}ms  "
+        f"p99={percentile(samples, 99):7.3f}ms  mean={statistics.mean(samples):7.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inventory availability lookup benchmark')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--sample', type=int, default=100, help='number of inventory rows to query')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        keys = [
+            (row.goods_id, row.warehouse_id)
+            for row in Inventory.query.options(lazyload('*')).limit(args.sample).all()
+        ]
+        if not keys:
+            print("No inventory rows found.")
+            return
+
+        def without_cache(goods_id, warehouse_id):
+            return InventoryService.get_inventory(goods_id, warehouse_id).available_stock_for_sale
+
+        def with_cache(goods_id, warehouse_id):
+            return InventoryService.get_availability(goods_id, warehouse_id)['available_stock_for_sale']
+
+        measure('get_inventory (database)', without_cache, keys, args.iterations)
+
+        app.config['INVENTORY_AVAILABILITY_CACHE'] = True
+        for goods_id, warehouse_id in keys:
+            with_cache(goods_id, warehouse_id)  # 预热：未命中时回填缓存
+        measure('get_availability (cache)', with_cache, keys, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
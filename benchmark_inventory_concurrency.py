@@ -0,0 +1,86 @@
+"""库存并发控制基准测试
+
+N 个并发 worker 对同一个热点商品反复执行锁定 / 解锁，分别在悲观锁（SELECT ... FOR UPDATE）
+与乐观锁（版本号比较 + 重试）模式下统计吞吐量、冲突失败数与可售库存不足被拒绝的次数。
+需要支持行锁的数据库（PostgreSQL / MySQL，读取 .env 中的连接配置），库存表中需已有可售库存。
+
+用法:
+    python benchmark_inventory_concurrency.py [--workers 16] [--operations 200] [--goods-id 1 --warehouse-id 1]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import lazyload
+
+from app import create_app
+from extensions import db
+from extensions.error import BadRequestException, ConflictException
+from warehouse.inventory.models import Inventory
+from warehouse.inventory.services import InventoryService
+
+
+def run_worker(app, goods_id, warehouse_id, operations):
+    """单个 worker：每次操作为一个独立事务（锁定 1 件后立即解锁）；可售库存不足时计为拒绝"""
+    succeeded = conflicts = rejected = 0
+    with app.app_context():
+        for _ in range(operations):
+            try:
+                InventoryService.lock_inventory(goods_id, warehouse_id, 1)
+                InventoryService.unlock_inventory(goods_id, warehouse_id, 1)
+                succeeded += 1
+            except ConflictException:
+                conflicts += 1
+            except BadRequestException:
+                rejected += 1
+            finally:
+                db.session.remove()
+    return succeeded, conflicts, rejected
+
+
+def run_mode(app, mode, goods_id, warehouse_id, workers, operations):
+    app.config['INVENTORY_CONCURRENCY_MODE'] = mode
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            lambda _: run_worker(app, goods_id, warehouse_id, operations), range(workers)
+        ))
+    duration = time.perf_counter() - start
+    succeeded = sum(r[0] for r in results)
+    conflicts = sum(r[1] for r in results)
+    rejected = sum(r[2] for r in results)
+    print(
+        f"{mode:<12} workers={workers:<3} ops={succeeded:<6} conflicts={conflicts:<5} rejected={rejected:<5} "
+        f"duration={duration:7.2f}s  throughput={succeeded / duration:8.1f} ops/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inventory concurrency mode benchmark')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=200, help='lock/unlock pairs per worker')
+    parser.add_argument('--goods-id', type=int, default=None)
+    parser.add_argument('--warehouse-id', type=int, default=None)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        query = Inventory.query.options(lazyload('*'))
+        if args.goods_id and args.warehouse_id:
+            query = query.filter_by(goods_id=args.goods_id, warehouse_id=args.warehouse_id)
+        else:
+            # 与锁定校验一致：按可售库存（onhand - locked - dn）挑选
+            query = query.filter(Inventory.onhand_stock - Inventory.locked_stock - Inventory.dn_stock > 0)
+        inventory = query.first()
+        if inventory is None:
+            print("No inventory row with sellable stock found.")
+            return
+        goods_id, warehouse_id = inventory.goods_id, inventory.warehouse_id
+
+    print(f"Hot SKU: goods={goods_id} warehouse={warehouse_id}")
+    for mode in ('pessimistic', 'optimistic'):
+        run_mode(app, mode, goods_id, warehouse_id, args.workers, args.operations)
+
+
+if __name__ == '__main__':
+    main()
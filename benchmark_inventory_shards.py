@@ -0,0 +1,122 @@
+"""热点商品分片基准测试
+
+N 个并发 worker 对同一个热点商品反复创建 1 件的 DN（每次一个事务），
+分别在未分片与不同分片数下统计每秒预扣数，结束后删除基准测试创建的 DN 并停用分片。
+需要支持行锁的数据库（PostgreSQL / MySQL，读取 .env 中的连接配置），库存表中需已有数据。
+
+用法:
+    python benchmark_inventory_shards.py [--workers 32] [--operations 100] [--shards 0,1,4,16]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import lazyload
+
+from app import create_app
+from extensions import db
+from extensions.error import BadRequestException
+from system.user.models import User
+from warehouse.dn.models import DN
+from warehouse.dn.services import DNService
+from warehouse.inventory.models import Inventory
+from warehouse.inventory.services import InventoryService
+from warehouse.recipient.models import Recipient
+
+BENCHMARK_REMARK = 'benchmark_inventory_shards'
+
+
+def run_worker(app, payload, created_by_id, operations):
+    """单个 worker：每次创建一张 1 件的 DN，记录成功与库存不足的次数"""
+    created = []
+    rejected = 0
+    with app.app_context():
+        for _ in range(operations):
+            try:
+                dn = DNService.create_dn(dict(payload), created_by_id=created_by_id)
+                created.append(dn.id)
+            except BadRequestException:
+                rejected += 1
+            finally:
+                db.session.remove()
+    return created, rejected
+
+
+def run_round(app, shard_count, goods_id, warehouse_id, payload, created_by_id, workers, operations):
+    with app.app_context():
+        if shard_count:
+            InventoryService.enable_sharding(goods_id, warehouse_id, shard_count)
+        else:
+            InventoryService.disable_sharding(goods_id, warehouse_id)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            lambda _: run_worker(app, payload, created_by_id, operations), range(workers)
+        ))
+    duration = time.perf_counter() - start
+
+    created = [dn_id for result in results for dn_id in result[0]]
+    rejected = sum(result[1] for result in results)
+    label = f"shards={shard_count}" if shard_count else "unsharded"
+    print(
+        f"{label:<12} workers={workers:<3} reservations={len(created):<6} rejected={rejected:<5} "
+        f"duration={duration:7.2f}s  throughput={len(created) / duration:8.1f} reservations/s"
+    )
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hot goods inventory shard benchmark')
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--operations', type=int, default=100, help='DNs created per worker')
+    parser.add_argument('--shards', type=str, default='0,1,4,16', help='comma separated shard counts, 0 = unsharded')
+    parser.add_argument('--goods-id', type=int, default=None)
+    parser.add_argument('--warehouse-id', type=int, default=None)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        query = Inventory.query.options(lazyload('*'))
+        if args.goods_id and args.warehouse_id:
+            query = query.filter_by(goods_id=args.goods_id, warehouse_id=args.warehouse_id)
+        else:
+            query = query.order_by(
+                (Inventory.onhand_stock - Inventory.locked_stock - Inventory.dn_stock).desc()
+            )
+        inventory = query.first()
+        recipient = Recipient.query.first()
+        user = User.query.first()
+        if inventory is None or recipient is None or user is None:
+            print("Inventory, recipient and user rows are required.")
+            return
+        goods_id, warehouse_id = inventory.goods_id, inventory.warehouse_id
+        print(f"Hot SKU: goods={goods_id} warehouse={warehouse_id} "
+              f"available={inventory.available_stock_for_sale}")
+        payload = {
+            'recipient_id': recipient.id,
+            'warehouse_id': warehouse_id,
+            'shipping_address': BENCHMARK_REMARK,
+            'expected_shipping_date': '2026-01-01',
+            'remark': BENCHMARK_REMARK,
+            'details': [{'goods_id': goods_id, 'quantity': 1}],
+        }
+        created_by_id = user.id
+
+    created = []
+    try:
+        for shard_count in (int(value) for value in args.shards.split(',')):
+            created.extend(run_round(
+                app, shard_count, goods_id, warehouse_id, payload, created_by_id,
+                args.workers, args.operations,
+            ))
+    finally:
+        with app.app_context():
+            for dn_id in created:
+                DNService.delete_dn(db.session.get(DN, dn_id))
+            InventoryService.disable_sharding(goods_id, warehouse_id)
+        print(f"Cleaned up {len(created)} benchmark DNs")
+
+
+if __name__ == '__main__':
+    main()
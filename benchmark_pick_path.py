@@ -0,0 +1,67 @@
+"""拣货路径规划基准测试
+
+在生成的仓库（默认 50 巷道 x 50 列 x 4 层 = 1 万个库位）中随机抽取不同行数的拣货任务，
+分别统计 S 形、2-opt 与精确解（停靠点不超过 --exact-max）的耗时与路径长度。
+只在内存中计算，不需要数据库。
+
+用法:
+    python benchmark_pick_path.py [--aisles 50] [--bays 50] [--levels 4] [--sizes 8,30,60,200,500] [--rounds 20]
+"""
+import argparse
+import random
+import time
+
+from warehouse.picking.path import PathPlanner
+
+
+def run_size(codes, size, rounds, exact_max, rng):
+    """同一行数跑 rounds 次，返回各算法的平均耗时（毫秒）与平均路径长度"""
+    results = {}
+    for _ in range(rounds):
+        stops = rng.sample(codes, size)
+        start = time.perf_counter()
+        planner = PathPlanner(stops)
+        s_shape = planner.s_shape(stops)
+        timings = {'s-shape': (time.perf_counter() - start, planner.route_length(s_shape))}
+
+        start = time.perf_counter()
+        route = planner.two_opt(s_shape)
+        timings['2-opt'] = (time.perf_counter() - start + timings['s-shape'][0], planner.route_length(route))
+
+        if size <= exact_max:
+            start = time.perf_counter()
+            route = planner.exact(stops)
+            timings['exact'] = (time.perf_counter() - start, planner.route_length(route))
+
+        for method, (elapsed, length) in timings.items():
+            total_elapsed, total_length = results.get(method, (0.0, 0.0))
+            results[method] = (total_elapsed + elapsed, total_length + length)
+    return {method: (elapsed * 1000 / rounds, length / rounds) for method, (elapsed, length) in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pick-path sequencing benchmark')
+    parser.add_argument('--aisles', type=int, default=50)
+    parser.add_argument('--bays', type=int, default=50)
+    parser.add_argument('--levels', type=int, default=4)
+    parser.add_argument('--sizes', type=str, default='8,30,60,200,500', help='comma separated stop counts')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--exact-max', type=int, default=10, help='largest stop count solved exactly')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    codes = [
+        f'{aisle:02d}-{bay:02d}-{level}'
+        for aisle in range(1, args.aisles + 1)
+        for bay in range(1, args.bays + 1)
+        for level in range(1, args.levels + 1)
+    ]
+    rng = random.Random(args.seed)
+    print(f"Warehouse: {len(codes)} locations ({args.aisles} aisles x {args.bays} bays x {args.levels} levels)")
+    for size in (int(value) for value in args.sizes.split(',')):
+        for method, (elapsed, length) in run_size(codes, size, args.rounds, args.exact_max, rng).items():
+            print(f"stops={size:<5} method={method:<8} avg_time={elapsed:9.2f}ms  avg_distance={length:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -30,6 +30,25 @@ class Config:
     CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))  # 默认缓存超时时间
     CACHE_TYPE = os.getenv('CACHE_TYPE', 'redis')  # 缓存类型
 
+    TRANSACTION_MAX_RETRIES = int(os.getenv('TRANSACTION_MAX_RETRIES', 3))  # 死锁/序列化冲突时最外层事务的重试次数
+    TRANSACTION_RETRY_BASE_DELAY = float(os.getenv('TRANSACTION_RETRY_BASE_DELAY', 0.05))  # 重试退避基数（秒），实际等待为随机抖动
+
+    INVENTORY_INCREMENTAL_STOCK = os.getenv('INVENTORY_INCREMENTAL_STOCK', 'False') == 'True'  # 上架/下架/移库/调整按库位类型增量更新 onhand/damage/return，不再逐次全量汇总
+    INVENTORY_CONCURRENCY_MODE = os.getenv('INVENTORY_CONCURRENCY_MODE', 'pessimistic')  # 库存写并发控制：pessimistic（SELECT ... FOR UPDATE）或 optimistic（版本号比较，冲突按 TRANSACTION_MAX_RETRIES 重试）
+    INVENTORY_AVAILABILITY_CACHE = os.getenv('INVENTORY_AVAILABILITY_CACHE', 'False') == 'True'  # 库存计数写穿 Redis，供高频可用量查询接口直接读取
+    INVENTORY_AVAILABILITY_CACHE_TTL = int(os.getenv('INVENTORY_AVAILABILITY_CACHE_TTL', 86400))  # 可用量缓存过期时间（秒），0 表示不过期
+    INVENTORY_MAX_SHARDS = int(os.getenv('INVENTORY_MAX_SHARDS', 64))  # 热点商品库存分片数上限
+
+    PICK_PATH_EXACT_MAX_STOPS = int(os.getenv('PICK_PATH_EXACT_MAX_STOPS', 8))  # 拣货路径停靠点不超过该数时用动态规划求精确解
+    PICK_PATH_TWO_OPT_MAX_STOPS = int(os.getenv('PICK_PATH_TWO_OPT_MAX_STOPS', 60))  # 不超过该数时在 S 形路径上做 2-opt 改进，更多停靠点只用 S 形路径
+
+    PUTAWAY_CAPACITY_INDEX = os.getenv('PUTAWAY_CAPACITY_INDEX', 'False') == 'True'  # 上架库位推荐使用 Redis 剩余容量索引（多 worker 共享，随商品库位数量变更增量更新），关闭时直接查询数据库
+    PUTAWAY_CAPACITY_INDEX_TTL = int(os.getenv('PUTAWAY_CAPACITY_INDEX_TTL', 3600))  # 容量索引全量重建间隔（秒），0 表示只在索引不存在时构建
+
+    RESERVATION_DEFAULT_TTL = int(os.getenv('RESERVATION_DEFAULT_TTL', 900))  # 库存预留默认有效期（秒）
+    RESERVATION_MAX_TTL = int(os.getenv('RESERVATION_MAX_TTL', 86400))  # 库存预留最长有效期（秒）
+    RESERVATION_REAP_BATCH_SIZE = int(os.getenv('RESERVATION_REAP_BATCH_SIZE', 500))  # 过期预留每批回收条数（每批一个事务）
+
 class DevelopmentConfig(Config):
     DEBUG = True # 只在开发环境中启用调试
     SQLALCHEMY_ECHO=False # 打印SQL语句
@@ -20,4 +20,40 @@ def get_object_or_none(model, object_id):
     """
     安全获取对象，找不到时返回 None
     """
-    return db.session.get(model, object_id)
\ No newline at end of file
+    return db.session.get(model, object_id)
+
+def upsert(model, rows: list, index_elements: list, increment=(), overwrite=()):
+    """
+    按数据库方言构造并执行 upsert（单条原子语句，不存在则插入，存在则更新）
+
+    使用 INSERT ... ON CONFLICT (index_elements) DO UPDATE，仅支持 PostgreSQL 与 SQLite（测试）。
+    批量写入等处还依赖 INSERT/DELETE ... RETURNING，MySQL 均不支持，不作为目标数据库。
+    :param model: ORM 模型
+    :param rows: list[dict]，待插入的行
+    :param index_elements: 唯一约束的列名
+    :param increment: 冲突时累加的列（原值 + 新行的值）
+    :param overwrite: 冲突时覆盖的列（取新行的值）
+    """
+    if not rows:
+        return None
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"upsert is not supported for dialect {dialect}")
+    stmt = insert(table).values(rows)
+    proposed = stmt.excluded
+
+    values = {column: table.c[column] + proposed[column] for column in increment}
+    values.update({column: proposed[column] for column in overwrite})
+    # 冲突走 UPDATE 分支时 Column.onupdate 不会自动生效
+    for column in table.c:
+        if column.onupdate is not None and column.name not in values and column.onupdate.is_clause_element:
+            values[column.name] = column.onupdate.arg
+
+    stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=values)
+    return db.session.execute(stmt)
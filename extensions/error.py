@@ -43,6 +43,12 @@ class NotFoundException(APIException):
     def __init__(self, message, biz_code=43000, field=None):
         super().__init__(message, biz_code, 404, field)
 
+# 409 Conflict
+class ConflictException(APIException):
+    """409 错误"""
+    def __init__(self, message, biz_code=49000, field=None):
+        super().__init__(message, biz_code, 409, field)
+
 # 500 Internal Server Error
 class InternalServerError(APIException):
     """500 错误"""
@@ -1,29 +1,152 @@
-# extensions/transaction.py
+import copy
+import random
+import time
+from contextlib import contextmanager
 from functools import wraps
-from flask import g  # 全局对象，用于记录请求范围内的事务嵌套深度
+from flask import g, current_app  # 全局对象，用于记录请求范围内的事务嵌套深度
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm.exc import StaleDataError
 from .db import db   # 导入初始化后的数据库对象
+from .error import ConflictException
+
+# 可重试的数据库错误：PostgreSQL 死锁 / 序列化失败，MySQL 死锁 / 锁等待超时
+RETRYABLE_PGCODES = ('40P01', '40001')
+RETRYABLE_MYSQL_ERRNOS = (1213, 1205)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """判断数据库异常是否为可重试的死锁/序列化冲突或乐观锁版本冲突"""
+    if isinstance(error, StaleDataError):
+        return True
+    if not isinstance(error, DBAPIError):
+        return False
+    orig = error.orig
+    if getattr(orig, 'pgcode', None) in RETRYABLE_PGCODES:
+        return True
+    if orig is not None and orig.args and orig.args[0] in RETRYABLE_MYSQL_ERRNOS:
+        return True
+    # SQLite 写锁冲突（WAL 下读锁升级写锁失败时立即返回 BUSY）
+    return 'database is locked' in str(orig)
+
+
+# 提交前重算：name -> handler(dirty)，dirty 为 {key: {bucket: source}}
+_dirty_handlers = {}
+
+
+def register_dirty_handler(name: str, handler):
+    """注册提交前重算回调（每类对象一个），见 mark_dirty"""
+    _dirty_handlers[name] = handler
+
+
+def mark_dirty(name: str, key, buckets, source=None):
+    """
+    将对象标记为需要重算，推迟到最外层事务提交前统一执行
+    :param name: 对象类型（对应 register_dirty_handler 注册的回调）
+    :param key: 对象主键，如 (goods_id, warehouse_id)
+    :param buckets: 需要刷新的字段组
+    :param source: 来源信息，同一对象同一字段组以首次标记为准
+
+    同一事务内对同一对象的多次标记只重算一次；不在事务中时立即重算。
+    """
+    if not g.get('transaction_depth'):
+        _dirty_handlers[name]({key: {bucket: source for bucket in buckets}})
+        return
+    entry = g.setdefault('dirty_sets', {}).setdefault(name, {}).setdefault(key, {})
+    for bucket in buckets:
+        entry.setdefault(bucket, source)
+
+
+def pop_dirty(name: str, keys=None, buckets=None) -> dict:
+    """
+    取出尚未重算的标记（供需要读取最新值的调用方提前重算）
+    :param keys: 只取出这些对象，None 表示全部
+    :param buckets: 只取出这些字段组，None 表示全部
+    :return: {key: {bucket: source}}
+    """
+    dirty = g.get('dirty_sets', {}).get(name)
+    if not dirty:
+        return {}
+    popped = {}
+    for key in list(dirty if keys is None else set(keys) & dirty.keys()):
+        entry = dirty[key]
+        taken = {bucket: source for bucket, source in entry.items() if buckets is None or bucket in buckets}
+        if not taken:
+            continue
+        popped[key] = taken
+        for bucket in taken:
+            del entry[bucket]
+        if not entry:
+            del dirty[key]
+    return popped
+
+
+@contextmanager
+def savepoint():
+    """
+    在 SAVEPOINT 中执行一段操作，异常时只回滚到保存点并继续抛出异常
+
+    回滚时一并恢复进入前的 mark_dirty 标记：保存点内新增的标记被丢弃，
+    保存点内 pop_dirty 取出并已重算（随保存点回滚）的标记重新放回。
+    """
+    snapshot = copy.deepcopy(g.get('dirty_sets', {}))
+    try:
+        with db.session.begin_nested():
+            yield
+    except Exception:
+        g.dirty_sets = snapshot
+        raise
+
+
+def _flush_dirty():
+    """依次执行各类对象的重算回调；回调中产生的新标记在下一轮处理"""
+    while g.get('dirty_sets'):
+        dirty_sets = g.pop('dirty_sets')
+        for name in sorted(dirty_sets):
+            if dirty_sets[name]:
+                _dirty_handlers[name](dirty_sets[name])
+
 
 def transactional(func):
-    """事务管理装饰器：确保嵌套调用只在最外层提交或回滚事务。"""
+    """事务管理装饰器：确保嵌套调用只在最外层提交或回滚事务。
+
+    最外层调用遇到死锁/序列化冲突或乐观锁版本冲突时回滚并在随机退避后整体重试，
+    次数与退避基数由 TRANSACTION_MAX_RETRIES / TRANSACTION_RETRY_BASE_DELAY 配置；
+    版本冲突重试耗尽后以 409（错误码 49001）返回。
+    最外层提交前先执行 mark_dirty 收集的重算，回滚时丢弃。
+    """
     @wraps(func)
     def wrapper(*args, **kwargs):
         # 初始化或更新嵌套事务深度计数
         if not hasattr(g, "transaction_depth"):
             g.transaction_depth = 0
-        g.transaction_depth += 1
-        try:
-            result = func(*args, **kwargs)     # 执行目标函数
-            if g.transaction_depth == 1:
-                # 只有在最外层调用（depth回到1）时提交事务
-                db.session.commit()
-            return result
-        except Exception as e:
-            # 发生异常时，只有最外层调用负责回滚
-            if g.transaction_depth == 1:
-                db.session.rollback()
-            # 将异常继续抛出，以便上层逻辑知道发生了错误
-            raise
-        finally:
-            # 函数执行完毕，减少嵌套深度
-            g.transaction_depth -= 1
+        max_retries = 0
+        if g.transaction_depth == 0:
+            max_retries = current_app.config.get('TRANSACTION_MAX_RETRIES', 3)
+        attempt = 0
+        while True:
+            g.transaction_depth += 1
+            try:
+                result = func(*args, **kwargs)     # 执行目标函数
+                if g.transaction_depth == 1:
+                    # 只有在最外层调用（depth回到1）时提交事务
+                    _flush_dirty()
+                    db.session.commit()
+                return result
+            except Exception as e:
+                # 发生异常时，只有最外层调用负责回滚
+                if g.transaction_depth == 1:
+                    db.session.rollback()
+                    g.pop('dirty_sets', None)
+                    if attempt < max_retries and is_retryable_error(e):
+                        attempt += 1
+                        base_delay = current_app.config.get('TRANSACTION_RETRY_BASE_DELAY', 0.05)
+                        time.sleep(random.uniform(0, base_delay * 2 ** attempt))
+                        continue
+                    if isinstance(e, StaleDataError):
+                        raise ConflictException("Concurrent update conflict, please retry", 49001) from e
+                # 将异常继续抛出，以便上层逻辑知道发生了错误
+                raise
+            finally:
+                # 函数执行完毕，减少嵌套深度
+                g.transaction_depth -= 1
     return wrapper
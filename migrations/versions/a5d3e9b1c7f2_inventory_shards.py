@@ -0,0 +1,33 @@
+"""Hot goods inventory shards
+
+Revision ID: a5d3e9b1c7f2
+Revises: f1c6a8e4d2b7
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a5d3e9b1c7f2'
+down_revision = 'f1c6a8e4d2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'inventory_shards',
+        sa.Column('goods_id', sa.Integer(), nullable=False),
+        sa.Column('warehouse_id', sa.Integer(), nullable=False),
+        sa.Column('shard_no', sa.Integer(), nullable=False),
+        sa.Column('allotment', sa.Integer(), nullable=False),
+        sa.Column('reserved', sa.Integer(), nullable=False),
+        sa.Column('rebalanced_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['goods_id'], ['goods.id'], ondelete='RESTRICT'),
+        sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ondelete='RESTRICT'),
+        sa.PrimaryKeyConstraint('goods_id', 'warehouse_id', 'shard_no'),
+    )
+
+
+def downgrade():
+    op.drop_table('inventory_shards')
@@ -0,0 +1,63 @@
+"""Deduplicate goods_locations and enforce unique (goods_id, location_id)
+
+Revision ID: b8f2d4a6c1e3
+Revises: a5d3e9b1c7f2
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'b8f2d4a6c1e3'
+down_revision = 'a5d3e9b1c7f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    goods_locations = sa.table(
+        'goods_locations',
+        sa.column('id', sa.Integer),
+        sa.column('goods_id', sa.Integer),
+        sa.column('location_id', sa.Integer),
+        sa.column('quantity', sa.Integer),
+    )
+
+    # 重复的 (goods_id, location_id) 合并到 id 最小的一条，数量求和，其余删除
+    duplicates = bind.execute(
+        sa.select(
+            goods_locations.c.goods_id,
+            goods_locations.c.location_id,
+            sa.func.min(goods_locations.c.id).label('keep_id'),
+            sa.func.sum(goods_locations.c.quantity).label('total'),
+        ).group_by(
+            goods_locations.c.goods_id, goods_locations.c.location_id
+        ).having(sa.func.count() > 1)
+    ).all()
+    for row in duplicates:
+        bind.execute(
+            goods_locations.update()
+            .where(goods_locations.c.id == row.keep_id)
+            .values(quantity=row.total)
+        )
+        bind.execute(
+            goods_locations.delete().where(
+                goods_locations.c.goods_id == row.goods_id,
+                goods_locations.c.location_id == row.location_id,
+                goods_locations.c.id != row.keep_id,
+            )
+        )
+
+    # 通过 db.create_all 建表的库已带有该约束
+    inspector = sa.inspect(bind)
+    existing = {constraint['name'] for constraint in inspector.get_unique_constraints('goods_locations')}
+    existing |= {index['name'] for index in inspector.get_indexes('goods_locations') if index.get('unique')}
+    if 'uix_goods_location' not in existing:
+        with op.batch_alter_table('goods_locations') as batch_op:
+            batch_op.create_unique_constraint('uix_goods_location', ['goods_id', 'location_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('goods_locations') as batch_op:
+        batch_op.drop_constraint('uix_goods_location', type_='unique')
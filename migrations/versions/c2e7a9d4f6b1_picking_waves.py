@@ -0,0 +1,73 @@
+"""Multi-order picking waves
+
+Revision ID: c2e7a9d4f6b1
+Revises: b8f2d4a6c1e3
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c2e7a9d4f6b1'
+down_revision = 'b8f2d4a6c1e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'picking_waves',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('warehouse_id', sa.Integer(), nullable=False),
+        sa.Column('carrier_id', sa.Integer(), nullable=True),
+        sa.Column('cutoff_date', sa.Date(), nullable=True),
+        sa.Column('zone', sa.String(length=50), nullable=True),
+        sa.Column('strategy', sa.String(length=10), nullable=False),
+        sa.Column('created_by', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ondelete='RESTRICT'),
+        sa.ForeignKeyConstraint(['carrier_id'], ['carriers.id'], ondelete='RESTRICT'),
+        sa.ForeignKeyConstraint(['created_by'], ['users.id'], ondelete='RESTRICT'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_picking_waves_warehouse_id', 'picking_waves', ['warehouse_id'])
+
+    with op.batch_alter_table('picking_tasks') as batch_op:
+        batch_op.add_column(sa.Column('wave_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('wall_slot', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_picking_tasks_wave_id', 'picking_waves', ['wave_id'], ['id'], ondelete='SET NULL'
+        )
+        batch_op.create_index('ix_picking_tasks_wave_id', ['wave_id'])
+
+    op.create_table(
+        'picking_wave_lines',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('wave_id', sa.Integer(), nullable=False),
+        sa.Column('picking_task_id', sa.Integer(), nullable=False),
+        sa.Column('dn_id', sa.Integer(), nullable=False),
+        sa.Column('wall_slot', sa.Integer(), nullable=False),
+        sa.Column('goods_id', sa.Integer(), nullable=False),
+        sa.Column('location_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.CheckConstraint('quantity > 0', name='chk_picking_wave_line_qty'),
+        sa.ForeignKeyConstraint(['wave_id'], ['picking_waves.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['picking_task_id'], ['picking_tasks.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['dn_id'], ['dn.id'], ondelete='RESTRICT'),
+        sa.ForeignKeyConstraint(['goods_id'], ['goods.id'], ondelete='RESTRICT'),
+        sa.ForeignKeyConstraint(['location_id'], ['locations.id'], ondelete='RESTRICT'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_picking_wave_line_location', 'picking_wave_lines', ['wave_id', 'location_id'])
+    op.create_index('ix_picking_wave_lines_picking_task_id', 'picking_wave_lines', ['picking_task_id'])
+
+
+def downgrade():
+    op.drop_table('picking_wave_lines')
+    with op.batch_alter_table('picking_tasks') as batch_op:
+        batch_op.drop_index('ix_picking_tasks_wave_id')
+        batch_op.drop_constraint('fk_picking_tasks_wave_id', type_='foreignkey')
+        batch_op.drop_column('wall_slot')
+        batch_op.drop_column('wave_id')
+    op.drop_index('ix_picking_waves_warehouse_id', table_name='picking_waves')
+    op.drop_table('picking_waves')
@@ -0,0 +1,66 @@
+"""Inventory ledger and snapshot time index
+
+Revision ID: c4d8e1f7a3b2
+Revises: b7e3c9a2d5f1
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c4d8e1f7a3b2'
+down_revision = 'b7e3c9a2d5f1'
+branch_labels = None
+depends_on = None
+
+# 流水覆盖的库存字段（与 InventoryService._LEDGER_FIELDS 一致）
+LEDGER_FIELDS = (
+    'onhand_stock', 'locked_stock', 'damage_stock', 'return_stock',
+    'asn_stock', 'received_stock', 'sorted_stock',
+    'dn_stock', 'picked_stock', 'packed_stock', 'delivered_stock',
+)
+
+
+def upgrade():
+    op.create_table(
+        'inventory_ledger',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('goods_id', sa.Integer(), nullable=False),
+        sa.Column('warehouse_id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.String(length=20), nullable=False),
+        sa.Column('delta', sa.Integer(), nullable=False),
+        sa.Column('source_type', sa.String(length=30), nullable=True),
+        sa.Column('source_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['goods_id'], ['goods.id'], ondelete='RESTRICT'),
+        sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ondelete='RESTRICT'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'idx_inventory_ledger_goods_warehouse_bucket_time',
+        'inventory_ledger', ['goods_id', 'warehouse_id', 'bucket', 'created_at'], unique=False,
+    )
+    op.create_index(
+        'idx_inventory_snapshot_goods_warehouse_time',
+        'inventory_snapshot', ['goods_id', 'warehouse_id', 'snapshot_time'], unique=False,
+    )
+    # 期初流水：现有库存每个非零字段写入一条，历史余额从此开始按流水回放
+    for field in LEDGER_FIELDS:
+        op.execute(sa.text(
+            "INSERT INTO inventory_ledger "
+            "(goods_id, warehouse_id, bucket, delta, source_type, source_id, created_at) "
+            f"SELECT goods_id, warehouse_id, '{field}', {field}, 'opening', NULL, CURRENT_TIMESTAMP "
+            f"FROM inventory WHERE COALESCE({field}, 0) <> 0"
+        ))
+
+
+def downgrade():
+    op.drop_index(
+        'idx_inventory_snapshot_goods_warehouse_time',
+        table_name='inventory_snapshot',
+    )
+    op.drop_index(
+        'idx_inventory_ledger_goods_warehouse_bucket_time',
+        table_name='inventory_ledger',
+    )
+    op.drop_table('inventory_ledger')
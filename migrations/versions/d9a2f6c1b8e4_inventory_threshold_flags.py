@@ -0,0 +1,43 @@
+"""Inventory threshold breach flags
+
+Revision ID: d9a2f6c1b8e4
+Revises: c4d8e1f7a3b2
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd9a2f6c1b8e4'
+down_revision = 'c4d8e1f7a3b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('inventory') as batch_op:
+        batch_op.add_column(sa.Column(
+            'is_below_low_threshold', sa.Boolean(), nullable=False, server_default=sa.false()
+        ))
+        batch_op.add_column(sa.Column(
+            'is_above_high_threshold', sa.Boolean(), nullable=False, server_default=sa.false()
+        ))
+        batch_op.create_index('idx_inventory_low_breach', ['warehouse_id', 'is_below_low_threshold'], unique=False)
+        batch_op.create_index('idx_inventory_high_breach', ['warehouse_id', 'is_above_high_threshold'], unique=False)
+
+    # 回填现有库存的越界标记（可售库存 = onhand - locked - dn）
+    op.execute(
+        "UPDATE inventory SET "
+        "is_below_low_threshold = (low_stock_threshold <> -1 "
+        "AND onhand_stock - locked_stock - dn_stock < low_stock_threshold), "
+        "is_above_high_threshold = (high_stock_threshold <> -1 "
+        "AND onhand_stock - locked_stock - dn_stock > high_stock_threshold)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('inventory') as batch_op:
+        batch_op.drop_index('idx_inventory_high_breach')
+        batch_op.drop_index('idx_inventory_low_breach')
+        batch_op.drop_column('is_above_high_threshold')
+        batch_op.drop_column('is_below_low_threshold')
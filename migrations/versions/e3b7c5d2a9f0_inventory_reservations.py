@@ -0,0 +1,41 @@
+"""Expiring inventory reservations
+
+Revision ID: e3b7c5d2a9f0
+Revises: d9a2f6c1b8e4
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e3b7c5d2a9f0'
+down_revision = 'd9a2f6c1b8e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'inventory_reservations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=64), nullable=False),
+        sa.Column('owner', sa.String(length=100), nullable=True),
+        sa.Column('goods_id', sa.Integer(), nullable=False),
+        sa.Column('warehouse_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('released_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['goods_id'], ['goods.id'], ondelete='RESTRICT'),
+        sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ondelete='RESTRICT'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_reservation_status_expires', 'inventory_reservations', ['status', 'expires_at'], unique=False)
+    op.create_index('idx_reservation_token', 'inventory_reservations', ['token'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_reservation_token', table_name='inventory_reservations')
+    op.drop_index('idx_reservation_status_expires', table_name='inventory_reservations')
+    op.drop_table('inventory_reservations')
@@ -0,0 +1,24 @@
+"""Inventory optimistic concurrency version
+
+Revision ID: f1c6a8e4d2b7
+Revises: e3b7c5d2a9f0
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'f1c6a8e4d2b7'
+down_revision = 'e3b7c5d2a9f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('inventory') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('inventory') as batch_op:
+        batch_op.drop_column('version')
@@ -20,6 +20,10 @@ def init_scheduler(app):
     webhook_interval = int(os.getenv('WEBHOOK_PUSH_INTERVAL_MINUTES', '30'))
     snapshot_hour = int(os.getenv('SNAPSHOT_HOUR', '2'))
     snapshot_minute = int(os.getenv('SNAPSHOT_MINUTE', '0'))
+    reconcile_hour = int(os.getenv('RECONCILE_HOUR', '3'))
+    reconcile_minute = int(os.getenv('RECONCILE_MINUTE', '0'))
+    reservation_reap_interval = int(os.getenv('RESERVATION_REAP_INTERVAL_SECONDS', '60'))
+    shard_rebalance_interval = int(os.getenv('INVENTORY_SHARD_REBALANCE_INTERVAL_SECONDS', '30'))
 
     app.config['JOBS'] = [
         {
@@ -37,6 +41,30 @@ def init_scheduler(app):
             'minute': snapshot_minute,
             'misfire_grace_time': 3600,
         },
+        {
+            'id': 'inventory_reconcile',
+            'func': 'scheduler:_job_inventory_reconcile',
+            'trigger': 'cron',
+            'hour': reconcile_hour,
+            'minute': reconcile_minute,
+            'misfire_grace_time': 3600,
+        },
+        {
+            'id': 'reservation_reaper',
+            'func': 'scheduler:_job_reservation_reaper',
+            'trigger': 'interval',
+            'seconds': reservation_reap_interval,
+            'max_instances': 1,
+            'misfire_grace_time': 60,
+        },
+        {
+            'id': 'inventory_shard_rebalance',
+            'func': 'scheduler:_job_inventory_shard_rebalance',
+            'trigger': 'interval',
+            'seconds': shard_rebalance_interval,
+            'max_instances': 1,
+            'misfire_grace_time': 30,
+        },
     ]
 
     scheduler.init_app(app)
@@ -99,3 +127,47 @@ def _job_inventory_snapshot():
             logger.info(f'[Scheduler] {result}')
         except Exception as e:
             logger.error(f'[Scheduler] Inventory snapshot failed: {e}')
+
+
+def _job_inventory_reconcile():
+    """定时任务：按库位库存对账 onhand/damage/return 并修正漂移"""
+    app = scheduler.app
+    if app is None:
+        return
+    with app.app_context():
+        try:
+            from tasks.reconcile import run_stock_reconciliation
+            result = run_stock_reconciliation()
+            logger.info(f'[Scheduler] {result}')
+        except Exception as e:
+            logger.error(f'[Scheduler] Inventory reconciliation failed: {e}')
+
+
+def _job_reservation_reaper():
+    """定时任务：释放已过期的库存预留"""
+    app = scheduler.app
+    if app is None:
+        return
+    with app.app_context():
+        try:
+            from tasks.reservations import run_reservation_reaper
+            result, released = run_reservation_reaper()
+            if released:
+                logger.info(f'[Scheduler] {result}')
+        except Exception as e:
+            logger.error(f'[Scheduler] Reservation reaper failed: {e}')
+
+
+def _job_inventory_shard_rebalance():
+    """定时任务：合并热点商品分片的预扣量并重新分配可售库存"""
+    app = scheduler.app
+    if app is None:
+        return
+    with app.app_context():
+        try:
+            from tasks.shards import run_shard_rebalance
+            result, rebalanced = run_shard_rebalance()
+            if rebalanced:
+                logger.info(f'[Scheduler] {result}')
+        except Exception as e:
+            logger.error(f'[Scheduler] Inventory shard rebalance failed: {e}')
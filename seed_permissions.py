@@ -108,6 +108,11 @@ PERMISSIONS = [
 
     # 仓库 - 库存
     ("inventory_read", "查看库存列表和详情"),
+    ("inventory_edit", "调整库存配置（如热点商品分片）"),
+
+    # 仓库 - 库存预留
+    ("reservation_read", "查看库存预留"),
+    ("reservation_edit", "创建、延长、确认或释放库存预留"),
 
     # 仓库 - 上架
     ("putaway_read", "查看上架任务列表和详情"),
@@ -6,6 +6,7 @@ import logging
 from datetime import datetime, timedelta
 
 import requests
+from sqlalchemy import insert
 
 from extensions import db
 from system.third_party.models import APIKey
@@ -52,6 +53,74 @@ def emit(event_type, payload, api_key_id=None):
     db.session.flush()
 
 
+def emit_many(events):
+    """批量创建 Webhook 事件记录（定向推送）
+
+    与逐条调用 emit 的结果相同：没有 api_key_id、Key 已停用或未配置
+    Webhook URL 的事件直接跳过。涉及的 API Key 一次查询，事件一次多行插入。
+
+    Args:
+        events: 可迭代的 (event_type, payload, api_key_id)
+    """
+    events = [event for event in events if event[2]]
+    if not events:
+        return
+
+    api_key_ids = {
+        row.id for row in db.session.query(APIKey.id).filter(
+            APIKey.id.in_({api_key_id for _, _, api_key_id in events}),
+            APIKey.is_active == True,
+            APIKey.webhook_url.isnot(None),
+            APIKey.webhook_url != '',
+        )
+    }
+    rows = [
+        {
+            'api_key_id': api_key_id,
+            'event_type': event_type,
+            'payload': payload,
+            'status': 'pending',
+        }
+        for event_type, payload, api_key_id in events
+        if api_key_id in api_key_ids
+    ]
+    if rows:
+        db.session.execute(insert(WebhookEvent), rows)
+
+
+def emit_to_company(event_type, payload, company_id, flush=True):
+    """创建 Webhook 事件记录（广播推送）
+
+    为公司下所有配置了 Webhook URL 的有效 API Key 各创建一条事件，
+    用于库存预警等不属于某个来源单据的事件。
+
+    Args:
+        event_type: 事件类型，如 'inventory.low_stock'
+        payload: 事件数据（dict）
+        company_id: 公司 ID
+        flush: 是否立即 flush；在 SQLAlchemy flush 事件中调用时必须为 False
+    """
+    if not company_id:
+        return
+
+    api_keys = APIKey.query.filter(
+        APIKey.company_id == company_id,
+        APIKey.is_active == True,
+        APIKey.webhook_url.isnot(None),
+        APIKey.webhook_url != '',
+    ).all()
+
+    for api_key in api_keys:
+        db.session.add(WebhookEvent(
+            api_key_id=api_key.id,
+            event_type=event_type,
+            payload=payload,
+            status='pending',
+        ))
+    if api_keys and flush:
+        db.session.flush()
+
+
 def _sign_payload(payload_bytes, secret):
     """使用 HMAC-SHA256 签名"""
     return hmac.new(
@@ -1,10 +1,16 @@
-"""库存快照 CLI 命令"""
+"""库存快照 / 对账 CLI 命令"""
 import click
 from flask.cli import AppGroup
 
+from .reconcile import run_stock_reconciliation, run_warehouse_recompute
+from .reservations import run_reservation_reaper
+from .shards import run_shard_rebalance
 from .snapshot import run_inventory_snapshot
 
 snapshot_cli = AppGroup('snapshot', help='Inventory snapshot commands')
+reconcile_cli = AppGroup('reconcile', help='Inventory reconciliation commands')
+reservation_cli = AppGroup('reservation', help='Inventory reservation commands')
+shard_cli = AppGroup('shard', help='Hot goods inventory shard commands')
 
 
 @snapshot_cli.command('run')
@@ -12,3 +18,42 @@ def snapshot_run_command():
     """为所有仓库创建库存快照（可由定时任务调用）"""
     result = run_inventory_snapshot()
     click.echo(result)
+
+
+@reconcile_cli.command('stock')
+@click.option('--warehouse-id', type=int, default=None, help='只对指定仓库对账')
+@click.option('--dry-run', is_flag=True, help='只报告漂移，不修改库存')
+def reconcile_stock_command(warehouse_id, dry_run):
+    """按库位库存全量重算 onhand/damage/return 并报告漂移"""
+    result = run_stock_reconciliation(warehouse_id=warehouse_id, dry_run=dry_run)
+    click.echo(result)
+
+
+@reconcile_cli.command('warehouse')
+@click.option('--warehouse-id', type=int, default=None, help='只重算指定仓库')
+@click.option('--dry-run', is_flag=True, help='只输出漂移的记录，不修改库存')
+def reconcile_warehouse_command(warehouse_id, dry_run):
+    """按仓库集合式重算 asn/dn/onhand/damage/return 库存"""
+    result, drifts = run_warehouse_recompute(warehouse_id=warehouse_id, dry_run=dry_run)
+    if dry_run:
+        for drift in drifts:
+            click.echo(
+                f"goods={drift['goods_id']} warehouse={drift['warehouse_id']} {drift['field']}: "
+                f"{drift['actual']} -> {drift['expected']}"
+            )
+    click.echo(result)
+
+
+@reservation_cli.command('reap')
+@click.option('--batch-size', type=int, default=None, help='每批回收的预留条数')
+def reservation_reap_command(batch_size):
+    """释放所有已过期的库存预留（可由定时任务调用）"""
+    result, _ = run_reservation_reaper(batch_size=batch_size)
+    click.echo(result)
+
+
+@shard_cli.command('rebalance')
+def shard_rebalance_command():
+    """合并所有热点商品分片的预扣量并重新分配可售库存（可由定时任务调用）"""
+    result, _ = run_shard_rebalance()
+    click.echo(result)
@@ -0,0 +1,48 @@
+import logging
+import time
+from warehouse.inventory.services import InventoryService
+from warehouse.warehouse.services import WarehouseService
+
+logger = logging.getLogger(__name__)
+
+
+def _log_drifts(drifts):
+    for drift in drifts:
+        logger.warning(
+            "Inventory drift goods=%(goods_id)s warehouse=%(warehouse_id)s "
+            "%(field)s: actual=%(actual)s expected=%(expected)s", drift
+        )
+
+
+def run_stock_reconciliation(warehouse_id: int = None, dry_run: bool = False):
+    """按库位库存对账 onhand/damage/return，记录并（非 dry-run 时）修正漂移"""
+    start_time = time.time()
+    drifts = InventoryService.reconcile_location_stock(warehouse_id=warehouse_id, dry_run=dry_run)
+    _log_drifts(drifts)
+    duration = time.time() - start_time
+    mode = "dry run" if dry_run else "fixed"
+    return f"Reconciliation completed in {duration:.2f} seconds, {len(drifts)} drifted fields ({mode})"
+
+
+def run_warehouse_recompute(warehouse_id: int = None, dry_run: bool = False):
+    """
+    按仓库集合式重算 asn/dn/onhand/damage/return，返回 (结果说明, 漂移列表)
+
+    未指定仓库时逐个仓库执行，每个仓库一个事务。
+    """
+    start_time = time.time()
+    if warehouse_id:
+        warehouse_ids = [warehouse_id]
+    else:
+        warehouse_ids = [warehouse.id for warehouse in WarehouseService.list_warehouses({})]
+    drifts = []
+    for current_id in warehouse_ids:
+        drifts.extend(InventoryService.recompute_warehouse_stock(current_id, dry_run=dry_run))
+    _log_drifts(drifts)
+    duration = time.time() - start_time
+    mode = "dry run" if dry_run else "fixed"
+    return (
+        f"Recompute completed in {duration:.2f} seconds, {len(warehouse_ids)} warehouses, "
+        f"{len(drifts)} drifted fields ({mode})",
+        drifts,
+    )
@@ -0,0 +1,28 @@
+import logging
+import time
+from flask import current_app
+from warehouse.reservation.services import ReservationService
+
+logger = logging.getLogger(__name__)
+
+
+def run_reservation_reaper(batch_size: int = None):
+    """
+    分批释放所有已过期的库存预留，每批一个事务，直到没有到期的预留，返回 (结果说明, 释放条数)
+    """
+    start_time = time.time()
+    batch_size = batch_size or current_app.config.get('RESERVATION_REAP_BATCH_SIZE', 500)
+    total = 0
+    batches = 0
+    while True:
+        released = ReservationService.reap_expired_reservations(batch_size=batch_size)
+        total += released
+        if released:
+            batches += 1
+        if released < batch_size:
+            break
+    duration = time.time() - start_time
+    return (
+        f"Reservation reaper completed in {duration:.2f} seconds, {total} expired lines in {batches} batches",
+        total,
+    )
@@ -0,0 +1,28 @@
+import logging
+import time
+from warehouse.inventory.services import InventoryService
+from warehouse.inventory.shards import all_sharded_keys
+
+logger = logging.getLogger(__name__)
+
+
+def run_shard_rebalance():
+    """
+    逐个再平衡所有已启用分片的商品，每个商品一个事务，返回 (结果说明, 再平衡商品数)
+    单个商品失败只记录日志，不影响其余商品。
+    """
+    start_time = time.time()
+    rebalanced = 0
+    failed = 0
+    for goods_id, warehouse_id in all_sharded_keys():
+        try:
+            InventoryService.rebalance_inventory_shards(goods_id, warehouse_id)
+            rebalanced += 1
+        except Exception as e:
+            failed += 1
+            logger.error(f"Shard rebalance failed for goods {goods_id} in warehouse {warehouse_id}: {e}")
+    duration = time.time() - start_time
+    return (
+        f"Shard rebalance completed in {duration:.2f} seconds, {rebalanced} goods rebalanced, {failed} failed",
+        rebalanced,
+    )
@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from extensions import db
+
+
+@pytest.fixture
+def capture_sql():
+    """
+    捕获实际下发的 SQL，用于断言语句数量与查询形态（需在应用上下文内使用）
+
+        with capture_sql() as statements:
+            ...
+
+    默认监听 before_cursor_execute，得到 SQL 字符串；
+    logical=True 时监听 before_execute，得到语句对象（驱动逐行执行的多行 INSERT 只计一次）。
+    """
+    @contextmanager
+    def capture(logical: bool = False):
+        statements = []
+        if logical:
+            identifier = 'before_execute'
+
+            def _capture(conn, clauseelement, multiparams, params, execution_options):
+                statements.append(clauseelement)
+        else:
+            identifier = 'before_cursor_execute'
+
+            def _capture(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+        event.listen(db.engine, identifier, _capture)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, identifier, _capture)
+
+    return capture
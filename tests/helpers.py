@@ -66,6 +66,7 @@ from warehouse.cyclecount.schemas import api_ns as cyclecount_ns
 from warehouse.adjustment.schemas import api_ns as adjustment_ns
 from warehouse.transfer.schemas import api_ns as transfer_ns
 from warehouse.payment.schemas import api_ns as payment_ns
+from warehouse.reservation.schemas import api_ns as reservation_ns
 from warehouse.common import extract_warehouse_id
 from system.user.schemas import api_ns as user_ns
 from tasks.views import api_ns as task_ns
@@ -79,14 +80,14 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 # 导入配置类
 from config import TestingConfig
 
-def setup_app():
+def setup_app(database_uri='sqlite:///:memory:'):
     app = Flask(__name__)
     config = TestingConfig()
 
     # 应用配置
     app.config.from_object(config)
-    # 确保测试环境使用内存数据库
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    # 确保测试环境使用内存数据库（并发测试可传入文件数据库）
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
 
     db.init_app(app)
     jwt = JWTManager(app)
@@ -139,6 +140,7 @@ def setup_app():
     api.add_namespace(adjustment_ns, path='/adjustment')
     api.add_namespace(transfer_ns, path='/transfer')
     api.add_namespace(payment_ns, path='/payment')
+    api.add_namespace(reservation_ns, path='/reservation')
     api.add_namespace(user_ns, path='/user')
     api.add_namespace(logs_ns, path='/logs')
     api.add_namespace(limiter_ns, path='/ip-lists')
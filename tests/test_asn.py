@@ -430,3 +430,175 @@ def test_complete_asn_webhook_payload_includes_weight_and_volume(client):
         )
         assert payload_detail['weight'] == 0.3
         assert payload_detail['volume'] == 0.002
+
+
+def _seed_asn_with_completed_sorting(count):
+    """新建 count 个商品的 ASN：每个商品分两批分拣（4 件良品 + 1 件损坏、3 件良品），分拣任务已完成"""
+    from datetime import datetime
+    from warehouse.goods.models import Goods
+    from warehouse.sorting.models import SortingBatch, SortingTask, SortingTaskDetail
+
+    admin_user = get_admin_user()
+    template = get_asn()
+    goods = [
+        Goods(code=f"RS{count}-{i}", company_id=get_company().id, name=f"Recalc {i}", unit="pcs",
+              is_active=True, created_by=admin_user.id)
+        for i in range(count)
+    ]
+    asn = ASN(warehouse_id=template.warehouse_id, supplier_id=template.supplier_id, asn_type='inbound',
+              status='received', created_by=admin_user.id)
+    db.session.add_all(goods + [asn])
+    db.session.flush()
+    db.session.add_all([ASNDetail(asn_id=asn.id, goods_id=item.id, quantity=10, created_by=admin_user.id) for item in goods])
+
+    task = SortingTask(asn_id=asn.id, status='completed', created_by=admin_user.id)
+    db.session.add(task)
+    db.session.flush()
+    batch = SortingBatch(sorting_task_id=task.id, operator_id=admin_user.id, operation_time=datetime.now())
+    db.session.add(batch)
+    db.session.flush()
+    for item in goods:
+        for sorted_quantity, damage_quantity in ((4, 1), (3, 0)):
+            db.session.add(SortingTaskDetail(sorting_task_id=task.id, batch_id=batch.id, goods_id=item.id,
+                                             sorted_quantity=sorted_quantity, damage_quantity=damage_quantity,
+                                             operator_id=admin_user.id))
+    db.session.commit()
+    return asn.id
+
+
+def test_update_and_calculate_quantity_uses_constant_queries(client, capture_sql):
+    """已分拣 / 损坏数量按商品一次分组汇总，明细一次批量更新：语句数与明细行数无关"""
+
+    with client.application.app_context():
+        small_asn_id = _seed_asn_with_completed_sorting(5)
+        large_asn_id = _seed_asn_with_completed_sorting(60)
+
+        def recalculate(asn_id):
+            db.session.expire_all()
+            with capture_sql() as statements:
+                ASNService._update_and_calculate_quantity(asn_id)
+            return statements
+
+        small = recalculate(small_asn_id)
+        large = recalculate(large_asn_id)
+        assert len(large) == len(small)
+        assert len(large) <= 4
+        assert len([s for s in large if s.lstrip().upper().startswith("UPDATE ASN_DETAILS")]) == 1
+
+        asn = db.session.get(ASN, large_asn_id)
+        assert {
+            (detail.sorted_quantity, detail.damage_quantity, detail.actual_quantity) for detail in asn.details
+        } == {(7, 1, 8)}
+
+
+def _seed_pending_asns(goods_id, quantities, api_key_id=None):
+    """为同一商品新建多张 pending ASN（quantities 中为 None 的 ASN 不带明细），返回 ASN ID 列表"""
+    admin_user = get_admin_user()
+    template = get_asn()
+    asns = [
+        ASN(warehouse_id=template.warehouse_id, supplier_id=template.supplier_id, asn_type='inbound',
+            status='pending', api_key_id=api_key_id, created_by=admin_user.id)
+        for _ in quantities
+    ]
+    db.session.add_all(asns)
+    db.session.flush()
+    db.session.add_all([
+        ASNDetail(asn_id=asn.id, goods_id=goods_id, quantity=quantity, created_by=admin_user.id)
+        for asn, quantity in zip(asns, quantities) if quantity is not None
+    ])
+    db.session.commit()
+    return [asn.id for asn in asns]
+
+
+def test_bulk_receive_and_complete_asns_report_per_asn_results(client, access_token):
+    """整车到货：ASN 库存按提交顺序逐单扣减额度，失败的 ASN 单独报错，不影响其他 ASN"""
+    from system.third_party.models import APIKey
+    from system.webhook.models import WebhookEvent
+    from warehouse.inventory.models import InventoryLedger
+    from warehouse.sorting.models import SortingTask
+
+    with client.application.app_context():
+        api_key = APIKey(key='wh-test-bulk-asn', system_name='bulk_asn_test', permissions=['all_access'])
+        api_key.webhook_url = 'http://127.0.0.1:9/webhook'  # emit 只落库，不实际发送
+        db.session.add(api_key)
+        db.session.commit()
+        received_asn = get_asn()
+        received_asn.status = 'received'
+        goods_id = received_asn.details[0].goods_id
+        warehouse_id = received_asn.warehouse_id
+        first, short, second, empty = _seed_pending_asns(goods_id, [3, 3, 2, None], api_key_id=api_key.id)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        inventory.asn_stock = 5
+        inventory.received_stock = 0
+        db.session.commit()
+        received_asn_id = received_asn.id
+
+    headers = {'Authorization': f'Bearer {access_token}'}
+    asn_ids = [first, short, second, empty, received_asn_id, 999999, first]
+    response = client.post('/asn/bulk/receive', headers=headers, json={'asn_ids': asn_ids})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert (data['succeeded'], data['failed']) == (2, 5)
+    assert [(result['asn_id'], result['success'], result['error_code']) for result in data['results']] == [
+        (first, True, None), (short, False, 15005), (second, True, None), (empty, False, 16016),
+        (received_asn_id, False, 16021), (999999, False, 13001), (first, False, 16043),
+    ]
+
+    with client.application.app_context():
+        assert {asn.id: asn.status for asn in ASN.query.filter(ASN.id.in_([first, short, second]))} == {
+            first: 'received', short: 'pending', second: 'received',
+        }
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        assert (inventory.asn_stock, inventory.received_stock) == (0, 5)
+        assert sorted(task.asn_id for task in SortingTask.query.filter(SortingTask.asn_id.in_([first, short, second]))) == [first, second]
+        ledger = InventoryLedger.query.filter_by(goods_id=goods_id, bucket='received_stock', source_type='asn').filter(
+            InventoryLedger.source_id.in_([first, second])
+        ).all()
+        assert sorted((row.source_id, row.delta) for row in ledger) == [(first, 3), (second, 2)]
+        events = WebhookEvent.query.filter_by(event_type='asn.received').all()
+        assert sorted(event.payload['asn_id'] for event in events) == [first, second]
+
+    response = client.post('/asn/bulk/complete', headers=headers, json={'asn_ids': [first, short, second]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [(result['asn_id'], result['status'], result['error_code']) for result in data['results']] == [
+        (first, 'completed', None), (short, None, 16022), (second, 'completed', None),
+    ]
+    with client.application.app_context():
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        assert inventory.received_stock == 0
+        events = WebhookEvent.query.filter_by(event_type='asn.completed').all()
+        assert sorted(event.payload['asn_id'] for event in events) == [first, second]
+
+    response = client.post('/asn/bulk/receive', headers=headers, json={'asn_ids': 'nope'})
+    assert response.status_code == 400
+
+
+def test_bulk_receive_asns_uses_constant_queries(client, capture_sql):
+    """整车到货的语句数不随 ASN 数量增长：加载、锁库存、写入都是集合式的"""
+
+    with client.application.app_context():
+        asn = get_asn()
+        goods_id = asn.details[0].goods_id
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=asn.warehouse_id).first()
+        inventory.asn_stock = 100000
+        db.session.commit()
+        small_ids = _seed_pending_asns(goods_id, [1] * 5)
+        large_ids = _seed_pending_asns(goods_id, [1] * 60)
+
+        def run(operation, asn_ids):
+            db.session.expire_all()
+            with capture_sql() as statements:
+                results = operation(asn_ids)
+            assert all(result['success'] for result in results)
+            return statements
+
+        small = run(ASNService.bulk_receive_asns, small_ids)
+        large = run(ASNService.bulk_receive_asns, large_ids)
+        assert len(large) == len(small)
+        assert len(large) <= 10
+        assert len([s for s in large if s.lstrip().upper().startswith("INSERT INTO SORTING_TASKS")]) == 1
+
+        small = run(ASNService.bulk_complete_asns, small_ids)
+        large = run(ASNService.bulk_complete_asns, large_ids)
+        assert len(large) == len(small)
@@ -1,4 +1,5 @@
 from warehouse.cyclecount.services import CycleCountTaskService
+from extensions.error import BadRequestException
 from .helpers import *
 
 # ---------------------------------------------------------
@@ -395,3 +396,86 @@ def test_create_cycle_count_tasks_from_goods_list_invalid_goods(client):
         # 确保方法在查询无效 Goods 时抛出异常
         with pytest.raises(Exception):
             CycleCountTaskService.create_cycle_count_tasks_from_goods_list(goods_ids, warehouse_id, created_by_id)
+
+
+def _seed_zone_locations(prefix, count, goods_id=1, warehouse_id=1):
+    """在仓库中按 <prefix>-NN 生成库位，并放入 goods_id，数量为序号"""
+    from warehouse.goods.models import GoodsLocation
+    from warehouse.location.models import Location
+
+    locations = [
+        Location(warehouse_id=warehouse_id, code=f"{prefix}-{index:02d}", location_type='standard', created_by=1)
+        for index in range(1, count + 1)
+    ]
+    db.session.add_all(locations)
+    db.session.flush()
+    db.session.add_all([
+        GoodsLocation(goods_id=goods_id, location_id=location.id, quantity=index)
+        for index, location in enumerate(locations, start=1)
+    ])
+    db.session.commit()
+    return {location.id: index for index, location in enumerate(locations, start=1)}
+
+
+def test_generate_task_details_with_one_insert_select(client, capture_sql):
+    """按库区/库位范围生成明细：一条 INSERT ... SELECT，同一语句快照 system_quantity"""
+
+    with client.application.app_context():
+        zone_1 = _seed_zone_locations('Z1', 30)
+        _seed_zone_locations('Z2', 10)
+
+        task, _ = CycleCountTaskService.create_task_by_scope({'warehouse_id': 1, 'goods_ids': [2]}, created_by_id=1)
+        db.session.expire_all()
+        with capture_sql() as statements:
+            count = CycleCountTaskService.generate_task_details(task, zone='Z1')
+        inserts = [statement for statement in statements if statement.lstrip().upper().startswith('INSERT')]
+        assert len(inserts) == 1 and 'SELECT' in inserts[0].upper()
+        assert count == 30
+
+        details = [detail for detail in task.task_details if detail.location_id in zone_1]
+        assert len(details) == 30
+        for detail in details:
+            assert detail.goods_id == 1
+            assert detail.system_quantity == zone_1[detail.location_id]
+            assert (detail.actual_quantity, detail.difference, detail.status) == (0, -detail.system_quantity, 'pending')
+
+        _, count = CycleCountTaskService.create_task_by_scope(
+            {'warehouse_id': 1, 'location_from': 'Z1-05', 'location_to': 'Z1-09'}, created_by_id=1
+        )
+        assert count == 5
+        _, count = CycleCountTaskService.create_task_by_scope({'warehouse_id': 1, 'goods_ids': [2], 'zone': 'Z1'}, created_by_id=1)
+        assert count == 0
+        with pytest.raises(BadRequestException):
+            CycleCountTaskService.create_task_by_scope(
+                {'warehouse_id': 1, 'location_from': 'Z1-09', 'location_to': 'Z1-05'}, created_by_id=1
+            )
+
+
+def test_process_task_resnapshots_system_quantity(client, access_token):
+    """POST /cyclecount/generate 生成整区盘点，开始盘点时按库位当前数量刷新 system_quantity"""
+    from warehouse.goods.models import GoodsLocation
+
+    with client.application.app_context():
+        zone = _seed_zone_locations('Z3', 4)
+
+    headers = {'Authorization': f'Bearer {access_token}'}
+    response = client.post('/cyclecount/generate', headers=headers, json={'warehouse_id': 1, 'zone': 'Z3'})
+    assert response.status_code == 201
+    data = response.get_json()
+    assert data['detail_count'] == 4
+    task_id = data['task']['id']
+
+    response = client.post('/cyclecount/generate', headers=headers, json={'warehouse_id': 1, 'goods_ids': 'x'})
+    assert response.status_code == 400
+
+    with client.application.app_context():
+        moved_location_id = next(iter(zone))
+        GoodsLocation.query.filter_by(goods_id=1, location_id=moved_location_id).first().quantity = 50
+        db.session.commit()
+
+        task = CycleCountTaskService.process_task(task_id, operator_id=1)
+        assert task.status == 'in_progress'
+        quantities = {detail.location_id: (detail.system_quantity, detail.difference) for detail in task.task_details}
+        expected = {location_id: (quantity, -quantity) for location_id, quantity in zone.items()}
+        expected[moved_location_id] = (50, -50)
+        assert quantities == expected
@@ -534,3 +534,239 @@ def test_dn_service_update_dn_detail_success(client):
         assert updated_detail.picked_quantity == 10
         assert updated_detail.remark == "All constraints satisfied"
 
+
+
+def test_concurrent_opposite_order_dn_creation(tmp_path):
+    """并发压力：多线程以相反的商品顺序创建 DN，按固定顺序加锁 + 冲突重试后全部成功"""
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import text
+
+    app = setup_app(f"sqlite:///{tmp_path / 'stress.db'}")
+    app.config['TRANSACTION_MAX_RETRIES'] = 20
+    init_test_data(app)
+    with app.app_context():
+        db.session.execute(text('PRAGMA journal_mode=WAL'))
+        warehouse = get_warehouse()
+        recipient = Recipient.query.first()
+        inventories = Inventory.query.filter_by(warehouse_id=warehouse.id).all()
+        for inventory in inventories:
+            inventory.onhand_stock = 10000
+            inventory.locked_stock = 0
+            InventoryService.update_and_calculate_dn_stock(inventory.goods_id, warehouse.id)
+        db.session.commit()
+        goods_ids = [inventory.goods_id for inventory in inventories]
+        dn_stock_before = {inventory.goods_id: inventory.dn_stock for inventory in inventories}
+        warehouse_id, recipient_id = warehouse.id, recipient.id
+        operator_id = get_operator_user().id
+
+    def create(reverse):
+        with app.app_context():
+            ordered = list(reversed(goods_ids)) if reverse else goods_ids
+            DNService.create_dn({
+                'recipient_id': recipient_id,
+                'warehouse_id': warehouse_id,
+                'shipping_address': 'stress',
+                'expected_shipping_date': '2026-08-13',
+                'dn_type': 'shipping',
+                'details': [{'goods_id': goods_id, 'quantity': 1} for goods_id in ordered],
+            }, created_by_id=operator_id)
+
+    workers = 16
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(create, [i % 2 == 0 for i in range(workers)]))
+
+    with app.app_context():
+        for inventory in Inventory.query.filter_by(warehouse_id=warehouse_id).all():
+            assert inventory.dn_stock == dn_stock_before[inventory.goods_id] + workers
+        db.drop_all()
+
+
+def test_transactional_retries_on_deadlock(client):
+    """最外层事务遇到死锁错误时回滚并重试，非可重试错误直接抛出"""
+    from sqlalchemy.exc import OperationalError
+    from extensions.transaction import transactional
+
+    class DeadlockDetected(Exception):
+        pgcode = '40P01'
+
+    calls = []
+
+    @transactional
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OperationalError("UPDATE inventory ...", {}, DeadlockDetected())
+        return 'ok'
+
+    with client.application.app_context():
+        client.application.config['TRANSACTION_RETRY_BASE_DELAY'] = 0
+        assert flaky() == 'ok'
+        assert len(calls) == 3
+
+        @transactional
+        def failing():
+            calls.append(1)
+            raise BadRequestException("not retryable", 16032)
+
+        calls.clear()
+        with pytest.raises(BadRequestException):
+            failing()
+        assert len(calls) == 1
+
+
+def test_bulk_create_dns_reports_per_dn_results(client, access_token):
+    """批量导入：库存按提交顺序逐单扣减额度，失败的 DN 单独报错，不影响其他 DN"""
+    with client.application.app_context():
+        warehouse = Warehouse.query.first()
+        recipient = Recipient.query.first()
+        goods = Goods.query.first()
+        carrier = Carrier.query.first()
+        carrier.name = 'ヤマト'
+        carrier.code = None
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        inventory.onhand_stock = 10
+        inventory.locked_stock = 0
+        inventory.dn_stock = 0
+        db.session.commit()
+        base = {
+            'recipient_id': recipient.id,
+            'warehouse_id': warehouse.id,
+            'company_id': carrier.company_id,
+            'shipping_address': 'bulk',
+            'expected_shipping_date': '2026-08-13',
+        }
+        goods_id, goods_code, carrier_id = goods.id, goods.code, carrier.id
+
+    payload = [
+        {**base, 'order_number': f'B{i}', 'details': [{'goods_code': goods_code, 'quantity': 2}]} for i in range(4)
+    ] + [
+        {**base, 'order_number': 'B4', 'details': [{'goods_id': goods_id, 'quantity': 3}]},
+        {**base, 'order_number': 'B5', 'carrier_code': 'yamato', 'details': [{'goods_id': goods_id, 'quantity': 2}]},
+        {**base, 'order_number': 'B6', 'details': [{'goods_code': 'NO-SUCH-CODE', 'quantity': 1}]},
+        {**base, 'order_number': 'B7', 'details': [{'goods_id': goods_id, 'quantity': 0}]},
+        {**base, 'order_number': 'B8', 'recipient_id': 999999, 'details': [{'goods_id': goods_id, 'quantity': 1}]},
+    ]
+    response = client.post('/dn/bulk', headers={'Authorization': f'Bearer {access_token}'}, json=payload)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['created'] == 5
+    assert data['failed'] == 4
+    assert [(result['order_number'], result['success'], result['error_code']) for result in data['results']] == [
+        ('B0', True, None), ('B1', True, None), ('B2', True, None), ('B3', True, None),
+        ('B4', False, 16032), ('B5', True, None), ('B6', False, 16030), ('B7', False, 16033), ('B8', False, 16042),
+    ]
+
+    with client.application.app_context():
+        dn = db.session.get(DN, data['results'][5]['dn_id'])
+        assert dn.carrier_id == carrier_id
+        assert [(detail.goods_id, detail.quantity) for detail in dn.details] == [(goods_id, 2)]
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=dn.warehouse_id).first()
+        assert inventory.onhand_stock - inventory.locked_stock - inventory.dn_stock <= 0
+
+
+def test_bulk_create_dns_uses_constant_queries(client, capture_sql):
+    """批量导入的语句数不随 DN 数量增长：解析、锁库存、写入都是集合式的"""
+    from sqlalchemy.sql.dml import Insert
+
+    with client.application.app_context():
+        warehouse = Warehouse.query.first()
+        recipient = Recipient.query.first()
+        goods = Goods.query.all()[:2]
+        for item in goods:
+            inventory = Inventory.query.filter_by(goods_id=item.id, warehouse_id=warehouse.id).first()
+            inventory.onhand_stock = 100000
+        db.session.commit()
+        operator_id = get_operator_user().id
+
+        def import_dns(count):
+            payload = [
+                {
+                    'recipient_id': recipient.id,
+                    'warehouse_id': warehouse.id,
+                    'shipping_address': 'bulk',
+                    'expected_shipping_date': '2026-08-13',
+                    'details': [{'goods_code': item.code, 'quantity': 1} for item in goods],
+                }
+                for _ in range(count)
+            ]
+
+            # 按逻辑语句计数（多行 INSERT 在 SQLite 上带 RETURNING 排序时由驱动逐行执行）
+            with capture_sql(logical=True) as statements:
+                results = DNService.bulk_create_dns(payload, operator_id)
+            assert all(result['success'] for result in results)
+            return statements
+
+        small = import_dns(20)
+        large = import_dns(300)
+        assert len(large) == len(small)
+        inserts = [statement.table.name for statement in large if isinstance(statement, Insert)]
+        assert inserts.count('dn') == 1
+        assert inserts.count('dn_details') == 1
+
+
+def _seed_dn_with_completed_tasks(count):
+    """新建 count 个商品的 DN：每个商品分两批拣货 2+3 件、打包 4 件，拣货 / 打包任务均已完成"""
+    from datetime import datetime
+    from warehouse.goods.models import Goods
+    from warehouse.picking.models import PickingBatch, PickingTask, PickingTaskDetail
+    from warehouse.packing.models import PackingBatch, PackingTask, PackingTaskDetail
+
+    admin_user = get_admin_user()
+    dn_template = get_dn()
+    location = get_location()
+    goods = [
+        Goods(code=f"RQ{count}-{i}", company_id=get_company().id, name=f"Recalc {i}", unit="pcs",
+              is_active=True, created_by=admin_user.id)
+        for i in range(count)
+    ]
+    dn = DN(recipient_id=dn_template.recipient_id, warehouse_id=dn_template.warehouse_id,
+            shipping_address='recalc', expected_shipping_date=db.func.current_date(),
+            dn_type='shipping', status='picked', created_by=admin_user.id)
+    db.session.add_all(goods + [dn])
+    db.session.flush()
+    db.session.add_all([DNDetail(dn_id=dn.id, goods_id=item.id, quantity=10, created_by=admin_user.id) for item in goods])
+
+    picking_task = PickingTask(dn_id=dn.id, status='completed', created_by=admin_user.id)
+    packing_task = PackingTask(dn_id=dn.id, status='completed', created_by=admin_user.id)
+    db.session.add_all([picking_task, packing_task])
+    db.session.flush()
+    picking_batch = PickingBatch(picking_task_id=picking_task.id, operator_id=admin_user.id, operation_time=datetime.now())
+    packing_batch = PackingBatch(packing_task_id=packing_task.id, operator_id=admin_user.id, operation_time=datetime.now())
+    db.session.add_all([picking_batch, packing_batch])
+    db.session.flush()
+    for item in goods:
+        for picked in (2, 3):
+            db.session.add(PickingTaskDetail(picking_task_id=picking_task.id, batch_id=picking_batch.id,
+                                             location_id=location.id, goods_id=item.id, picked_quantity=picked,
+                                             operator_id=admin_user.id))
+        db.session.add(PackingTaskDetail(packing_task_id=packing_task.id, batch_id=packing_batch.id,
+                                         goods_id=item.id, packed_quantity=4, operator_id=admin_user.id))
+    db.session.commit()
+    return dn.id
+
+
+def test_update_and_calculate_quantity_uses_constant_queries(client, capture_sql):
+    """已拣 / 已打包数量按商品分组汇总，明细一次批量更新：语句数与明细行数无关"""
+
+    with client.application.app_context():
+        small_dn_id = _seed_dn_with_completed_tasks(5)
+        large_dn_id = _seed_dn_with_completed_tasks(60)
+
+        def recalculate(dn_id):
+            db.session.expire_all()
+            with capture_sql() as statements:
+                DNService._update_and_calculate_quantity(dn_id)
+            return statements
+
+        small = recalculate(small_dn_id)
+        large = recalculate(large_dn_id)
+        assert len(large) == len(small)
+        assert len(large) <= 6
+        assert len([s for s in large if s.lstrip().upper().startswith("UPDATE DN_DETAILS")]) == 1
+
+        dn = db.session.get(DN, large_dn_id)
+        assert {(detail.picked_quantity, detail.packed_quantity, detail.delivered_quantity) for detail in dn.details} == {(5, 4, 0)}
+
+        # 数量未变化时不再发出 UPDATE
+        unchanged = recalculate(large_dn_id)
+        assert not [s for s in unchanged if s.lstrip().upper().startswith("UPDATE DN_DETAILS")]
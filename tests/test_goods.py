@@ -145,3 +145,82 @@ def test_delete_goods_location(client, access_token):
         # Ensure the goods location is deleted
         deleted_goods_location = get_goods_location_by_id(goods_location.id)
         assert deleted_goods_location is None
+
+
+def test_goods_location_quantity_changes_are_atomic_upserts(client):
+    """商品库位数量通过 upsert / 带条件扣减变更：同一 (商品, 库位) 只有一条记录，扣减不足时不修改"""
+    from sqlalchemy.exc import IntegrityError
+    from warehouse.goods.models import GoodsLocation
+    from warehouse.goods.services import GoodsLocationService
+    from warehouse.location.models import Location
+
+    with client.application.app_context():
+        goods = get_goods()
+        used = {record.location_id for record in GoodsLocation.query.filter_by(goods_id=goods.id)}
+        location = Location.query.filter(Location.id.notin_(used)).first()
+
+        GoodsLocationService.add_quantity(goods.id, location.id, 7)
+        GoodsLocationService.add_quantity(goods.id, location.id, 5)
+        assert GoodsLocation.query.filter_by(goods_id=goods.id, location_id=location.id).count() == 1
+        assert GoodsLocationService.get_goods_location_record(goods.id, location.id).quantity == 12
+
+        assert GoodsLocationService.deduct_quantity(goods.id, location.id, 13) is False
+        assert GoodsLocationService.get_quantity(goods.id, location.id) == 12
+        assert GoodsLocationService.deduct_quantity(goods.id, location.id, 12) is True
+        assert GoodsLocationService.get_goods_location_record(goods.id, location.id) is None
+        assert GoodsLocationService.deduct_quantity(goods.id, location.id, 1) is False
+
+        # 唯一约束：不能再插入重复的 (goods_id, location_id)
+        existing = get_goods_location()
+        db.session.add(GoodsLocation(goods_id=existing.goods_id, location_id=existing.location_id, quantity=1))
+        with pytest.raises(IntegrityError):
+            db.session.flush()
+        db.session.rollback()
+
+
+def test_apply_quantity_changes_checks_each_decrement_without_multi_rowcount(client, monkeypatch):
+    """驱动不支持 executemany 总行数时逐行扣减：任一扣减失败都返回 False，不会静默成功"""
+    from warehouse.goods.models import GoodsLocation
+    from warehouse.goods.services import GoodsLocationService
+
+    with client.application.app_context():
+        records = GoodsLocation.query.order_by(GoodsLocation.id).limit(2).all()
+        changes = {
+            (records[0].goods_id, records[0].location_id): -1,
+            (records[1].goods_id, records[1].location_id): -(records[1].quantity + 1),
+        }
+        monkeypatch.setattr(db.session.get_bind().dialect, 'supports_sane_multi_rowcount', False)
+        assert GoodsLocationService.apply_quantity_changes(changes) is False
+        db.session.rollback()
+
+
+def test_goods_location_crud_uses_atomic_statements(client, monkeypatch):
+    """商品库位增删改走 upsert / 带条件 UPDATE / DELETE 语句，并记录容量索引变化"""
+    from extensions.error import BadRequestException
+    from warehouse.goods import services as goods_services
+    from warehouse.goods.models import GoodsLocation
+    from warehouse.goods.services import GoodsLocationService
+
+    staged = []
+    monkeypatch.setattr(goods_services, 'stage_capacity_changes', lambda changes: staged.append(dict(changes)))
+
+    with client.application.app_context():
+        existing = get_goods_location()
+        existing_id = existing.id
+        key = (existing.goods_id, existing.location_id)
+        quantity = existing.quantity
+
+        # 已存在的 (商品, 库位) 创建时累加，不违反唯一约束
+        created = GoodsLocationService.create_goods_location(
+            {'goods_id': key[0], 'location_id': key[1], 'quantity': 5}
+        )
+        assert created.id == existing_id and created.quantity == quantity + 5
+
+        updated = GoodsLocationService.update_goods_location(existing_id, {'quantity': 2})
+        assert updated.quantity == 2
+        with pytest.raises(BadRequestException):
+            GoodsLocationService.update_goods_location(existing_id, {'quantity': -1})
+
+        GoodsLocationService.delete_goods_location(existing_id)
+        assert GoodsLocation.query.filter_by(goods_id=key[0], location_id=key[1]).count() == 0
+        assert staged == [{key: 5}, {key: 2 - (quantity + 5)}, {key: -2}]
@@ -1,4 +1,4 @@
-from extensions.error import BadRequestException
+from extensions.error import BadRequestException, NotFoundException
 from warehouse.inventory.services import InventoryService
 from .helpers import *
 
@@ -457,3 +457,691 @@ def test_dn_stock_recalculation_releases_short_pick_difference(client):
             goods_id=detail.goods_id, warehouse_id=dn.warehouse_id
         ).first()
         assert inventory.dn_stock == 0
+
+
+def test_apply_stock_deltas_updates_multiple_goods(client):
+    """批量变更：一次调用同时更新多个商品的库存，并重新计算 total_stock"""
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        inventories = Inventory.query.filter_by(warehouse_id=warehouse.id).all()
+        for inv in inventories:
+            inv.dn_stock = 20
+        db.session.commit()
+        initial = {
+            inv.goods_id: (inv.dn_stock, inv.picked_stock) for inv in inventories
+        }
+
+        InventoryService.bulk_dn_picked(
+            [(inv.goods_id, warehouse.id, 10, 8) for inv in inventories]
+        )
+
+        for inv in Inventory.query.filter_by(warehouse_id=warehouse.id).all():
+            dn_stock, picked_stock = initial[inv.goods_id]
+            assert inv.dn_stock == dn_stock - 10
+            assert inv.picked_stock == picked_stock + 8
+            assert inv.total_stock == InventoryService._calculate_total_stock(inv)
+
+
+def test_apply_stock_deltas_is_all_or_nothing(client):
+    """批量变更：任一条校验失败则整批回滚，错误码与单条操作一致"""
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods_1, goods_2 = [
+            inv.goods_id for inv in Inventory.query.filter_by(warehouse_id=warehouse.id).all()
+        ]
+        packed_before = {
+            inv.goods_id: inv.packed_stock
+            for inv in Inventory.query.filter_by(warehouse_id=warehouse.id).all()
+        }
+
+        with pytest.raises(BadRequestException) as exc_info:
+            InventoryService.bulk_dn_delivered([
+                (goods_1, warehouse.id, 0),
+                (goods_2, warehouse.id, 1),
+            ])
+        assert exc_info.value.biz_code == 15010
+
+        for inv in Inventory.query.filter_by(warehouse_id=warehouse.id).all():
+            assert inv.packed_stock == packed_before[inv.goods_id]
+
+
+def test_apply_stock_deltas_missing_inventory(client):
+    """批量变更：库存记录不存在时抛出 404"""
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        with pytest.raises(NotFoundException):
+            InventoryService.apply_stock_deltas([(999999, warehouse.id, {'dn_stock': 1})])
+
+
+def test_incremental_mode_applies_location_deltas(client):
+    """增量模式：上架/移库按库位类型直接累加，不再按 GoodsLocation 全量汇总"""
+    from warehouse.putaway.services import PutawayService
+    from warehouse.transfer.services import TransferService
+
+    with client.application.app_context():
+        client.application.config['INVENTORY_INCREMENTAL_STOCK'] = True
+        warehouse = get_warehouse()
+        goods = get_goods()
+        location = get_location()
+        damaged = Location(
+            warehouse_id=warehouse.id, code="DMG001", location_type="damaged",
+            created_by=get_admin_user().id,
+        )
+        db.session.add(damaged)
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        inventory.sorted_stock = 10
+        db.session.commit()
+        onhand_before, damage_before = inventory.onhand_stock, inventory.damage_stock
+
+        PutawayService.create_putaway_record(
+            {'goods_id': goods.id, 'location_id': location.id, 'quantity': 10},
+            get_operator_user().id,
+        )
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        assert inventory.onhand_stock == onhand_before + 10
+        assert inventory.sorted_stock == 0
+
+        TransferService.create_transfer_record(
+            {'goods_id': goods.id, 'from_location_id': location.id,
+             'to_location_id': damaged.id, 'quantity': 4},
+            get_operator_user().id,
+        )
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        assert inventory.onhand_stock == onhand_before + 6
+        assert inventory.damage_stock == damage_before + 4
+        assert inventory.total_stock == InventoryService._calculate_total_stock(inventory)
+
+
+def test_reconcile_location_stock_reports_and_fixes_drift(client):
+    """对账：dry-run 只报告漂移，正式运行后库存与库位汇总一致"""
+    from warehouse.goods.services import GoodsLocationService
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        inventory.onhand_stock += 7
+        db.session.commit()
+
+        drifts = InventoryService.reconcile_location_stock(warehouse.id, dry_run=True)
+        assert drifts == [{
+            'goods_id': goods.id,
+            'warehouse_id': warehouse.id,
+            'field': 'onhand_stock',
+            'expected': inventory.onhand_stock - 7,
+            'actual': inventory.onhand_stock,
+        }]
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        assert inventory.onhand_stock == drifts[0]['actual']
+
+        InventoryService.reconcile_location_stock(warehouse.id)
+        assert InventoryService.reconcile_location_stock(warehouse.id, dry_run=True) == []
+        for inventory in Inventory.query.filter_by(warehouse_id=warehouse.id).all():
+            quantities = GoodsLocationService.get_quantity_by_location_type(
+                inventory.goods_id, warehouse.id
+            )
+            assert inventory.onhand_stock == quantities['standard']
+            assert inventory.damage_stock == quantities['damaged']
+            assert inventory.return_stock == quantities['return']
+            assert inventory.total_stock == InventoryService._calculate_total_stock(inventory)
+
+
+def test_stock_transitions_write_ledger(client):
+    """库存流水：批量变更按字段写入带来源单据的变动量，合计等于实际变化"""
+    from warehouse.inventory.models import InventoryLedger
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        inventory.dn_stock = 20
+        db.session.commit()
+
+        InventoryService.bulk_dn_picked([(goods.id, warehouse.id, 10, 8)], source=('dn', 42))
+
+        rows = InventoryLedger.query.filter_by(source_type='dn', source_id=42).all()
+        deltas = {row.bucket: row.delta for row in rows}
+        assert deltas['dn_stock'] == -10
+        assert deltas['picked_stock'] == 8
+        assert all(row.goods_id == goods.id and row.warehouse_id == warehouse.id for row in rows)
+
+
+def test_get_balance_at_replays_from_snapshot(client, access_token):
+    """历史余额：以最近快照为起点回放流水，快照之前及时间点之后的流水不计入"""
+    from datetime import datetime
+    from warehouse.inventory.models import InventoryLedger
+    from warehouse.inventory_snapshot.models import InventorySnapshot
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        location = get_location()
+        InventoryLedger.query.delete()
+
+        def ledger(bucket, delta, created_at):
+            db.session.add(InventoryLedger(
+                goods_id=goods.id, warehouse_id=warehouse.id, bucket=bucket,
+                delta=delta, created_at=created_at,
+            ))
+
+        ledger('onhand_stock', 100, datetime(2026, 1, 1, 8))
+        db.session.add(InventorySnapshot(
+            goods_id=goods.id, warehouse_id=warehouse.id, location_id=location.id,
+            quantity=90, snapshot_time=datetime(2026, 1, 2),
+        ))
+        ledger('onhand_stock', -30, datetime(2026, 1, 3))
+        ledger('onhand_stock', 5, datetime(2026, 1, 5))
+        ledger('dn_stock', 12, datetime(2026, 1, 1))
+        ledger('dn_stock', -4, datetime(2026, 1, 4))
+        db.session.commit()
+
+        assert InventoryService.get_balance_at(goods.id, warehouse.id, datetime(2026, 1, 1, 12)) == 100
+        assert InventoryService.get_balance_at(goods.id, warehouse.id, datetime(2026, 1, 2)) == 90
+        assert InventoryService.get_balance_at(goods.id, warehouse.id, datetime(2026, 1, 4)) == 60
+        assert InventoryService.get_balance_at(
+            goods.id, warehouse.id, datetime(2026, 1, 4), bucket='dn_stock') == 8
+
+        with pytest.raises(BadRequestException) as exc_info:
+            InventoryService.get_balance_at(goods.id, warehouse.id, datetime(2026, 1, 4), bucket='foo')
+        assert exc_info.value.biz_code == 15016
+
+        response = client.get(
+            f'/inventory/goods/{goods.id}/warehouse/{warehouse.id}/balance',
+            query_string={'at': '2026-01-04T00:00:00', 'bucket': 'dn_stock'},
+            headers={'Authorization': f'Bearer {access_token}', 'X-Warehouse-ID': str(warehouse.id)},
+        )
+        assert response.status_code == 200
+        assert response.json['balance'] == 8
+
+
+def test_get_balance_at_starts_from_opening_ledger_and_ends_at_delete(client):
+    """历史余额：期初流水之前的快照不作为起点，删除库存记录时冲减为 0"""
+    from datetime import datetime
+    from warehouse.inventory.models import InventoryLedger
+    from warehouse.inventory_snapshot.models import InventorySnapshot
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        location = get_location()
+        InventoryLedger.query.delete()
+        db.session.add(InventorySnapshot(
+            goods_id=goods.id, warehouse_id=warehouse.id, location_id=location.id,
+            quantity=70, snapshot_time=datetime(2026, 1, 1),
+        ))
+        for bucket, delta in (('onhand_stock', 80), ('dn_stock', 6)):
+            db.session.add(InventoryLedger(
+                goods_id=goods.id, warehouse_id=warehouse.id, bucket=bucket, delta=delta,
+                source_type='opening', created_at=datetime(2026, 1, 2),
+            ))
+        db.session.add(InventoryLedger(
+            goods_id=goods.id, warehouse_id=warehouse.id, bucket='onhand_stock', delta=-5,
+            created_at=datetime(2026, 1, 3),
+        ))
+        db.session.commit()
+
+        assert InventoryService.get_balance_at(goods.id, warehouse.id, datetime(2026, 1, 1, 12)) == 70
+        assert InventoryService.get_balance_at(goods.id, warehouse.id, datetime(2026, 1, 4)) == 75
+        assert InventoryService.get_balance_at(
+            goods.id, warehouse.id, datetime(2026, 1, 4), bucket='dn_stock') == 6
+
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        state = InventoryService._stock_state(inventory)
+        InventoryService.delete_inventory(goods.id, warehouse.id)
+        rows = InventoryLedger.query.filter_by(
+            goods_id=goods.id, warehouse_id=warehouse.id, source_type='manual'
+        ).all()
+        assert {row.bucket: row.delta for row in rows} == {
+            field: -value for field, value in state.items() if value
+        }
+
+
+class _FakeRedisPipeline:
+    """测试用 Redis 管道：命令立即作用于 _FakeRedis"""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.redis, name)
+
+    def watch(self, key):
+        pass
+
+    def multi(self):
+        pass
+
+    def execute(self):
+        return []
+
+
+class _FakeRedis:
+    """测试用 Redis：只实现可用量缓存用到的 Hash 命令"""
+
+    def __init__(self):
+        self.store = {}
+
+    def pipeline(self, transaction=True):
+        return _FakeRedisPipeline(self)
+
+    def hset(self, key, mapping):
+        self.store.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.store.get(key, {}).pop(field, None)
+
+    def hincrby(self, key, field, amount):
+        data = self.store.setdefault(key, {})
+        data[field] = str(int(data.get(field, 0)) + amount)
+
+    def expire(self, key, ttl):
+        pass
+
+    def exists(self, key):
+        return key in self.store
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+    def hgetall(self, key):
+        return dict(self.store.get(key, {}))
+
+
+def test_availability_cache_write_through(client, access_token, monkeypatch):
+    """可用量缓存：未命中时回填，库存变更提交后写穿并递增版本号，回滚不写入"""
+    from warehouse.inventory import cache
+
+    fake = _FakeRedis()
+    monkeypatch.setattr(cache, 'redis_client', fake)
+    with client.application.app_context():
+        client.application.config['INVENTORY_AVAILABILITY_CACHE'] = True
+        warehouse = get_warehouse()
+        goods = get_goods()
+        key = cache.availability_key(warehouse.id, goods.id)
+
+        first = InventoryService.get_availability(goods.id, warehouse.id)
+        assert first['version'] is None
+        assert fake.store[key]['version'] == '1'
+
+        InventoryService.bulk_lock_inventory([(goods.id, warehouse.id, 3)])
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+
+        cached = InventoryService.get_availability(goods.id, warehouse.id)
+        assert cached['version'] == 2
+        assert cached['locked_stock'] == inventory.locked_stock == first['locked_stock'] + 3
+        assert cached['available_stock_for_sale'] == inventory.available_stock_for_sale
+
+        with pytest.raises(BadRequestException):
+            InventoryService.bulk_unlock_inventory([(goods.id, warehouse.id, inventory.locked_stock + 1)])
+        assert InventoryService.get_availability(goods.id, warehouse.id)['version'] == 2
+
+        response = client.get(
+            f'/inventory/availability/goods/{goods.id}/warehouse/{warehouse.id}',
+            headers={'Authorization': f'Bearer {access_token}', 'X-Warehouse-ID': str(warehouse.id)},
+        )
+        assert response.status_code == 200
+        assert response.json['locked_stock'] == inventory.locked_stock
+        assert response.json['version'] == 2
+
+
+def test_availability_batch(client, access_token):
+    """批量可用量：按商品 ID/编码一次查询，返回扁平的库存计数"""
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        inventories = Inventory.query.filter_by(warehouse_id=warehouse.id).all()
+        first, second = inventories[0], inventories[1]
+        headers = {'Authorization': f'Bearer {access_token}', 'X-Warehouse-ID': str(warehouse.id)}
+
+        response = client.post('/inventory/availability/batch', json={
+            'goods_ids': [first.goods_id, 999999],
+            'goods_codes': [second.goods.code],
+            'warehouse_ids': [warehouse.id],
+        }, headers=headers)
+        assert response.status_code == 200
+        items = {item['goods_id']: item for item in response.json['items']}
+        assert set(items) == {first.goods_id, second.goods_id}
+        assert items[first.goods_id]['available_stock_for_sale'] == first.available_stock_for_sale
+        assert items[second.goods_id]['goods_code'] == second.goods.code
+        assert items[second.goods_id]['onhand_stock'] == second.onhand_stock
+        assert 'goods' not in items[first.goods_id]
+
+        response = client.post('/inventory/availability/batch', json={'warehouse_ids': [warehouse.id]}, headers=headers)
+        assert response.status_code == 400
+
+        with pytest.raises(BadRequestException) as exc_info:
+            InventoryService.get_availability_batch(goods_ids=list(range(1, 1002)))
+        assert exc_info.value.biz_code == 15018
+
+
+def test_recompute_warehouse_stock_matches_per_goods_recompute(client):
+    """全仓重算：dry-run 只报告漂移，正式运行结果与逐个商品重算一致"""
+    from warehouse.inventory.models import InventoryLedger
+    from tasks.reconcile import run_warehouse_recompute
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        inventory.dn_stock += 5
+        inventory.asn_stock += 3
+        inventory.onhand_stock += 2
+        db.session.commit()
+        corrupted = InventoryService._stock_state(inventory)
+
+        _, drifts = run_warehouse_recompute(warehouse.id, dry_run=True)
+        assert {(d['goods_id'], d['field']) for d in drifts} == {
+            (goods.id, 'dn_stock'), (goods.id, 'asn_stock'), (goods.id, 'onhand_stock'),
+        }
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        assert InventoryService._stock_state(inventory) == corrupted
+
+        InventoryService.recompute_warehouse_stock(warehouse.id)
+        assert InventoryService.recompute_warehouse_stock(warehouse.id, dry_run=True) == []
+        recomputed = {
+            inv.goods_id: InventoryService._stock_state(inv)
+            for inv in Inventory.query.filter_by(warehouse_id=warehouse.id).all()
+        }
+        assert InventoryLedger.query.filter_by(
+            goods_id=goods.id, source_type='reconcile', bucket='dn_stock'
+        ).one().delta == -5
+
+        for goods_id in recomputed:
+            InventoryService.update_and_calculate_asn_stock(goods_id, warehouse.id)
+            InventoryService.update_and_calculate_dn_stock(goods_id, warehouse.id)
+            InventoryService.update_and_calculate_stock(goods_id, warehouse.id)
+        for inv in Inventory.query.filter_by(warehouse_id=warehouse.id).all():
+            assert InventoryService._stock_state(inv) == recomputed[inv.goods_id]
+            assert inv.total_stock == InventoryService._calculate_total_stock(inv)
+
+
+def test_threshold_breach_flags_and_replenishment_list(client, access_token):
+    """阈值越界标记：随库存变更刷新，只在状态变化时推送 Webhook，待补货清单按标记过滤"""
+    from system.third_party.models import APIKey
+    from system.webhook.models import WebhookEvent
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        api_key = APIKey(key='inventory-threshold-test', system_name='oms', permissions=['all_access'])
+        api_key.company_id = warehouse.company_id
+        api_key.webhook_url = 'http://127.0.0.1:9/webhook'  # emit 只落库，不实际发送
+        db.session.add(api_key)
+        db.session.commit()
+
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        available = inventory.available_stock_for_sale
+        InventoryService.set_low_stock_threshold(goods.id, warehouse.id, available + 5)
+        assert inventory.is_below_low_threshold is True
+        assert InventoryService.check_stock_thresholds(goods.id, warehouse.id)['is_below_low_threshold']
+
+        # 仍低于阈值：状态未变化，不重复推送
+        InventoryService.bulk_lock_inventory([(goods.id, warehouse.id, 1)])
+        events = WebhookEvent.query.filter_by(api_key_id=api_key.id, event_type='inventory.low_stock').all()
+        assert len(events) == 1
+        assert events[0].payload['available_stock_for_sale'] == available
+
+        response = client.get('/inventory/replenishment', headers={
+            'Authorization': f'Bearer {access_token}', 'X-Warehouse-ID': str(warehouse.id)
+        })
+        assert response.status_code == 200
+        assert [item['goods_id'] for item in response.json['items']] == [goods.id]
+
+        InventoryService.bulk_unlock_inventory([(goods.id, warehouse.id, 1)])
+        InventoryService.set_low_stock_threshold(goods.id, warehouse.id, -1)
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        assert inventory.is_below_low_threshold is False
+        assert WebhookEvent.query.filter_by(
+            api_key_id=api_key.id, event_type='inventory.low_stock_cleared'
+        ).count() == 1
+        assert InventoryService.list_threshold_breaches({'warehouse_id': warehouse.id}).count() == 0
+
+
+def test_optimistic_mode_retries_on_version_conflict(client, monkeypatch):
+    """乐观模式：读取后版本被其他事务修改时整体重试，重试耗尽返回 409"""
+    from sqlalchemy import text
+    from extensions.error import ConflictException
+    from warehouse.inventory import locks
+
+    with client.application.app_context():
+        client.application.config['INVENTORY_CONCURRENCY_MODE'] = 'optimistic'
+        client.application.config['TRANSACTION_RETRY_BASE_DELAY'] = 0
+        warehouse = get_warehouse()
+        goods = get_goods()
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        locked_before, version_before = inventory.locked_stock, inventory.version
+
+        reads = []
+        conflicts = {'remaining': 1}
+        original = locks.lock_inventories
+
+        def racing_lock_inventories(keys):
+            rows = original(keys)
+            reads.append(1)
+            if conflicts['remaining']:
+                # 模拟读取之后其他事务抢先提交了同一行
+                conflicts['remaining'] -= 1
+                db.session.execute(text(
+                    "UPDATE inventory SET version = version + 1 "
+                    "WHERE goods_id = :g AND warehouse_id = :w"
+                ), {'g': goods.id, 'w': warehouse.id})
+            return rows
+
+        monkeypatch.setattr('warehouse.inventory.services.lock_inventories', racing_lock_inventories)
+
+        InventoryService.bulk_lock_inventory([(goods.id, warehouse.id, 2)])
+        assert len(reads) == 2
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        assert inventory.locked_stock == locked_before + 2
+        assert inventory.version == version_before + 1
+
+        conflicts['remaining'] = 100
+        with pytest.raises(ConflictException) as exc_info:
+            InventoryService.bulk_lock_inventory([(goods.id, warehouse.id, 1)])
+        assert exc_info.value.biz_code == 49001
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        assert inventory.locked_stock == locked_before + 2
+
+
+def test_hot_goods_shards_draw_dn_reservations_and_fold_back(client, access_token):
+    """热点商品分片：DN 预扣从分片扣减不改动 dn_stock，再平衡后合并回 dn_stock 并重新分配"""
+    from warehouse.dn.services import DNService
+    from warehouse.inventory.models import InventoryShard
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        recipient_id = Recipient.query.first().id
+        InventoryService.update_and_calculate_dn_stock(goods.id, warehouse.id)
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        inventory.onhand_stock = inventory.dn_stock + 10
+        inventory.locked_stock = 0
+        db.session.commit()
+        goods_id, warehouse_id = goods.id, warehouse.id
+
+    response = client.put(
+        f'/inventory/goods/{goods_id}/warehouse/{warehouse_id}/shards',
+        headers={'Authorization': f'Bearer {access_token}'},
+        json={'shard_count': 3},
+    )
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['shard_count'] == 3
+
+    with client.application.app_context():
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        dn_stock_before = inventory.dn_stock
+        available = inventory.available_stock_for_sale
+        assert available == 10
+        assert [s['allotment'] for s in data['shards']] == [4, 3, 3]
+        assert data['remaining'] == available
+
+        def create(quantity):
+            return DNService.create_dn({
+                'recipient_id': recipient_id,
+                'warehouse_id': warehouse_id,
+                'shipping_address': 'test',
+                'expected_shipping_date': '2026-10-16',
+                'details': [{'goods_id': goods_id, 'quantity': quantity}],
+            }, created_by_id=get_operator_user().id)
+
+        create(1)
+        # 超过单个分片余量时合并多个分片扣减
+        create(5)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        assert inventory.dn_stock == dn_stock_before
+        drawn = 6
+        assert InventoryService.get_shards(goods_id, warehouse_id)['remaining'] == available - drawn
+
+        with pytest.raises(BadRequestException, match="Insufficient available stock"):
+            create(available - drawn + 1)
+
+        result = InventoryService.rebalance_inventory_shards(goods_id, warehouse_id)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        assert inventory.dn_stock == dn_stock_before + drawn
+        assert result['remaining'] == available - drawn
+        assert all(shard.reserved == 0 for shard in result['shards'])
+
+        InventoryService.disable_sharding(goods_id, warehouse_id)
+        assert InventoryShard.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).count() == 0
+        create(1)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        assert inventory.dn_stock == dn_stock_before + drawn + 1
+
+
+def test_draw_from_shards_uses_conditional_updates_before_locking(client, monkeypatch):
+    """分片扣减：单个分片够用时只发条件 UPDATE，不加锁读取；都不够时才按顺序锁定全部分片合并扣减"""
+    from warehouse.inventory import shards as shard_module
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        goods_id, warehouse_id = goods.id, warehouse.id
+        InventoryService.update_and_calculate_dn_stock(goods_id, warehouse_id)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        inventory.onhand_stock = inventory.dn_stock + 10
+        inventory.locked_stock = 0
+        db.session.commit()
+        InventoryService.enable_sharding(goods_id, warehouse_id, 2)
+
+        lock_calls = []
+        lock_shards = shard_module.lock_shards
+        monkeypatch.setattr(shard_module, 'lock_shards', lambda *args: lock_calls.append(args) or lock_shards(*args))
+
+        assert shard_module.draw_from_shards(goods_id, warehouse_id, 3)
+        assert lock_calls == []
+        assert InventoryService.get_shards(goods_id, warehouse_id)['remaining'] == 7
+
+        # 两个分片各剩 2、5：7 件只能合并扣减
+        assert shard_module.draw_from_shards(goods_id, warehouse_id, 7)
+        assert lock_calls == [(goods_id, warehouse_id)]
+        assert not shard_module.draw_from_shards(goods_id, warehouse_id, 1)
+        db.session.rollback()
+
+
+def test_sharded_goods_dn_can_be_picked_and_closed_without_double_counting(client):
+    """热点商品分片：DN 开始作业时预扣合并到 dn_stock 可正常拣货；关闭 DN 时分片预扣一并释放"""
+    from warehouse.dn.services import DNService
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        goods_id, warehouse_id = goods.id, warehouse.id
+        recipient_id = Recipient.query.first().id
+        InventoryService.update_and_calculate_dn_stock(goods_id, warehouse_id)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        inventory.onhand_stock = inventory.dn_stock + 10
+        inventory.locked_stock = 0
+        db.session.commit()
+        dn_stock_before = inventory.dn_stock
+        InventoryService.enable_sharding(goods_id, warehouse_id, 2)
+
+        def create(quantity):
+            return DNService.create_dn({
+                'recipient_id': recipient_id,
+                'warehouse_id': warehouse_id,
+                'shipping_address': 'test',
+                'expected_shipping_date': '2026-10-16',
+                'details': [{'goods_id': goods_id, 'quantity': quantity}],
+            }, created_by_id=get_operator_user().id)
+
+        picked_dn, closed_dn = create(3), create(4)
+        assert InventoryService.get_shards(goods_id, warehouse_id)['remaining'] == 3
+
+        # 关闭：dn_stock 重算不含该 DN，分片中的 4 件同时释放
+        DNService.close_dn(closed_dn.id)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        assert inventory.dn_stock == dn_stock_before + 3
+        assert InventoryService.get_shards(goods_id, warehouse_id)['remaining'] == 7
+        assert inventory.available_stock_for_sale == 7
+
+        # 开始作业后预扣已在 dn_stock 中，拣货（未拣出）释放全部预扣
+        DNService.progress_dn(picked_dn.id)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        assert inventory.dn_stock == dn_stock_before + 3
+        DNService.picking_dn(picked_dn.id)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        assert inventory.dn_stock == dn_stock_before
+        assert db.session.get(DN, picked_dn.id).status == 'picked'
+
+
+def test_sharded_goods_locks_draw_from_shards_and_cap_availability(client, access_token, monkeypatch):
+    """热点商品分片：锁定从分片扣减，可用量（缓存与数据库、批量）不超过分片余量"""
+    from warehouse.dn.services import DNService
+    from warehouse.inventory import cache
+
+    fake = _FakeRedis()
+    monkeypatch.setattr(cache, 'redis_client', fake)
+    with client.application.app_context():
+        client.application.config['INVENTORY_AVAILABILITY_CACHE'] = True
+        warehouse = get_warehouse()
+        goods = get_goods()
+        goods_id, warehouse_id = goods.id, warehouse.id
+        InventoryService.update_and_calculate_dn_stock(goods_id, warehouse_id)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        inventory.onhand_stock = inventory.dn_stock + 10
+        inventory.locked_stock = 0
+        db.session.commit()
+        InventoryService.enable_sharding(goods_id, warehouse_id, 2)
+
+        # DN 从分片扣减 6，dn_stock 在再平衡前不变，可售库存按分片余量计算
+        DNService.create_dn({
+            'recipient_id': Recipient.query.first().id,
+            'warehouse_id': warehouse_id,
+            'shipping_address': 'test',
+            'expected_shipping_date': '2026-10-16',
+            'details': [{'goods_id': goods_id, 'quantity': 6}],
+        }, created_by_id=get_operator_user().id)
+        assert InventoryService.get_availability(goods_id, warehouse_id)['available_stock_for_sale'] == 4
+
+        with pytest.raises(BadRequestException) as exc_info:
+            InventoryService.bulk_lock_inventory([(goods_id, warehouse_id, 5)])
+        assert exc_info.value.biz_code == 15003
+
+        InventoryService.bulk_lock_inventory([(goods_id, warehouse_id, 3)])
+        assert InventoryService.get_shards(goods_id, warehouse_id)['remaining'] == 1
+        # 分片扣减使缓存失效，未命中读取回填时带上分片余量
+        assert InventoryService.get_availability(goods_id, warehouse_id)['version'] is None
+        cached = InventoryService.get_availability(goods_id, warehouse_id)
+        assert cached['version'] is not None
+        assert cached['available_stock_for_sale'] == 1
+        assert cached['available_stock'] == cached['available_stock_for_sale'] + (
+            cached['damage_stock'] + cached['return_stock']
+        )
+        [item] = InventoryService.get_availability_batch(goods_ids=[goods_id], warehouse_ids=[warehouse_id])
+        assert item['available_stock_for_sale'] == 1
+
+        # 再平衡后分片按最新可售库存重新分配，与计数字段一致
+        InventoryService.rebalance_inventory_shards(goods_id, warehouse_id)
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        assert inventory.available_stock_for_sale == 1
+        assert InventoryService.get_availability(goods_id, warehouse_id)['available_stock_for_sale'] == 1
+
+        InventoryService.disable_sharding(goods_id, warehouse_id)
+        assert InventoryService.get_availability(goods_id, warehouse_id)['shard_remaining'] is None
@@ -161,3 +161,42 @@ def test_packing_task_service_delete_task(client):
 
         deleted_task = get_packing_task_by_id(task_id)
         assert deleted_task is None
+
+
+def test_create_batch_inserts_details_in_one_statement(client, access_token, capture_sql):
+    """批次明细以一条多行 INSERT 写入，packing_time 每个批次统一解析；默认只返回批次本身"""
+    from datetime import datetime
+
+    with client.application.app_context():
+        task = get_packing_task()
+        task.status = 'in_progress'
+        db.session.commit()
+        task_id, operator_id = task.id, get_operator_user().id
+
+        def create_batch(count):
+            db.session.expire_all()
+
+            details = [
+                {"goods_id": 1, "packed_quantity": 7, "packing_time": "2025-02-01T09:30:00" if i % 2 else None}
+                for i in range(count)
+            ]
+            with capture_sql() as statements:
+                batch = PackingTaskService.create_batch(task_id, {"details": details}, operator_id)
+            created = [detail for detail in batch.details if detail.packed_quantity == 7]
+            times = {detail.packing_time for detail in created}
+            assert len(created) == count
+            assert datetime(2025, 2, 1, 9, 30) in times and len(times) == 2
+            return statements
+
+        small = create_batch(4)
+        large = create_batch(300)
+        assert len(large) == len(small)
+        assert len([s for s in large if s.lstrip().upper().startswith("INSERT INTO PACKING_TASK_DETAILS")]) == 1
+
+    headers = {'Authorization': f'Bearer {access_token}'}
+    request_json = {"details": [{"goods_id": 1, "packed_quantity": 2}]}
+    data = client.post(f'/packing/{task_id}/batches/', headers=headers, json=request_json).get_json()
+    assert 'details' not in data
+    response = client.post(f'/packing/{task_id}/batches/?expand=details', headers=headers, json=request_json)
+    assert response.status_code == 201
+    assert [detail['packed_quantity'] for detail in response.get_json()['details']] == [2]
@@ -478,10 +478,10 @@ def test_complete_task_transaction_rollback(client, monkeypatch):
         # 将任务状态设置为 in_progress
         PickingTaskService.process_task(task.id, admin_user.id)
 
-        # 模拟 InventoryService.picking_completed 抛出异常
-        def fake_picking_completed(goods_id, warehouse_id, quantity, commit=True):
+        # 模拟 InventoryService.bulk_dn_picked 抛出异常
+        def fake_picking_completed(items, source=None):
             raise Exception("Simulated inventory update error")
-        monkeypatch.setattr(InventoryService, "dn_picked", fake_picking_completed)
+        monkeypatch.setattr(InventoryService, "bulk_dn_picked", fake_picking_completed)
 
         with pytest.raises(Exception) as exc_info:
             PickingTaskService.complete_task(task.id, admin_user.id)
@@ -633,3 +633,518 @@ def test_location_stock_lock_query_has_no_outer_join(client):
                 "goods_locations 行锁查询携带了 eager join 的 LEFT OUTER JOIN，"
                 "会在 PostgreSQL 上触发 FeatureNotSupported：\n" + statement
             )
+
+
+
+def test_create_batch_validates_location_stock_with_constant_queries(client, capture_sql):
+    """100 行的拣货批次：库位库存与在途已拣量各一条分组查询，明细一条多行 INSERT，查询数不随行数增长"""
+
+    with client.application.app_context():
+        admin_user = get_operator_user()
+        task = get_picking_task()
+        PickingTaskService.process_task(task.id, admin_user.id)
+        task.dn.details[0].quantity = 1000
+        goods_id = task.dn.details[0].goods_id
+        locations = [
+            Location(warehouse_id=task.dn.warehouse_id, code=f"QC{i:03d}", location_type="standard",
+                     created_by=admin_user.id)
+            for i in range(100)
+        ]
+        db.session.add_all(locations)
+        db.session.flush()
+        db.session.add_all([
+            GoodsLocation(goods_id=goods_id, location_id=location.id, quantity=5) for location in locations
+        ])
+        db.session.commit()
+        task_id, operator_id = task.id, admin_user.id
+        location_ids = [location.id for location in locations]
+
+        def create_batch(count):
+            db.session.expire_all()
+            with capture_sql() as statements:
+                PickingTaskService.create_batch(task_id, {"details": [
+                    {"location_id": location_id, "goods_id": goods_id, "picked_quantity": 2}
+                    for location_id in location_ids[:count]
+                ]}, operator_id)
+            return statements
+
+        small = create_batch(10)
+        large = create_batch(100)
+        assert len(large) == len(small)
+        assert len(large) <= 8
+        assert len([s for s in large if "FROM goods_locations" in s]) == 1
+        assert len([s for s in large if s.lstrip().upper().startswith("INSERT INTO PICKING_TASK_DETAILS")]) == 1
+        assert PickingTaskDetail.query.filter_by(picking_task_id=task_id).filter(
+            PickingTaskDetail.location_id.in_(location_ids)
+        ).count() == 110
+
+        # 前两批已在 QC000-QC009 各拣 4 件（库存 5），再拣 2 件超出库位可拣量
+        with pytest.raises(BadRequestException, match="Insufficient stock in location"):
+            create_batch(1)
+
+
+def test_create_batch_counts_other_wave_allocations_as_committed(client):
+    """批次校验与分配共用占用口径：其他波次任务的分配量不可拣，本任务自己的波次分配量不重复扣减"""
+    from warehouse.picking.models import PickingTask, PickingWave, PickingWaveLine
+
+    with client.application.app_context():
+        operator = get_operator_user()
+        task = get_picking_task()
+        PickingTaskService.process_task(task.id, operator.id)
+        task.dn.details[0].quantity = 100
+        goods_id = task.dn.details[0].goods_id
+        location = Location(warehouse_id=task.dn.warehouse_id, code="WVC01", location_type="standard",
+                            created_by=operator.id)
+        db.session.add(location)
+        db.session.flush()
+        db.session.add(GoodsLocation(goods_id=goods_id, location_id=location.id, quantity=5))
+
+        # 另一个波次任务在该库位分配了 3 件（尚未拣）
+        wave = PickingWave(warehouse_id=task.dn.warehouse_id, created_by=operator.id)
+        db.session.add(wave)
+        db.session.flush()
+        wave_task = PickingTask(dn_id=get_dn().id, status='pending', wave_id=wave.id, wall_slot=1,
+                                created_by=operator.id)
+        db.session.add(wave_task)
+        db.session.flush()
+        db.session.add(PickingWaveLine(wave_id=wave.id, picking_task_id=wave_task.id, dn_id=wave_task.dn_id,
+                                       wall_slot=1, goods_id=goods_id, location_id=location.id, quantity=3))
+        db.session.commit()
+        task_id, location_id, operator_id = task.id, location.id, operator.id
+
+        with pytest.raises(BadRequestException, match="Insufficient stock in location"):
+            PickingTaskService.create_batch(task_id, {"details": [
+                {"location_id": location_id, "goods_id": goods_id, "picked_quantity": 3}
+            ]}, operator_id)
+        db.session.rollback()
+        PickingTaskService.create_batch(task_id, {"details": [
+            {"location_id": location_id, "goods_id": goods_id, "picked_quantity": 2}
+        ]}, operator_id)
+
+        # 波次任务拣自己的分配量时，只扣减其他任务的占用（本批 2 件），不扣自己的 3 件分配量
+        PickingTaskService.process_task(wave_task.id, operator_id)
+        PickingTaskService.create_batch(wave_task.id, {"details": [
+            {"location_id": location_id, "goods_id": goods_id, "picked_quantity": 3}
+        ]}, operator_id)
+
+
+def _seed_allocation_bins(expiration_date):
+    """新建一个商品，放在三个 standard 库位（入库时间不同）和一个 damaged 库位上"""
+    from datetime import datetime
+    from warehouse.dn.models import DN, DNDetail
+    from warehouse.goods.models import Goods, GoodsLocation
+    from warehouse.location.models import Location
+    from warehouse.picking.models import PickingBatch, PickingTask
+
+    admin_user = get_admin_user()
+    warehouse = get_warehouse()
+    goods = Goods(code="GALLOC", company_id=get_company().id, name="Allocation Goods", unit="pcs",
+                  expiration_date=expiration_date, is_active=True, created_by=admin_user.id)
+    locations = [
+        Location(warehouse_id=warehouse.id, code=code, location_type=location_type, created_by=admin_user.id)
+        for code, location_type in (("ALC1", "standard"), ("ALC2", "standard"), ("ALC3", "standard"), ("ALCD", "damaged"))
+    ]
+    db.session.add(goods)
+    db.session.add_all(locations)
+    db.session.flush()
+    for location, quantity, day in zip(locations, (5, 8, 10, 50), (3, 1, 2, 1)):
+        db.session.add(GoodsLocation(goods_id=goods.id, location_id=location.id, quantity=quantity,
+                                     created_at=datetime(2026, 1, day)))
+
+    # 另一张 DN 的进行中拣货任务已从 ALC2 拣走 6 件（尚未下架）
+    other_task = PickingTask(dn_id=get_dn().id, status='in_progress', created_by=admin_user.id)
+    db.session.add(other_task)
+    db.session.flush()
+    other_batch = PickingBatch(picking_task_id=other_task.id, operator_id=admin_user.id)
+    db.session.add(other_batch)
+    db.session.flush()
+    db.session.add(PickingTaskDetail(picking_task_id=other_task.id, batch_id=other_batch.id, location_id=locations[1].id,
+                                     goods_id=goods.id, picked_quantity=6, operator_id=admin_user.id))
+
+    dn = DN(recipient_id=get_recipient().id, warehouse_id=warehouse.id, shipping_address='allocation',
+            expected_shipping_date=db.func.current_date(), dn_type='shipping', status='pending',
+            created_by=admin_user.id)
+    db.session.add(dn)
+    db.session.flush()
+    db.session.add(DNDetail(dn_id=dn.id, goods_id=goods.id, quantity=15, picked_quantity=0, created_by=admin_user.id))
+    db.session.commit()
+    return goods, locations, dn
+
+
+def test_allocate_dn_uses_fifo_standard_bins_minus_committed(client, access_token):
+    """分配只用 standard 库位，按入库时间先进先出，并扣除进行中拣货任务已拣的数量"""
+    from datetime import date, timedelta
+
+    with client.application.app_context():
+        goods, locations, dn = _seed_allocation_bins(date.today() + timedelta(days=30))
+        dn_id = dn.id
+        codes = [location.code for location in locations]
+
+    response = client.get(f'/picking/dn/{dn_id}/allocation', headers={
+        'Authorization': f'Bearer {access_token}'
+    })
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['strategy'] == 'fefo'
+    assert [(line['location_code'], line['quantity']) for line in data['lines']] == [
+        (codes[1], 2), (codes[2], 10), (codes[0], 3)
+    ]
+    assert data['shortages'] == []
+
+
+def test_allocate_fefo_skips_expired_goods(client):
+    """FEFO 不分配已过期商品的库存，FIFO 不看保质期"""
+    from datetime import date, timedelta
+
+    with client.application.app_context():
+        goods, _, dn = _seed_allocation_bins(date.today() - timedelta(days=1))
+
+        fefo = PickingTaskService.allocate_dn(dn, 'fefo')
+        assert fefo['lines'] == []
+        assert fefo['shortages'] == [{'goods_id': goods.id, 'quantity': 15}]
+
+        fifo = PickingTaskService.allocate_dn(dn, 'fifo')
+        assert sum(line['quantity'] for line in fifo['lines']) == 15
+
+        with pytest.raises(BadRequestException) as excinfo:
+            PickingTaskService.allocate_dn(dn, 'lifo')
+        assert excinfo.value.biz_code == 16047
+
+
+def test_allocate_large_wave_uses_in_memory_bin_index(client, capture_sql):
+    """500 行的分配只发出固定数量的查询（每个仓库一次构建库位索引），不随行数增长"""
+    from types import SimpleNamespace
+    from datetime import date, timedelta
+
+    with client.application.app_context():
+        goods, _, dn = _seed_allocation_bins(date.today() + timedelta(days=30))
+        # 5 张 DN 各 100 行，每行 1 件；三个 standard 库位共 17 件可拣（ALC2 已被占用 6 件）
+        wave = [
+            SimpleNamespace(id=dn.id + 1000 + i, warehouse_id=dn.warehouse_id, details=[
+                SimpleNamespace(goods_id=goods.id, quantity=1, picked_quantity=0) for _ in range(100)
+            ])
+            for i in range(5)
+        ]
+
+        with capture_sql() as statements:
+            results = PickingTaskService.allocate_dns(wave)
+
+        # 库位索引只加载一次：语句数与 DN 数、行数无关
+        assert len(statements) == 2
+        assert sum(line['quantity'] for result in results for line in result['lines']) == 17
+        assert sum(line['quantity'] for line in results[0]['lines']) == 17
+        assert sum(shortage['quantity'] for result in results for shortage in result['shortages']) == 483
+
+
+def test_cluster_by_location_overlap_groups_shared_locations():
+    """聚类：按库位重叠度贪心成波，无重叠的订单不会被拉进同一波次"""
+    from warehouse.picking.waves import cluster_by_location_overlap
+
+    location_sets = {
+        1: frozenset({1, 2}),
+        2: frozenset({7, 8}),
+        3: frozenset({2, 3}),
+        4: frozenset({1, 2, 3}),
+        5: frozenset({8}),
+    }
+    assert cluster_by_location_overlap(location_sets, 3) == [[1, 4, 3], [2, 5]]
+    assert cluster_by_location_overlap(location_sets, 2) == [[1, 4], [2, 5], [3]]
+
+
+def test_cluster_by_location_overlap_scales_to_thousands_of_orders():
+    """5000 张订单、每张 3 个库位的聚类每张订单恰好进入一个波次，查表次数随订单数线性增长（不做两两比较）"""
+    import random
+    from warehouse.picking.waves import cluster_by_location_overlap
+
+    class CountingSets(dict):
+        lookups = 0
+
+        def __getitem__(self, key):
+            self.lookups += 1
+            return super().__getitem__(key)
+
+    def cluster(orders):
+        rng = random.Random(7)
+        location_sets = CountingSets({
+            dn_id: frozenset(rng.sample(range(orders * 2 // 5), 3)) for dn_id in range(orders)
+        })
+        waves = cluster_by_location_overlap(location_sets, 25)
+        assert sorted(dn_id for wave in waves for dn_id in wave) == list(range(orders))
+        assert all(len(wave) <= 25 for wave in waves)
+        return location_sets.lookups
+
+    small, large = cluster(2500), cluster(5000)
+    # 订单数翻倍，查表次数约翻倍（两两比较时约为 4 倍）
+    assert large < small * 3
+    assert large < 5000 * 200
+
+
+def test_plan_waves_creates_per_dn_tasks_with_wall_slots(client, access_token):
+    """波次规划：每张 DN 仍有自己的拣货任务（带波次与格口），合并拣货单按库位汇总，缺货 DN 不入波"""
+    from datetime import date, timedelta
+    from warehouse.dn.models import DN, DNDetail
+    from warehouse.picking.models import PickingTask
+
+    with client.application.app_context():
+        goods, locations, alloc_dn = _seed_allocation_bins(date.today() + timedelta(days=30))
+        admin_user = get_admin_user()
+        # 缺货 DN：需要 100 件，三个库位合计只有 17 件可拣
+        alloc_dn.details[0].quantity = 100
+        stocked = get_goods_location_by_id(1)
+        wave_dns = []
+        for quantity in (2, 3):
+            dn = DN(recipient_id=get_recipient().id, warehouse_id=alloc_dn.warehouse_id, shipping_address='wave',
+                    expected_shipping_date=date.today(), dn_type='shipping', status='pending',
+                    created_by=admin_user.id)
+            db.session.add(dn)
+            db.session.flush()
+            db.session.add(DNDetail(dn_id=dn.id, goods_id=stocked.goods_id, quantity=quantity,
+                                    picked_quantity=0, created_by=admin_user.id))
+            wave_dns.append(dn.id)
+        # 只让本用例的 DN 参与规划
+        db.session.query(DN).filter(
+            DN.status == 'pending', DN.id.notin_(wave_dns + [alloc_dn.id])
+        ).update({'status': 'closed'}, synchronize_session=False)
+        db.session.commit()
+        warehouse_id = alloc_dn.warehouse_id
+        alloc_dn_id, goods_id, stocked_goods_id = alloc_dn.id, goods.id, stocked.goods_id
+
+    response = client.post('/picking/waves/', headers={
+        'Authorization': f'Bearer {access_token}'
+    }, json={'warehouse_id': warehouse_id, 'max_orders': 10})
+    assert response.status_code == 201
+    data = response.get_json()
+    assert [item['dn_id'] for item in data['unplanned']] == [alloc_dn_id]
+    assert data['unplanned'][0]['shortages'] == [{'goods_id': goods_id, 'quantity': 83}]
+    assert len(data['waves']) == 1
+    wave = data['waves'][0]
+    assert [(task['dn_id'], task['wall_slot'], task['status']) for task in wave['tasks']] == [
+        (wave_dns[0], 1, 'pending'), (wave_dns[1], 2, 'pending')
+    ]
+    assert sum(row['quantity'] for row in wave['pick_list']) == 5
+    assert all(row['goods_id'] == stocked_goods_id for row in wave['pick_list'])
+    assert sorted(
+        (slot['wall_slot'], slot['quantity']) for row in wave['pick_list'] for slot in row['slots']
+    ) == [(1, 2), (2, 3)]
+
+    with client.application.app_context():
+        assert get_dn_by_id(wave_dns[0]).status == 'in_progress'
+        assert get_dn_by_id(alloc_dn_id).status == 'pending'
+        assert PickingTask.query.filter_by(wave_id=wave['id']).count() == 2
+
+    response = client.get(f"/picking/waves/{wave['id']}", headers={
+        'Authorization': f'Bearer {access_token}'
+    })
+    assert response.status_code == 200
+    assert response.get_json()['pick_list'] == wave['pick_list']
+
+
+def test_plan_waves_isolates_failed_dns_and_commits_wave_lines(client, access_token):
+    """progress_dn 失败的 DN 只回滚自身并带错误码进入 unplanned；已入波的分配量不会再次分配"""
+    from datetime import date
+    from warehouse.dn.models import DN, DNDetail
+    from warehouse.inventory.models import Inventory
+    from warehouse.picking.allocation import BinIndex
+    from warehouse.picking.models import PickingTask, PickingWaveLine
+
+    with client.application.app_context():
+        admin_user = get_admin_user()
+        stocked = get_goods_location_by_id(1)
+        warehouse_id = stocked.location.warehouse_id
+        goods_id = stocked.goods_id
+        wave_dns = []
+        for quantity in (2, 3):
+            dn = DN(recipient_id=get_recipient().id, warehouse_id=warehouse_id, shipping_address='wave',
+                    expected_shipping_date=date.today(), dn_type='shipping', status='pending',
+                    created_by=admin_user.id)
+            db.session.add(dn)
+            db.session.flush()
+            db.session.add(DNDetail(dn_id=dn.id, goods_id=goods_id, quantity=quantity,
+                                    picked_quantity=0, created_by=admin_user.id))
+            wave_dns.append(dn.id)
+        db.session.query(DN).filter(
+            DN.status == 'pending', DN.id.notin_(wave_dns)
+        ).update({'status': 'closed'}, synchronize_session=False)
+        # 实物可用只剩 2 件：第一张 DN 能开始，第二张（3 件）progress_dn 报 16037
+        inventory = Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first()
+        inventory.locked_stock = inventory.onhand_stock - 2
+        db.session.commit()
+        available_before = BinIndex(warehouse_id, [goods_id]).available(goods_id)
+
+    headers = {'Authorization': f'Bearer {access_token}'}
+    response = client.post('/picking/waves/', headers=headers, json={'warehouse_id': warehouse_id, 'cutoff_date': '2026/01/01'})
+    assert response.status_code == 400
+    assert response.get_json()['code'] == 16048
+
+    response = client.post('/picking/waves/', headers=headers, json={'warehouse_id': warehouse_id})
+    assert response.status_code == 201
+    data = response.get_json()
+    assert [(item['dn_id'], item['error_code']) for item in data['unplanned']] == [(wave_dns[1], 16037)]
+    assert len(data['waves']) == 1
+    assert [(task['dn_id'], task['wall_slot']) for task in data['waves'][0]['tasks']] == [(wave_dns[0], 1)]
+
+    with client.application.app_context():
+        assert get_dn_by_id(wave_dns[0]).status == 'in_progress'
+        assert get_dn_by_id(wave_dns[1]).status == 'pending'
+        assert PickingTask.query.filter_by(dn_id=wave_dns[1]).count() == 0
+        assert [line.dn_id for line in PickingWaveLine.query.filter_by(wave_id=data['waves'][0]['id'])] == [wave_dns[0]]
+        # 待拣的波次分配量已占用库位，再次分配时不可拣
+        assert BinIndex(warehouse_id, [goods_id]).available(goods_id) == available_before - 2
+        assert PickingTaskService.allocate_dn(wave_dns[0])['lines'] == []
+
+
+def test_wave_savepoint_rollback_restores_dirty_marks(client):
+    """单张 DN 的保存点回滚时，其间新增的库存重算标记被丢弃，提前取出重算的标记重新放回"""
+    from flask import g
+    from extensions.transaction import savepoint, transactional
+
+    @transactional
+    def plan():
+        InventoryService.mark_stock_dirty(1, 1, 'dn', source=('dn', 1))
+        with pytest.raises(BadRequestException):
+            with savepoint():
+                InventoryService.mark_stock_dirty(2, 1, 'dn', source=('dn', 2))
+                InventoryService.flush_dirty_stock([(1, 1)])
+                raise BadRequestException("Failed DN", 16037)
+        return {name: {key: dict(entry) for key, entry in dirty.items()} for name, dirty in g.dirty_sets.items()}
+
+    with client.application.app_context():
+        assert plan() == {'inventory': {(1, 1): {'dn': ('dn', 1)}}}
+
+
+def test_parse_location_code_and_s_shape_route():
+    """库位代码解析为 (巷道, 列, 层)；S 形路径奇数序巷道正向、偶数序巷道反向穿行"""
+    from warehouse.picking.path import PathPlanner, parse_location_code
+
+    assert parse_location_code('A-01-03-2') == ('A', 1, 3)
+    assert parse_location_code('b0102') == ('B', 102, 0)
+    assert parse_location_code('12-4') == (12, 4, 0)
+    assert parse_location_code('ALC1') == ('ALC', 1, 0)
+
+    stops = ['B-05-1', 'A-09-1', 'C-02-1', 'A-01-2', 'B-01-1', 'A-01-1']
+    planner = PathPlanner(stops)
+    assert planner.s_shape(stops) == ['A-01-1', 'A-01-2', 'A-09-1', 'B-05-1', 'B-01-1', 'C-02-1']
+
+
+def test_pick_path_exact_and_two_opt_never_worse_than_s_shape():
+    """精确解与 2-opt 的路径长度不超过 S 形路径；配置的距离矩阵优先于代码推算的距离"""
+    import random
+    from warehouse.picking.path import PathPlanner
+
+    rng = random.Random(18)
+    codes = [f'{aisle}-{bay:02d}-{level}' for aisle in 'ABCDEF' for bay in range(1, 31) for level in (1, 2)]
+    for size in (6, 30):
+        stops = rng.sample(codes, size)
+        planner = PathPlanner(stops, exact_max_stops=8, two_opt_max_stops=60)
+        route, method = planner.sequence(stops + stops[:2])
+        assert method == ('exact' if size <= 8 else '2-opt')
+        assert sorted(route) == sorted(stops)
+        assert planner.route_length(route) <= planner.route_length(planner.s_shape(stops)) + 1e-9
+
+    # 精确解与穷举结果一致
+    from itertools import permutations
+    stops = rng.sample(codes, 5)
+    planner = PathPlanner(stops)
+    best = min(planner.route_length(list(order)) for order in permutations(stops))
+    assert abs(planner.route_length(planner.exact(stops)) - best) < 1e-9
+
+    planner = PathPlanner(['A-01-1', 'B-01-1'], {'A-01-1': {'B-01-1': 42}})
+    assert planner.distance('A-01-1', 'B-01-1') == 42
+    assert planner.distance('B-01-1', 'A-01-1') == 42
+
+    # 重复的库位合并为一个停靠点
+    stops = ['A-01-1', 'A-20-1', 'A-40-1', 'B-40-1', 'C-01-1']
+    route, method = PathPlanner(stops).sequence(stops * 20)
+    assert method == 'exact'
+    assert sorted(route) == sorted(stops)
+
+
+def test_two_opt_with_asymmetric_overrides_only_accepts_real_improvements():
+    """
+    距离配置不对称时，2-opt 按实际总距离判断：能正常结束（只按边差判断会来回反转同一段），
+    结果不差于初始解，且任何一段反转都不能再缩短
+    """
+    import random
+    from warehouse.picking.path import PathPlanner
+
+    stops = [f'{aisle}-{bay:02d}-1' for aisle in 'ABC' for bay in range(1, 5)]
+    for seed in range(5):
+        rng = random.Random(seed)
+        overrides = {a: {b: rng.randint(1, 40) for b in stops if b != a} for a in stops}
+        planner = PathPlanner(stops, overrides)
+        assert planner.distance(stops[0], stops[1]) == overrides[stops[0]][stops[1]]
+        assert planner.distance(stops[1], stops[0]) == overrides[stops[1]][stops[0]]
+
+        initial = planner.s_shape(stops)
+        route = planner.two_opt(initial)
+        length = planner.route_length(route)
+        assert sorted(route) == sorted(stops)
+        assert length <= planner.route_length(initial) + 1e-9
+        for i in range(len(route)):
+            for j in range(i + 1, len(route)):
+                candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                assert planner.route_length(candidate) >= length - 1e-9
+
+
+def test_pick_path_200_lines_on_10k_location_warehouse_skips_pairwise_distances(monkeypatch):
+    """在 1 万个库位（50 巷道 x 50 列 x 4 层）的仓库里，200 行任务直接走 S 形路径，不计算两两距离"""
+    import random
+    from warehouse.picking.path import PathPlanner
+
+    rng = random.Random(10000)
+    codes = [f'{aisle:02d}-{bay:02d}-{level}' for aisle in range(1, 51) for bay in range(1, 51) for level in range(1, 5)]
+    stops = rng.sample(codes, 200)
+
+    planner = PathPlanner(stops)
+    calls = []
+    distance = planner.distance
+    monkeypatch.setattr(planner, 'distance', lambda *args: calls.append(args) or distance(*args))
+    route, method = planner.sequence(stops)
+
+    assert method == 's-shape'
+    assert sorted(route) == sorted(stops)
+    assert calls == []
+    aisles = [planner.points[code][0] for code in route]
+    assert aisles == sorted(aisles)
+
+
+def test_picking_task_sequence_endpoint_orders_lines_by_walk(client, access_token):
+    """拣货任务的行走顺序接口按库位路径排列分配结果，并使用仓库配置的距离矩阵"""
+    from datetime import date, timedelta
+    from warehouse.picking.models import PickingTask
+
+    with client.application.app_context():
+        _, locations, dn = _seed_allocation_bins(date.today() + timedelta(days=30))
+        task = PickingTask(dn_id=dn.id, status='pending', created_by=get_admin_user().id)
+        db.session.add(task)
+        db.session.commit()
+        task_id, warehouse_id = task.id, dn.warehouse_id
+        codes = [location.code for location in locations]
+
+    headers = {'Authorization': f'Bearer {access_token}'}
+    response = client.get(f'/picking/{task_id}/sequence', headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['task_id'] == task_id
+    assert data['method'] == 'exact'
+    # 同一巷道 ALC 内按列行走：ALC1 -> ALC2 -> ALC3
+    assert [(line['sequence'], line['location_code'], line['quantity']) for line in data['lines']] == [
+        (1, codes[0], 3), (2, codes[1], 2), (3, codes[2], 10)
+    ]
+    assert data['total_distance'] == 3
+
+    # 配置距离矩阵：ALC3 紧挨入口方向的 ALC1，且 ALC2 离 ALC1 很远
+    response = client.put(f'/picking/warehouses/{warehouse_id}/distance-matrix', headers=headers, json={
+        'distances': {codes[0]: {codes[1]: 50, codes[2]: 0.5}}
+    })
+    assert response.status_code == 200
+    response = client.get(f'/picking/warehouses/{warehouse_id}/distance-matrix', headers=headers)
+    assert response.get_json()['distances'][codes[0]][codes[2]] == 0.5
+
+    data = client.get(f'/picking/{task_id}/sequence', headers=headers).get_json()
+    assert [line['location_code'] for line in data['lines']] == [codes[0], codes[2], codes[1]]
+
+    response = client.put(f'/picking/warehouses/{warehouse_id}/distance-matrix', headers=headers, json={
+        'distances': {codes[0]: {codes[1]: -1}}
+    })
+    assert response.status_code == 400
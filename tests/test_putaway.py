@@ -1,5 +1,6 @@
 from sqlalchemy import func
 
+from extensions.error import BadRequestException
 from warehouse.inventory.services import InventoryService
 from .helpers import *
 
@@ -211,4 +212,376 @@ def test_bulk_create_putaway_record(client, access_token):
             
             # 验证外键约束
             assert record.goods == goods, "商品关联关系错误"
-            assert record.location == location, "库位关联关系错误"
\ No newline at end of file
+            assert record.location == location, "库位关联关系错误"
+
+def test_bulk_putaway_recomputes_each_goods_once_before_commit(client, monkeypatch):
+    """批量上架同一商品多条记录：全量重算推迟到提交前，每个商品只执行一次"""
+    from warehouse.putaway.services import PutawayService
+
+    with client.application.app_context():
+        goods = get_goods()
+        location = get_location()
+        operator = get_admin_user()
+        InventoryService.asn_received(goods.id, location.warehouse_id, 300)
+        InventoryService.asn_completed(goods.id, location.warehouse_id, 300, 300)
+        onhand_before = get_inventory_by_goods_id_and_warehouse_id(goods.id, location.warehouse_id).onhand_stock
+
+        calls = []
+        original = InventoryService.update_and_calculate_stock
+
+        def counting_update_and_calculate_stock(goods_id, warehouse_id, source=None):
+            calls.append((goods_id, warehouse_id))
+            return original(goods_id, warehouse_id, source=source)
+
+        monkeypatch.setattr(InventoryService, 'update_and_calculate_stock', counting_update_and_calculate_stock)
+
+        PutawayService.bulk_create_putaway_records([
+            {"goods_id": goods.id, "location_id": location.id, "quantity": 10},
+            {"goods_id": goods.id, "location_id": location.id, "quantity": 20},
+            {"goods_id": goods.id, "location_id": location.id, "quantity": 30},
+        ], operator.id)
+
+        assert calls == [(goods.id, location.warehouse_id)]
+        inventory = get_inventory_by_goods_id_and_warehouse_id(goods.id, location.warehouse_id)
+        assert inventory.onhand_stock == onhand_before + 60
+
+
+def test_bulk_putaway_is_set_based_for_large_batches(client, capture_sql):
+    """2000 行批量上架：集合式处理，语句数与行数无关，商品库位与库存汇总正确"""
+    from warehouse.goods.services import GoodsLocationService
+    from warehouse.putaway.services import PutawayService
+
+    with client.application.app_context():
+        goods = get_goods()
+        operator = get_admin_user()
+        warehouse_id = get_location().warehouse_id
+        db.session.add_all([
+            Location(warehouse_id=warehouse_id, code=f"BULK{i:03d}", location_type="standard", created_by=operator.id)
+            for i in range(200)
+        ])
+        db.session.commit()
+        locations = Location.query.filter_by(warehouse_id=warehouse_id, is_active=True).all()
+        location_ids = [location.id for location in locations]
+
+        inventory = get_inventory_by_goods_id_and_warehouse_id(goods.id, warehouse_id)
+        inventory.sorted_stock += 2020
+        db.session.commit()
+        onhand_before, sorted_before = inventory.onhand_stock, inventory.sorted_stock
+        bin_before = {
+            row.location_id: row.quantity
+            for row in GoodsLocation.query.filter(GoodsLocation.goods_id == goods.id).all()
+        }
+        operator_id = operator.id
+
+        # 先上架 20 行作为对照，库位与库存的预期值以此后的状态为基准
+        with capture_sql(logical=True) as small:
+            PutawayService.bulk_create_putaway_records([
+                {"goods_id": goods.id, "location_id": location_ids[i], "quantity": 1} for i in range(20)
+            ], operator_id)
+        for location_id in location_ids[:20]:
+            bin_before[location_id] = bin_before.get(location_id, 0) + 1
+        onhand_before, sorted_before = onhand_before + 20, sorted_before - 20
+
+        payload = [
+            {"goods_id": goods.id, "location_id": location_ids[i % len(location_ids)], "quantity": 1}
+            for i in range(2000)
+        ]
+        with capture_sql(logical=True) as large:
+            records = PutawayService.bulk_create_putaway_records(payload, operator_id)
+
+        assert len(large) == len(small)
+        assert len(records) == 2000
+        assert [record.location_id for record in records] == [item['location_id'] for item in payload]
+
+        per_location = {}
+        for item in payload:
+            per_location[item['location_id']] = per_location.get(item['location_id'], 0) + 1
+        for location_id, quantity in per_location.items():
+            assert GoodsLocationService.get_quantity(goods.id, location_id) == bin_before.get(location_id, 0) + quantity
+
+        inventory = get_inventory_by_goods_id_and_warehouse_id(goods.id, warehouse_id)
+        assert inventory.onhand_stock == onhand_before + 2000
+        assert inventory.sorted_stock == sorted_before - 2000
+
+
+def _seed_slotting_locations():
+    """新商品（10cm 立方体，每件 1000cm³）与三个带尺寸的 standard 库位，商品已有 2 件放在 SL3"""
+    admin_user = get_admin_user()
+    warehouse_id = get_location().warehouse_id
+    goods = Goods(code="GSLOT", company_id=get_company().id, name="Slotting Goods", unit="pcs",
+                  length=100, width=100, height=100, is_active=True, created_by=admin_user.id)
+    locations = [
+        Location(warehouse_id=warehouse_id, code=code, location_type=location_type,
+                 width=size, depth=size, height=size, created_by=admin_user.id)
+        for code, size, location_type in (
+            ("SL1", 50, "standard"), ("SL2", 20, "standard"), ("SL3", 30, "standard"), ("SLD", 100, "damaged"),
+        )
+    ]
+    db.session.add(goods)
+    db.session.add_all(locations)
+    db.session.flush()
+    db.session.add(GoodsLocation(goods_id=goods.id, location_id=locations[2].id, quantity=2))
+    db.session.commit()
+    return goods, locations, warehouse_id
+
+
+def test_suggest_locations_consolidates_then_best_fits(client, access_token):
+    """推荐库位：先放已有同商品的库位，余量放进剩余体积最小且放得下的库位；都放不下时先填最大的库位"""
+    from warehouse.putaway.services import PutawayService
+
+    with client.application.app_context():
+        goods, locations, warehouse_id = _seed_slotting_locations()
+        goods_id = goods.id
+        sl1, sl2, sl3 = (location.id for location in locations[:3])
+
+        result = PutawayService.suggest_locations(goods_id, warehouse_id, 200)
+        assert [(item['location_id'], item['quantity'], item['reason']) for item in result['suggestions']] == [
+            (sl3, 25, 'consolidate'), (sl1, 125, 'best_fit'), (sl2, 8, 'best_fit'),
+        ]
+        assert result['unassigned'] == 42
+
+        with pytest.raises(BadRequestException):
+            PutawayService.suggest_locations(goods_id, warehouse_id, 0)
+
+    response = client.get('/putaway/suggestions', query_string={
+        'goods_id': goods_id, 'warehouse_id': warehouse_id, 'quantity': 30,
+    }, headers={'Authorization': f'Bearer {access_token}'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['unit_volume'] == 1000
+    assert [(item['location_code'], item['quantity'], item['current_quantity']) for item in data['suggestions']] == [
+        ('SL3', 25, 2), ('SL2', 5, 0),
+    ]
+    assert data['suggestions'][0]['free_volume'] == 25000
+    assert data['unassigned'] == 0
+
+
+class _FakeCapacityRedis:
+    """测试用 Redis：实现容量索引用到的 Hash / Set / Sorted Set 命令（有序集合用 bisect 维护）"""
+
+    def __init__(self):
+        self.hashes, self.sets, self.strings = {}, {}, {}
+        self.zsets = {}  # key -> (members: {member: score}, ordered: [(score, member)])
+
+    def pipeline(self, transaction=True):
+        return _FakeCapacityPipeline(self)
+
+    def exists(self, key):
+        return int(key in self.hashes or key in self.sets or key in self.strings or key in self.zsets)
+
+    def delete(self, *keys):
+        for key in keys:
+            for store in (self.hashes, self.sets, self.strings, self.zsets):
+                store.pop(key, None)
+
+    def set(self, key, value, ex=None):
+        self.strings[key] = str(value)
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({str(k): str(v) for k, v in mapping.items()})
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hincrby(self, key, field, amount):
+        data = self.hashes.setdefault(key, {})
+        data[str(field)] = str(int(data.get(str(field), 0)) + amount)
+        return int(data[str(field)])
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(str(field), None)
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(str(member) for member in members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def zadd(self, key, mapping):
+        for member, score in mapping.items():
+            self._zset_score(key, str(member), float(score))
+
+    def zincrby(self, key, amount, member):
+        members, _ = self.zsets.setdefault(key, ({}, []))
+        score = members.get(str(member), 0.0) + amount
+        self._zset_score(key, str(member), score)
+        return score
+
+    def _zset_score(self, key, member, score):
+        import bisect
+        members, ordered = self.zsets.setdefault(key, ({}, []))
+        if member in members:
+            ordered.pop(bisect.bisect_left(ordered, (members[member], member)))
+        members[member] = score
+        bisect.insort(ordered, (score, member))
+
+    def zmscore(self, key, members):
+        scores = self.zsets.get(key, ({}, []))[0]
+        return [scores.get(str(member)) for member in members]
+
+    @staticmethod
+    def _bound(value):
+        if value == '+inf':
+            return float('inf'), False
+        if isinstance(value, str) and value.startswith('('):
+            return float(value[1:]), True
+        return float(value), False
+
+    def zrangebyscore(self, key, low, high, start=0, num=None, withscores=False):
+        import bisect
+        ordered = self.zsets.get(key, ({}, []))[1]
+        low, exclusive = self._bound(low)
+        index = bisect.bisect_right(ordered, (low, chr(0x10FFFF))) if exclusive else bisect.bisect_left(ordered, (low,))
+        return [(member, score) for score, member in ordered[index + start:index + start + num]]
+
+    def zrevrangebyscore(self, key, high, low, start=0, num=None, withscores=False):
+        import bisect
+        ordered = self.zsets.get(key, ({}, []))[1]
+        low, exclusive = self._bound(low)
+        index = bisect.bisect_right(ordered, (low, chr(0x10FFFF))) if exclusive else bisect.bisect_left(ordered, (low,))
+        end = len(ordered) - start
+        return [(member, score) for score, member in reversed(ordered[max(index, end - num):end])]
+
+
+class _FakeCapacityPipeline:
+    """测试用 Redis 管道：记录命令，execute 时依次执行并返回结果"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.commands.append((getattr(self.redis, name), args, kwargs))
+        return record
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+
+def test_capacity_index_is_updated_incrementally_after_commit(client, monkeypatch):
+    """启用 Redis 容量索引：首次查询全量构建，之后商品库位数量变更在提交后增量写入，回滚不写入"""
+    from warehouse.goods import capacity
+    from warehouse.goods.services import GoodsLocationService
+    from warehouse.putaway.services import PutawayService
+
+    fake = _FakeCapacityRedis()
+    monkeypatch.setattr(capacity, 'redis_client', fake)
+    with client.application.app_context():
+        client.application.config['PUTAWAY_CAPACITY_INDEX'] = True
+        goods, locations, warehouse_id = _seed_slotting_locations()
+        goods_id = goods.id
+        sl1, sl2, sl3 = (location.id for location in locations[:3])
+        free_key = capacity.FREE_KEY.format(warehouse_id=warehouse_id)
+        goods_key = capacity.GOODS_KEY.format(warehouse_id=warehouse_id, goods_id=goods_id)
+
+        result = PutawayService.suggest_locations(goods_id, warehouse_id, 30)
+        assert [(item['location_id'], item['quantity']) for item in result['suggestions']] == [(sl3, 25), (sl2, 5)]
+        # 只索引容量已知的 standard 库位
+        assert set(fake.zsets[free_key][0]) == {str(sl1), str(sl2), str(sl3)}
+        assert fake.hashes[goods_key] == {str(sl3): '2'}
+
+        # 上架 / 下架 / 移库都经由 apply_quantity_changes，提交后增量更新索引
+        GoodsLocationService.apply_quantity_changes({(goods_id, sl1): 100, (goods_id, sl3): -2})
+        db.session.commit()
+        assert fake.zsets[free_key][0][str(sl1)] == 25000
+        assert fake.zsets[free_key][0][str(sl3)] == 27000
+        assert fake.hashes[goods_key] == {str(sl1): '100'}
+
+        GoodsLocationService.add_quantity(goods_id, sl2, 5)
+        db.session.rollback()
+        assert fake.zsets[free_key][0][str(sl2)] == 8000
+
+        result = PutawayService.suggest_locations(goods_id, warehouse_id, 30)
+        assert [(item['location_id'], item['quantity'], item['reason']) for item in result['suggestions']] == [
+            (sl1, 25, 'consolidate'), (sl2, 5, 'best_fit'),
+        ]
+        client.application.config['PUTAWAY_CAPACITY_INDEX'] = False
+        assert PutawayService.suggest_locations(goods_id, warehouse_id, 30)['suggestions'] == result['suggestions']
+
+
+def test_capacity_index_follows_goods_location_crud_and_location_edits(client, monkeypatch):
+    """商品库位增删改增量写入索引；库位停用 / 尺寸变更使索引失效，下一次查询全量重建"""
+    from warehouse.goods import capacity
+    from warehouse.goods.services import GoodsLocationService
+    from warehouse.location.services import LocationService
+    from warehouse.putaway.services import PutawayService
+
+    fake = _FakeCapacityRedis()
+    monkeypatch.setattr(capacity, 'redis_client', fake)
+    with client.application.app_context():
+        client.application.config['PUTAWAY_CAPACITY_INDEX'] = True
+        try:
+            goods, locations, warehouse_id = _seed_slotting_locations()
+            goods_id = goods.id
+            sl1, sl2, sl3 = (location.id for location in locations[:3])
+            free_key = capacity.FREE_KEY.format(warehouse_id=warehouse_id)
+            goods_key = capacity.GOODS_KEY.format(warehouse_id=warehouse_id, goods_id=goods_id)
+            built_key = capacity.BUILT_KEY.format(warehouse_id=warehouse_id)
+            PutawayService.suggest_locations(goods_id, warehouse_id, 1)
+
+            record = GoodsLocationService.create_goods_location({'goods_id': goods_id, 'location_id': sl2, 'quantity': 3})
+            GoodsLocationService.update_goods_location(record.id, {'quantity': 8})
+            assert fake.zsets[free_key][0][str(sl2)] == 0
+            assert fake.hashes[goods_key] == {str(sl3): '2', str(sl2): '8'}
+            GoodsLocationService.delete_goods_location(record.id)
+            assert fake.zsets[free_key][0][str(sl2)] == 8000
+            assert fake.hashes[goods_key] == {str(sl3): '2'}
+
+            # 名称之类的无关字段不影响索引
+            LocationService.update_location(sl1, {'description': 'renamed'})
+            assert fake.exists(built_key)
+
+            LocationService.deactivate_location(sl1)
+            assert not fake.exists(built_key)
+            PutawayService.suggest_locations(goods_id, warehouse_id, 1)
+            assert set(fake.zsets[free_key][0]) == {str(sl2), str(sl3)}
+
+            LocationService.update_location(sl2, {'width': 10})
+            assert not fake.exists(built_key)
+            PutawayService.suggest_locations(goods_id, warehouse_id, 1)
+            assert fake.zsets[free_key][0][str(sl2)] == 4000
+        finally:
+            client.application.config['PUTAWAY_CAPACITY_INDEX'] = False
+
+
+def test_capacity_index_query_reads_few_members_with_50k_locations():
+    """5 万个库位的索引上，单次推荐只读取常量级的有序集合成员（按剩余体积做区间查询，不扫描全部库位）"""
+    import random
+    from warehouse.goods.capacity import RedisCapacityStore
+    from warehouse.putaway.slotting import suggest_bins
+
+    class CountingRedis(_FakeCapacityRedis):
+        read = 0
+
+        def zrangebyscore(self, *args, **kwargs):
+            rows = super().zrangebyscore(*args, **kwargs)
+            self.read += len(rows)
+            return rows
+
+        def zrevrangebyscore(self, *args, **kwargs):
+            rows = super().zrevrangebyscore(*args, **kwargs)
+            self.read += len(rows)
+            return rows
+
+    fake = CountingRedis()
+    rng = random.Random(50000)
+    fake.zadd('putaway:capacity:1:free', {location_id: rng.randint(0, 200000) for location_id in range(1, 50001)})
+    fake.hset('putaway:capacity:1:goods:7', mapping={location_id: 10 for location_id in rng.sample(range(1, 50001), 20)})
+
+    import warehouse.goods.capacity as capacity
+    original = capacity.redis_client
+    capacity.redis_client = fake
+    try:
+        store = RedisCapacityStore(1)
+        # 商品 7 已有库位，商品 8 没有，需要从有序集合中找空闲库位
+        for goods_id in (7, 8):
+            for quantity in (10, 500, 5000):
+                fake.read = 0
+                suggestions, unassigned = suggest_bins(store, goods_id, quantity, 1000.0, 5)
+                assert sum(item['quantity'] for item in suggestions) + unassigned == quantity
+                # 每次区间查询最多取 max_bins 个成员
+                assert fake.read <= 5 * 5
+    finally:
+        capacity.redis_client = original
\ No newline at end of file
@@ -200,4 +200,36 @@ def test_bulk_create_removal_records(client, access_token):
         assert record2['location_id'] == location.id
         assert record2['quantity'] == 5
         assert record2['reason'] == "expired"
-        assert record2['remark'] == "Bulk removal record 2"
\ No newline at end of file
+        assert record2['remark'] == "Bulk removal record 2"
+
+def test_bulk_removal_is_all_or_nothing(client):
+    """批量下架：逐行在内存中扣减校验，超出库位数量时整批回滚，成功时库存按商品一次同步"""
+    from extensions.error import BadRequestException
+    from warehouse.goods.services import GoodsLocationService
+    from warehouse.removal.services import RemovalService
+
+    with client.application.app_context():
+        goods = get_goods()
+        location = get_location()
+        operator = get_operator_user()
+        start = GoodsLocationService.get_quantity(goods.id, location.id)
+        onhand_before = get_inventory_by_goods_id_and_warehouse_id(goods.id, location.warehouse_id).onhand_stock
+        removal_count = RemovalRecord.query.count()
+
+        with pytest.raises(BadRequestException) as exc_info:
+            RemovalService.bulk_create_removal_records([
+                {"goods_id": goods.id, "location_id": location.id, "quantity": start - 1, "reason": "damaged"},
+                {"goods_id": goods.id, "location_id": location.id, "quantity": 2, "reason": "damaged"},
+            ], operator.id)
+        assert exc_info.value.biz_code == 15001
+        assert RemovalRecord.query.count() == removal_count
+        assert GoodsLocationService.get_quantity(goods.id, location.id) == start
+
+        RemovalService.bulk_create_removal_records([
+            {"goods_id": goods.id, "location_id": location.id, "quantity": start - 1, "reason": "damaged"},
+            {"goods_id": goods.id, "location_id": location.id, "quantity": 1, "reason": "expired"},
+        ], operator.id)
+        assert RemovalRecord.query.count() == removal_count + 2
+        assert GoodsLocationService.get_goods_location_record(goods.id, location.id) is None
+        inventory = get_inventory_by_goods_id_and_warehouse_id(goods.id, location.warehouse_id)
+        assert inventory.onhand_stock == onhand_before - start
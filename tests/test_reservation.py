@@ -0,0 +1,127 @@
+from extensions.error import BadRequestException
+from warehouse.reservation.models import InventoryReservation
+from warehouse.reservation.services import ReservationService
+from tasks.reservations import run_reservation_reaper
+from .helpers import *
+from datetime import datetime, timedelta
+
+
+def _locked_stock(goods_id, warehouse_id):
+    return Inventory.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id).first().locked_stock
+
+
+def test_create_and_release_reservation(client, access_token):
+    """创建预留锁定库存，按令牌释放后归还锁定量"""
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        headers = {'Authorization': f'Bearer {access_token}', 'X-Warehouse-ID': str(warehouse.id)}
+        locked_before = _locked_stock(goods.id, warehouse.id)
+
+        response = client.post('/reservation/', json={
+            'owner': 'cart-1',
+            'ttl_seconds': 600,
+            'items': [{'goods_id': goods.id, 'warehouse_id': warehouse.id, 'quantity': 2}],
+        }, headers=headers)
+        assert response.status_code == 201
+        token = response.json['token']
+        assert response.json['items'][0]['status'] == 'active'
+        assert _locked_stock(goods.id, warehouse.id) == locked_before + 2
+
+        response = client.delete(f'/reservation/{token}', headers=headers)
+        assert response.status_code == 200
+        assert response.json['items'][0]['status'] == 'released'
+        assert _locked_stock(goods.id, warehouse.id) == locked_before
+
+        with pytest.raises(BadRequestException) as exc_info:
+            ReservationService.consume_reservation(token)
+        assert exc_info.value.biz_code == 15022
+
+
+def test_reaper_releases_only_expired_reservations(client):
+    """回收任务分批释放已过期的预留，未过期及已释放的预留不受影响"""
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        locked_before = _locked_stock(goods.id, warehouse.id)
+        item = {'goods_id': goods.id, 'warehouse_id': warehouse.id, 'quantity': 1}
+
+        expired = [ReservationService.create_reservation([item], 'cart', 60)[0].token for _ in range(3)]
+        live = ReservationService.create_reservation([item], 'cart', 3600)[0].token
+        for line in InventoryReservation.query.filter(InventoryReservation.token.in_(expired)):
+            line.expires_at = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+        assert _locked_stock(goods.id, warehouse.id) == locked_before + 4
+
+        _, released = run_reservation_reaper(batch_size=2)
+        assert released == 3
+        assert {line.status for line in InventoryReservation.query.filter(
+            InventoryReservation.token.in_(expired))} == {'expired'}
+        assert ReservationService.get_reservation(live)[0].status == 'active'
+        assert _locked_stock(goods.id, warehouse.id) == locked_before + 1
+
+        assert ReservationService.reap_expired_reservations() == 0
+
+
+def test_reservation_cannot_lock_already_locked_or_dn_reserved_stock(client):
+    """预留只能锁定可售库存：已锁定和 DN 预扣的数量不能再次锁定"""
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        goods = get_goods()
+        inventory = Inventory.query.filter_by(goods_id=goods.id, warehouse_id=warehouse.id).first()
+        inventory.locked_stock = inventory.onhand_stock - 10
+        inventory.dn_stock = 6
+        db.session.commit()
+
+        with pytest.raises(BadRequestException) as exc_info:
+            ReservationService.create_reservation(
+                [{'goods_id': goods.id, 'warehouse_id': warehouse.id, 'quantity': 5}], 'cart', 60
+            )
+        assert exc_info.value.biz_code == 15003
+        assert _locked_stock(goods.id, warehouse.id) == inventory.onhand_stock - 10
+
+        # 同一批次中前面的行已锁定的数量也计入
+        with pytest.raises(BadRequestException):
+            ReservationService.create_reservation([
+                {'goods_id': goods.id, 'warehouse_id': warehouse.id, 'quantity': 3},
+                {'goods_id': goods.id, 'warehouse_id': warehouse.id, 'quantity': 2},
+            ], 'cart', 60)
+        ReservationService.create_reservation(
+            [{'goods_id': goods.id, 'warehouse_id': warehouse.id, 'quantity': 4}], 'cart', 60
+        )
+        assert _locked_stock(goods.id, warehouse.id) == inventory.onhand_stock - 6
+
+
+def test_reaper_orphans_lines_whose_inventory_was_deleted(client):
+    """库存记录已删除的过期预留标记为 orphaned，不阻塞同批其他预留的回收；流水按预留明细记录来源"""
+    from warehouse.inventory.models import InventoryLedger
+
+    with client.application.app_context():
+        warehouse = get_warehouse()
+        first, second = Inventory.query.filter_by(warehouse_id=warehouse.id).order_by(Inventory.goods_id).limit(2)
+        for inventory in (first, second):
+            inventory.locked_stock = 0
+            inventory.dn_stock = 0
+        db.session.commit()
+        keys = [(first.goods_id, warehouse.id), (second.goods_id, warehouse.id)]
+
+        orphan = ReservationService.create_reservation(
+            [{'goods_id': keys[0][0], 'warehouse_id': warehouse.id, 'quantity': 1}], 'cart', 60)[0]
+        kept = ReservationService.create_reservation(
+            [{'goods_id': keys[1][0], 'warehouse_id': warehouse.id, 'quantity': 2}], 'cart', 60)[0]
+        orphan_id, kept_id = orphan.id, kept.id
+        assert InventoryLedger.query.filter_by(
+            source_type='reservation', source_id=kept_id, bucket='locked_stock').one().delta == 2
+
+        orphan.expires_at = datetime.now() - timedelta(seconds=2)
+        kept.expires_at = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+        InventoryService.delete_inventory(*keys[0])
+
+        assert ReservationService.reap_expired_reservations(batch_size=2) == 2
+        assert db.session.get(InventoryReservation, orphan_id).status == 'orphaned'
+        assert db.session.get(InventoryReservation, kept_id).status == 'expired'
+        assert _locked_stock(*keys[1]) == 0
+        assert [row.delta for row in InventoryLedger.query.filter_by(
+            source_type='reservation', source_id=kept_id, bucket='locked_stock'
+        ).order_by(InventoryLedger.id)] == [2, -2]
@@ -661,3 +661,35 @@ def test_delete_batch(client, access_token):
     with client.application.app_context():
         deleted_batch = get_sorting_batch_by_id(batch_id)
         assert deleted_batch is None
+
+
+def test_create_batch_inserts_details_in_one_statement(client, access_token, capture_sql):
+    """批次明细以一条多行 INSERT 写入，语句数不随行数增长；默认只返回批次本身，expand=details 时附带明细"""
+
+    with client.application.app_context():
+        operator = get_operator_user()
+        task = get_sorting_task()
+        SortingTaskService.process_task(task.id, operator_id=operator.id)
+        task_id, operator_id = task.id, operator.id
+
+        def create_batch(count):
+            db.session.expire_all()
+            with capture_sql() as statements:
+                batch = SortingTaskService.create_batch(task_id, {"details": [
+                    {"goods_id": 1, "sorted_quantity": 1, "damage_quantity": 0} for _ in range(count)
+                ]}, operator_id)
+            assert len(batch.details) == count
+            return statements
+
+        small = create_batch(5)
+        large = create_batch(300)
+        assert len(large) == len(small)
+        assert len([s for s in large if s.lstrip().upper().startswith("INSERT INTO SORTING_TASK_DETAILS")]) == 1
+
+    headers = {'Authorization': f'Bearer {access_token}'}
+    request_json = {"details": [{"goods_id": 1, "sorted_quantity": 2}, {"goods_id": 2, "sorted_quantity": 3}]}
+    data = client.post(f'/sorting/{task_id}/batches/', headers=headers, json=request_json).get_json()
+    assert 'details' not in data
+    response = client.post(f'/sorting/{task_id}/batches/?expand=details', headers=headers, json=request_json)
+    assert response.status_code == 201
+    assert sorted((detail['goods_id'], detail['sorted_quantity']) for detail in response.get_json()['details']) == [(1, 2), (2, 3)]
@@ -107,4 +107,67 @@ def test_bulk_create_transfer_record(client, access_token):
         record2 = data[1]
         assert record2['goods_id'] == goods.id
         assert record2['quantity'] == 15
-        assert record2['remark'] == "Bulk record 2"
\ No newline at end of file
+        assert record2['remark'] == "Bulk record 2"
+
+def test_bulk_transfer_is_sequential_and_all_or_nothing(client):
+    """批量移库：按请求顺序在内存中移动（前面移入的数量可被后面移出），任一行失败整批不生效"""
+    from extensions.error import BadRequestException
+    from warehouse.goods.services import GoodsLocationService
+    from warehouse.transfer.services import TransferService
+
+    with client.application.app_context():
+        goods = get_goods()
+        loc1, loc2, loc3 = get_location_by_id(1), get_location_by_id(2), get_location_by_id(3)
+        operator = get_operator_user()
+        start = GoodsLocationService.get_quantity(goods.id, loc1.id)
+        assert GoodsLocationService.get_quantity(goods.id, loc2.id) == 0
+        onhand_before = get_inventory_by_goods_id_and_warehouse_id(goods.id, loc1.warehouse_id).onhand_stock
+
+        records = TransferService.bulk_create_transfer_records([
+            {"goods_id": goods.id, "from_location_id": loc1.id, "to_location_id": loc2.id, "quantity": start - 40},
+            {"goods_id": goods.id, "from_location_id": loc2.id, "to_location_id": loc3.id, "quantity": start - 50},
+            {"goods_id": goods.id, "from_location_id": loc1.id, "to_location_id": loc3.id, "quantity": 40},
+        ], operator.id)
+        assert [record.quantity for record in records] == [start - 40, start - 50, 40]
+        assert GoodsLocationService.get_goods_location_record(goods.id, loc1.id) is None
+        assert GoodsLocationService.get_quantity(goods.id, loc2.id) == 10
+        assert GoodsLocationService.get_quantity(goods.id, loc3.id) == start - 10
+        assert get_inventory_by_goods_id_and_warehouse_id(goods.id, loc1.warehouse_id).onhand_stock == onhand_before
+
+        transfer_count = TransferRecord.query.count()
+        with pytest.raises(BadRequestException) as exc_info:
+            TransferService.bulk_create_transfer_records([
+                {"goods_id": goods.id, "from_location_id": loc2.id, "to_location_id": loc1.id, "quantity": 5},
+                {"goods_id": goods.id, "from_location_id": loc2.id, "to_location_id": loc3.id, "quantity": 10},
+            ], operator.id)
+        assert exc_info.value.biz_code == 15001
+        assert TransferRecord.query.count() == transfer_count
+        assert GoodsLocationService.get_goods_location_record(goods.id, loc1.id) is None
+        assert GoodsLocationService.get_quantity(goods.id, loc2.id) == 10
+
+
+def test_bulk_transfer_endpoint_allows_chained_moves_and_rejects_unknown_locations(client, access_token):
+    """批量移库接口：后面的行可移出前面的行刚移入的库存；引用不存在的库位返回 13001"""
+    from extensions.error import NotFoundException
+    from warehouse.goods.services import GoodsLocationService
+    from warehouse.transfer.services import TransferService
+
+    with client.application.app_context():
+        goods_id = get_goods().id
+        loc1, loc2, loc3 = (get_location_by_id(location_id).id for location_id in (1, 2, 3))
+        operator_id = get_operator_user().id
+        assert GoodsLocationService.get_quantity(goods_id, loc2) == 0
+
+    response = client.post('/transfer/bulk', headers={'Authorization': f'Bearer {access_token}'}, json=[
+        {"goods_id": goods_id, "from_location_id": loc1, "to_location_id": loc2, "quantity": 5},
+        {"goods_id": goods_id, "from_location_id": loc2, "to_location_id": loc3, "quantity": 5},
+    ])
+    assert response.status_code == 201
+    assert [record['quantity'] for record in response.get_json()] == [5, 5]
+
+    with client.application.app_context():
+        with pytest.raises(NotFoundException) as exc_info:
+            TransferService.bulk_create_transfer_records([
+                {"goods_id": goods_id, "from_location_id": loc1, "to_location_id": 999999, "quantity": 1},
+            ], operator_id)
+        assert exc_info.value.biz_code == 13001
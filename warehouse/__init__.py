@@ -22,6 +22,7 @@ from .cyclecount.schemas import api_ns as cyclecount_ns
 from .adjustment.schemas import api_ns as adjustment_ns
 from .transfer.schemas import api_ns as transfer_ns
 from .payment.schemas import api_ns as payment_ns
+from .reservation.schemas import api_ns as reservation_ns
 
 blueprint = Blueprint('warehouse_api', __name__)
 api = Api(
@@ -66,4 +67,5 @@ api.add_namespace(delivery_ns, path='/delivery')
 api.add_namespace(cyclecount_ns, path='/cyclecount')
 api.add_namespace(adjustment_ns, path='/adjustment')
 api.add_namespace(transfer_ns, path='/transfer')
-api.add_namespace(payment_ns, path='/payment')
\ No newline at end of file
+api.add_namespace(payment_ns, path='/payment')
+api.add_namespace(reservation_ns, path='/reservation')
\ No newline at end of file
@@ -275,22 +275,19 @@ class AdjustmentService:
 
         # 修改库位信息
         for detail in adjustment.details:
-            goods_location_record = GoodsLocationService.get_goods_location_record(detail.goods_id, detail.location_id)
-            if goods_location_record is None:
+            if not GoodsLocationService.is_goods_in_location(detail.goods_id, detail.location_id):
                 raise NotFoundException(f"GoodsLocation not found for goods_id={detail.goods_id} and location_id={detail.location_id}", 13003)
-            goods_location_record.quantity += detail.adjustment_quantity
-            
-            if goods_location_record.quantity < 0:
+            if detail.adjustment_quantity >= 0:
+                GoodsLocationService.add_quantity(detail.goods_id, detail.location_id, detail.adjustment_quantity)
+            elif not GoodsLocationService.deduct_quantity(detail.goods_id, detail.location_id, -detail.adjustment_quantity):
+                # 带条件的原子扣减，数量不足时不修改；扣减到 0 时删除商品库位记录
                 raise BadRequestException(f"Insufficient stock for goods_id={detail.goods_id} in location_id={detail.location_id}", 15002)
-            elif goods_location_record.quantity == 0:
-                db.session.delete(goods_location_record)
-            else:
-                db.session.add(goods_location_record)
-            db.session.flush()
 
         # 更新库存
-        for detail in adjustment.details:
-            InventoryService.update_and_calculate_stock(detail.goods_id, adjustment.warehouse_id)
+        InventoryService.bulk_location_stock_changed(
+            [(detail.goods_id, detail.location, detail.adjustment_quantity) for detail in adjustment.details],
+            source=('adjustment', adjustment.id),
+        )
 
         return adjustment
 
@@ -153,6 +153,26 @@ asn_input_model = api_ns.inherit('ASNInput', asn_input_base_model, {
     'details': fields.List(fields.Nested(asn_detail_input_model), description='List of ASN details')
 })
 
+# 批量到货 / 完成（逐单成功 / 失败）
+asn_bulk_input_model = api_ns.model('ASNBulkInput', {
+    'asn_ids': fields.List(fields.Integer, required=True, description='IDs of the ASNs to process'),
+})
+
+asn_bulk_result_model = api_ns.model('ASNBulkResult', {
+    'index': fields.Integer(description='Position of the ASN in the request'),
+    'asn_id': fields.Integer(description='ASN ID'),
+    'success': fields.Boolean(description='Whether the ASN was processed'),
+    'status': fields.String(description='New status of the ASN', enum=ASN.ASN_STATUSES),
+    'error_code': fields.Integer(description='Business error code when the ASN was rejected'),
+    'error_message': fields.String(description='Error message when the ASN was rejected'),
+})
+
+asn_bulk_response_model = api_ns.model('ASNBulkResponse', {
+    'succeeded': fields.Integer(description='Number of ASNs processed'),
+    'failed': fields.Integer(description='Number of ASNs rejected'),
+    'results': fields.List(fields.Nested(asn_bulk_result_model), description='Per-ASN results in request order'),
+})
+
 # -----------------------------
 # 分页解析器 & 分页模型
 # -----------------------------
@@ -2,12 +2,14 @@ from datetime import datetime, timedelta
 from extensions.db import *
 from extensions.error import BadRequestException, NotFoundException
 from extensions.transaction import transactional
+from warehouse.inventory.locks import lock_inventories
 from warehouse.inventory.services import InventoryService
 from warehouse.goods.services import GoodsService
-from system.webhook.services import emit as webhook_emit
+from system.webhook.services import emit as webhook_emit, emit_many as webhook_emit_many
 from .models import ASN, ASNDetail
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import and_, func, case, extract
+from sqlalchemy import and_, func, case, extract, update
+from sqlalchemy.orm import selectinload
 class ASNService:
     """
     A service class that encapsulates various operations
@@ -63,39 +65,143 @@ class ASNService:
         更新 ASNDetail 的实际数量并计算已分拣数量。
         参数可以是 ASN 的 ID（int）或 ASN 实例。
         如果找不到 ASN，则抛出 NotFound 异常。
+        已分拣 / 损坏数量用一条按商品分组的汇总查询，有变化的明细一次按主键批量更新，查询数与明细行数无关。
         """
-        
-        from warehouse.sorting.models import SortingTask, SortingTaskDetail
         asn = ASNService._get_instance(asn_or_id)
+        if ASNService._recalculate_details([asn.id]):
+            db.session.expire(asn, ['details'])
+        # db.session.commit()
+
+        return asn
+
+    @staticmethod
+    def _recalculate_details(asn_ids: list) -> bool:
+        """
+        按已完成的分拣任务重算多张 ASN 的明细数量
+        :param asn_ids: ASN ID 列表
+        :return: 是否有明细被更新
+
+        已分拣 / 损坏数量按 (ASN, 商品) 一次分组汇总，有变化的明细一次按主键批量更新；
+        会话中已加载的明细随之失效。
+        """
+        from warehouse.sorting.models import SortingTask, SortingTaskDetail
 
-        for asn_detail in asn.details:
-            # 查询与该 ASN 关联、且属于当前商品（goods_id）的已完成的 SortingTaskDetail
-            st_details = (
-                db.session.query(SortingTaskDetail)
+        sorted_by_goods = {
+            (asn_id, goods_id): (sorted_quantity or 0, damage_quantity or 0)
+            for asn_id, goods_id, sorted_quantity, damage_quantity in (
+                db.session.query(
+                    SortingTask.asn_id,
+                    SortingTaskDetail.goods_id,
+                    func.sum(SortingTaskDetail.sorted_quantity),
+                    func.sum(SortingTaskDetail.damage_quantity),
+                )
                 .join(SortingTask)
                 .filter(
-                    SortingTask.asn_id == asn.id,
-                    SortingTaskDetail.goods_id == asn_detail.goods_id,
+                    SortingTask.asn_id.in_(asn_ids),
                     SortingTask.is_active == True,
                     SortingTask.status == 'completed'
                 )
+                .group_by(SortingTask.asn_id, SortingTaskDetail.goods_id)
                 .all()
             )
+        }
 
-            # 计算已分拣数量和损坏数量
-            sorted_quantity = sum(detail.sorted_quantity for detail in st_details)
-            damage_quantity = sum(detail.damage_quantity for detail in st_details)
+        updates = []
+        details = (
+            db.session.query(
+                ASNDetail.id, ASNDetail.asn_id, ASNDetail.goods_id,
+                ASNDetail.sorted_quantity, ASNDetail.damage_quantity, ASNDetail.actual_quantity,
+            )
+            .filter(ASNDetail.asn_id.in_(asn_ids))
+            .all()
+        )
+        for detail_id, asn_id, goods_id, *current in details:
+            sorted_quantity, damage_quantity = sorted_by_goods.get((asn_id, goods_id), (0, 0))
+            actual_quantity = sorted_quantity + damage_quantity
+            if current == [sorted_quantity, damage_quantity, actual_quantity]:
+                continue
+            updates.append({
+                'id': detail_id,
+                'sorted_quantity': sorted_quantity,
+                'damage_quantity': damage_quantity,
+                'actual_quantity': actual_quantity,
+            })
+        if not updates:
+            return False
+
+        # 按主键批量 UPDATE 绕过了 ORM：使会话中已加载的明细失效
+        db.session.execute(update(ASNDetail), updates)
+        for row in updates:
+            detail = db.session.identity_map.get(db.session.identity_key(ASNDetail, row['id']))
+            if detail is not None:
+                db.session.expire(detail)
+        return True
 
-            # 更新 ASNDetail 的统计值
-            asn_detail.sorted_quantity = sorted_quantity
-            asn_detail.damage_quantity = damage_quantity
-            asn_detail.actual_quantity = sorted_quantity + damage_quantity
+    @staticmethod
+    def _received_webhook_payload(asn: ASN) -> dict:
+        """asn.received 事件数据"""
+        return {
+            'asn_id': asn.id, 'status': 'received', 'order_number': getattr(asn, 'order_number', None),
+            'details': [{'goods_code': d.goods.code if d.goods else None,
+                         'quantity': d.quantity} for d in asn.details],
+        }
 
-        db.session.add_all(asn.details)
-        db.session.flush()
-        # db.session.commit()
+    @staticmethod
+    def _completed_webhook_payload(asn: ASN) -> dict:
+        """asn.completed 事件数据"""
+        return {
+            'asn_id': asn.id, 'status': 'completed', 'order_number': asn.order_number,
+            'details': [{'goods_code': d.goods.code if d.goods else None,
+                         'actual_quantity': d.actual_quantity,
+                         'quantity': d.quantity,
+                         'sorted_quantity': d.sorted_quantity,
+                         'damage_quantity': d.damage_quantity,
+                         # weight/volume 为该明细行的合计值（kg / m³），
+                         # 入库分拣时在 WMS 称量录入，是重量数据的唯一来源，
+                         # 由订阅方（Wholesale）换算回填其商品主数据
+                         'weight': d.weight,
+                         'volume': d.volume} for d in asn.details],
+        }
 
-        return asn
+    @staticmethod
+    def _load_for_bulk(asn_ids: list, results: list, can_access=None) -> dict:
+        """
+        批量操作的公共前置：一次查询加载 ASN 及明细，记录不存在 / 无权访问的 ASN
+        :return: dict，{asn_id: ASN}，只包含存在且可访问的 ASN
+        """
+        asns = {
+            asn.id: asn for asn in ASN.query.options(selectinload(ASN.details)).filter(ASN.id.in_(asn_ids))
+        }
+        for result in results:
+            if result['error_code']:
+                continue
+            asn = asns.get(result['asn_id'])
+            if asn is None:
+                result.update(error_code=13001, error_message=f"ASN {result['asn_id']} not found")
+            elif can_access is not None and not can_access(asn.warehouse_id):
+                result.update(error_code=12001, error_message="You do not have access to this ASN")
+                del asns[asn.id]
+        return asns
+
+    @staticmethod
+    def _bulk_results(asn_ids: list) -> list:
+        """批量操作的逐单结果（重复的 ASN ID 只处理第一次出现）"""
+        results = []
+        seen = set()
+        for index, asn_id in enumerate(asn_ids):
+            result = {
+                'index': index,
+                'asn_id': asn_id,
+                'success': False,
+                'status': None,
+                'error_code': None,
+                'error_message': None,
+            }
+            if asn_id in seen:
+                result.update(error_code=16043, error_message="Duplicate ASN in request")
+            seen.add(asn_id)
+            results.append(result)
+        return results
 
     # --------------------------------------
     # ASNService 公共方法
@@ -245,7 +351,7 @@ class ASNService:
                 db.session.flush()
             
             # 重新计算库存
-            InventoryService.update_and_calculate_asn_stock(new_detail.goods_id, new_asn.warehouse_id)
+            InventoryService.mark_stock_dirty(new_detail.goods_id, new_asn.warehouse_id, 'asn', source=('asn', new_asn.id))
 
         # db.session.commit()
         return new_asn
@@ -297,10 +403,11 @@ class ASNService:
         
         goods_ids = [detail.goods_id for detail in asn.details]
         warehouse_id = asn.warehouse_id
+        asn_id = asn.id
         db.session.delete(asn)
         db.session.flush()
         for goods_id in goods_ids:
-            InventoryService.update_and_calculate_asn_stock(goods_id, warehouse_id)
+            InventoryService.mark_stock_dirty(goods_id, warehouse_id, 'asn', source=('asn', asn_id))
 
         # db.session.commit()
 
@@ -316,7 +423,7 @@ class ASNService:
         db.session.flush()
 
         for detail in asn.details:
-            InventoryService.update_and_calculate_asn_stock(detail.goods_id, asn.warehouse_id)
+            InventoryService.mark_stock_dirty(detail.goods_id, asn.warehouse_id, 'asn', source=('asn', asn.id))
             
         # db.session.commit()
         return asn
@@ -383,7 +490,7 @@ class ASNService:
             InventoryService.create_inventory({"goods_id": new_detail.goods_id, "warehouse_id": asn.warehouse_id})
             db.session.flush()
 
-        InventoryService.update_and_calculate_asn_stock(new_detail.goods_id, asn.warehouse_id)
+        InventoryService.mark_stock_dirty(new_detail.goods_id, asn.warehouse_id, 'asn', source=('asn', asn.id))
         # db.session.commit()
         return new_detail
 
@@ -410,7 +517,7 @@ class ASNService:
 
         db.session.add(detail)
         db.session.flush()
-        InventoryService.update_and_calculate_asn_stock(detail.goods_id, asn.warehouse_id)
+        InventoryService.mark_stock_dirty(detail.goods_id, asn.warehouse_id, 'asn', source=('asn', asn.id))
 
         # db.session.commit()
         return detail
@@ -493,7 +600,7 @@ class ASNService:
                 InventoryService.create_inventory({"goods_id": detail.goods_id, "warehouse_id": asn.warehouse_id})
                 db.session.flush()
 
-            InventoryService.update_and_calculate_asn_stock(detail.goods_id, asn.warehouse_id)
+            InventoryService.mark_stock_dirty(detail.goods_id, asn.warehouse_id, 'asn', source=('asn', asn.id))
         
         # 更新被删除明细的库存状态
         for goods_id in deleted_goods_ids:
@@ -503,7 +610,7 @@ class ASNService:
                 InventoryService.create_inventory({"goods_id": goods_id, "warehouse_id": asn.warehouse_id})
                 db.session.flush()
 
-            InventoryService.update_and_calculate_asn_stock(goods_id, asn.warehouse_id)
+            InventoryService.mark_stock_dirty(goods_id, asn.warehouse_id, 'asn', source=('asn', asn.id))
 
         return asn.details
     
@@ -524,7 +631,7 @@ class ASNService:
         db.session.delete(detail)
         db.session.flush()
 
-        InventoryService.update_and_calculate_asn_stock(goods_id, asn.warehouse_id)
+        InventoryService.mark_stock_dirty(goods_id, asn.warehouse_id, 'asn', source=('asn', asn.id))
 
         # db.session.commit()
 
@@ -545,19 +652,17 @@ class ASNService:
 
         asn = ASNService._update_asn_status(asn, "received")
 
-        # 更新库存信息
-        for detail in asn.details:
-            InventoryService.asn_received(detail.goods_id, asn.warehouse_id, detail.quantity)        
+        # 更新库存信息（整单一次批量加锁与更新）
+        InventoryService.bulk_asn_received(
+            [(detail.goods_id, asn.warehouse_id, detail.quantity) for detail in asn.details],
+            source=('asn', asn.id),
+        )
 
         # 自动创建分拣任务
         from warehouse.sorting.services import SortingTaskService
         SortingTaskService.create_sorting_task_from_asn(asn.id)
 
-        webhook_emit('asn.received', {
-            'asn_id': asn.id, 'status': 'received', 'order_number': getattr(asn, 'order_number', None),
-            'details': [{'goods_code': d.goods.code if d.goods else None,
-                         'quantity': d.quantity} for d in asn.details],
-        }, api_key_id=asn.api_key_id)
+        webhook_emit('asn.received', ASNService._received_webhook_payload(asn), api_key_id=asn.api_key_id)
 
         return asn
 
@@ -579,26 +684,169 @@ class ASNService:
         asn = ASNService._update_asn_status(asn, "completed")
         ASNService._update_and_calculate_quantity(asn_or_id)
 
-        # 更新库存信息
-        for detail in asn.details:
-            InventoryService.asn_completed(detail.goods_id, asn.warehouse_id, detail.quantity,detail.actual_quantity)
+        # 更新库存信息（整单一次批量加锁与更新）
+        InventoryService.bulk_asn_completed(
+            [(detail.goods_id, asn.warehouse_id, detail.quantity, detail.actual_quantity)
+             for detail in asn.details],
+            source=('asn', asn.id),
+        )
 
-        webhook_emit('asn.completed', {
-            'asn_id': asn.id, 'status': 'completed', 'order_number': asn.order_number,
-            'details': [{'goods_code': d.goods.code if d.goods else None,
-                         'actual_quantity': d.actual_quantity,
-                         'quantity': d.quantity,
-                         'sorted_quantity': d.sorted_quantity,
-                         'damage_quantity': d.damage_quantity,
-                         # weight/volume 为该明细行的合计值（kg / m³），
-                         # 入库分拣时在 WMS 称量录入，是重量数据的唯一来源，
-                         # 由订阅方（Wholesale）换算回填其商品主数据
-                         'weight': d.weight,
-                         'volume': d.volume} for d in asn.details],
-        }, api_key_id=asn.api_key_id)
+        webhook_emit('asn.completed', ASNService._completed_webhook_payload(asn), api_key_id=asn.api_key_id)
 
         return asn
 
+    @staticmethod
+    @transactional
+    def bulk_receive_asns(asn_ids: list, can_access=None) -> list:
+        """
+        整车到货：一次确认多张 ASN（逐单成功 / 失败，失败的 ASN 不影响其他 ASN）
+        :param asn_ids: ASN ID 列表
+        :param can_access: 可选回调 can_access(warehouse_id)，返回 False 的 ASN 视为无权访问
+        :return: list[dict]，与 asn_ids 顺序一致：{index, asn_id, success, status, error_code, error_message}
+
+        ASN 与明细一次加载；涉及的库存按 (仓库, 商品) 一次按固定顺序锁定，
+        按提交顺序在内存中逐单校验 ASN 库存（不足的 ASN 不占用额度）；
+        通过的 ASN 合并为一批库存变更（流水仍按 ASN 记录来源），
+        分拣任务与 Webhook 事件各以一条多行 INSERT 写入。
+        """
+        results = ASNService._bulk_results(asn_ids)
+        asns = ASNService._load_for_bulk(asn_ids, results, can_access)
+
+        candidates = []
+        for result in results:
+            asn = asns.get(result['asn_id'])
+            if asn is None or result['error_code']:
+                continue
+            if asn.status != 'pending':
+                result.update(error_code=16021, error_message="Cannot receive a non-pending ASN")
+            elif not asn.details:
+                result.update(error_code=16016, error_message="ASN has no details to create a Sorting Task.")
+            else:
+                candidates.append((result, asn))
+
+        # 先重算本事务内已标记的 ASN 库存，再一次锁定全部库存行，按提交顺序逐单扣减额度
+        keys = {(detail.goods_id, asn.warehouse_id) for _, asn in candidates for detail in asn.details}
+        InventoryService.flush_dirty_stock(keys, ['asn'])
+        inventories = lock_inventories(keys, missing_ok=True)
+        remaining = {key: inventory.asn_stock or 0 for key, inventory in inventories.items()}
+
+        accepted = []
+        for result, asn in candidates:
+            demand = {}
+            for detail in asn.details:
+                key = (detail.goods_id, asn.warehouse_id)
+                demand[key] = demand.get(key, 0) + detail.quantity
+            missing = next((key for key in demand if key not in remaining), None)
+            if missing is not None:
+                result.update(
+                    error_code=43001,
+                    error_message=f"Inventory not found for goods {missing[0]} in warehouse {missing[1]}",
+                )
+                continue
+            if any(remaining[key] < quantity for key, quantity in demand.items()):
+                result.update(error_code=15005, error_message="Not enough ASN stock.")
+                continue
+            for key, quantity in demand.items():
+                remaining[key] -= quantity
+            accepted.append(asn)
+            result.update(success=True, status='received')
+
+        if not accepted:
+            return results
+
+        items, sources = [], []
+        for asn in accepted:
+            for detail in asn.details:
+                items.append((detail.goods_id, asn.warehouse_id, detail.quantity))
+                sources.append(('asn', asn.id))
+        InventoryService.bulk_asn_received(items, sources=sources)
+
+        now = datetime.now()
+        for asn in accepted:
+            asn.status = 'received'
+            asn.received_at = now
+            asn.updated_at = now
+        db.session.flush()
+
+        from warehouse.sorting.services import SortingTaskService
+        SortingTaskService.create_sorting_tasks_from_asns(accepted)
+
+        webhook_emit_many(
+            ('asn.received', ASNService._received_webhook_payload(asn), asn.api_key_id) for asn in accepted
+        )
+        # db.session.commit()
+        return results
+
+    @staticmethod
+    @transactional
+    def bulk_complete_asns(asn_ids: list, can_access=None) -> list:
+        """
+        一次完成多张已到货的 ASN（逐单成功 / 失败，失败的 ASN 不影响其他 ASN）
+        :param asn_ids: ASN ID 列表
+        :param can_access: 可选回调 can_access(warehouse_id)，返回 False 的 ASN 视为无权访问
+        :return: list[dict]，与 asn_ids 顺序一致：{index, asn_id, success, status, error_code, error_message}
+
+        明细数量按 (ASN, 商品) 一次分组重算，通过的 ASN 合并为一批库存变更（流水仍按 ASN 记录来源），
+        Webhook 事件一次多行 INSERT 写入。
+        """
+        results = ASNService._bulk_results(asn_ids)
+        asns = ASNService._load_for_bulk(asn_ids, results, can_access)
+
+        candidates = []
+        for result in results:
+            asn = asns.get(result['asn_id'])
+            if asn is None or result['error_code']:
+                continue
+            if asn.status != 'received':
+                result.update(error_code=16022, error_message="Cannot complete a non-received ASN")
+            else:
+                candidates.append((result, asn))
+
+        keys = {(detail.goods_id, asn.warehouse_id) for _, asn in candidates for detail in asn.details}
+        inventories = lock_inventories(keys, missing_ok=True)
+        accepted = []
+        for result, asn in candidates:
+            missing = next(
+                (detail.goods_id for detail in asn.details if (detail.goods_id, asn.warehouse_id) not in inventories),
+                None,
+            )
+            if missing is not None:
+                result.update(
+                    error_code=43001,
+                    error_message=f"Inventory not found for goods {missing} in warehouse {asn.warehouse_id}",
+                )
+                continue
+            accepted.append(asn)
+            result.update(success=True, status='completed')
+
+        if not accepted:
+            return results
+
+        now = datetime.now()
+        for asn in accepted:
+            asn.status = 'completed'
+            asn.completed_at = now
+            asn.updated_at = now
+        db.session.flush()
+
+        accepted_ids = [asn.id for asn in accepted]
+        if ASNService._recalculate_details(accepted_ids):
+            # 一次重新加载全部明细，避免逐单访问 asn.details 时各自查询
+            ASN.query.options(selectinload(ASN.details)).populate_existing().filter(ASN.id.in_(accepted_ids)).all()
+
+        items, sources = [], []
+        for asn in accepted:
+            for detail in asn.details:
+                items.append((detail.goods_id, asn.warehouse_id, detail.quantity, detail.actual_quantity))
+                sources.append(('asn', asn.id))
+        InventoryService.bulk_asn_completed(items, sources=sources)
+
+        webhook_emit_many(
+            ('asn.completed', ASNService._completed_webhook_payload(asn), asn.api_key_id) for asn in accepted
+        )
+        # db.session.commit()
+        return results
+
     @staticmethod
     @transactional
     def close_asn(asn_or_id: int | ASN):
@@ -617,7 +865,7 @@ class ASNService:
 
         # 更新库存信息
         for detail in asn.details:
-            InventoryService.update_and_calculate_asn_stock(detail.goods_id, asn.warehouse_id)
+            InventoryService.mark_stock_dirty(detail.goods_id, asn.warehouse_id, 'asn', source=('asn', asn.id))
     
         return asn
     
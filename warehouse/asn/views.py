@@ -2,7 +2,7 @@ from flask import g
 from werkzeug.exceptions import NotFound
 from flask_restx import Resource,abort
 from extensions import cache
-from extensions.error import ForbiddenException
+from extensions.error import BadRequestException, ForbiddenException
 from system.common import permission_required,paginate
 from system.third_party.utils import get_api_key_company_id
 from warehouse.common import warehouse_required,check_warehouse_access,add_warehouse_filter
@@ -12,6 +12,8 @@ from .schemas import (
     asn_detail_model,
     asn_input_model,
     asn_input_base_model,
+    asn_bulk_input_model,
+    asn_bulk_response_model,
     asn_detail_input_model,
     asn_pagination_parser,
     asn_pagination_model,
@@ -141,6 +143,61 @@ class ASNReceiveResource(Resource):
         return updated_asn, 200
 
 
+def _bulk_asn_ids():
+    """批量接口的请求体：{"asn_ids": [...]}"""
+    asn_ids = (api_ns.payload or {}).get('asn_ids')
+    if not isinstance(asn_ids, list) or not all(isinstance(asn_id, int) for asn_id in asn_ids):
+        raise BadRequestException("asn_ids must be a list of ASN IDs", 16044)
+    return asn_ids
+
+
+def _bulk_response(results):
+    succeeded = sum(1 for result in results if result['success'])
+    return {'succeeded': succeeded, 'failed': len(results) - succeeded, 'results': results}, 200
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/bulk/receive')
+class ASNBulkReceiveResource(Resource):
+    """
+    Mark many ASNs (e.g. a whole truck) as 'received' in one call.
+    Calls the ASNService.bulk_receive_asns(asn_ids) method.
+    """
+
+    @permission_required(["all_access","company_all_access","asn_edit"])
+    @warehouse_required()
+    @api_ns.expect(asn_bulk_input_model)
+    @api_ns.marshal_with(asn_bulk_response_model)
+    def post(self):
+        """
+        Receive ASNs in bulk
+        - Each ASN succeeds or fails on its own; `results` follows the request order
+        """
+        results = ASNService.bulk_receive_asns(_bulk_asn_ids(), can_access=check_warehouse_access)
+        return _bulk_response(results)
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/bulk/complete')
+class ASNBulkCompleteResource(Resource):
+    """
+    Mark many received ASNs as 'completed' in one call.
+    Calls the ASNService.bulk_complete_asns(asn_ids) method.
+    """
+
+    @permission_required(["all_access","company_all_access","asn_edit"])
+    @warehouse_required()
+    @api_ns.expect(asn_bulk_input_model)
+    @api_ns.marshal_with(asn_bulk_response_model)
+    def post(self):
+        """
+        Complete ASNs in bulk
+        - Each ASN succeeds or fails on its own; `results` follows the request order
+        """
+        results = ASNService.bulk_complete_asns(_bulk_asn_ids(), can_access=check_warehouse_access)
+        return _bulk_response(results)
+
+
 @api_ns.doc(security="jsonWebToken")
 @api_ns.route('/<int:asn_id>/close/')
 class ASNCloseResource(Resource):
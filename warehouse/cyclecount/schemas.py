@@ -166,6 +166,29 @@ cycle_count_task_batch_save_input_model = api_ns.model('CycleCountTaskBatchSaveI
 })
 
 
+# ------------------------------------------------------------------------------
+# 按范围生成盘点任务的输入/输出模型
+# ------------------------------------------------------------------------------
+cycle_count_generate_input_model = api_ns.model('CycleCountGenerateInput', {
+    'warehouse_id': fields.Integer(required=True, description='Warehouse ID'),
+    'task_name': fields.String(description='Task name (defaults to a timestamped name)'),
+    'scheduled_date': fields.DateTime(description='Scheduled date/time for counting'),
+    'goods_ids': fields.List(fields.Integer, description='Only count these goods'),
+    'zone': fields.String(description='Zone, i.e. location code prefix'),
+    'location_from': fields.String(description='Location code range start (inclusive)'),
+    'location_to': fields.String(description='Location code range end (inclusive)'),
+})
+
+cycle_count_task_header_fields = {
+    key: value for key, value in cycle_count_task_base_fields.items()
+    if key not in ('detail_count', 'total_system_quantity', 'total_actual_quantity', 'total_difference')
+}
+cycle_count_generate_result_model = api_ns.model('CycleCountGenerateResult', {
+    'task': fields.Nested(api_ns.model('CycleCountTaskHeader', cycle_count_task_header_fields)),
+    'detail_count': fields.Integer(description='Number of generated detail lines'),
+})
+
+
 # ------------------------------------------------------------------------------
 # 5. 分页解析器与分页模型
 # ------------------------------------------------------------------------------
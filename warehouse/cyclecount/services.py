@@ -2,7 +2,8 @@ from werkzeug.exceptions import NotFound
 from extensions.db import *
 from extensions.error import BadRequestException, NotFoundException
 from extensions.transaction import transactional
-from warehouse.goods.models import Goods
+from warehouse.goods.models import Goods, GoodsLocation
+from warehouse.location.models import Location
 from .models import (
     CycleCountTask, 
     CycleCountTaskDetail, 
@@ -10,7 +11,7 @@ from .models import (
 )
 from warehouse.goods.services import GoodsLocationService, GoodsService
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import and_, func, case, extract
+from sqlalchemy import and_, func, case, extract, insert, literal, select, update
 from datetime import datetime, timedelta
 
 class CycleCountTaskService:
@@ -268,12 +269,8 @@ class CycleCountTaskService:
         # 若 pending -> in_progress，则记录 started_at
         if old_status == 'pending' and new_status == 'in_progress':
             task.started_at = now
-            # 遍历task_detail，获取goodslocation的数量更新到task_detail中的system_quantity
-            for detail in task.task_details:
-                goods_location = GoodsLocationService.get_quantity(detail.goods_id, detail.location_id)
-                detail.system_quantity = goods_location
-                # 计算差异
-                detail.difference = detail.actual_quantity - goods_location
+            # 开始盘点时重新快照 system_quantity：一条 UPDATE 关联子查询取商品库位当前数量（无记录视为 0）
+            CycleCountTaskService._snapshot_system_quantity(task)
 
         # 若 in_progress -> completed，则记录 completed_at
         elif old_status == 'in_progress' and new_status == 'completed':
@@ -392,47 +389,134 @@ class CycleCountTaskService:
     # -------------------------------------------------------------------------
     # 其他辅助方法
     # -------------------------------------------------------------------------
+    @staticmethod
+    def _snapshot_system_quantity(task: CycleCountTask) -> None:
+        """
+        内部方法：用商品库位当前数量刷新任务全部明细的 system_quantity 与 difference（单条 UPDATE）
+        """
+        current = (
+            select(func.coalesce(func.max(GoodsLocation.quantity), 0))
+            .where(
+                GoodsLocation.goods_id == CycleCountTaskDetail.goods_id,
+                GoodsLocation.location_id == CycleCountTaskDetail.location_id
+            )
+            .scalar_subquery()
+        )
+        db.session.execute(
+            update(CycleCountTaskDetail)
+            .where(CycleCountTaskDetail.task_id == task.id)
+            .values(
+                system_quantity=current,
+                difference=CycleCountTaskDetail.actual_quantity - current
+            )
+            .execution_options(synchronize_session=False)
+        )
+        # 已加载的明细对象与数据库不一致，过期后按需重新加载
+        for detail in task.task_details:
+            db.session.expire(detail)
+        db.session.expire(task, ['task_details'])
+
     @staticmethod
     @transactional
-    def create_cycle_count_tasks_from_goods_list(goods_ids: list, warehouse_id: int, created_by_id: int) -> CycleCountTask:
+    def generate_task_details(task: CycleCountTask, goods_ids: list = None, zone: str = None,
+                              location_from: str = None, location_to: str = None) -> int:
+        """
+        按范围为盘点任务生成明细：一条 INSERT ... SELECT 从 GoodsLocation 关联 Location 选出
+        任务仓库内的商品库位，同一语句快照 system_quantity（actual_quantity 为 0，difference 为 -system_quantity）。
+
+        :param goods_ids: 商品 ID 列表；None 表示不限商品，空列表表示不生成明细
+        :param zone: 库区，即库位代码前缀（如 A-01-02 属于库区 A）
+        :param location_from: 库位代码范围起点（含）
+        :param location_to: 库位代码范围终点（含）
+        :return: 生成的明细数量
+        """
+        if goods_ids is not None and not goods_ids:
+            return 0
+
+        query = (
+            select(
+                literal(task.id),
+                GoodsLocation.goods_id,
+                GoodsLocation.location_id,
+                GoodsLocation.quantity,
+                literal(0),
+                -GoodsLocation.quantity,
+                literal('pending'),
+                func.now()
+            )
+            .join(Location, Location.id == GoodsLocation.location_id)
+            .where(Location.warehouse_id == task.warehouse_id)
+            .order_by(GoodsLocation.goods_id, GoodsLocation.id)
+        )
+        if goods_ids is not None:
+            query = query.where(GoodsLocation.goods_id.in_(goods_ids))
+        if zone:
+            query = query.where(Location.code.startswith(zone, autoescape=True))
+        if location_from:
+            query = query.where(Location.code >= location_from)
+        if location_to:
+            query = query.where(Location.code <= location_to)
+
+        result = db.session.execute(
+            insert(CycleCountTaskDetail).from_select(
+                ['task_id', 'goods_id', 'location_id', 'system_quantity', 'actual_quantity',
+                 'difference', 'status', 'updated_at'],
+                query
+            )
+        )
+        db.session.expire(task, ['task_details'])
+        return result.rowcount
+
+    @staticmethod
+    @transactional
+    def create_task_by_scope(data: dict, created_by_id: int) -> tuple:
         """
-        示例：根据一组 goods_id 自动创建一个 CycleCountTask，并生成对应的明细。
+        创建盘点任务并按范围生成明细（见 generate_task_details）
+        :param data: warehouse_id 必填；task_name、scheduled_date 可选；
+                     范围 goods_ids / zone / location_from / location_to 可组合，均不传表示整仓盘点
+        :return: (task, detail_count)
         """
+        location_from, location_to = data.get('location_from'), data.get('location_to')
+        if location_from and location_to and location_from > location_to:
+            raise BadRequestException("location_from must not be greater than location_to", 16045)
+
+        goods_ids = data.get('goods_ids')
+        if goods_ids:
+            goods_ids = list(dict.fromkeys(goods_ids))
+            found = set(db.session.scalars(select(Goods.id).where(Goods.id.in_(goods_ids))))
+            missing = [goods_id for goods_id in goods_ids if goods_id not in found]
+            if missing:
+                raise NotFoundException(f"Goods with id {missing[0]} not found", 13001)
+
         task = CycleCountTaskService.create_task({
-            'task_name': f"Cycle Count Task - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            'warehouse_id': warehouse_id,
+            'task_name': data.get('task_name') or f"Cycle Count Task - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            'warehouse_id': data['warehouse_id'],
+            'scheduled_date': data.get('scheduled_date'),
             'status': 'pending',
             'is_active': True
         }, created_by_id=created_by_id)
+        db.session.flush()
+
+        detail_count = CycleCountTaskService.generate_task_details(
+            task,
+            goods_ids=goods_ids,
+            zone=data.get('zone'),
+            location_from=location_from,
+            location_to=location_to
+        )
+        return task, detail_count
 
-        details = []
-        for goods_id in goods_ids:
-            goods = get_object_or_404(Goods, goods_id)
-
-            # 如果你有 'goods.locations' 结构，需要过滤出同一warehouse的货位
-            for storage_record in goods.storage_records:
-                if storage_record.location.warehouse_id != warehouse_id:
-                    continue
-                location_id = storage_record.location_id
-
-                # 创建明细
-                detail_obj = CycleCountTaskService.create_task_detail(
-                    task.id,
-                    {
-                        'goods_id': goods_id,
-                        'location_id': location_id,
-                        'actual_quantity': 0
-                    },
-                    created_by_id=created_by_id
-                )
-                details.append(detail_obj)
-
-        task.task_details = details
-        db.session.add(task)
-        # db.session.commit()
-
+    @staticmethod
+    @transactional
+    def create_cycle_count_tasks_from_goods_list(goods_ids: list, warehouse_id: int, created_by_id: int) -> CycleCountTask:
+        """
+        示例：根据一组 goods_id 自动创建一个 CycleCountTask，并生成对应的明细。
+        """
+        task, _ = CycleCountTaskService.create_task_by_scope({
+            'warehouse_id': warehouse_id,
+            'goods_ids': list(goods_ids)
+        }, created_by_id=created_by_id)
         return task
-    
 
     @staticmethod
     def get_cyclecount_monthly_stats(months=6, filters=None):
@@ -16,6 +16,8 @@ from .schemas import (
     cycle_count_detail_pagination_model,
     cycle_count_monthly_stats_parser,
     cycle_count_task_batch_save_input_model,
+    cycle_count_generate_input_model,
+    cycle_count_generate_result_model,
     cycle_count_monthly_stats_parser
 )
 from .services import CycleCountTaskService
@@ -63,6 +65,32 @@ class CycleCountTaskList(Resource):
         return new_task, 201
 
 
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/generate')
+class CycleCountTaskGenerate(Resource):
+
+    @permission_required(["all_access","company_all_access","cycle_count_edit"])
+    @api_ns.expect(cycle_count_generate_input_model)
+    @api_ns.marshal_with(cycle_count_generate_result_model)
+    def post(self):
+        """
+        Create a Cycle Count Task and generate its details by warehouse / goods / zone / location range
+        """
+        data = api_ns.payload or {}
+        if not isinstance(data.get('warehouse_id'), int):
+            raise BadRequestException("warehouse_id is required", 16046)
+        goods_ids = data.get('goods_ids')
+        if goods_ids is not None and (
+            not isinstance(goods_ids, list) or not all(isinstance(goods_id, int) for goods_id in goods_ids)
+        ):
+            raise BadRequestException("goods_ids must be a list of Goods IDs", 16046)
+        if not check_warehouse_access(data['warehouse_id']):
+            raise ForbiddenException("You do not have access to this warehouse", 12001)
+
+        task, detail_count = CycleCountTaskService.create_task_by_scope(data, g.current_user.id)
+        return {'task': task, 'detail_count': detail_count}, 201
+
+
 @api_ns.doc(security="jsonWebToken")
 @api_ns.route('/<int:task_id>')
 class CycleCountTaskDetailView(Resource):
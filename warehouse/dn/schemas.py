@@ -147,6 +147,22 @@ dn_input_model = api_ns.inherit('DNInput', dn_input_base_model, {
     'details': fields.List(fields.Nested(dn_detail_input_model), description='List of DN details'),
 })
 
+# 6.1) 批量导入结果模型（逐单成功 / 失败）
+dn_bulk_result_model = api_ns.model('DNBulkResult', {
+    'index': fields.Integer(description='Position of the DN in the request'),
+    'order_number': fields.String(description='Order number of the DN'),
+    'success': fields.Boolean(description='Whether the DN was created'),
+    'dn_id': fields.Integer(description='ID of the created DN'),
+    'error_code': fields.Integer(description='Business error code when the DN was rejected'),
+    'error_message': fields.String(description='Error message when the DN was rejected'),
+})
+
+dn_bulk_response_model = api_ns.model('DNBulkResponse', {
+    'created': fields.Integer(description='Number of DNs created'),
+    'failed': fields.Integer(description='Number of DNs rejected'),
+    'results': fields.List(fields.Nested(dn_bulk_result_model), description='Per-DN results in request order'),
+})
+
 # --------------------------------------------
 # DN 分页 Parser & 分页模型
 # --------------------------------------------
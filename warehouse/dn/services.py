@@ -1,15 +1,28 @@
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import and_, func, case, extract
+from sqlalchemy import and_, func, case, extract, insert, tuple_, update
+from sqlalchemy.orm import lazyload
 from extensions.db import *
 from extensions.error import BadRequestException, NotFoundException
 from extensions.transaction import transactional
+from warehouse.inventory.locks import lock_inventories, sort_lock_keys
+from warehouse.inventory.shards import sharded_keys, draw_from_shards, remaining_in_shards, lock_shards
 from warehouse.inventory.services import InventoryService
 
+from warehouse.goods.models import Goods
 from warehouse.goods.services import GoodsService
 from system.webhook.services import emit as webhook_emit
 from .models import DN, DNDetail
 
+# 承运商 code 的别名：传 carrier_code 时按 code 精确匹配或按名称包含别名匹配
+CARRIER_ALIASES = {
+    'yamato': ('yamato', 'ヤマト'),
+    'sagawa': ('sagawa', '佐川'),
+    'sf': ('sf', 'sf-express', '順豊'),
+    'ems': ('ems',),
+    'dhl': ('dhl',),
+}
+
 class DNService:
     """
     A service class that encapsulates various operations
@@ -17,16 +30,40 @@ class DNService:
     """
 
     @staticmethod
-    def _assert_new_dn_stock_available(warehouse_id: int, details: list):
-        """Prevent a new DN from reserving more stock than is available."""
+    def _assert_new_dn_stock_available(warehouse_id: int, details: list) -> set:
+        """
+        Prevent a new DN from reserving more stock than is available.
+        热点商品（已启用库存分片）从分片中扣减，不锁定库存主记录。
+        :return: 已从分片扣减的商品 ID 集合（其 dn_stock 由分片再平衡统一合并）
+        """
         requested_by_goods = {}
         for detail in details:
             goods_id = detail['goods_id']
             quantity = detail['quantity']
             requested_by_goods[goods_id] = requested_by_goods.get(goods_id, 0) + quantity
 
-        for goods_id, quantity in requested_by_goods.items():
-            inventory = InventoryService._get_for_update(goods_id, warehouse_id)
+        sharded_goods = {
+            goods_id for goods_id, _ in
+            sharded_keys((goods_id, warehouse_id) for goods_id in requested_by_goods)
+        }
+        # 本事务内已标记待重算的库存先重算，确保校验读取的是最新值
+        InventoryService.flush_dirty_stock((goods_id, warehouse_id) for goods_id in requested_by_goods)
+        # 一次按 (warehouse_id, goods_id) 顺序锁定全部商品，与明细在请求中的顺序无关
+        inventories = lock_inventories(
+            (goods_id, warehouse_id) for goods_id in requested_by_goods
+            if goods_id not in sharded_goods
+        )
+        for goods_id, quantity in sorted(requested_by_goods.items()):
+            if goods_id in sharded_goods:
+                if not draw_from_shards(goods_id, warehouse_id, quantity):
+                    available = remaining_in_shards(goods_id, warehouse_id)
+                    raise BadRequestException(
+                        f"Insufficient available stock for goods {goods_id}: "
+                        f"requested {quantity}, available {max(available, 0)}.",
+                        16032,
+                    )
+                continue
+            inventory = inventories[(goods_id, warehouse_id)]
             available = (
                 inventory.onhand_stock
                 - inventory.locked_stock
@@ -38,6 +75,7 @@ class DNService:
                     f"requested {quantity}, available {max(available, 0)}.",
                     16032,
                 )
+        return sharded_goods
 
     # ------------------------------------
     # DN Services 私有方法
@@ -89,6 +127,7 @@ class DNService:
         更新 DNDetail 的已拣选、已打包和已发货数量。
         参数可以是 DN 的 ID（int）或 DN 实例。
         如果找不到 DN，则抛出 NotFound 异常。
+        拣选 / 打包数量各用一条按商品分组的汇总查询，有变化的明细一次按主键批量更新，查询数与明细行数无关。
         """
         from warehouse.picking.models import PickingTask, PickingTaskDetail
         from warehouse.packing.models import PackingTask, PackingTaskDetail
@@ -108,45 +147,63 @@ class DNService:
             is not None
         )
 
-        for dn_detail in dn.details:
-            goods_id = dn_detail.goods_id
-
-            # 1. 计算已拣选数量（来自 PickingTaskDetail）
-            picked_query = (
-                db.session.query(PickingTaskDetail.picked_quantity)
-                .join(PickingTask)
-                .filter(
-                    PickingTask.dn_id == dn.id,
-                    PickingTaskDetail.goods_id == goods_id,
-                    PickingTask.is_active == True,
-                    PickingTask.status == 'completed'
-                )
+        # 1. 已拣选数量（来自已完成的 PickingTaskDetail），按商品一次汇总
+        picked_by_goods = dict(
+            db.session.query(PickingTaskDetail.goods_id, func.sum(PickingTaskDetail.picked_quantity))
+            .join(PickingTask)
+            .filter(
+                PickingTask.dn_id == dn.id,
+                PickingTask.is_active == True,
+                PickingTask.status == 'completed'
             )
-            picked_quantity = sum(result[0] for result in picked_query.all())
-
-            # 2. 计算已打包数量（来自 PackingTaskDetail）
-            packed_query = (
-                db.session.query(PackingTaskDetail.packed_quantity)
-                .join(PackingTask)
-                .filter(
-                    PackingTask.dn_id == dn.id,
-                    PackingTaskDetail.goods_id == goods_id,
-                    PackingTask.is_active == True,
-                    PackingTask.status == 'completed'
-                )
+            .group_by(PickingTaskDetail.goods_id)
+            .all()
+        )
+
+        # 2. 已打包数量（来自已完成的 PackingTaskDetail），按商品一次汇总
+        packed_by_goods = dict(
+            db.session.query(PackingTaskDetail.goods_id, func.sum(PackingTaskDetail.packed_quantity))
+            .join(PackingTask)
+            .filter(
+                PackingTask.dn_id == dn.id,
+                PackingTask.is_active == True,
+                PackingTask.status == 'completed'
             )
-            packed_quantity = sum(result[0] for result in packed_query.all())
+            .group_by(PackingTaskDetail.goods_id)
+            .all()
+        )
 
-            # 3. 计算已发货数量（如果存在已完成的 DeliveryTask，则等于已打包数量）
+        # 3. 已发货数量：如果存在已完成的 DeliveryTask，则等于已打包数量
+        updates = []
+        details = (
+            db.session.query(
+                DNDetail.id, DNDetail.goods_id,
+                DNDetail.picked_quantity, DNDetail.packed_quantity, DNDetail.delivered_quantity,
+            )
+            .filter(DNDetail.dn_id == dn.id)
+            .all()
+        )
+        for detail_id, goods_id, *current in details:
+            picked_quantity = picked_by_goods.get(goods_id) or 0
+            packed_quantity = packed_by_goods.get(goods_id) or 0
             delivered_quantity = packed_quantity if has_completed_delivery else 0
-
-            # 更新 DNDetail 的统计值
-            dn_detail.picked_quantity = picked_quantity
-            dn_detail.packed_quantity = packed_quantity
-            dn_detail.delivered_quantity = delivered_quantity
-
-        db.session.add_all(dn.details)
-        db.session.flush()
+            if current == [picked_quantity, packed_quantity, delivered_quantity]:
+                continue
+            updates.append({
+                'id': detail_id,
+                'picked_quantity': picked_quantity,
+                'packed_quantity': packed_quantity,
+                'delivered_quantity': delivered_quantity,
+            })
+
+        if updates:
+            # 按主键批量 UPDATE 绕过了 ORM：使会话中已加载的明细失效，下次访问 dn.details 时一次重新加载
+            db.session.execute(update(DNDetail), updates)
+            for row in updates:
+                detail = db.session.identity_map.get(db.session.identity_key(DNDetail, row['id']))
+                if detail is not None:
+                    db.session.expire(detail)
+            db.session.expire(dn, ['details'])
         # db.session.commit()
 
         return dn
@@ -243,13 +300,6 @@ class DNService:
         if not data.get('carrier_id') and data.get('carrier_code'):
             from warehouse.carrier.models import Carrier
             carrier_code = data['carrier_code'].strip().lower()
-            carrier_aliases = {
-                'yamato': ('yamato', 'ヤマト'),
-                'sagawa': ('sagawa', '佐川'),
-                'sf': ('sf', 'sf-express', '順豊'),
-                'ems': ('ems',),
-                'dhl': ('dhl',),
-            }
             carrier = Carrier.query.filter(
                 Carrier.company_id == data.get('company_id', 1),
                 Carrier.is_active.is_(True),
@@ -257,7 +307,7 @@ class DNService:
                     func.lower(Carrier.code) == carrier_code,
                     *[
                         Carrier.name.ilike(f'%{alias}%')
-                        for alias in carrier_aliases.get(carrier_code, (carrier_code,))
+                        for alias in CARRIER_ALIASES.get(carrier_code, (carrier_code,))
                     ],
                 ),
             ).order_by(Carrier.id.asc()).first()
@@ -288,8 +338,9 @@ class DNService:
 
         # Pending/in-progress DNs reserve on-hand stock. Reject over-reservation
         # here so an impossible integration payload never reaches picking.
+        sharded_goods = set()
         if data.get('status', 'pending') in ('pending', 'in_progress'):
-            DNService._assert_new_dn_stock_available(
+            sharded_goods = DNService._assert_new_dn_stock_available(
                 data['warehouse_id'], resolved_details
             )
 
@@ -326,9 +377,10 @@ class DNService:
                 created_by=created_by_id
             )
             db.session.add(new_detail)
-            db.session.flush()
+        db.session.flush()
 
-            InventoryService.update_and_calculate_dn_stock(new_detail.goods_id,new_dn.warehouse_id)
+        for goods_id in sorted({detail['goods_id'] for detail in resolved_details} - sharded_goods):
+            InventoryService.mark_stock_dirty(goods_id, new_dn.warehouse_id, 'dn', source=('dn', new_dn.id))
 
         # db.session.commit()
 
@@ -336,6 +388,247 @@ class DNService:
 
         return new_dn
 
+    @staticmethod
+    def _match_carrier(carriers: list, carrier_code: str):
+        """在已加载的承运商中按 create_dn 的规则匹配 carrier_code（code 精确匹配或名称包含别名，取 ID 最小者）"""
+        carrier_code = carrier_code.strip().lower()
+        aliases = [alias.lower() for alias in CARRIER_ALIASES.get(carrier_code, (carrier_code,))]
+        for carrier in carriers:
+            name = (carrier.name or '').lower()
+            if (carrier.code or '').lower() == carrier_code or any(alias in name for alias in aliases):
+                return carrier
+        return None
+
+    @staticmethod
+    @transactional
+    def bulk_create_dns(data_list: list, created_by_id: int) -> list:
+        """
+        批量导入 DN（逐单成功 / 失败，失败的 DN 不影响其他 DN）
+        :param data_list: list，每个元素与 create_dn 的 data 相同
+        :param created_by_id: 当前用户 ID
+        :return: list[dict]，与 data_list 顺序一致：
+                 {index, order_number, success, dn_id, error_code, error_message}
+
+        商品编码与承运商 code 各一次查询解析；需要预扣库存的 DN 按 (仓库, 商品) 汇总需求后
+        一次按固定顺序锁定库存，再按提交顺序在内存中逐单校验可用量（库存不足的 DN 不占用额度）；
+        通过的 DN 与明细各以一条多行 INSERT 写入，每个商品的 DN 库存在提交前只重算一次。
+        """
+        from warehouse.carrier.models import Carrier
+        from warehouse.recipient.models import Recipient
+        from warehouse.warehouse.models import Warehouse
+
+        results = [
+            {
+                'index': index,
+                'order_number': data.get('order_number'),
+                'success': False,
+                'dn_id': None,
+                'error_code': None,
+                'error_message': None,
+            }
+            for index, data in enumerate(data_list)
+        ]
+
+        def fail(index, message, code):
+            results[index]['error_code'] = code
+            results[index]['error_message'] = message
+
+        # 1) 一次查询解析全部商品（goods_id 校验存在，goods_code 按公司解析），收货人与仓库各一次查询校验存在
+        goods_ids, goods_codes, carrier_companies = set(), set(), set()
+        recipient_ids = {data.get('recipient_id') for data in data_list} - {None}
+        warehouse_ids = {data.get('warehouse_id') for data in data_list} - {None}
+        known_recipient_ids = {
+            row.id for row in db.session.query(Recipient.id).filter(Recipient.id.in_(list(recipient_ids)))
+        } if recipient_ids else set()
+        known_warehouse_ids = {
+            row.id for row in db.session.query(Warehouse.id).filter(Warehouse.id.in_(list(warehouse_ids)))
+        } if warehouse_ids else set()
+        for data in data_list:
+            company_id = data.get('company_id', 1)
+            for detail in data.get('details') or []:
+                if detail.get('goods_id'):
+                    goods_ids.add(detail['goods_id'])
+                elif detail.get('goods_code'):
+                    goods_codes.add((company_id, detail['goods_code']))
+            if not data.get('carrier_id') and data.get('carrier_code'):
+                carrier_companies.add(company_id)
+        known_goods_ids, goods_by_code = set(), {}
+        if goods_ids or goods_codes:
+            conditions = []
+            if goods_ids:
+                conditions.append(Goods.id.in_(list(goods_ids)))
+            if goods_codes:
+                conditions.append(tuple_(Goods.company_id, Goods.code).in_(list(goods_codes)))
+            for goods_id, company_id, code in db.session.query(Goods.id, Goods.company_id, Goods.code).filter(
+                db.or_(*conditions)
+            ).order_by(Goods.id):
+                known_goods_ids.add(goods_id)
+                goods_by_code.setdefault((company_id, code), goods_id)
+
+        # 2) 一次查询加载相关公司的启用承运商，在内存中按别名匹配
+        carriers_by_company = {}
+        if carrier_companies:
+            for carrier in Carrier.query.options(lazyload('*')).filter(
+                Carrier.company_id.in_(list(carrier_companies)),
+                Carrier.is_active.is_(True),
+            ).order_by(Carrier.id.asc()):
+                carriers_by_company.setdefault(carrier.company_id, []).append(carrier)
+
+        # 3) 逐单校验并解析
+        prepared = {}
+        for index, data in enumerate(data_list):
+            try:
+                for field in ('recipient_id', 'shipping_address', 'expected_shipping_date', 'warehouse_id'):
+                    if not data.get(field):
+                        raise BadRequestException(f"{field} is required", 16042)
+                if data['recipient_id'] not in known_recipient_ids:
+                    raise BadRequestException(f"Recipient not found for id: {data['recipient_id']}", 16042)
+                if data['warehouse_id'] not in known_warehouse_ids:
+                    raise BadRequestException(f"Warehouse not found for id: {data['warehouse_id']}", 16042)
+                expected_shipping_date = data.get('expected_shipping_date')
+                if isinstance(expected_shipping_date, str):
+                    try:
+                        expected_shipping_date = datetime.strptime(expected_shipping_date, '%Y-%m-%d').date()
+                    except ValueError:
+                        raise BadRequestException(
+                            f"Invalid expected_shipping_date: {expected_shipping_date}", 16041
+                        )
+                carrier_id = data.get('carrier_id')
+                if not carrier_id and data.get('carrier_code'):
+                    carrier = DNService._match_carrier(
+                        carriers_by_company.get(data.get('company_id', 1), []), data['carrier_code']
+                    )
+                    carrier_id = carrier.id if carrier else None
+
+                details = []
+                for detail in data.get('details') or []:
+                    goods_id = detail.get('goods_id')
+                    if goods_id and goods_id not in known_goods_ids:
+                        raise BadRequestException(f"Goods not found for id: {goods_id}", 16030)
+                    if not goods_id and detail.get('goods_code'):
+                        goods_id = goods_by_code.get((data.get('company_id', 1), detail['goods_code']))
+                        if not goods_id:
+                            raise BadRequestException(
+                                f"Goods not found for code: {detail['goods_code']}", 16030
+                            )
+                    if not goods_id:
+                        raise BadRequestException(
+                            "goods_id or goods_code is required for detail", 16031
+                        )
+                    quantity = detail.get('quantity', 0)
+                    if quantity <= 0:
+                        raise BadRequestException("DN detail quantity must be positive", 16033)
+                    details.append({**detail, 'goods_id': goods_id, 'quantity': quantity})
+            except BadRequestException as e:
+                fail(index, e.message, e.biz_code)
+                continue
+            prepared[index] = (data, expected_shipping_date, carrier_id, details)
+
+        # 4) 汇总需求，一次按 (仓库, 商品) 顺序锁定库存，逐单在内存中扣减可用额度
+        demand = {}
+        for data, _, _, details in prepared.values():
+            if data.get('status', 'pending') in ('pending', 'in_progress'):
+                for detail in details:
+                    key = (detail['goods_id'], data['warehouse_id'])
+                    demand[key] = demand.get(key, 0) + detail['quantity']
+        sharded = sharded_keys(demand)
+        InventoryService.flush_dirty_stock(demand)
+        inventories = lock_inventories((key for key in demand if key not in sharded), missing_ok=True)
+        budget = {
+            key: inventory.onhand_stock - inventory.locked_stock - inventory.dn_stock
+            for key, inventory in inventories.items()
+        }
+        for goods_id, warehouse_id in sort_lock_keys(sharded):
+            budget[(goods_id, warehouse_id)] = sum(
+                shard.allotment - shard.reserved for shard in lock_shards(goods_id, warehouse_id)
+            )
+
+        drawn = {}
+        for index, (data, _, _, details) in list(prepared.items()):
+            if data.get('status', 'pending') not in ('pending', 'in_progress'):
+                continue
+            requested = {}
+            for detail in details:
+                requested[detail['goods_id']] = requested.get(detail['goods_id'], 0) + detail['quantity']
+            for goods_id, quantity in sorted(requested.items()):
+                available = budget.get((goods_id, data['warehouse_id']), 0)
+                if quantity > available:
+                    fail(index,
+                         f"Insufficient available stock for goods {goods_id}: "
+                         f"requested {quantity}, available {max(available, 0)}.",
+                         16032)
+                    del prepared[index]
+                    break
+            else:
+                for goods_id, quantity in requested.items():
+                    key = (goods_id, data['warehouse_id'])
+                    budget[key] -= quantity
+                    if key in sharded:
+                        drawn[key] = drawn.get(key, 0) + quantity
+
+        # 分片已在上面加锁读取，按汇总量一次扣减
+        for goods_id, warehouse_id in sort_lock_keys(drawn):
+            if not draw_from_shards(goods_id, warehouse_id, drawn[(goods_id, warehouse_id)]):
+                raise BadRequestException(
+                    f"Insufficient available stock for goods {goods_id} in warehouse shards.", 16032
+                )
+
+        if not prepared:
+            return results
+
+        # 5) DN 与明细各一条多行 INSERT
+        indexes = sorted(prepared)
+        dn_ids = db.session.scalars(
+            insert(DN).returning(DN.id, sort_by_parameter_order=True),
+            [
+                {
+                    'recipient_id': data['recipient_id'],
+                    'shipping_address': data['shipping_address'],
+                    'expected_shipping_date': expected_shipping_date,
+                    'warehouse_id': data['warehouse_id'],
+                    'carrier_id': carrier_id,
+                    'dn_type': data.get('dn_type', 'shipping'),
+                    'status': data.get('status', 'pending'),
+                    'order_number': data.get('order_number'),
+                    'transportation_mode': data.get('transportation_mode'),
+                    'packaging_info': data.get('packaging_info'),
+                    'special_handling': data.get('special_handling'),
+                    'remark': data.get('remark'),
+                    'is_active': data.get('is_active', True),
+                    'created_by': created_by_id,
+                    'api_key_id': data.get('api_key_id'),
+                }
+                for data, expected_shipping_date, carrier_id, _ in (prepared[index] for index in indexes)
+            ],
+        ).all()
+
+        detail_rows = []
+        dirty = {}
+        for index, dn_id in zip(indexes, dn_ids):
+            data, _, _, details = prepared[index]
+            results[index]['success'] = True
+            results[index]['dn_id'] = dn_id
+            for detail in details:
+                detail_rows.append({
+                    'dn_id': dn_id,
+                    'goods_id': detail['goods_id'],
+                    'quantity': detail['quantity'],
+                    'picked_quantity': detail.get('picked_quantity', 0),
+                    'packed_quantity': detail.get('packed_quantity', 0),
+                    'delivered_quantity': detail.get('delivered_quantity', 0),
+                    'remark': detail.get('remark', ''),
+                    'created_by': created_by_id,
+                })
+                dirty.setdefault((detail['goods_id'], data['warehouse_id']), dn_id)
+        if detail_rows:
+            db.session.execute(insert(DNDetail), detail_rows)
+
+        for (goods_id, warehouse_id), dn_id in sorted(dirty.items(), key=lambda item: (item[0][1], item[0][0])):
+            if (goods_id, warehouse_id) not in sharded:
+                InventoryService.mark_stock_dirty(goods_id, warehouse_id, 'dn', source=('dn', dn_id))
+
+        return results
+
     @staticmethod
     @transactional
     def update_dn(dn_or_id: int | DN, data: dict) -> DN:
@@ -390,12 +683,13 @@ class DNService:
 
         goods_ids = [detail.goods_id for detail in dn.details]
         warehouse_id = dn.warehouse_id
+        dn_id = dn.id
 
         db.session.delete(dn)
         db.session.flush()
 
-        for goods_id in goods_ids:
-            InventoryService.update_and_calculate_dn_stock(goods_id,warehouse_id)
+        for goods_id in sorted(set(goods_ids)):
+            InventoryService.mark_stock_dirty(goods_id, warehouse_id, 'dn', source=('dn', dn_id))
 
         # db.session.commit()
 
@@ -410,8 +704,8 @@ class DNService:
         db.session.add(dn)
         db.session.flush()
 
-        for detail in dn.details:
-            InventoryService.update_and_calculate_dn_stock(detail.goods_id,dn.warehouse_id)
+        for goods_id in sorted({detail.goods_id for detail in dn.details}):
+            InventoryService.mark_stock_dirty(goods_id, dn.warehouse_id, 'dn', source=('dn', dn.id))
 
         # db.session.commit()
         return dn
@@ -467,7 +761,7 @@ class DNService:
         db.session.add(new_detail)
         db.session.flush()
 
-        InventoryService.update_and_calculate_dn_stock(new_detail.goods_id,dn.warehouse_id)
+        InventoryService.mark_stock_dirty(new_detail.goods_id, dn.warehouse_id, 'dn', source=('dn', dn.id))
 
         # db.session.commit()
         return new_detail
@@ -493,7 +787,7 @@ class DNService:
 
         db.session.add(detail)
         db.session.flush()
-        InventoryService.update_and_calculate_dn_stock(detail.goods_id,dn.warehouse_id)
+        InventoryService.mark_stock_dirty(detail.goods_id, dn.warehouse_id, 'dn', source=('dn', dn.id))
 
         # db.session.commit()
         return detail
@@ -513,7 +807,7 @@ class DNService:
         db.session.delete(detail)
         db.session.flush()
 
-        InventoryService.update_and_calculate_dn_stock(detail.goods_id,dn.warehouse_id)
+        InventoryService.mark_stock_dirty(detail.goods_id, dn.warehouse_id, 'dn', source=('dn', dn.id))
 
         # db.session.commit()
 
@@ -591,12 +885,14 @@ class DNService:
         # 更新后的明细列表
         latest_details = dn.details
 
-        for detail in latest_details:
-            InventoryService.update_and_calculate_dn_stock(detail.goods_id,dn.warehouse_id)
-        
-        # 更新被删除明细的库存状态
-        for goods_id in deleted_goods_ids:
-            InventoryService.update_and_calculate_dn_stock(goods_id, dn.warehouse_id)
+        # 更新现有及被删除明细的库存状态：先按固定顺序一次锁定，再逐个重算
+        affected_keys = sort_lock_keys(
+            [(detail.goods_id, dn.warehouse_id) for detail in latest_details]
+            + [(goods_id, dn.warehouse_id) for goods_id in deleted_goods_ids]
+        )
+        lock_inventories(affected_keys)
+        for goods_id, warehouse_id in affected_keys:
+            InventoryService.mark_stock_dirty(goods_id, warehouse_id, 'dn', source=('dn', dn.id))
 
         return dn.details
 
@@ -610,12 +906,18 @@ class DNService:
         if dn.status != 'pending':
             raise BadRequestException("Cannot mark a DN as 'in progress' that is not in 'pending' status.", 16000)
 
+        # 热点商品的预扣仍在分片中，先合并到 dn_stock，后续拣货按 dn_stock 扣减
+        InventoryService.fold_shard_reservations(
+            ((detail.goods_id, dn.warehouse_id) for detail in dn.details), source=('dn', dn.id)
+        )
         # Revalidate just before work starts. Stock may have changed since the
         # DN was created, especially for old integrations that over-reserved.
-        for detail in dn.details:
-            inventory = InventoryService._get_for_update(
-                detail.goods_id, dn.warehouse_id
-            )
+        InventoryService.flush_dirty_stock((detail.goods_id, dn.warehouse_id) for detail in dn.details)
+        inventories = lock_inventories(
+            (detail.goods_id, dn.warehouse_id) for detail in dn.details
+        )
+        for detail in sorted(dn.details, key=lambda detail: detail.goods_id):
+            inventory = inventories[(detail.goods_id, dn.warehouse_id)]
             physical_available = inventory.onhand_stock - inventory.locked_stock
             if detail.quantity > physical_available:
                 raise BadRequestException(
@@ -647,13 +949,20 @@ class DNService:
         dn = DNService._get_instance(dn_or_id)
         if dn.status != 'in_progress':
             raise BadRequestException("Cannot pick a DN that is not in 'in_progress' status.", 16000)
-        
+
+        # 直接以 in_progress 创建的 DN 未经过 progress_dn，分片中的预扣在此合并
+        InventoryService.fold_shard_reservations(
+            ((detail.goods_id, dn.warehouse_id) for detail in dn.details), source=('dn', dn.id)
+        )
         dn = DNService._update_dn_status(dn, "picked")
         DNService._update_and_calculate_quantity(dn_or_id)
 
-        for detail in dn.details:            
-            # 更新库存信息
-            InventoryService.dn_picked(detail.goods_id,dn.warehouse_id,detail.quantity,detail.picked_quantity)
+        # 更新库存信息（整单一次批量加锁与更新）
+        InventoryService.bulk_dn_picked(
+            [(detail.goods_id, dn.warehouse_id, detail.quantity, detail.picked_quantity)
+             for detail in dn.details],
+            source=('dn', dn.id),
+        )
 
         # 创建打包任务
         from warehouse.packing.services import PackingTaskService
@@ -676,9 +985,10 @@ class DNService:
         dn = DNService._update_dn_status(dn, "packed")        
         DNService._update_and_calculate_quantity(dn_or_id)
 
-        for detail in dn.details:
-
-            InventoryService.dn_packed(detail.goods_id,dn.warehouse_id,detail.packed_quantity)
+        InventoryService.bulk_dn_packed(
+            [(detail.goods_id, dn.warehouse_id, detail.packed_quantity) for detail in dn.details],
+            source=('dn', dn.id),
+        )
 
         # 创建发货任务
         from warehouse.delivery.services import DeliveryTaskService
@@ -699,8 +1009,10 @@ class DNService:
         dn = DNService._update_dn_status(dn, "delivered")
         DNService._update_and_calculate_quantity(dn_or_id)
 
-        for detail in dn.details:
-            InventoryService.dn_delivered(detail.goods_id,dn.warehouse_id,detail.delivered_quantity)
+        InventoryService.bulk_dn_delivered(
+            [(detail.goods_id, dn.warehouse_id, detail.delivered_quantity) for detail in dn.details],
+            source=('dn', dn.id),
+        )
 
         # 获取 tracking_number
         from warehouse.delivery.models import DeliveryTask
@@ -740,8 +1052,10 @@ class DNService:
         dn = DNService._update_dn_status(dn, "completed")
         DNService._update_and_calculate_quantity(dn_or_id)
 
-        for detail in dn.details:
-            InventoryService.dn_completed(detail.goods_id,dn.warehouse_id,detail.delivered_quantity)
+        InventoryService.bulk_dn_completed(
+            [(detail.goods_id, dn.warehouse_id, detail.delivered_quantity) for detail in dn.details],
+            source=('dn', dn.id),
+        )
 
         webhook_emit('dn.completed', {
             'dn_id': dn.id, 'status': 'completed', 'order_number': dn.order_number,
@@ -774,8 +1088,8 @@ class DNService:
         
         dn = DNService._update_dn_status(dn, "closed")
 
-        for detail in dn.details:
-            InventoryService.update_and_calculate_dn_stock(detail.goods_id,dn.warehouse_id)
+        for goods_id in sorted({detail.goods_id for detail in dn.details}):
+            InventoryService.mark_stock_dirty(goods_id, dn.warehouse_id, 'dn', source=('dn', dn.id))
     
         return dn
     
@@ -1,7 +1,7 @@
 from flask import g
 from flask_restx import Resource
 from extensions import cache
-from extensions.error import ForbiddenException
+from extensions.error import BadRequestException, ForbiddenException
 from system.common import permission_required,paginate
 from system.third_party.utils import get_api_key_company_id
 from warehouse.common import warehouse_required,add_warehouse_filter,check_warehouse_access
@@ -12,6 +12,7 @@ from .schemas import (
     dn_detail_model,
     dn_input_model,
     dn_input_base_model,
+    dn_bulk_response_model,
     dn_detail_input_model,
     dn_pagination_parser,
     dn_pagination_model,
@@ -74,6 +75,35 @@ class DNList(Resource):
         return new_dn, 201
 
 
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/bulk')
+class DNBulk(Resource):
+
+    @permission_required(["all_access","company_all_access","dn_edit"])
+    @api_ns.expect([dn_input_model])
+    @api_ns.marshal_with(dn_bulk_response_model)
+    def post(self):
+        """
+        Import DNs in bulk
+        - Accepts a list of DNs in the same format as `POST /dn/`
+        - Each DN succeeds or fails on its own; `results` follows the request order
+        """
+        data_list = api_ns.payload
+        if not isinstance(data_list, list):
+            raise BadRequestException("Payload must be a list of DNs", 16042)
+        api_company_id = get_api_key_company_id()
+        api_key = g.current_system['api_key'] if g.current_system and g.current_system.get('api_key') else None
+        for data in data_list:
+            # API Key 认证时强制注入 company_id，并记录创建来源 API Key
+            if api_company_id:
+                data['company_id'] = api_company_id
+            if api_key:
+                data['api_key_id'] = api_key.id
+        results = DNService.bulk_create_dns(data_list, g.current_user.id)
+        created = sum(1 for result in results if result['success'])
+        return {'created': created, 'failed': len(results) - created, 'results': results}, 200
+
+
 @api_ns.doc(security="jsonWebToken")
 @api_ns.route('/<int:dn_id>')
 class DNDetailView(Resource):
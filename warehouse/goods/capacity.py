@@ -0,0 +1,306 @@
+import time
+from flask import current_app, has_app_context
+from redis.exceptions import RedisError
+from sqlalchemy import case, event, func, select
+from sqlalchemy.orm import lazyload
+from extensions import db, redis_client
+from warehouse.location.models import Location
+from .models import Goods, GoodsLocation
+
+# 库位剩余容量索引（立方厘米）：每个仓库一个 Sorted Set，member 为库位ID，score 为剩余体积，
+# 只包含容量已知的启用 standard 库位
+FREE_KEY = 'putaway:capacity:{warehouse_id}:free'
+# 同商品库位：每个 (仓库, 商品) 一个 Hash，库位ID -> 数量，用于同 SKU 合并上架
+GOODS_KEY = 'putaway:capacity:{warehouse_id}:goods:{goods_id}'
+# 索引中出现过的商品ID集合（重建时据此清理 GOODS_KEY）
+GOODS_IDS_KEY = 'putaway:capacity:{warehouse_id}:goods_ids'
+# 索引构建标记，过期后下一次查询全量重建，限制增量更新累积的偏差
+BUILT_KEY = 'putaway:capacity:{warehouse_id}:built'
+
+# 本事务内待写入索引的变更，保存在 session.info 中，提交后统一写入、回滚时丢弃
+_PENDING_KEY = 'putaway_capacity_pending'
+# 本事务内需要整体失效的仓库（库位增删改），提交后删除构建标记，下一次查询全量重建
+_INVALIDATED_KEY = 'putaway_capacity_invalidated'
+
+_BUILD_CHUNK_SIZE = 5000
+
+
+def capacity_index_enabled() -> bool:
+    return has_app_context() and current_app.config.get('PUTAWAY_CAPACITY_INDEX', False)
+
+
+def location_volume(capacity, width, depth, height):
+    """库位容积（立方厘米）：优先用 capacity（立方米），否则用长宽高（厘米）；都未设置时返回 None"""
+    if capacity:
+        return capacity * 1_000_000
+    if width and depth and height:
+        return width * depth * height
+    return None
+
+
+def goods_unit_volume(length, width, height) -> float:
+    """单件商品体积（立方厘米，商品尺寸为毫米）；尺寸不全时按 0 处理"""
+    if length and width and height:
+        return length * width * height / 1000
+    return 0.0
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisCapacityStore:
+    """
+    Redis 中的库位剩余容量索引（多 worker 共享）
+
+    首次查询（或构建标记过期）时从数据库全量构建；之后由商品库位数量变更在事务提交后增量更新。
+    """
+
+    def __init__(self, warehouse_id: int):
+        self.warehouse_id = warehouse_id
+        self.free_key = FREE_KEY.format(warehouse_id=warehouse_id)
+
+    def ensure_built(self):
+        if not redis_client.exists(BUILT_KEY.format(warehouse_id=self.warehouse_id)):
+            build_capacity_index(self.warehouse_id)
+
+    def goods_bins(self, goods_id: int) -> dict:
+        raw = redis_client.hgetall(GOODS_KEY.format(warehouse_id=self.warehouse_id, goods_id=goods_id))
+        return {int(_decode(k)): int(_decode(v)) for k, v in raw.items() if int(_decode(v)) > 0}
+
+    def free_volumes(self, location_ids: list) -> dict:
+        scores = redis_client.zmscore(self.free_key, location_ids)
+        return {location_id: score for location_id, score in zip(location_ids, scores) if score is not None}
+
+    def smallest_fitting(self, volume: float, count: int) -> list:
+        low = volume if volume > 0 else '(0'
+        rows = redis_client.zrangebyscore(self.free_key, low, '+inf', start=0, num=count, withscores=True)
+        return [(int(_decode(member)), score) for member, score in rows]
+
+    def largest(self, count: int) -> list:
+        rows = redis_client.zrevrangebyscore(self.free_key, '+inf', '(0', start=0, num=count, withscores=True)
+        return [(int(_decode(member)), score) for member, score in rows]
+
+
+class DatabaseCapacityStore:
+    """未启用 Redis 索引（或 Redis 不可用）时直接按数据库计算剩余容量"""
+
+    def __init__(self, warehouse_id: int):
+        self.warehouse_id = warehouse_id
+        unit_volume = case(
+            (
+                Goods.length.isnot(None) & Goods.width.isnot(None) & Goods.height.isnot(None),
+                Goods.length * Goods.width * Goods.height / 1000.0,
+            ),
+            else_=0,
+        )
+        used = select(
+            GoodsLocation.location_id.label('location_id'),
+            func.sum(GoodsLocation.quantity * unit_volume).label('volume'),
+        ).join(
+            Goods, GoodsLocation.goods_id == Goods.id
+        ).group_by(GoodsLocation.location_id).subquery()
+        volume = case(
+            (Location.capacity > 0, Location.capacity * 1_000_000),
+            else_=Location.width * Location.depth * Location.height,
+        )
+        self.free = (volume - func.coalesce(used.c.volume, 0)).label('free')
+        self.query = db.session.query(Location.id, self.free).outerjoin(
+            used, used.c.location_id == Location.id
+        ).filter(
+            Location.warehouse_id == warehouse_id,
+            Location.location_type == 'standard',
+            Location.is_active.is_(True),
+        )
+
+    def goods_bins(self, goods_id: int) -> dict:
+        rows = db.session.query(GoodsLocation.location_id, GoodsLocation.quantity).join(
+            Location, GoodsLocation.location_id == Location.id
+        ).filter(
+            GoodsLocation.goods_id == goods_id,
+            GoodsLocation.quantity > 0,
+            Location.warehouse_id == self.warehouse_id,
+            Location.location_type == 'standard',
+            Location.is_active.is_(True),
+        )
+        return dict(rows.all())
+
+    def free_volumes(self, location_ids: list) -> dict:
+        rows = self.query.filter(Location.id.in_(location_ids), self.free.isnot(None))
+        return {location_id: free for location_id, free in rows}
+
+    def smallest_fitting(self, volume: float, count: int) -> list:
+        condition = self.free >= volume if volume > 0 else self.free > 0
+        return [tuple(row) for row in self.query.filter(condition).order_by(self.free, Location.id).limit(count)]
+
+    def largest(self, count: int) -> list:
+        return [tuple(row) for row in self.query.filter(self.free > 0).order_by(self.free.desc(), Location.id).limit(count)]
+
+
+def build_capacity_index(warehouse_id: int):
+    """从数据库全量构建仓库的 Redis 容量索引（两次查询）"""
+    locations = db.session.query(
+        Location.id, Location.capacity, Location.width, Location.depth, Location.height
+    ).filter(
+        Location.warehouse_id == warehouse_id,
+        Location.location_type == 'standard',
+        Location.is_active.is_(True),
+    ).all()
+    free = {}
+    for location_id, capacity, width, depth, height in locations:
+        volume = location_volume(capacity, width, depth, height)
+        if volume is not None:
+            free[location_id] = volume
+
+    bins = {}
+    rows = db.session.query(
+        GoodsLocation.goods_id, GoodsLocation.location_id, GoodsLocation.quantity,
+        Goods.length, Goods.width, Goods.height,
+    ).join(
+        Goods, GoodsLocation.goods_id == Goods.id
+    ).join(
+        Location, GoodsLocation.location_id == Location.id
+    ).filter(
+        Location.warehouse_id == warehouse_id,
+        Location.location_type == 'standard',
+        Location.is_active.is_(True),
+        GoodsLocation.quantity > 0,
+    )
+    for goods_id, location_id, quantity, length, width, height in rows:
+        bins.setdefault(goods_id, {})[location_id] = quantity
+        if location_id in free:
+            free[location_id] -= quantity * goods_unit_volume(length, width, height)
+
+    free_key = FREE_KEY.format(warehouse_id=warehouse_id)
+    goods_ids_key = GOODS_IDS_KEY.format(warehouse_id=warehouse_id)
+    stale = [GOODS_KEY.format(warehouse_id=warehouse_id, goods_id=_decode(goods_id))
+             for goods_id in redis_client.smembers(goods_ids_key)]
+    pipe = redis_client.pipeline()
+    pipe.delete(free_key, goods_ids_key, *stale)
+    items = list(free.items())
+    for start in range(0, len(items), _BUILD_CHUNK_SIZE):
+        pipe.zadd(free_key, dict(items[start:start + _BUILD_CHUNK_SIZE]))
+    for goods_id, quantities in bins.items():
+        pipe.hset(GOODS_KEY.format(warehouse_id=warehouse_id, goods_id=goods_id), mapping=quantities)
+    if bins:
+        pipe.sadd(goods_ids_key, *bins)
+    pipe.set(BUILT_KEY.format(warehouse_id=warehouse_id), time.time(),
+             ex=current_app.config.get('PUTAWAY_CAPACITY_INDEX_TTL', 3600) or None)
+    pipe.execute()
+
+
+def stage_capacity_changes(changes: dict):
+    """
+    记录商品库位数量变更（提交后写入索引）
+    :param changes: dict，{(goods_id, location_id): 数量变化}
+
+    由 GoodsLocationService.apply_quantity_changes 调用，上架/下架/移库/调整都经由这里；
+    一次查询取出库位所属仓库与商品体积，提交前就算好每个库位的体积变化。
+    """
+    if not capacity_index_enabled() or not changes:
+        return
+    goods_ids = {goods_id for goods_id, _ in changes}
+    location_ids = {location_id for _, location_id in changes}
+    goods_volumes = {
+        goods_id: goods_unit_volume(length, width, height)
+        for goods_id, length, width, height in db.session.query(
+            Goods.id, Goods.length, Goods.width, Goods.height
+        ).filter(Goods.id.in_(goods_ids))
+    }
+    locations = {
+        location.id: location
+        for location in Location.query.options(lazyload('*')).filter(
+            Location.id.in_(location_ids),
+            Location.location_type == 'standard',
+            Location.is_active.is_(True),
+        )
+    }
+    pending = db.session.info.setdefault(_PENDING_KEY, [])
+    for (goods_id, location_id), quantity in changes.items():
+        location = locations.get(location_id)
+        if location is None:
+            continue
+        tracked = location_volume(location.capacity, location.width, location.depth, location.height) is not None
+        pending.append((
+            location.warehouse_id, goods_id, location_id, quantity,
+            quantity * goods_volumes.get(goods_id, 0.0) if tracked else None,
+        ))
+
+
+def invalidate_capacity_index(warehouse_id: int):
+    """
+    标记仓库的容量索引失效（提交后删除构建标记，下一次查询全量重建）
+
+    库位的新增、删除、停用或尺寸/类型变更会改变索引中的库位集合与容积，无法增量修正，
+    由 LocationService 在这些变更时调用。
+    """
+    if not capacity_index_enabled():
+        return
+    db.session.info.setdefault(_INVALIDATED_KEY, set()).add(warehouse_id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _write_capacity_changes(session):
+    """事务提交后增量更新已构建的索引；未构建（或刚被失效）的仓库跳过（下次查询时全量构建）"""
+    invalidated = session.info.pop(_INVALIDATED_KEY, None)
+    if invalidated:
+        try:
+            redis_client.delete(*(BUILT_KEY.format(warehouse_id=warehouse_id) for warehouse_id in sorted(invalidated)))
+        except RedisError as e:
+            current_app.logger.warning(f"Failed to invalidate putaway capacity index: {e}")
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    try:
+        warehouse_ids = sorted({item[0] for item in pending})
+        pipe = redis_client.pipeline(transaction=False)
+        for warehouse_id in warehouse_ids:
+            pipe.exists(BUILT_KEY.format(warehouse_id=warehouse_id))
+        built = {warehouse_id for warehouse_id, exists in zip(warehouse_ids, pipe.execute()) if exists}
+
+        pipe = redis_client.pipeline(transaction=False)
+        applied = []
+        for warehouse_id, goods_id, location_id, quantity, volume in pending:
+            if warehouse_id not in built:
+                continue
+            goods_key = GOODS_KEY.format(warehouse_id=warehouse_id, goods_id=goods_id)
+            pipe.hincrby(goods_key, location_id, quantity)
+            pipe.sadd(GOODS_IDS_KEY.format(warehouse_id=warehouse_id), goods_id)
+            if volume is not None:
+                pipe.zincrby(FREE_KEY.format(warehouse_id=warehouse_id), -volume, location_id)
+            applied.append((goods_key, location_id, volume is not None))
+        results = iter(pipe.execute())
+
+        # 数量归零的同商品库位从 Hash 中移除
+        pipe = redis_client.pipeline(transaction=False)
+        emptied = False
+        for goods_key, location_id, has_volume in applied:
+            remaining = next(results)
+            next(results)
+            if has_volume:
+                next(results)
+            if int(remaining) <= 0:
+                pipe.hdel(goods_key, location_id)
+                emptied = True
+        if emptied:
+            pipe.execute()
+    except RedisError as e:
+        current_app.logger.warning(f"Failed to update putaway capacity index: {e}")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_capacity_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_INVALIDATED_KEY, None)
+
+
+def get_capacity_store(warehouse_id: int):
+    """启用索引时返回 Redis 索引（必要时先构建），否则或 Redis 不可用时返回数据库实现"""
+    if capacity_index_enabled():
+        store = RedisCapacityStore(warehouse_id)
+        try:
+            store.ensure_built()
+            return store
+        except RedisError as e:
+            current_app.logger.warning(f"Putaway capacity index unavailable, falling back to database: {e}")
+    return DatabaseCapacityStore(warehouse_id)
@@ -1,12 +1,16 @@
 from datetime import datetime
 from extensions import db
-from sqlalchemy import or_,func
+from sqlalchemy import or_,func, update, delete, tuple_, bindparam, inspect
+from sqlalchemy.orm import lazyload
+from sqlalchemy.orm.exc import StaleDataError
 from collections import defaultdict
-from extensions.db import get_object_or_404
+from extensions.db import get_object_or_404, upsert
+from extensions.error import BadRequestException
 from extensions.transaction import transactional
 from warehouse.inventory.models import Inventory
 from warehouse.location.models import Location
 from .models import Goods, GoodsLocation
+from .capacity import stage_capacity_changes
 
 class GoodsService:
     """
@@ -358,15 +362,22 @@ class GoodsLocationService:
 
         :param data: 包含 GoodsLocation 数据的字典
         :return: 新创建的 GoodsLocation 对象
-        """
-        new_goods_location = GoodsLocation(
-            goods_id=data['goods_id'],
-            location_id=data['location_id'],
-            quantity=data.get('quantity', 0)
+
+        与上架一致走 upsert：(goods_id, location_id) 已存在时累加数量，不会违反唯一约束。
+        """
+        quantity = data.get('quantity') or 0
+        if quantity < 0:
+            raise BadRequestException("Goods location quantity must not be negative", 15027)
+        key = (data['goods_id'], data['location_id'])
+        upsert(
+            GoodsLocation,
+            [{'goods_id': key[0], 'location_id': key[1], 'quantity': quantity}],
+            index_elements=['goods_id', 'location_id'],
+            increment=['quantity'],
         )
-        db.session.add(new_goods_location)
+        GoodsLocationService._after_quantity_changes({key: quantity})
         # db.session.commit()
-        return new_goods_location
+        return GoodsLocationService.get_goods_location_record(*key)
 
     @staticmethod
     def get_goods_location(goods_location_id: int) -> GoodsLocation:
@@ -387,9 +398,29 @@ class GoodsLocationService:
         :param goods_location: 需要更新的 GoodsLocation 对象
         :param data: 要更新的字段数据
         :return: 更新后的 GoodsLocation 对象
+
+        数量以带条件的 UPDATE 写入（WHERE quantity = 读取时的数量），期间被其他事务修改时
+        抛出 StaleDataError，由 @transactional 整体重试。
         """
         goods_location = GoodsLocationService.get_goods_location(goods_location_id)
-        goods_location.quantity = data.get('quantity', goods_location.quantity)
+        quantity = data.get('quantity')
+        if quantity is None or quantity == goods_location.quantity:
+            return goods_location
+        if quantity < 0:
+            raise BadRequestException("Goods location quantity must not be negative", 15027)
+
+        previous = goods_location.quantity
+        result = db.session.execute(
+            update(GoodsLocation)
+            .where(GoodsLocation.id == goods_location_id, GoodsLocation.quantity == previous)
+            .values(quantity=quantity, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise StaleDataError(f"GoodsLocation {goods_location_id} was modified concurrently")
+        GoodsLocationService._after_quantity_changes(
+            {(goods_location.goods_id, goods_location.location_id): quantity - previous}
+        )
         # db.session.commit()
         return goods_location
 
@@ -400,9 +431,20 @@ class GoodsLocationService:
         删除指定的 GoodsLocation。
 
         :param goods_location: 需要删除的 GoodsLocation 对象
+
+        以一条 DELETE ... RETURNING 删除，按实际删除的数量更新容量索引。
         """
         goods_location = GoodsLocationService.get_goods_location(goods_location_id)
-        db.session.delete(goods_location)
+        key = (goods_location.goods_id, goods_location.location_id)
+        removed = db.session.execute(
+            delete(GoodsLocation)
+            .where(GoodsLocation.id == goods_location_id)
+            .returning(GoodsLocation.quantity)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        db.session.expunge(goods_location)
+        if removed:
+            stage_capacity_changes({key: -removed})
         # db.session.commit()
 
     @staticmethod
@@ -453,24 +495,147 @@ class GoodsLocationService:
         return GoodsLocation.query.filter_by(
             goods_id=goods_id,
             location_id=location_id
-        ).first()
+        ).one_or_none()
     
 
+    @staticmethod
+    def get_goods_location_records_for_update(keys) -> dict:
+        """
+        一次查询并锁定多条商品库位记录
+        :param keys: 可迭代的 (goods_id, location_id)
+        :return: dict，{(goods_id, location_id): GoodsLocation}，不存在的组合不在结果中
+        """
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        query = (
+            GoodsLocation.query.options(lazyload('*'))
+            .filter(tuple_(GoodsLocation.goods_id, GoodsLocation.location_id).in_(keys))
+            .order_by(GoodsLocation.id)
+            .with_for_update()
+        )
+        return {(record.goods_id, record.location_id): record for record in query}
+
+    @staticmethod
+    def existing_goods_location_keys(keys) -> set:
+        """
+        批量判断商品是否在库位上（is_goods_in_location 的批量版本，一次查询）
+        :param keys: 可迭代的 (goods_id, location_id)
+        :return: set，存在商品库位记录的 (goods_id, location_id)
+        """
+        keys = list(set(keys))
+        if not keys:
+            return set()
+        rows = db.session.query(GoodsLocation.goods_id, GoodsLocation.location_id).filter(
+            tuple_(GoodsLocation.goods_id, GoodsLocation.location_id).in_(keys)
+        ).distinct().all()
+        return {(row.goods_id, row.location_id) for row in rows}
+
+    @staticmethod
+    def apply_quantity_changes(changes: dict) -> bool:
+        """
+        以原子语句批量变更商品库位数量，不先读后写
+        :param changes: dict，{(goods_id, location_id): 数量变化}，正数增加、负数扣减
+        :return: 是否全部成功；有扣减失败（记录不存在或数量不足）时返回 False，
+                 此时增加部分尚未执行，调用方应抛出异常回滚事务
+
+        扣减：带条件的 UPDATE（quantity >= 扣减量），扣减到 0 的记录随后一条 DELETE 删除；
+        增加：一条多行 upsert（依赖 (goods_id, location_id) 唯一约束），不存在的记录直接插入。
+        """
+        changes = {key: quantity for key, quantity in changes.items() if quantity}
+        if not changes:
+            return True
+        db.session.flush()
+        table = GoodsLocation.__table__
+
+        decrements = [
+            {'b_goods_id': goods_id, 'b_location_id': location_id, 'b_quantity': -quantity}
+            for (goods_id, location_id), quantity in changes.items() if quantity < 0
+        ]
+        if decrements:
+            statement = (
+                update(table)
+                .where(
+                    table.c.goods_id == bindparam('b_goods_id'),
+                    table.c.location_id == bindparam('b_location_id'),
+                    table.c.quantity >= bindparam('b_quantity'),
+                )
+                .values(quantity=table.c.quantity - bindparam('b_quantity'), updated_at=func.now())
+            )
+            if len(decrements) == 1 or db.session.get_bind().dialect.supports_sane_multi_rowcount:
+                if db.session.execute(statement, decrements).rowcount != len(decrements):
+                    return False
+            else:
+                # 驱动不返回 executemany 的总影响行数时逐行执行，逐行核对扣减是否成功
+                for decrement in decrements:
+                    if db.session.execute(statement, decrement).rowcount != 1:
+                        return False
+            db.session.execute(
+                delete(GoodsLocation).where(
+                    tuple_(GoodsLocation.goods_id, GoodsLocation.location_id).in_(
+                        [key for key, quantity in changes.items() if quantity < 0]
+                    ),
+                    GoodsLocation.quantity == 0,
+                ),
+                execution_options={'synchronize_session': 'fetch'},
+            )
+
+        upsert(
+            GoodsLocation,
+            [
+                {'goods_id': goods_id, 'location_id': location_id, 'quantity': quantity}
+                for (goods_id, location_id), quantity in changes.items() if quantity > 0
+            ],
+            index_elements=['goods_id', 'location_id'],
+            increment=['quantity'],
+        )
+
+        GoodsLocationService._after_quantity_changes(changes)
+        return True
+
+    @staticmethod
+    def _after_quantity_changes(changes: dict):
+        """
+        以语句变更商品库位数量后的收尾：身份映射中已加载的记录过期，容量索引记录待写入的变化
+        :param changes: dict，{(goods_id, location_id): 数量变化}
+        """
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, GoodsLocation):
+                state = inspect(obj).dict
+                if (state.get('goods_id'), state.get('location_id')) in changes:
+                    db.session.expire(obj, ['quantity', 'updated_at'])
+
+        # 上架库位推荐的剩余容量索引在提交后增量更新
+        stage_capacity_changes({key: quantity for key, quantity in changes.items() if quantity})
+
+    @staticmethod
+    def add_quantity(goods_id: int, location_id: int, quantity: int):
+        """
+        增加商品在库位上的数量，记录不存在则创建（一条 upsert 语句）
+        """
+        GoodsLocationService.apply_quantity_changes({(goods_id, location_id): quantity})
+
+    @staticmethod
+    def deduct_quantity(goods_id: int, location_id: int, quantity: int) -> bool:
+        """
+        扣减商品在库位上的数量，扣减到 0 时删除记录
+        :return: 是否扣减成功；记录不存在或数量不足时返回 False，不做任何修改
+        """
+        return GoodsLocationService.apply_quantity_changes({(goods_id, location_id): -quantity})
+
     @staticmethod
     def get_quantity(goods_id:int,location_id:int) -> int:
         """
-        获取商品数量：根据库存记录获取指定商品在指定库位的总库存量
+        获取商品数量：根据库存记录获取指定商品在指定库位的库存量
         """
-        # 使用 SQLAlchemy 的 sum 函数对 quantity 进行聚合
-        total_quantity = GoodsLocation.query.with_entities(
-            func.sum(GoodsLocation.quantity).label('total')
-        ).filter_by(
+        # (goods_id, location_id) 唯一，至多一条记录
+        quantity = db.session.query(GoodsLocation.quantity).filter_by(
             goods_id=goods_id,
             location_id=location_id
-        ).scalar()  # scalar() 返回单个标量值
+        ).scalar()
 
-        # 处理查询结果为 None 的情况（当没有库存记录时返回 0）
-        return total_quantity if total_quantity is not None else 0
+        # 没有库存记录时返回 0
+        return quantity if quantity is not None else 0
     
     @staticmethod
     def is_goods_in_location(goods_id:int,location_id:int) -> bool:
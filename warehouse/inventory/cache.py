@@ -0,0 +1,195 @@
+import time
+from flask import current_app, has_app_context
+from redis.exceptions import RedisError, WatchError
+from sqlalchemy import event
+from extensions import db, redis_client
+from .models import Inventory, InventoryShard
+from .shards import remaining_by_key
+
+# 可用量缓存：Redis Hash，key 为 inventory:availability:{warehouse_id}:{goods_id}
+AVAILABILITY_KEY = 'inventory:availability:{warehouse_id}:{goods_id}'
+
+# 缓存的库存计数字段
+AVAILABILITY_FIELDS = (
+    'total_stock', 'onhand_stock', 'locked_stock', 'damage_stock', 'return_stock',
+    'asn_stock', 'received_stock', 'sorted_stock',
+    'dn_stock', 'picked_stock', 'packed_stock', 'delivered_stock',
+)
+
+# 本事务内待写入缓存的变更，保存在 session.info 中，提交后统一写入、回滚时丢弃
+_PENDING_KEY = 'inventory_availability_pending'
+
+
+def availability_cache_enabled() -> bool:
+    return has_app_context() and current_app.config.get('INVENTORY_AVAILABILITY_CACHE', False)
+
+
+def availability_key(warehouse_id: int, goods_id: int) -> str:
+    return AVAILABILITY_KEY.format(warehouse_id=warehouse_id, goods_id=goods_id)
+
+
+def pack_availability(inventory: Inventory, shard_remaining: int = None) -> dict:
+    """
+    将库存记录打包为缓存内容（只包含数值计数字段）
+    :param shard_remaining: 已启用分片时为分片余量合计，未启用为 None
+    """
+    payload = {field: getattr(inventory, field) or 0 for field in AVAILABILITY_FIELDS}
+    payload['goods_id'] = inventory.goods_id
+    payload['warehouse_id'] = inventory.warehouse_id
+    payload['shard_remaining'] = shard_remaining
+    return payload
+
+
+def with_derived_fields(payload: dict) -> dict:
+    """
+    补充可用库存、可售库存等派生字段（与 Inventory 模型属性计算方式一致）
+
+    已启用分片的商品，分片扣减在再平衡前不会计入 dn_stock / locked_stock，
+    可售库存取计数字段与分片余量中较小者，可用库存扣减相同的差额。
+    """
+    payload['available_stock'] = (
+        payload['onhand_stock'] + payload['damage_stock'] + payload['return_stock']
+        - payload['locked_stock'] - payload['dn_stock']
+    )
+    payload['available_stock_for_sale'] = (
+        payload['onhand_stock'] - payload['locked_stock'] - payload['dn_stock']
+    )
+    shard_remaining = payload.get('shard_remaining')
+    if shard_remaining is not None:
+        excess = payload['available_stock_for_sale'] - max(shard_remaining, 0)
+        if excess > 0:
+            payload['available_stock'] -= excess
+            payload['available_stock_for_sale'] -= excess
+    return payload
+
+
+def _write(pipe, payload: dict):
+    """写入一条缓存：覆盖计数字段，版本号自增，并记录写入时间"""
+    key = availability_key(payload['warehouse_id'], payload['goods_id'])
+    mapping = {field: value for field, value in payload.items() if value is not None}
+    mapping['cached_at'] = time.time()
+    pipe.hset(key, mapping=mapping)
+    if payload.get('shard_remaining') is None:
+        pipe.hdel(key, 'shard_remaining')
+    pipe.hincrby(key, 'version', 1)
+    ttl = current_app.config.get('INVENTORY_AVAILABILITY_CACHE_TTL', 86400)
+    if ttl:
+        pipe.expire(key, ttl)
+
+
+def stage_availability_invalidation(keys):
+    """
+    标记缓存失效（提交后删除）
+    :param keys: 可迭代的 (goods_id, warehouse_id)
+
+    用于绕过 ORM 的批量 UPDATE/DELETE 语句，ORM 对象的变更会在 flush 时自动收集。
+    """
+    if not availability_cache_enabled():
+        return
+    pending = db.session.info.setdefault(_PENDING_KEY, {})
+    for goods_id, warehouse_id in keys:
+        pending[(goods_id, warehouse_id)] = None
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_inventory_changes(session, flush_context):
+    """
+    flush 后收集本次新增/修改/删除的库存记录，此时字段值即为写入数据库的值
+
+    只有分片变更（DN 预扣、锁定从分片扣减）时缓存直接失效，由下次读取回填；
+    库存记录变更时同时查询分片余量一并写入。
+    """
+    if not availability_cache_enabled():
+        return
+    changes = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, InventoryShard):
+            changes.setdefault((obj.goods_id, obj.warehouse_id), None)
+        elif isinstance(obj, Inventory):
+            changes[(obj.goods_id, obj.warehouse_id)] = None if obj in session.deleted else obj
+    if not changes:
+        return
+    shard_remaining = remaining_by_key(key for key, obj in changes.items() if obj is not None)
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for key, obj in changes.items():
+        pending[key] = None if obj is None else pack_availability(obj, shard_remaining.get(key))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _write_through(session):
+    """事务提交后写穿缓存；Redis 不可用时只记录日志，读取端会回落到数据库"""
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for (goods_id, warehouse_id), payload in pending.items():
+            if payload is None:
+                pipe.delete(availability_key(warehouse_id, goods_id))
+            else:
+                _write(pipe, payload)
+        pipe.execute()
+    except RedisError as e:
+        current_app.logger.warning(f"Failed to update inventory availability cache: {e}")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _invalidate_after_savepoint_rollback(session, previous_transaction):
+    """回滚到保存点时，已收集的写入值可能来自被回滚的 flush，一律改为提交后失效"""
+    if not previous_transaction.nested:
+        return
+    pending = session.info.get(_PENDING_KEY)
+    if pending:
+        for key in pending:
+            pending[key] = None
+
+
+def get_cached_availability(goods_id: int, warehouse_id: int):
+    """
+    读取缓存的库存计数
+    :return: dict 或 None（未命中或 Redis 不可用）
+    """
+    try:
+        raw = redis_client.hgetall(availability_key(warehouse_id, goods_id))
+    except RedisError as e:
+        current_app.logger.warning(f"Failed to read inventory availability cache: {e}")
+        return None
+    if not raw:
+        return None
+    data = {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in raw.items()
+    }
+    payload = {field: int(data.get(field, 0)) for field in AVAILABILITY_FIELDS}
+    payload['goods_id'] = goods_id
+    payload['warehouse_id'] = warehouse_id
+    payload['shard_remaining'] = int(data['shard_remaining']) if 'shard_remaining' in data else None
+    payload['version'] = int(data.get('version', 0))
+    payload['cached_at'] = float(data.get('cached_at', 0))
+    return payload
+
+
+def fill_availability_cache(payload: dict):
+    """
+    未命中时回填缓存：仅在 key 仍不存在时写入（WATCH 保护）
+
+    读取数据库与回填之间若已有事务提交并写穿缓存，则放弃回填，避免旧值覆盖新值。
+    """
+    key = availability_key(payload['warehouse_id'], payload['goods_id'])
+    try:
+        with redis_client.pipeline() as pipe:
+            pipe.watch(key)
+            if pipe.exists(key):
+                return
+            pipe.multi()
+            _write(pipe, payload)
+            pipe.execute()
+    except WatchError:
+        pass
+    except RedisError as e:
+        current_app.logger.warning(f"Failed to fill inventory availability cache: {e}")
@@ -0,0 +1,59 @@
+from flask import current_app, has_app_context
+from sqlalchemy import tuple_
+from sqlalchemy.orm import lazyload
+from extensions.error import NotFoundException
+from .models import Inventory
+
+
+def sort_lock_keys(keys) -> list:
+    """
+    对 (goods_id, warehouse_id) 去重并按 (warehouse_id, goods_id) 排序
+    :param keys: 可迭代的 (goods_id, warehouse_id)
+    :return: list，排序后的 (goods_id, warehouse_id)
+
+    所有多行库存操作都必须按此顺序加锁：两个事务即使以相反顺序提交相同的商品，
+    也会以同一顺序竞争行锁，只会互相等待而不会形成死锁。
+    """
+    return sorted(set(keys), key=lambda key: (key[1], key[0]))
+
+
+def optimistic_locking_enabled() -> bool:
+    """INVENTORY_CONCURRENCY_MODE 为 optimistic 时库存写操作不加行锁，依赖版本号比较"""
+    return has_app_context() and current_app.config.get('INVENTORY_CONCURRENCY_MODE') == 'optimistic'
+
+
+def lock_inventories(keys, missing_ok: bool = False) -> dict:
+    """
+    库存行锁统一入口：一次 SELECT ... FOR UPDATE 按固定顺序锁定多条库存记录
+    :param keys: 可迭代的 (goods_id, warehouse_id)
+    :param missing_ok: 为 True 时不存在的记录直接不出现在结果中
+    :return: dict，{(goods_id, warehouse_id): Inventory}
+
+    任一记录不存在则抛出 404（错误码 43001），missing_ok 时除外。
+    乐观模式下只做普通读取：写回时的 UPDATE 带 WHERE version = :v，
+    期间若有其他事务提交则抛出 StaleDataError，由 @transactional 整体重试。
+    """
+    keys = sort_lock_keys(keys)
+    if not keys:
+        return {}
+    query = (
+        Inventory.query
+        .options(lazyload('*'))
+        .filter(tuple_(Inventory.goods_id, Inventory.warehouse_id).in_(keys))
+        .order_by(Inventory.warehouse_id, Inventory.goods_id)
+    )
+    if optimistic_locking_enabled():
+        # 身份映射中可能是本事务早先读取的旧值，强制刷新以拿到最新版本号
+        query = query.populate_existing()
+    else:
+        query = query.with_for_update()
+    rows = query.all()
+    inventories = {(row.goods_id, row.warehouse_id): row for row in rows}
+    if missing_ok:
+        return inventories
+    for goods_id, warehouse_id in keys:
+        if (goods_id, warehouse_id) not in inventories:
+            raise NotFoundException(
+                f"Inventory not found for goods {goods_id} in warehouse {warehouse_id}", 43001
+            )
+    return inventories
@@ -8,6 +8,8 @@ class Inventory(db.Model):
         db.Index('idx_inventory_goods_warehouse', 'goods_id', 'warehouse_id'),  # 商品+仓库维度查询        
         db.Index('idx_low_stock', 'low_stock_threshold'),  # 低库存预警查询加速
         db.Index('idx_high_stock', 'high_stock_threshold'),  # 高库存积压分析
+        db.Index('idx_inventory_low_breach', 'warehouse_id', 'is_below_low_threshold'),  # 待补货清单
+        db.Index('idx_inventory_high_breach', 'warehouse_id', 'is_above_high_threshold'),  # 积压清单
         db.CheckConstraint('total_stock >= 0', name='chk_non_negative_total_stock'),
     )
 
@@ -73,6 +75,21 @@ class Inventory(db.Model):
         default=-1,
         info={'description': '积压阈值（触发促销建议）'}
     )
+    # 阈值越界标记（随库存变更在同一事务内刷新，见 thresholds.py）
+    is_below_low_threshold = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+        server_default=db.false(),
+        info={'description': '可售库存低于补货阈值'}
+    )
+    is_above_high_threshold = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+        server_default=db.false(),
+        info={'description': '可售库存高于积压阈值'}
+    )
 
     # 物流过程字段（增加流程校验）
     asn_stock = db.Column(
@@ -125,6 +142,15 @@ class Inventory(db.Model):
         nullable=True,
         info={'description': '库存备注'}
     )
+    # 乐观锁版本号：每次 UPDATE 以 WHERE version = :v 比较并递增，版本不符时抛出 StaleDataError
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default='1',
+        info={'description': '版本号（乐观并发控制）'}
+    )
+    __mapper_args__ = {'version_id_col': version}
     # 时间字段（优化索引策略）
     create_at = db.Column(
         db.DateTime,
@@ -185,4 +211,102 @@ class Inventory(db.Model):
             f"  - Packed       : {self.packed_stock}\n"
             f"  - Delivered    : {self.delivered_stock}\n\n"
             f"  Thresholds     : {self.low_stock_threshold}~{self.high_stock_threshold}"
-    )
\ No newline at end of file
+    )
+
+class InventoryLedger(db.Model):
+    """库存流水表（只追加，按商品+仓库+库存字段记录每次变动量）"""
+    __tablename__ = 'inventory_ledger'
+
+    __table_args__ = (
+        db.Index('idx_inventory_ledger_goods_warehouse_bucket_time', 'goods_id', 'warehouse_id', 'bucket', 'created_at'),  # 按时间区间回放
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    goods_id = db.Column(
+        db.Integer,
+        db.ForeignKey('goods.id', ondelete='RESTRICT'),
+        nullable=False,
+        info={'description': '商品ID'}
+    )
+    warehouse_id = db.Column(
+        db.Integer,
+        db.ForeignKey('warehouses.id', ondelete='RESTRICT'),
+        nullable=False,
+        info={'description': '仓库ID'}
+    )
+    bucket = db.Column(
+        db.String(20),
+        nullable=False,
+        info={'description': '库存字段（onhand_stock、dn_stock 等）'}
+    )
+    delta = db.Column(
+        db.Integer,
+        nullable=False,
+        info={'description': '变动量（有符号）'}
+    )
+    source_type = db.Column(
+        db.String(30),
+        nullable=True,
+        info={'description': '来源单据类型（asn、dn、putaway、removal、transfer、adjustment、reconcile、shard、manual）'}
+    )
+    source_id = db.Column(
+        db.Integer,
+        nullable=True,
+        info={'description': '来源单据ID'}
+    )
+    created_at = db.Column(
+        db.DateTime,
+        default=db.func.now(),
+        nullable=False,
+        info={'description': '变动时间'}
+    )
+
+    def __repr__(self):
+        return f"<InventoryLedger {self.goods_id}@{self.warehouse_id} {self.bucket} {self.delta:+d}>"
+
+
+class InventoryShard(db.Model):
+    """热点商品库存分片（可售库存拆分到多个子行，DN 预扣从各分片独立扣减，定期回收合并到 Inventory.dn_stock）"""
+    __tablename__ = 'inventory_shards'
+
+    goods_id = db.Column(
+        db.Integer,
+        db.ForeignKey('goods.id', ondelete='RESTRICT'),
+        primary_key=True,
+        info={'description': '商品ID'}
+    )
+    warehouse_id = db.Column(
+        db.Integer,
+        db.ForeignKey('warehouses.id', ondelete='RESTRICT'),
+        primary_key=True,
+        info={'description': '仓库ID'}
+    )
+    shard_no = db.Column(
+        db.Integer,
+        primary_key=True,
+        info={'description': '分片序号（从 0 开始）'}
+    )
+    allotment = db.Column(
+        db.Integer,
+        default=0,
+        nullable=False,
+        info={'description': '上次再平衡时分配给本分片的可售库存'}
+    )
+    reserved = db.Column(
+        db.Integer,
+        default=0,
+        nullable=False,
+        info={'description': '自上次再平衡以来从本分片扣减的 DN 预扣量'}
+    )
+    rebalanced_at = db.Column(
+        db.DateTime,
+        default=db.func.now(),
+        info={'description': '上次再平衡时间'}
+    )
+
+    @property
+    def remaining(self):
+        return self.allotment - self.reserved
+
+    def __repr__(self):
+        return f"<InventoryShard {self.goods_id}@{self.warehouse_id}#{self.shard_no} {self.reserved}/{self.allotment}>"
@@ -1,4 +1,4 @@
-from flask_restx import Namespace, fields
+from flask_restx import Namespace, fields, reqparse, inputs
 from system.common import pagination_parser,create_pagination_model
 from warehouse.goods.schemas import goods_model,goods_simple_model
 from warehouse.warehouse.schemas import warehouse_simple_model as warehouse_model
@@ -19,6 +19,8 @@ inventory_base_model = api_ns.model('InventoryBase', {
     'available_stock_for_sale': fields.Integer(readOnly=True, description='Available stock for sale (calculated)'),
     'low_stock_threshold': fields.Integer(description='Low Stock Warning Threshold (-1 to disable)'),
     'high_stock_threshold': fields.Integer(description='High Stock Warning Threshold (-1 to disable)'),
+    'is_below_low_threshold': fields.Boolean(readOnly=True, description='Available stock for sale is below the low stock threshold'),
+    'is_above_high_threshold': fields.Boolean(readOnly=True, description='Available stock for sale is above the high stock threshold'),
 
     # 收货相关字段
     'asn_stock': fields.Integer(default=0, description='ASN stock quantity (expected arrivals)'),
@@ -74,5 +76,96 @@ inventory_pagination_parser.add_argument('low_stock_threshold', type=int, help='
 inventory_pagination_parser.add_argument('high_stock_threshold', type=int, help='High Stock Warning Threshold', location='args')
 inventory_pagination_parser.add_argument('keyword', type=str, help='Search by keyword in goods name, code, manufacturer, category, tags, brand', location='args')
 
+# 阈值越界（待补货 / 积压）列表分页参数
+inventory_breach_pagination_parser = pagination_parser.copy()
+inventory_breach_pagination_parser.add_argument('breach', type=str, default='low', choices=('low', 'high'), help='low: below low stock threshold (replenishment needed), high: above high stock threshold', location='args')
+inventory_breach_pagination_parser.add_argument('goods_id', type=int, help='Associated Goods ID', location='args')
+
 # 创建分页模型
-pagination_model = create_pagination_model(api_ns, inventory_base_model)
\ No newline at end of file
+pagination_model = create_pagination_model(api_ns, inventory_base_model)
+
+# 历史时间点余额查询
+inventory_balance_parser = reqparse.RequestParser()
+inventory_balance_parser.add_argument('at', type=inputs.datetime_from_iso8601, required=True, help='Point in time (ISO 8601)', location='args')
+inventory_balance_parser.add_argument('bucket', type=str, default='onhand_stock', help='Stock field, e.g. onhand_stock, dn_stock', location='args')
+
+inventory_balance_model = api_ns.model('InventoryBalance', {
+    'goods_id': fields.Integer(description='Associated Goods ID'),
+    'warehouse_id': fields.Integer(description='Associated Warehouse ID'),
+    'bucket': fields.String(description='Stock field'),
+    'at': fields.DateTime(description='Point in time'),
+    'balance': fields.Integer(description='Balance of the stock field at the given time'),
+})
+
+# 可用量快速查询（缓存）模型
+inventory_availability_model = api_ns.model('InventoryAvailability', {
+    'goods_id': fields.Integer(description='Associated Goods ID'),
+    'warehouse_id': fields.Integer(description='Associated Warehouse ID'),
+    'total_stock': fields.Integer(description='Total stock quantity'),
+    'onhand_stock': fields.Integer(description='Available stock quantity'),
+    'locked_stock': fields.Integer(description='Locked stock quantity'),
+    'damage_stock': fields.Integer(description='Damaged stock quantity'),
+    'return_stock': fields.Integer(description='Backorder stock quantity'),
+    'asn_stock': fields.Integer(description='ASN stock quantity (expected arrivals)'),
+    'received_stock': fields.Integer(description='Received stock quantity'),
+    'sorted_stock': fields.Integer(description='Receiving sort stock quantity'),
+    'dn_stock': fields.Integer(description='DN stock quantity (pending shipments)'),
+    'picked_stock': fields.Integer(description='Pick stock quantity (to be picked)'),
+    'packed_stock': fields.Integer(description='Packed stock quantity (completed picks)'),
+    'delivered_stock': fields.Integer(description='Delivered stock quantity (ready for delivery)'),
+    'available_stock': fields.Integer(description='Available stock quantity (calculated)'),
+    'available_stock_for_sale': fields.Integer(description='Available stock for sale (calculated)'),
+    'version': fields.Integer(description='Cache version, increases on every committed change (null when read from database)'),
+    'cached_at': fields.Float(description='Unix timestamp of the cached value (null when read from database)'),
+})
+
+# 批量可用量查询模型
+inventory_availability_batch_input_model = api_ns.model('InventoryAvailabilityBatchInput', {
+    'goods_ids': fields.List(fields.Integer, description='Goods IDs'),
+    'goods_codes': fields.List(fields.String, description='Goods codes (merged with goods_ids)'),
+    'warehouse_ids': fields.List(fields.Integer, description='Warehouse IDs (default: all accessible warehouses)'),
+})
+
+inventory_availability_batch_item_model = api_ns.model('InventoryAvailabilityBatchItem', {
+    'goods_id': fields.Integer(description='Associated Goods ID'),
+    'goods_code': fields.String(description='Goods code'),
+    'warehouse_id': fields.Integer(description='Associated Warehouse ID'),
+    'total_stock': fields.Integer(description='Total stock quantity'),
+    'onhand_stock': fields.Integer(description='Available stock quantity'),
+    'locked_stock': fields.Integer(description='Locked stock quantity'),
+    'damage_stock': fields.Integer(description='Damaged stock quantity'),
+    'return_stock': fields.Integer(description='Backorder stock quantity'),
+    'asn_stock': fields.Integer(description='ASN stock quantity (expected arrivals)'),
+    'received_stock': fields.Integer(description='Received stock quantity'),
+    'sorted_stock': fields.Integer(description='Receiving sort stock quantity'),
+    'dn_stock': fields.Integer(description='DN stock quantity (pending shipments)'),
+    'picked_stock': fields.Integer(description='Pick stock quantity (to be picked)'),
+    'packed_stock': fields.Integer(description='Packed stock quantity (completed picks)'),
+    'delivered_stock': fields.Integer(description='Delivered stock quantity (ready for delivery)'),
+    'available_stock': fields.Integer(description='Available stock quantity (calculated)'),
+    'available_stock_for_sale': fields.Integer(description='Available stock for sale (calculated)'),
+})
+
+inventory_availability_batch_model = api_ns.model('InventoryAvailabilityBatch', {
+    'items': fields.List(fields.Nested(inventory_availability_batch_item_model), description='Stock counters per goods and warehouse'),
+})
+
+inventory_shard_input_model = api_ns.model('InventoryShardInput', {
+    'shard_count': fields.Integer(required=True, description='Number of shards (1 ~ INVENTORY_MAX_SHARDS)'),
+})
+
+inventory_shard_model = api_ns.model('InventoryShard', {
+    'shard_no': fields.Integer(description='Shard number'),
+    'allotment': fields.Integer(description='Stock for sale allotted at the last rebalance'),
+    'reserved': fields.Integer(description='DN reservations drawn since the last rebalance'),
+    'remaining': fields.Integer(description='Allotment not yet drawn'),
+    'rebalanced_at': fields.DateTime(description='Last rebalance time'),
+})
+
+inventory_shards_model = api_ns.model('InventoryShards', {
+    'goods_id': fields.Integer(description='Associated Goods ID'),
+    'warehouse_id': fields.Integer(description='Associated Warehouse ID'),
+    'shard_count': fields.Integer(description='Number of shards (0 = sharding disabled)'),
+    'remaining': fields.Integer(description='Allotment not yet drawn across all shards'),
+    'shards': fields.List(fields.Nested(inventory_shard_model)),
+})
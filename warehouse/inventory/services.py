@@ -1,30 +1,99 @@
-from sqlalchemy import func, case
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import func, case, insert, update, or_
 from sqlalchemy.orm import lazyload
 from extensions.db import *
 from extensions.error import BadRequestException, NotFoundException
-from extensions.transaction import transactional
+from extensions.transaction import transactional, mark_dirty, pop_dirty, register_dirty_handler
 from warehouse.goods.models import Goods
 from warehouse.warehouse.models import Warehouse
-from .models import Inventory
+from .cache import (
+    AVAILABILITY_FIELDS, availability_cache_enabled, get_cached_availability, fill_availability_cache,
+    pack_availability, stage_availability_invalidation, with_derived_fields,
+)
+from .locks import lock_inventories, sort_lock_keys
+from .thresholds import threshold_flags, threshold_transitions, emit_threshold_events
+from .models import Inventory, InventoryLedger, InventoryShard
+from .shards import draw_from_shards, lock_shards, remaining_by_key, sharded_keys, split_allotments
 
 class InventoryService:
 
+    # 各库存字段扣减为负时的默认错误（信息, 错误码），与单条操作的历史错误码保持一致
+    _INSUFFICIENT_STOCK_ERRORS = {
+        'locked_stock': ("Insufficient locked stock to unlock", 15004),
+        'asn_stock': ("Not enough ASN stock.", 15005),
+        'received_stock': ("Not enough received stock.", 15006),
+        'sorted_stock': ("Not enough sort stock.", 15007),
+        'dn_stock': ("Not enough DN stock.", 15008),
+        'picked_stock': ("Not enough pick stock.", 15009),
+        'packed_stock': ("Not enough packed stock.", 15010),
+        'delivered_stock': ("Not enough delivered stock.", 15011),
+    }
+
+    # 写入库存流水的库存字段（total_stock 为派生值，不单独记录）
+    _LEDGER_FIELDS = (
+        'onhand_stock', 'locked_stock', 'damage_stock', 'return_stock',
+        'asn_stock', 'received_stock', 'sorted_stock',
+        'dn_stock', 'picked_stock', 'packed_stock', 'delivered_stock',
+    )
+
+    # 库位类型与库存字段的对应关系（与 update_and_calculate_stock 的全量重算口径一致）
+    _LOCATION_STOCK_FIELDS = {
+        'standard': 'onhand_stock',
+        'damaged': 'damage_stock',
+        'return': 'return_stock',
+    }
+
+    @staticmethod
+    def _get_many_for_update(keys) -> dict:
+        """批量 SELECT ... FOR UPDATE，按 (warehouse_id, goods_id) 顺序加锁，见 locks.lock_inventories"""
+        return lock_inventories(keys)
+
     @staticmethod
     def _get_for_update(goods_id: int, warehouse_id: int) -> Inventory:
         """SELECT ... FOR UPDATE — 写操作专用，防止并发更新导致库存数据竞争"""
-        from extensions.error import NotFoundException
-        inventory = (
-            Inventory.query
-            .options(lazyload('*'))
-            .filter_by(goods_id=goods_id, warehouse_id=warehouse_id)
-            .with_for_update()
-            .first()
-        )
-        if not inventory:
-            raise NotFoundException(
-                f"Inventory not found for goods {goods_id} in warehouse {warehouse_id}", 43001
-            )
-        return inventory
+        return lock_inventories([(goods_id, warehouse_id)])[(goods_id, warehouse_id)]
+
+    @staticmethod
+    def _stock_state(inventory: Inventory) -> dict:
+        """记录库存各字段当前值，用于变更后生成流水"""
+        return {field: getattr(inventory, field) or 0 for field in InventoryService._LEDGER_FIELDS}
+
+    @staticmethod
+    def _ledger_rows(goods_id: int, warehouse_id: int, before: dict, after: dict, source: tuple = None) -> list:
+        """按字段比较变更前后的值，生成库存流水行（只包含变化的字段）"""
+        source_type, source_id = source or (None, None)
+        return [
+            {
+                'goods_id': goods_id,
+                'warehouse_id': warehouse_id,
+                'bucket': field,
+                'delta': (after.get(field) or 0) - (before.get(field) or 0),
+                'source_type': source_type,
+                'source_id': source_id,
+            }
+            for field in InventoryService._LEDGER_FIELDS
+            if (after.get(field) or 0) != (before.get(field) or 0)
+        ]
+
+    @staticmethod
+    def _write_ledger(changes: list, source: tuple = None):
+        """
+        写入库存流水（只追加）
+        :param changes: list，每个元素为 (inventory, before)，before 为变更前的 _stock_state，
+                        空 dict 表示新建记录（各字段从 0 开始）
+        :param source: 来源单据 (source_type, source_id)
+
+        只记录实际发生变化的字段，整批流水以一次 executemany 插入。
+        """
+        rows = []
+        for inventory, before in changes:
+            rows.extend(InventoryService._ledger_rows(
+                inventory.goods_id, inventory.warehouse_id, before,
+                InventoryService._stock_state(inventory), source,
+            ))
+        if rows:
+            db.session.execute(insert(InventoryLedger), rows)
 
     @staticmethod
     def _calculate_total_stock(inventory: Inventory) -> int:
@@ -78,6 +147,93 @@ class InventoryService:
         # 注意：对于复合主键，需要传入元组
         return get_object_or_404(Inventory, (goods_id, warehouse_id))
     
+    @staticmethod
+    def get_availability(goods_id: int, warehouse_id: int) -> dict:
+        """
+        快速查询单个商品在某仓库的库存计数（优先读取 Redis 可用量缓存）
+        :param goods_id: 关联的商品 ID
+        :param warehouse_id: 仓库 ID
+        :return: dict，各库存计数字段及 available_stock / available_stock_for_sale，
+                 version / cached_at 为缓存版本号与写入时间（来自数据库时为 None）
+
+        缓存由库存变更在事务提交后写穿；未命中时只查询库存表本身（不关联商品、仓库）及分片余量，
+        并回填缓存。已启用分片的商品可售库存不超过分片余量。记录不存在时抛出 404（错误码 43001）。
+        """
+        if availability_cache_enabled():
+            payload = get_cached_availability(goods_id, warehouse_id)
+            if payload is not None:
+                return with_derived_fields(payload)
+
+        inventory = Inventory.query.options(lazyload('*')).filter_by(
+            goods_id=goods_id, warehouse_id=warehouse_id
+        ).first()
+        if inventory is None:
+            raise NotFoundException(
+                f"Inventory not found for goods {goods_id} in warehouse {warehouse_id}", 43001
+            )
+        payload = pack_availability(
+            inventory, remaining_by_key([(goods_id, warehouse_id)]).get((goods_id, warehouse_id))
+        )
+        if availability_cache_enabled():
+            fill_availability_cache(payload)
+        payload['version'] = None
+        payload['cached_at'] = None
+        return with_derived_fields(payload)
+
+    # 批量可用量查询单次最多商品数
+    AVAILABILITY_BATCH_LIMIT = 1000
+
+    @staticmethod
+    def get_availability_batch(goods_ids: list = None, goods_codes: list = None,
+                               warehouse_ids: list = None) -> list:
+        """
+        批量查询多个商品在多个仓库的库存计数
+        :param goods_ids: 商品 ID 列表
+        :param goods_codes: 商品编码列表（与 goods_ids 取并集）
+        :param warehouse_ids: 仓库 ID 列表，为空时不限制仓库
+        :return: list，每个元素为扁平 dict（商品、仓库及各库存计数字段）
+
+        只查询所需的数值列（不加载 ORM 对象及关联的商品、仓库），
+        一次按主键 IN 查询返回全部结果（分片余量另用一次分组查询），单次最多 AVAILABILITY_BATCH_LIMIT 个商品。
+        """
+        goods_ids = list(dict.fromkeys(goods_ids or []))
+        goods_codes = list(dict.fromkeys(goods_codes or []))
+        if not goods_ids and not goods_codes:
+            raise BadRequestException("goods_ids or goods_codes is required", 15017)
+        if len(goods_ids) + len(goods_codes) > InventoryService.AVAILABILITY_BATCH_LIMIT:
+            raise BadRequestException(
+                f"At most {InventoryService.AVAILABILITY_BATCH_LIMIT} goods per request", 15018
+            )
+
+        query = db.session.query(
+            Inventory.goods_id,
+            Goods.code,
+            Inventory.warehouse_id,
+            *[getattr(Inventory, field) for field in AVAILABILITY_FIELDS],
+        ).join(Goods, Inventory.goods_id == Goods.id)
+
+        conditions = []
+        if goods_ids:
+            conditions.append(Inventory.goods_id.in_(goods_ids))
+        if goods_codes:
+            conditions.append(Goods.code.in_(goods_codes))
+        query = query.filter(or_(*conditions))
+        if warehouse_ids is not None:
+            query = query.filter(Inventory.warehouse_id.in_(warehouse_ids))
+        query = query.order_by(Inventory.goods_id, Inventory.warehouse_id)
+
+        rows = query.all()
+        shard_remaining = remaining_by_key((row.goods_id, row.warehouse_id) for row in rows)
+        results = []
+        for goods_id, goods_code, warehouse_id, *counters in rows:
+            payload = dict(zip(AVAILABILITY_FIELDS, counters))
+            payload['goods_id'] = goods_id
+            payload['goods_code'] = goods_code
+            payload['warehouse_id'] = warehouse_id
+            payload['shard_remaining'] = shard_remaining.get((goods_id, warehouse_id))
+            results.append(with_derived_fields(payload))
+        return results
+
     @staticmethod
     def list_inventories(filters: dict):
         """
@@ -148,6 +304,7 @@ class InventoryService:
         )
 
         db.session.add(new_inventory)
+        InventoryService._write_ledger([(new_inventory, {})], ('manual', None))
         # db.session.commit()
         return new_inventory
 
@@ -162,6 +319,7 @@ class InventoryService:
         :return: 更新后的 Inventory 实例
         """
         inventory = InventoryService.get_inventory(goods_id, warehouse_id)
+        before = InventoryService._stock_state(inventory)
 
         # 更新库存字段
         inventory.total_stock = data.get('total_stock', inventory.total_stock)
@@ -177,6 +335,7 @@ class InventoryService:
         inventory.packed_stock = data.get('packed_stock', inventory.packed_stock)        
         inventory.delivered_stock = data.get('delivered_stock', inventory.delivered_stock)  
         inventory.remark = data.get('remark', inventory.remark)  
+        InventoryService._write_ledger([(inventory, before)], ('manual', None))
 
         # db.session.commit()
         return inventory
@@ -191,9 +350,90 @@ class InventoryService:
         :return: None
         """        
         inventory = InventoryService.get_inventory(goods_id, warehouse_id)
+        # 删除前将各字段冲减为 0，历史余额回放到删除之后为 0
+        ledger_rows = InventoryService._ledger_rows(
+            goods_id, warehouse_id, InventoryService._stock_state(inventory), {}, ('manual', None)
+        )
+        if ledger_rows:
+            db.session.execute(insert(InventoryLedger), ledger_rows)
         db.session.delete(inventory)
         # db.session.commit()
 
+    @staticmethod
+    @transactional
+    def apply_stock_deltas(mutations: list, validate=None, errors: dict = None,
+                           clamp: tuple = (), recalculate_total: bool = True,
+                           source: tuple = None, sources: list = None) -> dict:
+        """
+        批量库存变更入口：一次加锁、内存校验、一次 flush
+        :param mutations: list，每个元素为 (goods_id, warehouse_id, deltas)，
+                          deltas 为 {库存字段: 有符号增量} 的 dict
+        :param validate: 可选回调 validate(inventory, deltas)，在应用增量前做额外校验
+        :param errors: 可选 {库存字段: (错误信息, 错误码)}，覆盖默认的库存不足错误
+        :param clamp: 应用增量后低于 0 时直接归零（而不是报错）的库存字段
+        :param recalculate_total: 是否重新计算 total_stock
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        :param sources: 可选，与 mutations 一一对应的来源单据；给出时流水按每条增量分别记录来源
+                        （多张单据合并成一批变更时仍可按单据追溯），忽略 source
+        :return: dict，{(goods_id, warehouse_id): Inventory}
+
+        所有涉及的库存行通过 _get_many_for_update 一次性按 (warehouse_id, goods_id)
+        排序加锁；增量按传入顺序依次应用，任一条校验失败则整批失败（由外层事务回滚）。
+        最后统一 flush，同一批次的 UPDATE 由 unit of work 合并为一次 executemany，
+        实际变化量同时写入库存流水。
+        """
+        if not mutations:
+            return {}
+
+        # 先执行本事务内已标记、会影响本次校验的重算：带 validate 时全部重算，否则只重算与增量字段重叠的字段组
+        keys = {(goods_id, warehouse_id) for goods_id, warehouse_id, _ in mutations}
+        if validate:
+            InventoryService.flush_dirty_stock(keys)
+        else:
+            fields = {field for _, _, deltas in mutations for field in deltas}
+            InventoryService.flush_dirty_stock(keys, [
+                bucket for bucket, bucket_fields in InventoryService._DIRTY_BUCKET_FIELDS.items()
+                if fields.intersection(bucket_fields)
+            ])
+
+        inventories = InventoryService._get_many_for_update(keys)
+        before = {key: InventoryService._stock_state(inventory) for key, inventory in inventories.items()}
+        errors = {**InventoryService._INSUFFICIENT_STOCK_ERRORS, **(errors or {})}
+
+        ledger_rows = []
+        for index, (goods_id, warehouse_id, deltas) in enumerate(mutations):
+            inventory = inventories[(goods_id, warehouse_id)]
+            if sources is not None:
+                step_before = InventoryService._stock_state(inventory)
+            if validate:
+                validate(inventory, deltas)
+            for field, delta in deltas.items():
+                value = getattr(inventory, field) + delta
+                if value < 0:
+                    if field in clamp:
+                        value = 0
+                    else:
+                        message, biz_code = errors.get(field, (f"Not enough {field}.", 15002))
+                        raise BadRequestException(message, biz_code)
+                setattr(inventory, field, value)
+            if recalculate_total:
+                inventory.total_stock = InventoryService._calculate_total_stock(inventory)
+            if sources is not None:
+                ledger_rows.extend(InventoryService._ledger_rows(
+                    goods_id, warehouse_id, step_before, InventoryService._stock_state(inventory), sources[index],
+                ))
+
+        db.session.flush()
+        if sources is not None:
+            if ledger_rows:
+                db.session.execute(insert(InventoryLedger), ledger_rows)
+        else:
+            InventoryService._write_ledger(
+                [(inventory, before[key]) for key, inventory in inventories.items()], source
+            )
+        # db.session.commit()
+        return inventories
+
     @staticmethod
     @transactional
     def lock_inventory(goods_id: int, warehouse_id: int, quantity: int):
@@ -204,11 +444,39 @@ class InventoryService:
         :param quantity: 锁定数量
         注意：这里不需要扣减 onhand_stock，使用的时候用onhand_stock - locked_stock计算可用库存
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        if inventory.onhand_stock < quantity:
-            raise BadRequestException("Insufficient stock to lock", 15003)
-        inventory.locked_stock += quantity
-        # db.session.commit()
+        InventoryService.bulk_lock_inventory([(goods_id, warehouse_id, quantity)])
+
+    @staticmethod
+    @transactional
+    def bulk_lock_inventory(items: list, source: tuple = None, sources: list = None):
+        """
+        批量锁定库存
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        :param sources: 可选，与 items 一一对应的来源单据，见 apply_stock_deltas
+
+        只能锁定可售库存（onhand_stock - locked_stock - dn_stock），已锁定和 DN 预扣的数量不能再次锁定。
+        已启用分片的商品同时从分片扣减（与 DN 预扣共用分片余量），分片余量不足时同样拒绝锁定；
+        解锁不回补分片，由再平衡按最新的可售库存重新分配。
+        """
+        def validate(inventory, deltas):
+            if inventory.available_stock_for_sale < deltas['locked_stock']:
+                raise BadRequestException("Insufficient stock to lock", 15003)
+
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, {'locked_stock': quantity})
+             for goods_id, warehouse_id, quantity in items],
+            validate=validate,
+            recalculate_total=False,
+            source=source,
+            sources=sources,
+        )
+
+        sharded = sharded_keys((goods_id, warehouse_id) for goods_id, warehouse_id, _ in items)
+        for goods_id, warehouse_id, quantity in items:
+            if (goods_id, warehouse_id) in sharded and quantity > 0:
+                if not draw_from_shards(goods_id, warehouse_id, quantity):
+                    raise BadRequestException("Insufficient stock to lock", 15003)
             
     @staticmethod
     @transactional
@@ -219,11 +487,22 @@ class InventoryService:
         :param warehouse_id: 仓库 ID
         :param quantity: 解锁数量
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        if inventory.locked_stock < quantity:
-            raise BadRequestException("Insufficient locked stock to unlock", 15004)
-        inventory.locked_stock -= quantity
-        # db.session.commit()
+        InventoryService.bulk_unlock_inventory([(goods_id, warehouse_id, quantity)])
+
+    @staticmethod
+    @transactional
+    def bulk_unlock_inventory(items: list, source: tuple = None):
+        """
+        批量解锁库存
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        """
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, {'locked_stock': -quantity})
+             for goods_id, warehouse_id, quantity in items],
+            recalculate_total=False,
+            source=source,
+        )
 
     @staticmethod
     @transactional
@@ -234,12 +513,24 @@ class InventoryService:
         :param warehouse_id: 仓库 ID
         :param quantity: 到货数量
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        if inventory.asn_stock < quantity:
-            raise BadRequestException("Not enough ASN stock.", 15005)
-        inventory.asn_stock -= quantity
-        inventory.received_stock += quantity
-        # db.session.commit()
+        InventoryService.bulk_asn_received([(goods_id, warehouse_id, quantity)])
+
+    @staticmethod
+    @transactional
+    def bulk_asn_received(items: list, source: tuple = None, sources: list = None):
+        """
+        批量到货确认
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        :param sources: 可选，与 items 一一对应的来源单据（多张 ASN 合并确认时使用）
+        """
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, {'asn_stock': -quantity, 'received_stock': quantity})
+             for goods_id, warehouse_id, quantity in items],
+            recalculate_total=False,
+            source=source,
+            sources=sources,
+        )
 
     @staticmethod
     @transactional
@@ -252,51 +543,412 @@ class InventoryService:
         :param actual_quantity: 实际分拣数量
         这里的实际分拣数量可能小于签收数量，表示部分商品缺货，也有可能大于签收数量，表示多拣货
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        # if inventory.received_stock < quantity:
-        #     raise BadRequestException("Not enough received stock.", 15006)
-        inventory.received_stock -= quantity
-        if inventory.received_stock < 0:
-            inventory.received_stock = 0
-        # 分拣库存增加
-        inventory.sorted_stock += actual_quantity
-        inventory.total_stock = InventoryService._calculate_total_stock(inventory)
-        # db.session.commit()
+        InventoryService.bulk_asn_completed([(goods_id, warehouse_id, quantity, actual_quantity)])
+
+    @staticmethod
+    @transactional
+    def bulk_asn_completed(items: list, source: tuple = None, sources: list = None):
+        """
+        批量分拣完成
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity, actual_quantity)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        :param sources: 可选，与 items 一一对应的来源单据（多张 ASN 合并完成时使用）
+        签收库存不足时归零而不报错，与单条 asn_completed 的语义一致
+        """
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, {'received_stock': -quantity, 'sorted_stock': actual_quantity})
+             for goods_id, warehouse_id, quantity, actual_quantity in items],
+            clamp=('received_stock',),
+            source=source,
+            sources=sources,
+        )
+
+    @staticmethod
+    def _incremental_stock_enabled() -> bool:
+        """是否启用库位库存增量模式（配置项 INVENTORY_INCREMENTAL_STOCK）"""
+        return current_app.config.get('INVENTORY_INCREMENTAL_STOCK', False)
+
+    @staticmethod
+    def _location_stock_deltas(location, quantity: int) -> dict:
+        """库位数量变化对应的库存字段增量；停用库位与 update_and_calculate_stock 一样不计入库存"""
+        field = InventoryService._LOCATION_STOCK_FIELDS.get(location.location_type)
+        if not location.is_active or field is None:
+            return {}
+        return {field: quantity}
+
+    @staticmethod
+    @transactional
+    def _apply_location_movements(movements: list, source: tuple = None):
+        """
+        将库位库存变动同步到库存记录
+        :param movements: list，每个元素为 (goods_id, warehouse_id, deltas, location, quantity)，
+                          deltas 为流程字段（如 sorted_stock）的增量，quantity 为库位数量变化，
+                          location 为 None 时无法增量计算
+
+        增量模式下库位数量变化按 location_type 直接累加到 onhand/damage/return；
+        否则（或缺少库位信息时）应用 deltas 后标记涉及的商品，在事务提交前各做一次全量重算。
+        同一商品的多条变动先合并再应用，避免中间值被截断。
+        """
+        incremental = InventoryService._incremental_stock_enabled()
+        merged = {}
+        recompute = set()
+        for goods_id, warehouse_id, deltas, location, quantity in movements:
+            key = (goods_id, warehouse_id)
+            merged_deltas = merged.setdefault(key, {})
+            if incremental and location is not None:
+                deltas = dict(deltas)
+                for field, delta in InventoryService._location_stock_deltas(location, quantity).items():
+                    deltas[field] = deltas.get(field, 0) + delta
+            else:
+                recompute.add(key)
+            for field, delta in deltas.items():
+                merged_deltas[field] = merged_deltas.get(field, 0) + delta
+
+        # 库位汇总字段若已漂移（低于本次扣减量）则归零，由定期对账修正
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, deltas) for (goods_id, warehouse_id), deltas in merged.items()],
+            clamp=tuple(InventoryService._LOCATION_STOCK_FIELDS.values()),
+            source=source,
+        )
+        for goods_id, warehouse_id in recompute:
+            InventoryService.mark_stock_dirty(goods_id, warehouse_id, 'stock', source=source)
 
     @staticmethod
     @transactional
-    def putaway_completed(goods_id: int, warehouse_id: int, quantity: int):
+    def putaway_completed(goods_id: int, warehouse_id: int, quantity: int, location=None,
+                          source: tuple = None):
         """
         上架完成：分拣库存减少，现有库存增加
         :param goods_id: 关联的商品 ID
         :param warehouse_id: 仓库 ID
         :param quantity: 上架数量
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        :param location: 上架库位（增量模式下据此决定增加哪类库存）
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        if inventory.sorted_stock < quantity:
-            raise BadRequestException("Not enough sort stock.",15007)
-        inventory.sorted_stock -= quantity
-        db.session.flush()
-        InventoryService.update_and_calculate_stock(goods_id, warehouse_id)
+        InventoryService.bulk_putaway_completed([(goods_id, warehouse_id, quantity, location)], source=source)
+
+    @staticmethod
+    @transactional
+    def bulk_putaway_completed(items: list, source: tuple = None):
+        """
+        批量上架完成
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity) 或
+                      (goods_id, warehouse_id, quantity, location)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        """
+        InventoryService._apply_location_movements(
+            [(goods_id, warehouse_id, {'sorted_stock': -quantity}, location[0] if location else None, quantity)
+             for goods_id, warehouse_id, quantity, *location in items],
+            source=source,
+        )
         # db.session.commit()
 
     @staticmethod
     @transactional
-    def removal_completed(goods_id: int, warehouse_id: int, quantity: int):
+    def removal_completed(goods_id: int, warehouse_id: int, quantity: int, location=None,
+                          source: tuple = None):
         """
         下架完成：现有库存减少
         :param goods_id: 关联的商品 ID
         :param warehouse_id: 仓库 ID
         :param quantity: 下架数量
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        :param location: 下架库位（增量模式下据此决定扣减哪类库存）
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        inventory.sorted_stock += quantity
+        InventoryService.bulk_removal_completed([(goods_id, warehouse_id, quantity, location)], source=source)
+
+    @staticmethod
+    @transactional
+    def bulk_removal_completed(items: list, source: tuple = None):
+        """
+        批量下架完成
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity) 或
+                      (goods_id, warehouse_id, quantity, location)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        """
+        InventoryService._apply_location_movements(
+            [(goods_id, warehouse_id, {'sorted_stock': quantity}, location[0] if location else None, -quantity)
+             for goods_id, warehouse_id, quantity, *location in items],
+            source=source,
+        )
+        # db.session.commit()
+
+    @staticmethod
+    @transactional
+    def bulk_location_stock_changed(items: list, source: tuple = None):
+        """
+        库位数量直接变化（移库、盘点调整）后同步库存
+        :param items: list，每个元素为 (goods_id, location, quantity)，quantity 为该库位的有符号变化量
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        """
+        InventoryService._apply_location_movements(
+            [(goods_id, location.warehouse_id, {}, location, quantity)
+             for goods_id, location, quantity in items],
+            source=source,
+        )
+
+    @staticmethod
+    def _expected_location_stock(warehouse_id: int = None) -> dict:
+        """
+        一次 GROUP BY 按库位类型汇总 GoodsLocation 数量
+        :param warehouse_id: 仓库 ID，为空时汇总所有仓库
+        :return: dict，{(goods_id, warehouse_id): {onhand_stock/damage_stock/return_stock: quantity}}
+        """
+        from warehouse.goods.models import GoodsLocation
+        from warehouse.location.models import Location
+
+        query = db.session.query(
+            GoodsLocation.goods_id,
+            Location.warehouse_id,
+            Location.location_type,
+            func.sum(GoodsLocation.quantity),
+        ).join(
+            Location, GoodsLocation.location_id == Location.id
+        ).filter(
+            Location.location_type.in_(list(InventoryService._LOCATION_STOCK_FIELDS)),
+            Location.is_active == True,
+        )
+        if warehouse_id:
+            query = query.filter(Location.warehouse_id == warehouse_id)
+
+        expected = {}
+        for goods_id, location_warehouse_id, location_type, quantity in query.group_by(
+            GoodsLocation.goods_id, Location.warehouse_id, Location.location_type
+        ):
+            field = InventoryService._LOCATION_STOCK_FIELDS[location_type]
+            expected.setdefault((goods_id, location_warehouse_id), {})[field] = quantity
+        return expected
+
+    @staticmethod
+    @transactional
+    def reconcile_location_stock(warehouse_id: int = None, dry_run: bool = False) -> list:
+        """
+        库位库存对账：按 GoodsLocation 全量重算 onhand/damage/return 并报告漂移
+        :param warehouse_id: 仓库 ID，为空时对所有仓库对账
+        :param dry_run: 为 True 时只报告差异，不修改库存
+        :return: list，每个元素为 {goods_id, warehouse_id, field, expected, actual}
+
+        一次 GROUP BY 汇总全部库位数量，作为增量模式的定期校正手段。
+        """
+        expected = InventoryService._expected_location_stock(warehouse_id)
+
+        inventories = Inventory.query.options(lazyload('*')).order_by(
+            Inventory.warehouse_id, Inventory.goods_id
+        )
+        if warehouse_id:
+            inventories = inventories.filter(Inventory.warehouse_id == warehouse_id)
+        if not dry_run:
+            inventories = inventories.with_for_update()
+
+        drifts = []
+        changes = []
+        for inventory in inventories:
+            quantities = expected.get((inventory.goods_id, inventory.warehouse_id), {})
+            before = InventoryService._stock_state(inventory)
+            drifted = False
+            for field in InventoryService._LOCATION_STOCK_FIELDS.values():
+                quantity = quantities.get(field, 0)
+                if getattr(inventory, field) == quantity:
+                    continue
+                drifts.append({
+                    'goods_id': inventory.goods_id,
+                    'warehouse_id': inventory.warehouse_id,
+                    'field': field,
+                    'expected': quantity,
+                    'actual': getattr(inventory, field),
+                })
+                if not dry_run:
+                    setattr(inventory, field, quantity)
+                    drifted = True
+            if drifted:
+                inventory.total_stock = InventoryService._calculate_total_stock(inventory)
+                changes.append((inventory, before))
+
         db.session.flush()
-        InventoryService.update_and_calculate_stock(goods_id, warehouse_id)
+        InventoryService._write_ledger(changes, ('reconcile', None))
         # db.session.commit()
+        return drifts
+
+    # 全仓重算覆盖的库存字段（onhand/damage/return 按库位汇总，asn/dn 按单据汇总）
+    _RECOMPUTE_FIELDS = ('asn_stock', 'dn_stock', 'onhand_stock', 'damage_stock', 'return_stock')
+
+    @staticmethod
+    @transactional
+    def recompute_warehouse_stock(warehouse_id: int, dry_run: bool = False) -> list:
+        """
+        全仓集合式重算 asn_stock、dn_stock 与 onhand/damage/return
+        :param warehouse_id: 仓库 ID
+        :param dry_run: 为 True 时只报告差异，不修改库存
+        :return: list，每个元素为 {goods_id, warehouse_id, field, expected, actual}
+
+        与逐个商品调用 update_and_calculate_asn_stock / update_and_calculate_dn_stock /
+        update_and_calculate_stock 的口径一致，但只执行三条 GROUP BY 与一次按主键的批量 UPDATE，
+        用于数据修复或批量导入后的整仓校正。
+        """
+        from warehouse.asn.models import ASN, ASNDetail
+        from warehouse.dn.models import DN, DNDetail
+
+        expected = InventoryService._expected_location_stock(warehouse_id)
+
+        asn_query = db.session.query(
+            ASNDetail.goods_id, func.sum(ASNDetail.quantity)
+        ).join(ASN, ASNDetail.asn_id == ASN.id).filter(
+            ASN.warehouse_id == warehouse_id,
+            ASN.is_active == True,
+            ASN.status == 'pending',
+        ).group_by(ASNDetail.goods_id)
+        for goods_id, quantity in asn_query:
+            expected.setdefault((goods_id, warehouse_id), {})['asn_stock'] = quantity
+
+        # 预扣口径与 update_and_calculate_dn_stock 相同
+        reserved_expr = case(
+            (DN.status.in_(['pending', 'in_progress']), DNDetail.quantity),
+            else_=0
+        )
+        dn_query = db.session.query(
+            DNDetail.goods_id, func.sum(reserved_expr)
+        ).join(DN, DNDetail.dn_id == DN.id).filter(
+            DN.warehouse_id == warehouse_id,
+            DN.is_active == True,
+        ).group_by(DNDetail.goods_id)
+        for goods_id, quantity in dn_query:
+            expected.setdefault((goods_id, warehouse_id), {})['dn_stock'] = quantity
+
+        # 只读取数值列，不加载 ORM 对象
+        current = db.session.query(
+            Inventory.goods_id,
+            Inventory.low_stock_threshold,
+            Inventory.high_stock_threshold,
+            Inventory.is_below_low_threshold,
+            Inventory.is_above_high_threshold,
+            Inventory.version,
+            *[getattr(Inventory, field) for field in InventoryService._LEDGER_FIELDS],
+        ).filter(
+            Inventory.warehouse_id == warehouse_id
+        ).order_by(Inventory.goods_id)
+        if not dry_run:
+            current = current.with_for_update()
+
+        drifts = []
+        updates = []
+        ledger_rows = []
+        transitions = []
+        for goods_id, low, high, is_below_low, is_above_high, version, *values in current:
+            before = dict(zip(InventoryService._LEDGER_FIELDS, values))
+            quantities = expected.get((goods_id, warehouse_id), {})
+            after = dict(before)
+            for field in InventoryService._RECOMPUTE_FIELDS:
+                quantity = quantities.get(field) or 0
+                if before[field] == quantity:
+                    continue
+                drifts.append({
+                    'goods_id': goods_id,
+                    'warehouse_id': warehouse_id,
+                    'field': field,
+                    'expected': quantity,
+                    'actual': before[field],
+                })
+                after[field] = quantity
+            if after == before:
+                continue
+            row = {field: after[field] for field in InventoryService._RECOMPUTE_FIELDS}
+            row['goods_id'] = goods_id
+            row['warehouse_id'] = warehouse_id
+            row['version'] = version  # 按主键批量 UPDATE 同样比较并递增版本号
+            row['total_stock'] = InventoryService._calculate_total_stock(SimpleNamespace(**after))
+            flags = threshold_flags(after['onhand_stock'], after['locked_stock'], after['dn_stock'], low, high)
+            row['is_below_low_threshold'], row['is_above_high_threshold'] = flags
+            transitions.extend(threshold_transitions(
+                goods_id, warehouse_id, (is_below_low, is_above_high), flags,
+                after['onhand_stock'] - after['locked_stock'] - after['dn_stock'], low, high,
+            ))
+            updates.append(row)
+            ledger_rows.extend(
+                InventoryService._ledger_rows(goods_id, warehouse_id, before, after, ('reconcile', None))
+            )
+
+        if dry_run or not updates:
+            return drifts
+
+        db.session.execute(update(Inventory), updates)
+        if ledger_rows:
+            db.session.execute(insert(InventoryLedger), ledger_rows)
+        if transitions:
+            emit_threshold_events(transitions)
+
+        # 批量 UPDATE 绕过了 ORM：使会话中已加载的库存对象失效，并在提交后清除可用量缓存
+        keys = [(row['goods_id'], warehouse_id) for row in updates]
+        for key in keys:
+            inventory = db.session.identity_map.get(db.session.identity_key(Inventory, key))
+            if inventory is not None:
+                db.session.expire(inventory)
+        stage_availability_invalidation(keys)
+        # db.session.commit()
+        return drifts
+
+    @staticmethod
+    def get_balance_at(goods_id: int, warehouse_id: int, at, bucket: str = 'onhand_stock') -> int:
+        """
+        查询指定时间点的库存余额
+        :param goods_id: 关联的商品 ID
+        :param warehouse_id: 仓库 ID
+        :param at: 时间点（datetime）
+        :param bucket: 库存字段（onhand_stock、dn_stock 等）
+        :return: int，该时间点的余额
+
+        库位类字段（onhand/damage/return）以 at 之前最近一次 InventorySnapshot 为起点，
+        其余字段以流水起点（0）为起点，再按 (goods_id, warehouse_id, bucket, created_at)
+        索引区间回放流水，代价为 O(log n + 区间内流水条数)，无需扫描全部快照。
+        启用流水时写入的期初流水（source_type='opening'）之前的快照不作为起点，
+        避免与期初余额重复计算。
+        """
+        from warehouse.inventory_snapshot.models import InventorySnapshot
+        from warehouse.location.models import Location
+
+        if bucket not in InventoryService._LEDGER_FIELDS:
+            raise BadRequestException(f"Invalid stock bucket: {bucket}", 15016)
+
+        balance = 0
+        replay_from = None
+        location_types = [
+            location_type for location_type, field in InventoryService._LOCATION_STOCK_FIELDS.items()
+            if field == bucket
+        ]
+        if location_types:
+            opened_at = db.session.query(func.max(InventoryLedger.created_at)).filter(
+                InventoryLedger.goods_id == goods_id,
+                InventoryLedger.warehouse_id == warehouse_id,
+                InventoryLedger.bucket == bucket,
+                InventoryLedger.source_type == 'opening',
+                InventoryLedger.created_at <= at,
+            ).scalar_subquery()
+            replay_from = db.session.query(func.max(InventorySnapshot.snapshot_time)).filter(
+                InventorySnapshot.goods_id == goods_id,
+                InventorySnapshot.warehouse_id == warehouse_id,
+                InventorySnapshot.snapshot_time <= at,
+                InventorySnapshot.snapshot_time >= func.coalesce(opened_at, InventorySnapshot.snapshot_time),
+            ).scalar()
+        if replay_from is not None:
+            balance = db.session.query(func.coalesce(func.sum(InventorySnapshot.quantity), 0)).join(
+                Location, InventorySnapshot.location_id == Location.id
+            ).filter(
+                InventorySnapshot.goods_id == goods_id,
+                InventorySnapshot.warehouse_id == warehouse_id,
+                InventorySnapshot.snapshot_time == replay_from,
+                Location.location_type.in_(location_types),
+            ).scalar()
+
+        ledger = db.session.query(func.coalesce(func.sum(InventoryLedger.delta), 0)).filter(
+            InventoryLedger.goods_id == goods_id,
+            InventoryLedger.warehouse_id == warehouse_id,
+            InventoryLedger.bucket == bucket,
+            InventoryLedger.created_at <= at,
+        )
+        if replay_from is not None:
+            ledger = ledger.filter(InventoryLedger.created_at > replay_from)
+
+        return balance + ledger.scalar()
 
-    
-    
     @staticmethod
     @transactional
     def dn_picked(goods_id: int, warehouse_id: int, quantity: int,picked_quantity: int):
@@ -309,18 +961,29 @@ class InventoryService:
         注意：picked_quantity 可能小于 quantity，表示部分商品缺货
         如果缺货的情况下需要重置 dn_stock 的值，否则会锁死商品dn数量。
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        if inventory.dn_stock < picked_quantity:
-            raise BadRequestException("Not enough DN stock.", 15008)
+        InventoryService.bulk_dn_picked([(goods_id, warehouse_id, quantity, picked_quantity)])
+
+    @staticmethod
+    @transactional
+    def bulk_dn_picked(items: list, source: tuple = None):
+        """
+        批量拣货完成
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity, picked_quantity)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        """
+        def validate(inventory, deltas):
+            if inventory.dn_stock < deltas['picked_stock']:
+                raise BadRequestException("Not enough DN stock.", 15008)
+
         # Release this DN's full reservation when picking closes. Only the
         # physically picked amount moves to picked_stock; any short quantity
         # becomes available to other DNs again.
-        if inventory.dn_stock < quantity:
-            raise BadRequestException("Not enough DN stock.", 15008)
-        inventory.dn_stock -= quantity
-        inventory.picked_stock += picked_quantity
-        inventory.total_stock = InventoryService._calculate_total_stock(inventory)
-        # db.session.commit()
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, {'dn_stock': -quantity, 'picked_stock': picked_quantity})
+             for goods_id, warehouse_id, quantity, picked_quantity in items],
+            validate=validate,
+            source=source,
+        )
 
     @staticmethod
     @transactional
@@ -331,13 +994,21 @@ class InventoryService:
         :param warehouse_id: 仓库 ID
         :param quantity: 包装数量
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        if inventory.picked_stock < quantity:
-            raise BadRequestException("Not enough pick stock.", 15009)
-        inventory.picked_stock -= quantity
-        inventory.packed_stock += quantity
-        inventory.total_stock = InventoryService._calculate_total_stock(inventory)
-        # db.session.commit()
+        InventoryService.bulk_dn_packed([(goods_id, warehouse_id, quantity)])
+
+    @staticmethod
+    @transactional
+    def bulk_dn_packed(items: list, source: tuple = None):
+        """
+        批量包装完成
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        """
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, {'picked_stock': -quantity, 'packed_stock': quantity})
+             for goods_id, warehouse_id, quantity in items],
+            source=source,
+        )
 
     @staticmethod
     @transactional
@@ -348,13 +1019,21 @@ class InventoryService:
         :param warehouse_id: 仓库 ID
         :param quantity: 发货数量
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        if inventory.packed_stock < quantity:
-            raise BadRequestException("Not enough packed stock.", 15010)
-        inventory.packed_stock -= quantity
-        inventory.delivered_stock += quantity
-        inventory.total_stock = InventoryService._calculate_total_stock(inventory)
-        # db.session.commit()
+        InventoryService.bulk_dn_delivered([(goods_id, warehouse_id, quantity)])
+
+    @staticmethod
+    @transactional
+    def bulk_dn_delivered(items: list, source: tuple = None):
+        """
+        批量发货完成
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        """
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, {'packed_stock': -quantity, 'delivered_stock': quantity})
+             for goods_id, warehouse_id, quantity in items],
+            source=source,
+        )
 
     @staticmethod
     @transactional
@@ -365,12 +1044,21 @@ class InventoryService:
         :param warehouse_id: 仓库 ID
         :param quantity: 签收数量
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        if inventory.delivered_stock < quantity:
-            raise BadRequestException("Not enough delivered stock.", 15011)
-        inventory.delivered_stock -= quantity
-        inventory.total_stock = InventoryService._calculate_total_stock(inventory)
-        # db.session.commit()
+        InventoryService.bulk_dn_completed([(goods_id, warehouse_id, quantity)])
+
+    @staticmethod
+    @transactional
+    def bulk_dn_completed(items: list, source: tuple = None):
+        """
+        批量签收确认
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        """
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, {'delivered_stock': -quantity})
+             for goods_id, warehouse_id, quantity in items],
+            source=source,
+        )
 
     @staticmethod
     @transactional
@@ -381,12 +1069,22 @@ class InventoryService:
         :param warehouse_id: 仓库 ID
         :param quantity: 关闭数量
         """
-        inventory = InventoryService._get_for_update(goods_id, warehouse_id)
-        if inventory.dn_stock < quantity:
-            raise BadRequestException("Not enough DN stock to close.", 15012)
-        inventory.dn_stock -= quantity
-        inventory.total_stock = InventoryService._calculate_total_stock(inventory)
-        # db.session.commit()
+        InventoryService.bulk_dn_closed([(goods_id, warehouse_id, quantity)])
+
+    @staticmethod
+    @transactional
+    def bulk_dn_closed(items: list, source: tuple = None):
+        """
+        批量关闭 DN
+        :param items: list，每个元素为 (goods_id, warehouse_id, quantity)
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+        """
+        InventoryService.apply_stock_deltas(
+            [(goods_id, warehouse_id, {'dn_stock': -quantity})
+             for goods_id, warehouse_id, quantity in items],
+            errors={'dn_stock': ("Not enough DN stock to close.", 15012)},
+            source=source,
+        )
 
     @staticmethod
     @transactional
@@ -429,21 +1127,181 @@ class InventoryService:
         :return: dict，包含库存状态信息
         """
         inventory = InventoryService.get_inventory(goods_id, warehouse_id)
-        
+        is_below_low, is_above_high = threshold_flags(
+            inventory.onhand_stock, inventory.locked_stock, inventory.dn_stock,
+            inventory.low_stock_threshold, inventory.high_stock_threshold,
+        )
         return {
-            "is_below_low_threshold": (
-                inventory.low_stock_threshold != -1
-                and inventory.available_stock_for_sale < inventory.low_stock_threshold
-            ),
-            "is_above_high_threshold": (
-                inventory.high_stock_threshold != -1
-                and inventory.available_stock_for_sale > inventory.high_stock_threshold
-            ),
+            "is_below_low_threshold": is_below_low,
+            "is_above_high_threshold": is_above_high,
         }
     
+    @staticmethod
+    def list_threshold_breaches(filters: dict, breach: str = 'low'):
+        """
+        列出阈值越界的库存（breach='low' 为待补货，'high' 为积压）
+        :param filters: dict，支持 warehouse_id / warehouse_ids / goods_id
+        :param breach: 'low' 或 'high'
+        :return: 查询对象
+
+        直接按 (warehouse_id, 越界标记) 索引过滤，越界标记在每次库存变更时同步刷新。
+        """
+        if breach not in ('low', 'high'):
+            raise BadRequestException(f"Invalid threshold breach type: {breach}", 15019)
+        flag = Inventory.is_below_low_threshold if breach == 'low' else Inventory.is_above_high_threshold
+        query = Inventory.query.filter(flag == True)
+
+        if filters.get('warehouse_id'):
+            query = query.filter(Inventory.warehouse_id == filters['warehouse_id'])
+        elif filters.get('warehouse_ids'):
+            query = query.filter(Inventory.warehouse_id.in_(filters['warehouse_ids']))
+        if filters.get('goods_id'):
+            query = query.filter(Inventory.goods_id == filters['goods_id'])
+
+        return query.order_by(Inventory.warehouse_id, Inventory.goods_id)
+
+    # ------------------------------------
+    # 热点商品库存分片
+    # ------------------------------------
+
+    @staticmethod
+    def get_shards(goods_id: int, warehouse_id: int) -> dict:
+        """
+        获取商品在仓库中的库存分片
+        :return: dict，shard_count 为 0 表示未启用分片
+        """
+        InventoryService.get_inventory(goods_id, warehouse_id)
+        shards = InventoryShard.query.filter_by(
+            goods_id=goods_id, warehouse_id=warehouse_id
+        ).order_by(InventoryShard.shard_no).all()
+        return {
+            'goods_id': goods_id,
+            'warehouse_id': warehouse_id,
+            'shard_count': len(shards),
+            'remaining': sum(shard.remaining for shard in shards),
+            'shards': shards,
+        }
+
+    @staticmethod
+    def _split_shards(inventory: Inventory, shards: list):
+        """将最新的可售库存平均分配到各分片，并清零扣减量。调用方需已锁定全部分片及库存主记录。"""
+        allotments = split_allotments(inventory.available_stock_for_sale, len(shards))
+        for shard, allotment in zip(shards, allotments):
+            shard.allotment = allotment
+            shard.reserved = 0
+            shard.rebalanced_at = func.now()
+        db.session.flush()
+
+    @staticmethod
+    @transactional
+    def fold_shard_reservations(keys, source: tuple = None):
+        """
+        已启用分片的商品立即回收分片，将分片中的 DN 预扣量合并到 Inventory.dn_stock
+        :param keys: 可迭代的 (goods_id, warehouse_id)，未启用分片的忽略
+
+        DN 离开 pending（开始作业、拣货）前调用，之后按 dn_stock 扣减的拣货流程才能看到该 DN 的预扣。
+        """
+        for goods_id, warehouse_id in sort_lock_keys(sharded_keys(keys)):
+            InventoryService.update_and_calculate_dn_stock(goods_id, warehouse_id, source=source)
+
+    @staticmethod
+    @transactional
+    def enable_sharding(goods_id: int, warehouse_id: int, shard_count: int) -> dict:
+        """
+        为热点商品启用（或调整）库存分片
+        :param shard_count: 分片数量，1 ~ INVENTORY_MAX_SHARDS
+
+        启用后，新建 DN 的预扣从分片中扣减，不再锁定库存主记录；
+        Inventory.dn_stock 在再平衡、DN 开始作业及每次 dn_stock 重算时统一合并。
+        """
+        max_shards = current_app.config.get('INVENTORY_MAX_SHARDS', 64)
+        if not 1 <= shard_count <= max_shards:
+            raise BadRequestException(f"shard_count must be between 1 and {max_shards}", 15023)
+
+        # 加锁顺序：先分片后库存主记录，与再平衡任务一致
+        existing = lock_shards(goods_id, warehouse_id)
+        InventoryService._get_for_update(goods_id, warehouse_id)
+        for shard in existing[shard_count:]:
+            db.session.delete(shard)
+        for shard_no in range(len(existing), shard_count):
+            db.session.add(InventoryShard(
+                goods_id=goods_id, warehouse_id=warehouse_id, shard_no=shard_no, allotment=0, reserved=0,
+            ))
+        db.session.flush()
+
+        InventoryService.update_and_calculate_dn_stock(goods_id, warehouse_id, source=('shard', None))
+        return InventoryService.get_shards(goods_id, warehouse_id)
+
+    @staticmethod
+    @transactional
+    def rebalance_inventory_shards(goods_id: int, warehouse_id: int) -> dict:
+        """将分片中的预扣量合并到 Inventory.dn_stock，并重新分配可售库存"""
+        if not sharded_keys([(goods_id, warehouse_id)]):
+            raise BadRequestException(
+                f"Sharding is not enabled for goods {goods_id} in warehouse {warehouse_id}", 15024
+            )
+        InventoryService.update_and_calculate_dn_stock(goods_id, warehouse_id, source=('shard', None))
+        return InventoryService.get_shards(goods_id, warehouse_id)
+
+    @staticmethod
+    @transactional
+    def disable_sharding(goods_id: int, warehouse_id: int):
+        """停用库存分片：合并预扣量后删除全部分片，之后 DN 预扣恢复为锁定库存主记录"""
+        if not sharded_keys([(goods_id, warehouse_id)]):
+            return
+        InventoryService.update_and_calculate_dn_stock(goods_id, warehouse_id, source=('shard', None))
+        for shard in lock_shards(goods_id, warehouse_id):
+            db.session.delete(shard)
+        db.session.flush()
+
+    # ------------------------------------
+    # 提交前统一重算（dirty set）
+    # ------------------------------------
+
+    # 重算字段组与其刷新的库存字段
+    _DIRTY_BUCKET_FIELDS = {
+        'asn': ('asn_stock',),
+        'dn': ('dn_stock',),
+        'stock': ('onhand_stock', 'damage_stock', 'return_stock'),
+    }
+
+    @staticmethod
+    def mark_stock_dirty(goods_id: int, warehouse_id: int, *buckets, source: tuple = None):
+        """
+        标记库存需要重算，推迟到最外层事务提交前执行，同一事务内每个商品只重算一次
+        :param buckets: 'asn'（update_and_calculate_asn_stock）、'dn'（update_and_calculate_dn_stock）、
+                        'stock'（update_and_calculate_stock）
+        :param source: 来源单据 (source_type, source_id)，写入库存流水；同一商品同一字段组以首次标记为准
+        """
+        mark_dirty('inventory', (goods_id, warehouse_id), buckets, source)
+
+    @staticmethod
+    def flush_dirty_stock(keys=None, buckets=None):
+        """
+        立即重算已标记的库存（需要在同一事务内读取最新库存时调用）
+        :param keys: 可迭代的 (goods_id, warehouse_id)，None 表示全部
+        :param buckets: 只重算这些字段组，None 表示全部
+        """
+        dirty = pop_dirty('inventory', keys, buckets)
+        if dirty:
+            InventoryService._recompute_dirty(dirty)
+
+    @staticmethod
+    def _recompute_dirty(dirty: dict):
+        """按 (warehouse_id, goods_id) 顺序对每个标记的商品重算一次对应字段组"""
+        recompute = {
+            'asn': InventoryService.update_and_calculate_asn_stock,
+            'dn': InventoryService.update_and_calculate_dn_stock,
+            'stock': InventoryService.update_and_calculate_stock,
+        }
+        for key in sort_lock_keys(dirty):
+            for bucket in ('asn', 'dn', 'stock'):
+                if bucket in dirty[key]:
+                    recompute[bucket](*key, source=dirty[key][bucket])
+
     @staticmethod
     @transactional
-    def update_and_calculate_stock(goods_id: int, warehouse_id: int):
+    def update_and_calculate_stock(goods_id: int, warehouse_id: int, source: tuple = None):
 
         from warehouse.goods.services import GoodsLocationService
 
@@ -451,8 +1309,10 @@ class InventoryService:
         更新库存并计算库存状态
         :param goods_id: 关联的商品 ID
         :param warehouse_id: 仓库 ID
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
         """
         inventory = InventoryService._get_for_update(goods_id, warehouse_id)
+        before = InventoryService._stock_state(inventory)
         # 查找GoodsLocation表中的库存记录（这里假设支持传入 warehouse_id）
         gl_record = GoodsLocationService.get_quantity_by_location_type(goods_id, warehouse_id)
         
@@ -467,17 +1327,20 @@ class InventoryService:
         inventory.total_stock = InventoryService._calculate_total_stock(inventory)
         db.session.add(inventory)
         db.session.flush()
+        InventoryService._write_ledger([(inventory, before)], source)
         # db.session.commit()
 
     @staticmethod
     @transactional
-    def update_and_calculate_asn_stock(goods_id: int, warehouse_id: int):
+    def update_and_calculate_asn_stock(goods_id: int, warehouse_id: int, source: tuple = None):
         """
         更新 ASN 库存并计算库存状态
         :param goods_id: 关联的商品 ID
         :param warehouse_id: 仓库 ID
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
         """
         inventory = InventoryService._get_for_update(goods_id, warehouse_id)
+        before = InventoryService._stock_state(inventory)
 
         from warehouse.asn.models import ASN,ASNDetail
 
@@ -494,18 +1357,26 @@ class InventoryService:
         
         inventory.asn_stock = total_quantity
         db.session.flush()
+        InventoryService._write_ledger([(inventory, before)], source)
         # db.session.commit()
 
     
     @staticmethod
     @transactional
-    def update_and_calculate_dn_stock(goods_id: int, warehouse_id: int):
+    def update_and_calculate_dn_stock(goods_id: int, warehouse_id: int, source: tuple = None):
         """
         更新 DN 库存并计算库存状态
         :param goods_id: 关联的商品 ID
         :param warehouse_id: 仓库 ID
+        :param source: 来源单据 (source_type, source_id)，写入库存流水
+
+        已启用分片的商品同时回收分片：重算后的 dn_stock 已包含分片中扣减的 DN，
+        分片按最新可售库存重新分配并清零扣减量，避免同一预扣在两处重复计算。
+        加锁顺序：先分片后库存主记录，与 DN 从分片扣减一致。
         """
+        shards = lock_shards(goods_id, warehouse_id)
         inventory = InventoryService._get_for_update(goods_id, warehouse_id)
+        before = InventoryService._stock_state(inventory)
 
         from warehouse.dn.models import DN,DNDetail
 
@@ -534,9 +1405,15 @@ class InventoryService:
 
         db.session.add(inventory)
         db.session.flush()
+        if shards:
+            InventoryService._split_shards(inventory, shards)
+        InventoryService._write_ledger([(inventory, before)], source)
         # db.session.commit()
 
             
 
     
     
+
+
+register_dirty_handler('inventory', InventoryService._recompute_dirty)
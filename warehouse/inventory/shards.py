@@ -0,0 +1,118 @@
+import random
+from sqlalchemy import func, tuple_, update
+from extensions import db
+from .models import InventoryShard
+
+
+def sharded_keys(keys) -> set:
+    """
+    返回已启用分片的 (goods_id, warehouse_id)
+    :param keys: 可迭代的 (goods_id, warehouse_id)
+    """
+    keys = set(keys)
+    if not keys:
+        return set()
+    rows = db.session.query(InventoryShard.goods_id, InventoryShard.warehouse_id).filter(
+        tuple_(InventoryShard.goods_id, InventoryShard.warehouse_id).in_(list(keys))
+    ).distinct().all()
+    return {(row.goods_id, row.warehouse_id) for row in rows}
+
+
+def lock_shards(goods_id: int, warehouse_id: int, shard_nos=None) -> list:
+    """按 shard_no 顺序加行锁读取分片，刷新身份映射中的旧值"""
+    query = InventoryShard.query.filter_by(goods_id=goods_id, warehouse_id=warehouse_id)
+    if shard_nos is not None:
+        query = query.filter(InventoryShard.shard_no.in_(list(shard_nos)))
+    return query.order_by(InventoryShard.shard_no).populate_existing().with_for_update().all()
+
+
+def draw_from_shards(goods_id: int, warehouse_id: int, quantity: int) -> bool:
+    """
+    从分片扣减 DN 预扣量
+
+    先从随机起点逐个分片尝试一条带条件的 UPDATE（余量足够才扣减，不先加锁读取），
+    并发请求分散在不同分片上，成功即返回，失败的尝试不持有任何分片锁；
+    单个分片都不够时，再按 shard_no 顺序锁定全部分片合并扣减，加锁顺序固定，不会与其他扣减交叉等待。
+    :return: 是否扣减成功（全部分片合计也不足时返回 False，不做任何扣减）
+    """
+    from .cache import stage_availability_invalidation
+
+    shard_nos = [
+        row.shard_no for row in db.session.query(InventoryShard.shard_no).filter_by(
+            goods_id=goods_id, warehouse_id=warehouse_id
+        )
+    ]
+    if not shard_nos:
+        return False
+
+    start = random.randrange(len(shard_nos))
+    for shard_no in shard_nos[start:] + shard_nos[:start]:
+        result = db.session.execute(
+            update(InventoryShard)
+            .where(
+                InventoryShard.goods_id == goods_id,
+                InventoryShard.warehouse_id == warehouse_id,
+                InventoryShard.shard_no == shard_no,
+                InventoryShard.allotment - InventoryShard.reserved >= quantity,
+            )
+            .values(reserved=InventoryShard.reserved + quantity)
+            .execution_options(synchronize_session='fetch')
+        )
+        if result.rowcount == 1:
+            stage_availability_invalidation([(goods_id, warehouse_id)])
+            return True
+
+    shards = lock_shards(goods_id, warehouse_id)
+    if sum(max(shard.remaining, 0) for shard in shards) < quantity:
+        return False
+    left = quantity
+    for shard in shards:
+        take = min(max(shard.remaining, 0), left)
+        shard.reserved += take
+        left -= take
+        if not left:
+            break
+    db.session.flush()
+    return True
+
+
+def remaining_in_shards(goods_id: int, warehouse_id: int) -> int:
+    """分片中尚未扣减的可售库存合计"""
+    return db.session.query(
+        func.coalesce(func.sum(InventoryShard.allotment - InventoryShard.reserved), 0)
+    ).filter(
+        InventoryShard.goods_id == goods_id,
+        InventoryShard.warehouse_id == warehouse_id,
+    ).scalar()
+
+
+def remaining_by_key(keys) -> dict:
+    """
+    按 (goods_id, warehouse_id) 汇总分片余量，未启用分片的 key 不出现在结果中
+    :param keys: 可迭代的 (goods_id, warehouse_id)
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+    rows = db.session.query(
+        InventoryShard.goods_id,
+        InventoryShard.warehouse_id,
+        func.sum(InventoryShard.allotment - InventoryShard.reserved).label('remaining'),
+    ).filter(
+        tuple_(InventoryShard.goods_id, InventoryShard.warehouse_id).in_(list(keys))
+    ).group_by(InventoryShard.goods_id, InventoryShard.warehouse_id).all()
+    return {(row.goods_id, row.warehouse_id): int(row.remaining) for row in rows}
+
+
+def split_allotments(available: int, shard_count: int) -> list:
+    """将可售库存平均拆分到各分片，余数分给序号靠前的分片"""
+    base, extra = divmod(max(available, 0), shard_count)
+    return [base + (1 if shard_no < extra else 0) for shard_no in range(shard_count)]
+
+
+def all_sharded_keys() -> list:
+    """所有已启用分片的 (goods_id, warehouse_id)，按 (warehouse_id, goods_id) 排序"""
+    rows = db.session.query(InventoryShard.goods_id, InventoryShard.warehouse_id).distinct().order_by(
+        InventoryShard.warehouse_id, InventoryShard.goods_id
+    ).all()
+    return [(row.goods_id, row.warehouse_id) for row in rows]
@@ -0,0 +1,85 @@
+from sqlalchemy import event
+from extensions import db
+from .models import Inventory
+
+# 阈值状态变化时推送的 Webhook 事件类型：(阈值类型, 是否越界) -> event_type
+THRESHOLD_EVENTS = {
+    ('low', True): 'inventory.low_stock',
+    ('low', False): 'inventory.low_stock_cleared',
+    ('high', True): 'inventory.high_stock',
+    ('high', False): 'inventory.high_stock_cleared',
+}
+
+
+def threshold_flags(onhand_stock: int, locked_stock: int, dn_stock: int,
+                    low_stock_threshold: int, high_stock_threshold: int) -> tuple:
+    """
+    按可售库存计算阈值越界状态（口径与 InventoryService.check_stock_thresholds 一致）
+    :return: (is_below_low_threshold, is_above_high_threshold)
+    """
+    available = (onhand_stock or 0) - (locked_stock or 0) - (dn_stock or 0)
+    low = low_stock_threshold if low_stock_threshold is not None else -1
+    high = high_stock_threshold if high_stock_threshold is not None else -1
+    return (
+        low != -1 and available < low,
+        high != -1 and available > high,
+    )
+
+
+def threshold_transitions(goods_id: int, warehouse_id: int, before: tuple, after: tuple,
+                          available_stock_for_sale: int, low_stock_threshold: int,
+                          high_stock_threshold: int) -> list:
+    """比较变更前后的越界状态，返回需要推送的 (event_type, payload) 列表"""
+    transitions = []
+    for breach, was, now in zip(('low', 'high'), before, after):
+        if bool(was) == now:
+            continue
+        transitions.append((THRESHOLD_EVENTS[(breach, now)], {
+            'goods_id': goods_id,
+            'warehouse_id': warehouse_id,
+            'available_stock_for_sale': available_stock_for_sale,
+            'low_stock_threshold': low_stock_threshold,
+            'high_stock_threshold': high_stock_threshold,
+        }))
+    return transitions
+
+
+def emit_threshold_events(transitions: list):
+    """为越界状态变化创建 Webhook 事件（推送给仓库所属公司的 API Key），不触发 flush"""
+    from system.webhook.services import emit_to_company
+    from warehouse.warehouse.models import Warehouse
+
+    companies = {}
+    for event_type, payload in transitions:
+        warehouse_id = payload['warehouse_id']
+        if warehouse_id not in companies:
+            warehouse = db.session.get(Warehouse, warehouse_id)
+            companies[warehouse_id] = warehouse.company_id if warehouse else None
+        emit_to_company(event_type, payload, companies[warehouse_id], flush=False)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _refresh_threshold_flags(session, flush_context, instances):
+    """
+    flush 前为新增/修改的库存记录刷新越界标记，与库存变更在同一事务内写入；
+    仅在状态发生变化时创建 Webhook 事件
+    """
+    transitions = []
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Inventory):
+            continue
+        before = (obj.is_below_low_threshold, obj.is_above_high_threshold)
+        after = threshold_flags(
+            obj.onhand_stock, obj.locked_stock, obj.dn_stock,
+            obj.low_stock_threshold, obj.high_stock_threshold,
+        )
+        if tuple(bool(flag) for flag in before) == after and None not in before:
+            continue
+        obj.is_below_low_threshold, obj.is_above_high_threshold = after
+        transitions.extend(threshold_transitions(
+            obj.goods_id, obj.warehouse_id, before, after,
+            (obj.onhand_stock or 0) - (obj.locked_stock or 0) - (obj.dn_stock or 0),
+            obj.low_stock_threshold, obj.high_stock_threshold,
+        ))
+    if transitions:
+        emit_threshold_events(transitions)
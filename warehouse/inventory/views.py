@@ -4,7 +4,8 @@ from flask_restx import Resource
 from system.common import paginate,permission_required
 from warehouse.common import warehouse_required
 from warehouse.common.utils import add_warehouse_filter
-from .schemas import api_ns, inventory_model, inventory_pagination_parser,pagination_model
+from .schemas import api_ns, inventory_model, inventory_pagination_parser,pagination_model, inventory_breach_pagination_parser, inventory_balance_parser, inventory_balance_model, inventory_availability_model, \
+    inventory_availability_batch_input_model, inventory_availability_batch_model, inventory_shard_input_model, inventory_shards_model
 from .services import InventoryService
 
 
@@ -48,6 +49,24 @@ class InventoryList(Resource):
     #     new_inventory = InventoryService.create_inventory(data)
     #     return new_inventory, 201
 
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/replenishment')
+class InventoryReplenishmentList(Resource):
+
+    @permission_required(["all_access","company_all_access","inventory_read"])
+    @warehouse_required()
+    @api_ns.marshal_with(pagination_model)
+    @api_ns.expect(inventory_breach_pagination_parser)
+    def get(self):
+        """
+        Get a paginated list of inventory currently breaching a stock threshold.
+        - `breach`: `low` (default) lists goods below the low stock threshold (replenishment needed), `high` lists goods above the high stock threshold.
+        """
+        args = inventory_breach_pagination_parser.parse_args()
+        filters = add_warehouse_filter({'goods_id': args.get('goods_id')})
+        query = InventoryService.list_threshold_breaches(filters, args.get('breach') or 'low')
+        return paginate(query, args.get('page'), args.get('per_page'), args.get('all', False)), 200
+
 @api_ns.doc(security="jsonWebToken")
 @api_ns.route('/goods/<int:goods_id>/warehouse/<int:warehouse_id>')
 class InventoryDetail(Resource):
@@ -79,4 +98,123 @@ class InventoryDetail(Resource):
     #     """Delete an inventory record by Goods ID"""
     #     from .services import InventoryService
     #     InventoryService.delete_inventory(goods_id, warehouse_id)
-    #     return {"message": "Inventory record deleted successfully"}, 200
\ No newline at end of file
+    #     return {"message": "Inventory record deleted successfully"}, 200
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/availability/goods/<int:goods_id>/warehouse/<int:warehouse_id>')
+class InventoryAvailability(Resource):
+
+    @permission_required(["all_access","company_all_access","inventory_read"])
+    @warehouse_required()
+    @api_ns.marshal_with(inventory_availability_model)
+    def get(self, goods_id, warehouse_id):
+        """
+        Get stock counters of a goods in a warehouse, served from the availability cache when enabled.
+        - `version` / `cached_at` let callers detect stale values; both are null when read from the database.
+        """
+        return InventoryService.get_availability(goods_id, warehouse_id), 200
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/availability/batch')
+class InventoryAvailabilityBatch(Resource):
+
+    @permission_required(["all_access","company_all_access","inventory_read"])
+    @warehouse_required()
+    @api_ns.expect(inventory_availability_batch_input_model)
+    @api_ns.marshal_with(inventory_availability_batch_model)
+    def post(self):
+        """
+        Get stock counters for many goods across warehouses in one call (up to 1000 goods).
+        - `goods_ids` / `goods_codes`: at least one is required.
+        - `warehouse_ids`: optional, limited to the warehouses accessible to the current user.
+        """
+        data = api_ns.payload or {}
+        warehouse_ids = data.get('warehouse_ids')
+        scope = add_warehouse_filter({})
+        if 'warehouse_id' in scope:
+            allowed = [scope['warehouse_id']]
+        elif 'warehouse_ids' in scope:
+            allowed = scope['warehouse_ids']
+        else:
+            allowed = None
+        if allowed is not None:
+            warehouse_ids = [w for w in warehouse_ids if w in allowed] if warehouse_ids else allowed
+
+        items = InventoryService.get_availability_batch(
+            goods_ids=data.get('goods_ids'),
+            goods_codes=data.get('goods_codes'),
+            warehouse_ids=warehouse_ids,
+        )
+        return {'items': items}, 200
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/goods/<int:goods_id>/warehouse/<int:warehouse_id>/balance')
+class InventoryBalance(Resource):
+
+    @permission_required(["all_access","company_all_access","inventory_read"])
+    @warehouse_required()
+    @api_ns.expect(inventory_balance_parser)
+    @api_ns.marshal_with(inventory_balance_model)
+    def get(self, goods_id, warehouse_id):
+        """
+        Get the balance of a stock field at a point in time, replayed from the inventory ledger.
+        - `at`: Required, ISO 8601 datetime.
+        - `bucket`: Optional, stock field name (default `onhand_stock`).
+        """
+        args = inventory_balance_parser.parse_args()
+        balance = InventoryService.get_balance_at(goods_id, warehouse_id, args['at'], args['bucket'])
+        return {
+            'goods_id': goods_id,
+            'warehouse_id': warehouse_id,
+            'bucket': args['bucket'],
+            'at': args['at'],
+            'balance': balance,
+        }, 200
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/goods/<int:goods_id>/warehouse/<int:warehouse_id>/shards')
+class InventoryShards(Resource):
+
+    @permission_required(["all_access","company_all_access","inventory_read"])
+    @warehouse_required()
+    @api_ns.marshal_with(inventory_shards_model)
+    def get(self, goods_id, warehouse_id):
+        """
+        Get the stock shards of a hot goods (shard_count is 0 when sharding is disabled).
+        """
+        return InventoryService.get_shards(goods_id, warehouse_id), 200
+
+    @permission_required(["all_access","company_all_access","inventory_edit"])
+    @warehouse_required()
+    @api_ns.expect(inventory_shard_input_model)
+    @api_ns.marshal_with(inventory_shards_model)
+    def put(self, goods_id, warehouse_id):
+        """
+        Enable or resize stock sharding for a hot goods.
+        - New DN reservations draw from the shards instead of locking the inventory row.
+        - `Inventory.dn_stock` is folded back at every rebalance.
+        """
+        data = api_ns.payload or {}
+        return InventoryService.enable_sharding(goods_id, warehouse_id, data.get('shard_count', 0)), 200
+
+    @permission_required(["all_access","company_all_access","inventory_edit"])
+    @warehouse_required()
+    def delete(self, goods_id, warehouse_id):
+        """
+        Disable stock sharding (reservations are folded back into the inventory row first).
+        """
+        InventoryService.disable_sharding(goods_id, warehouse_id)
+        return {"message": "Inventory sharding disabled successfully"}, 200
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/goods/<int:goods_id>/warehouse/<int:warehouse_id>/shards/rebalance')
+class InventoryShardsRebalance(Resource):
+
+    @permission_required(["all_access","company_all_access","inventory_edit"])
+    @warehouse_required()
+    @api_ns.marshal_with(inventory_shards_model)
+    def post(self, goods_id, warehouse_id):
+        """
+        Fold shard reservations into `Inventory.dn_stock` and re-split the stock for sale across the shards.
+        """
+        return InventoryService.rebalance_inventory_shards(goods_id, warehouse_id), 200
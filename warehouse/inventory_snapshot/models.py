@@ -6,6 +6,7 @@ class InventorySnapshot(db.Model):
 
     __table_args__ = (
         db.Index('idx_inventory_snapshot_goods_warehouse_location_time', 'goods_id', 'warehouse_id', 'location_id', 'snapshot_time'),  # 商品+仓库+时间
+        db.Index('idx_inventory_snapshot_goods_warehouse_time', 'goods_id', 'warehouse_id', 'snapshot_time'),  # 按时间查找最近快照
     )
     id = db.Column(db.Integer, primary_key=True)
 
@@ -1,9 +1,14 @@
 # services.py
-from sqlalchemy import or_
+from sqlalchemy import inspect, or_
 from extensions.db import *
 from extensions.transaction import transactional
+from warehouse.goods.capacity import invalidate_capacity_index
 from .models import Location
 
+# 影响上架容量索引的库位字段
+_CAPACITY_FIELDS = ('location_type', 'width', 'depth', 'height', 'capacity', 'is_active')
+
+
 class LocationService:
 
     @staticmethod
@@ -71,6 +76,7 @@ class LocationService:
             created_by=created_by_id
         )
         db.session.add(new_location)
+        invalidate_capacity_index(new_location.warehouse_id)
         # db.session.commit()
         return new_location
 
@@ -91,6 +97,9 @@ class LocationService:
         location.capacity = data.get('capacity', location.capacity)
         location.is_active = data.get('is_active', location.is_active)
 
+        # 类型、尺寸、启用状态影响上架容量索引
+        if any(inspect(location).attrs[name].history.has_changes() for name in _CAPACITY_FIELDS):
+            invalidate_capacity_index(location.warehouse_id)
         # db.session.commit()
         return location
 
@@ -101,6 +110,7 @@ class LocationService:
         删除库位（硬删除）
         """
         location = LocationService.get_location(location_id)
+        invalidate_capacity_index(location.warehouse_id)
         db.session.delete(location)
         # db.session.commit()
 
@@ -112,5 +122,6 @@ class LocationService:
         """
         location = LocationService.get_location(location_id)
         location.is_active = False
+        invalidate_capacity_index(location.warehouse_id)
         # db.session.commit()
         return location
\ No newline at end of file
@@ -44,13 +44,20 @@ packing_task_detail_for_batch_model = api_ns.model('PackingTaskDetailForBatch',
 # ---------------------------------------------------------------------------------
 # 3. Packing Batch 序列化模型（输出）
 # ---------------------------------------------------------------------------------
-packing_batch_model = api_ns.model('PackingBatch', {
+packing_batch_header_fields = {
     'id': fields.Integer(readOnly=True, description='Packing batch ID'),
     'packing_task_id': fields.Integer(required=True, description='Associated packing task ID'),
     'operator_id': fields.Integer(required=True, description='Operator ID'),
     'operation_time': fields.DateTime(description='Operation time'),
     'remark': fields.String(description='Batch remarks'),
     'operator': fields.Nested(user_model,readOnly=True, description='Operator details'),
+}
+
+# 只含批次本身（创建批次时的默认返回，不读取明细）
+packing_batch_header_model = api_ns.model('PackingBatchHeader', packing_batch_header_fields)
+
+packing_batch_model = api_ns.model('PackingBatch', {
+    **packing_batch_header_fields,
     'details': fields.List(fields.Nested(packing_task_detail_for_batch_model),readOnly=True,description='List of associated packing details for this batch')
 })
 
@@ -138,6 +145,11 @@ packing_batch_input_fields['details'] = fields.List(
 )
 packing_batch_input_model = api_ns.model('PackingBatchInput', packing_batch_input_fields)
 
+# 创建批次的查询参数：expand=details 时返回批次及其明细
+packing_batch_create_parser = reqparse.RequestParser()
+packing_batch_create_parser.add_argument('expand', type=str, location='args', choices=('details',),
+                                         help='Return the created details along with the batch')
+
 # ---------------------------------------------------------------------------------
 # 分页解析器 & 分页模型
 # ---------------------------------------------------------------------------------
@@ -12,7 +12,7 @@ from .models import (
 from warehouse.dn.services import DNService
 from warehouse.inventory.services import InventoryService
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import and_, func, case, extract
+from sqlalchemy import and_, func, case, extract, insert
 from datetime import datetime, timedelta
 
 class PackingTaskService:
@@ -269,26 +269,52 @@ class PackingTaskService:
         # 使用 flush() 以获取 new_batch.id
         db.session.flush()
 
-        # 2) 如果有 details，就批量创建
+        # 2) 如果有 details，就以一条多行 INSERT 批量创建
         details_data = data.get('details')
         if details_data:
             if not isinstance(details_data, list):
                 raise BadRequestException("'details' must be a list if provided", 16015)
 
-            for item in details_data:
-                detail = PackingTaskDetail(
-                    packing_task_id=task.id,
-                    batch_id=new_batch.id,
-                    goods_id=item['goods_id'],
-                    packed_quantity=item.get('packed_quantity', 0),
-                    packing_time=item.get('packing_time', datetime.now()),
-                    operator_id=operator_id
-                )
-                db.session.add(detail)
+            packing_times = PackingTaskService._parse_packing_times(details_data)
+            db.session.execute(insert(PackingTaskDetail), [
+                {
+                    'packing_task_id': task.id,
+                    'batch_id': new_batch.id,
+                    'goods_id': item['goods_id'],
+                    'packed_quantity': item.get('packed_quantity', 0),
+                    'packing_time': packing_time,
+                    'operator_id': operator_id,
+                }
+                for item, packing_time in zip(details_data, packing_times)
+            ])
+            # 已加载的明细集合随后过期，下次访问时重新读取
+            db.session.expire(task, ['task_details'])
+            db.session.expire(new_batch, ['details'])
         
         # db.session.commit()
         return new_batch
 
+    @staticmethod
+    def _parse_packing_times(details_data: list) -> list:
+        """
+        解析一个批次中各明细的 packing_time
+        相同的时间字符串只解析一次，未提供时间的明细统一使用同一个当前时间。
+        """
+        now = datetime.now()
+        parsed = {}
+        times = []
+        for item in details_data:
+            value = item.get('packing_time')
+            if value is None:
+                times.append(now)
+            elif isinstance(value, str):
+                if value not in parsed:
+                    parsed[value] = datetime.fromisoformat(value)
+                times.append(parsed[value])
+            else:
+                times.append(value)
+        return times
+
     @staticmethod
     def get_batch(task_id: int, batch_id: int) -> PackingBatch:
         """
@@ -1,5 +1,5 @@
 from flask import g
-from flask_restx import Resource,abort
+from flask_restx import Resource,abort,marshal
 from extensions.error import ForbiddenException
 from warehouse.common import warehouse_required,add_warehouse_filter,check_warehouse_access
 from .schemas import (
@@ -11,7 +11,9 @@ from .schemas import (
     packing_task_input_model,
     packing_task_detail_input_model,
     packing_batch_model,
+    packing_batch_header_model,
     packing_batch_input_model,
+    packing_batch_create_parser,
     packing_monthly_stats_parser
 )
 from .services import PackingTaskService
@@ -217,15 +219,17 @@ class PackingBatchList(Resource):
 
     @permission_required(["all_access","company_all_access","packing_edit"])
     @warehouse_required()
-    @api_ns.expect(packing_batch_input_model)
-    @api_ns.marshal_with(packing_batch_model)
+    @api_ns.expect(packing_batch_input_model, packing_batch_create_parser)
+    @api_ns.response(201, 'Created', packing_batch_header_model)
     def post(self, task_id):
         """
         创建新的 PackingBatch
 
         - 如果传入 data['details']，则同时批量创建 PackingTaskDetail
+        - 默认只返回批次本身，`?expand=details` 时同时返回本批次明细
         - 要求对应的 PackingTask 必须是 in_progress 状态
         """
+        args = packing_batch_create_parser.parse_args()
         data = api_ns.payload or {}
         operator_id = g.current_user.id
 
@@ -235,7 +239,9 @@ class PackingBatchList(Resource):
 
         new_batch = PackingTaskService.create_batch(task_id, data, operator_id)
 
-        return new_batch, 201
+        # 默认只返回批次本身；expand=details 时再读取并返回本批次明细
+        model = packing_batch_model if args.get('expand') == 'details' else packing_batch_header_model
+        return marshal(new_batch, model), 201
 
 
 @api_ns.doc(security="jsonWebToken")
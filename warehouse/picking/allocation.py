@@ -0,0 +1,151 @@
+from datetime import date, datetime
+from sqlalchemy import and_, func, or_, select, union_all
+from extensions import db
+from warehouse.goods.models import Goods, GoodsLocation
+from warehouse.location.models import Location
+from .models import PickingTask, PickingTaskDetail, PickingWaveLine
+
+ALLOCATION_STRATEGIES = ('fefo', 'fifo')
+
+
+def open_pick_commitments(own_task_id: int = None):
+    """
+    未完成拣货任务占用的库位数量明细（UNION ALL 子查询，列为 dn_id / goods_id / location_id / quantity）
+    :param own_task_id: 正在为其校验拣货的任务；该任务按已拣量计，不计它自己的波次分配量
+
+    波次任务（未完成即占用）按 PickingWaveLine 分配量计；
+    非波次的进行中任务按已拣、尚未完成下架的数量计。
+    """
+    picked = select(
+        PickingTask.dn_id.label('dn_id'),
+        PickingTaskDetail.goods_id.label('goods_id'),
+        PickingTaskDetail.location_id.label('location_id'),
+        PickingTaskDetail.picked_quantity.label('quantity'),
+    ).join(
+        PickingTask, PickingTaskDetail.picking_task_id == PickingTask.id
+    ).where(
+        PickingTask.status == 'in_progress',
+        PickingTask.is_active.is_(True),
+        or_(PickingTask.wave_id.is_(None), PickingTask.id == own_task_id),
+    )
+    waved = select(
+        PickingTask.dn_id.label('dn_id'),
+        PickingWaveLine.goods_id.label('goods_id'),
+        PickingWaveLine.location_id.label('location_id'),
+        PickingWaveLine.quantity.label('quantity'),
+    ).join(
+        PickingTask, PickingWaveLine.picking_task_id == PickingTask.id
+    ).where(
+        PickingTask.status != 'completed',
+        PickingTask.is_active.is_(True),
+    )
+    if own_task_id is not None:
+        waved = waved.where(PickingTask.id != own_task_id)
+    return union_all(picked, waved).subquery()
+
+
+def committed_pick_quantities(own_task_id: int = None):
+    """未完成拣货任务占用的数量（见 open_pick_commitments），按 (goods_id, location_id) 汇总的子查询"""
+    commitments = open_pick_commitments(own_task_id)
+    return select(
+        commitments.c.goods_id,
+        commitments.c.location_id,
+        func.sum(commitments.c.quantity).label('quantity'),
+    ).group_by(
+        commitments.c.goods_id, commitments.c.location_id
+    ).subquery()
+
+
+class BinIndex:
+    """
+    单个仓库的库位可拣库存内存索引（一次查询构建）
+
+    只包含启用的 standard 库位，可拣量 = 商品库位数量 - 未完成拣货任务占用量（波次分配量 / 进行中已拣量）。
+    每个商品的库位按拣货优先级排序：
+        fefo：先按商品保质期（已过期的不分配），同一保质期按入库时间先进先出
+        fifo：只按入库时间先进先出
+    allocate 只在内存中扣减，同一索引上连续分配多张 DN 不会重复占用同一份库存。
+    """
+
+    def __init__(self, warehouse_id: int, goods_ids=None, strategy: str = 'fefo', zone: str = None):
+        self.warehouse_id = warehouse_id
+        self.strategy = strategy
+        self.zone = zone
+        # goods_id -> [[location_id, location_code, 可拣量], ...]（按优先级排序）
+        self.bins = {}
+
+        committed = committed_pick_quantities()
+        query = db.session.query(
+            GoodsLocation.goods_id,
+            GoodsLocation.location_id,
+            Location.code,
+            (GoodsLocation.quantity - func.coalesce(committed.c.quantity, 0)).label('available'),
+            Goods.expiration_date,
+            GoodsLocation.created_at,
+        ).join(
+            Location, GoodsLocation.location_id == Location.id
+        ).join(
+            Goods, GoodsLocation.goods_id == Goods.id
+        ).outerjoin(
+            committed, and_(
+                committed.c.goods_id == GoodsLocation.goods_id,
+                committed.c.location_id == GoodsLocation.location_id,
+            )
+        ).filter(
+            Location.warehouse_id == warehouse_id,
+            Location.location_type == 'standard',
+            Location.is_active.is_(True),
+            GoodsLocation.quantity > 0,
+        )
+        if goods_ids is not None:
+            query = query.filter(GoodsLocation.goods_id.in_(list(set(goods_ids))))
+        if zone:
+            # 库区以库位代码前缀表示（如 A-01-02 属于库区 A）
+            query = query.filter(Location.code.startswith(zone, autoescape=True))
+        if strategy == 'fefo':
+            query = query.filter(or_(Goods.expiration_date.is_(None), Goods.expiration_date >= date.today()))
+
+        rows = [row for row in query.all() if row.available > 0]
+        if strategy == 'fefo':
+            rows.sort(key=lambda row: (
+                row.expiration_date is None, row.expiration_date or date.max,
+                row.created_at or datetime.min, row.code,
+            ))
+        else:
+            rows.sort(key=lambda row: (row.created_at or datetime.min, row.code))
+        for row in rows:
+            self.bins.setdefault(row.goods_id, []).append([row.location_id, row.code, row.available])
+
+    def locations(self, goods_id: int) -> set:
+        """商品当前仍有可拣量的库位ID集合"""
+        return {entry[0] for entry in self.bins.get(goods_id, ()) if entry[2] > 0}
+
+    def available(self, goods_id: int) -> int:
+        """商品在该仓库剩余的可拣量合计"""
+        return sum(entry[2] for entry in self.bins.get(goods_id, ()))
+
+    def allocate(self, goods_id: int, quantity: int) -> tuple:
+        """
+        按优先级从各库位分配拣货数量，并在索引中扣减
+        :return: (lines, shortage)，lines 为 [(location_id, location_code, quantity), ...]，
+                 shortage 为可拣量不足而未能分配的数量
+        """
+        lines = []
+        for entry in self.bins.get(goods_id, ()):
+            if quantity <= 0:
+                break
+            take = min(entry[2], quantity)
+            if take <= 0:
+                continue
+            entry[2] -= take
+            quantity -= take
+            lines.append((entry[0], entry[1], take))
+        return lines, max(quantity, 0)
+
+    def release(self, goods_id: int, lines):
+        """归还 allocate 分配出去的数量（分配结果被放弃时调用）"""
+        returned = {}
+        for location_id, _, quantity in lines:
+            returned[location_id] = returned.get(location_id, 0) + quantity
+        for entry in self.bins.get(goods_id, ()):
+            entry[2] += returned.pop(entry[0], 0)
@@ -43,6 +43,18 @@ class PickingTask(db.Model):
         nullable=False,
         info={'description': '创建人ID'}
     )
+    wave_id = db.Column(
+        db.Integer,
+        db.ForeignKey('picking_waves.id', ondelete='SET NULL'),
+        nullable=True,
+        index=True,
+        info={'description': '所属拣货波次ID（单独拣货的任务为空）'}
+    )
+    wall_slot = db.Column(
+        db.Integer,
+        nullable=True,
+        info={'description': '波次内播种墙格口号（从 1 开始）'}
+    )
     created_at = db.Column(
         db.DateTime,
         default=db.func.now(),
@@ -276,4 +288,148 @@ class PickingTaskStatusLog(db.Model):
         backref=db.backref('picking_status_changes', lazy='dynamic'),
         lazy='joined',
         info={'description': '操作人对象'}
-    )
\ No newline at end of file
+    )
+
+
+class PickingWave(db.Model):
+    """拣货波次表（多张 DN 合并拣货，按格口播种回各自的拣货任务）
+
+    Attributes:
+        cutoff_date: 截单日期（选取 expected_shipping_date 不晚于该日期的 DN）
+        zone: 库区（库位代码前缀），为空表示整个仓库
+        strategy: 库位分配策略 (fefo/fifo)
+    """
+    __tablename__ = 'picking_waves'
+
+    id = db.Column(db.Integer, primary_key=True)
+    warehouse_id = db.Column(
+        db.Integer,
+        db.ForeignKey('warehouses.id', ondelete='RESTRICT'),
+        nullable=False,
+        index=True,
+        info={'description': '仓库ID'}
+    )
+    carrier_id = db.Column(
+        db.Integer,
+        db.ForeignKey('carriers.id', ondelete='RESTRICT'),
+        nullable=True,
+        info={'description': '承运商ID'}
+    )
+    cutoff_date = db.Column(
+        db.Date,
+        nullable=True,
+        info={'description': '截单日期'}
+    )
+    zone = db.Column(
+        db.String(50),
+        nullable=True,
+        info={'description': '库区（库位代码前缀）'}
+    )
+    strategy = db.Column(
+        db.String(10),
+        nullable=False,
+        default='fefo',
+        info={'description': '库位分配策略'}
+    )
+    created_by = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='RESTRICT'),
+        nullable=False,
+        info={'description': '创建人ID'}
+    )
+    created_at = db.Column(
+        db.DateTime,
+        default=db.func.now(),
+        info={'description': '波次创建时间'}
+    )
+
+    tasks = db.relationship(
+        'PickingTask',
+        backref=db.backref('wave', lazy='select'),
+        lazy='select',
+        order_by='PickingTask.wall_slot',
+        info={'description': '波次内各 DN 的拣货任务'}
+    )
+    lines = db.relationship(
+        'PickingWaveLine',
+        backref='wave',
+        lazy='select',
+        cascade='all, delete-orphan',
+        order_by='PickingWaveLine.id',
+        info={'description': '波次分配明细'}
+    )
+
+    @property
+    def pick_list(self) -> list:
+        """合并拣货单：同一库位同一商品合并为一行，附各格口的播种数量，按库位代码排序"""
+        rows = {}
+        for line in self.lines:
+            row = rows.setdefault((line.location_id, line.goods_id), {
+                'location_id': line.location_id,
+                'location_code': line.location.code,
+                'goods_id': line.goods_id,
+                'quantity': 0,
+                'slots': [],
+            })
+            row['quantity'] += line.quantity
+            row['slots'].append({'wall_slot': line.wall_slot, 'dn_id': line.dn_id, 'quantity': line.quantity})
+        return sorted(rows.values(), key=lambda row: (row['location_code'], row['goods_id']))
+
+
+class PickingWaveLine(db.Model):
+    """拣货波次分配明细表（某 DN 的某商品从某库位拣多少、放入哪个格口）"""
+    __tablename__ = 'picking_wave_lines'
+
+    __table_args__ = (
+        db.Index('idx_picking_wave_line_location', 'wave_id', 'location_id'),
+        db.CheckConstraint('quantity > 0', name='chk_picking_wave_line_qty'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    wave_id = db.Column(
+        db.Integer,
+        db.ForeignKey('picking_waves.id', ondelete='CASCADE'),
+        nullable=False,
+        info={'description': '波次ID'}
+    )
+    picking_task_id = db.Column(
+        db.Integer,
+        db.ForeignKey('picking_tasks.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+        info={'description': 'DN 对应的拣货任务ID'}
+    )
+    dn_id = db.Column(
+        db.Integer,
+        db.ForeignKey('dn.id', ondelete='RESTRICT'),
+        nullable=False,
+        info={'description': '发货单ID'}
+    )
+    wall_slot = db.Column(
+        db.Integer,
+        nullable=False,
+        info={'description': '播种墙格口号'}
+    )
+    goods_id = db.Column(
+        db.Integer,
+        db.ForeignKey('goods.id', ondelete='RESTRICT'),
+        nullable=False,
+        info={'description': '商品ID'}
+    )
+    location_id = db.Column(
+        db.Integer,
+        db.ForeignKey('locations.id', ondelete='RESTRICT'),
+        nullable=False,
+        info={'description': '库位ID'}
+    )
+    quantity = db.Column(
+        db.Integer,
+        nullable=False,
+        info={'description': '分配数量'}
+    )
+
+    location = db.relationship(
+        'Location',
+        lazy='joined',
+        info={'description': '库位对象'}
+    )
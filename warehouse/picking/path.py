@@ -0,0 +1,174 @@
+import re
+from itertools import groupby
+
+# 相邻两条巷道之间的横向距离（以库位间距为单位）
+AISLE_PITCH = 3
+# 同一库位上下层之间的取货代价（只用于同一位置的先后排序）
+LEVEL_COST = 0.1
+
+_TOKEN = re.compile(r'[A-Za-z]+|\d+')
+
+
+def parse_location_code(code: str) -> tuple:
+    """
+    从库位代码解析 (巷道, 列, 层)
+
+    代码按字母段 / 数字段切分：第一段为巷道，第二段为列（bay），第三段为层（level），
+    如 A-01-03-2、A0103、B12-4；解析不出的部分取 0。巷道保留原始段（字母或数字），
+    由 PathPlanner 统一排序后换算成巷道序号。
+    """
+    tokens = _TOKEN.findall(code or '')
+    aisle = tokens[0].upper() if tokens else ''
+    if aisle.isdigit():
+        aisle = int(aisle)
+    numbers = [int(token) for token in tokens[1:] if token.isdigit()]
+    bay = numbers[0] if numbers else 0
+    level = numbers[1] if len(numbers) > 1 else 0
+    return aisle, bay, level
+
+
+class PathPlanner:
+    """
+    拣货路径规划
+
+    库位按代码解析为 (巷道序号, 列, 层)，仓库视为两端有横向通道的平行巷道：
+    同一巷道内按列距离行走，换巷道时从前端或后端通道绕行，取较短的一侧。
+    distance_overrides 为按库位代码配置的距离矩阵（{from_code: {to_code: 距离}}），
+    配置了的库位对优先使用配置值；只配置一个方向时反向取相同值，两个方向都配置时允许不对称（如单向通道）。路径从仓库入口（第一条巷道前端）出发，不要求返回。
+
+    sequence 按停靠点数量选择算法：
+        不超过 exact_max_stops：Held-Karp 动态规划求精确最短路径
+        不超过 two_opt_max_stops：S 形路径为初始解，2-opt 迭代改进
+        其余：S 形路径（按巷道蛇形穿行）
+    """
+
+    def __init__(self, codes, distance_overrides: dict = None, exact_max_stops: int = 8, two_opt_max_stops: int = 60):
+        self.exact_max_stops = exact_max_stops
+        self.two_opt_max_stops = two_opt_max_stops
+        self.overrides = {}
+        for from_code, targets in (distance_overrides or {}).items():
+            for to_code, distance in targets.items():
+                self.overrides[(from_code, to_code)] = float(distance)
+                self.overrides.setdefault((to_code, from_code), float(distance))
+
+        parsed = {code: parse_location_code(code) for code in set(codes)}
+        # 字母巷道与数字巷道分开排序，避免比较不同类型
+        aisles = sorted({aisle for aisle, _, _ in parsed.values()}, key=lambda aisle: (isinstance(aisle, str), aisle))
+        rank = {aisle: index for index, aisle in enumerate(aisles)}
+        self.points = {code: (rank[aisle], bay, level) for code, (aisle, bay, level) in parsed.items()}
+        self.depth = max((bay for _, bay, _ in self.points.values()), default=0) + 1
+
+    def distance(self, from_code, to_code) -> float:
+        """两个库位之间的行走距离；from_code 为 None 表示仓库入口"""
+        if from_code is not None and (from_code, to_code) in self.overrides:
+            return self.overrides[(from_code, to_code)]
+        aisle_a, bay_a, level_a = self.points[from_code] if from_code is not None else (0, 0, 0)
+        aisle_b, bay_b, level_b = self.points[to_code]
+        if aisle_a == aisle_b:
+            return abs(bay_a - bay_b) + abs(level_a - level_b) * LEVEL_COST
+        return (
+            abs(aisle_a - aisle_b) * AISLE_PITCH
+            + min(bay_a + bay_b, 2 * self.depth - bay_a - bay_b)
+            + abs(level_a - level_b) * LEVEL_COST
+        )
+
+    def route_length(self, route: list) -> float:
+        """从入口出发依次经过 route 的总距离"""
+        total, previous = 0.0, None
+        for code in route:
+            total += self.distance(previous, code)
+            previous = code
+        return total
+
+    def s_shape(self, stops) -> list:
+        """S 形路径：巷道按序号依次进入，奇偶巷道交替正向 / 反向穿行，同列按层由低到高"""
+        route = []
+        ordered = sorted(stops, key=lambda code: self.points[code])
+        for turn, (_, codes) in enumerate(groupby(ordered, key=lambda code: self.points[code][0])):
+            codes = list(codes)
+            if turn % 2:
+                codes.sort(key=lambda code: (-self.points[code][1], self.points[code][2]))
+            route.extend(codes)
+        return route
+
+    def exact(self, stops) -> list:
+        """Held-Karp 动态规划：O(n^2 * 2^n)，只用于少量停靠点"""
+        stops = list(stops)
+        n = len(stops)
+        if n <= 1:
+            return stops
+        dist = [[self.distance(a, b) for b in stops] for a in stops]
+        # best[(mask, last)] = (距离, 上一个停靠点)
+        best = {(1 << i, i): (self.distance(None, stops[i]), None) for i in range(n)}
+        for mask in range(1, 1 << n):
+            for last in range(n):
+                state = best.get((mask, last))
+                if state is None:
+                    continue
+                for nxt in range(n):
+                    if mask & (1 << nxt):
+                        continue
+                    key = (mask | (1 << nxt), nxt)
+                    cost = state[0] + dist[last][nxt]
+                    if key not in best or cost < best[key][0]:
+                        best[key] = (cost, last)
+        full = (1 << n) - 1
+        last = min(range(n), key=lambda i: best[(full, i)][0])
+        route, mask = [], full
+        while last is not None:
+            route.append(stops[last])
+            previous = best[(mask, last)][1]
+            mask ^= 1 << last
+            last = previous
+        return route[::-1]
+
+    def two_opt(self, route: list) -> list:
+        """
+        2-opt 改进：反转任意一段能缩短总距离时就反转，直到没有改进（入口固定为起点，终点开放）
+
+        比较时计入被反转段内的行走距离，距离配置不对称时同样按实际总距离判断。
+        """
+        route = list(route)
+        n = len(route)
+        if n < 3:
+            return route
+        nodes = [None] + route
+        dist = {}
+        for a in nodes:
+            for b in route:
+                dist[(a, b)] = self.distance(a, b)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1, n):
+                # nodes[i..j] 段内正向 / 反向行走的距离，随 j 递增累加
+                forward = backward = 0.0
+                for j in range(i + 1, n + 1):
+                    forward += dist[(nodes[j - 1], nodes[j])]
+                    backward += dist[(nodes[j], nodes[j - 1])]
+                    # 反转 nodes[i..j]：边 (i-1, i) 与 (j, j+1) 被替换为 (i-1, j) 与 (i, j+1)，
+                    # 段内改为反向行走（距离配置可能不对称，不能假定段内距离不变）
+                    before = dist[(nodes[i - 1], nodes[i])] + forward
+                    after = dist[(nodes[i - 1], nodes[j])] + backward
+                    if j < n:
+                        before += dist[(nodes[j], nodes[j + 1])]
+                        after += dist[(nodes[i], nodes[j + 1])]
+                    if after < before - 1e-9:
+                        nodes[i:j + 1] = reversed(nodes[i:j + 1])
+                        forward, backward = backward, forward
+                        improved = True
+        return nodes[1:]
+
+    def sequence(self, stops) -> tuple:
+        """
+        规划停靠顺序
+        :param stops: 库位代码（重复的会合并）
+        :return: (route, method)，method 为 exact / 2-opt / s-shape
+        """
+        stops = list(dict.fromkeys(stops))
+        if len(stops) <= self.exact_max_stops:
+            return self.exact(stops), 'exact'
+        route = self.s_shape(stops)
+        if len(stops) <= self.two_opt_max_stops:
+            return self.two_opt(route), '2-opt'
+        return route, 's-shape'
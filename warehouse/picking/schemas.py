@@ -7,6 +7,7 @@ from warehouse.goods.schemas import goods_simple_model as goods_model
 from warehouse.location.schemas import location_simple_model as location_model
 from system.common import pagination_parser, create_pagination_model
 from .models import PickingTask
+from .allocation import ALLOCATION_STRATEGIES
 
 api_ns = Namespace(
     'picking',
@@ -79,6 +80,8 @@ picking_task_base_model = api_ns.model('PickingTaskBase', {
     ),
     'is_active': fields.Boolean(description='Is active'),
     'created_by': fields.Integer(description='Creator ID'),
+    'wave_id': fields.Integer(readOnly=True, description='Picking wave ID'),
+    'wall_slot': fields.Integer(readOnly=True, description='Put-to-wall slot within the wave'),
     'created_at': fields.DateTime(readOnly=True, description='Creation time'),
     'updated_at': fields.DateTime(readOnly=True, description='Last update time'),
     'started_at': fields.DateTime(description='Task start time'),
@@ -148,6 +151,7 @@ picking_batch_input_model = api_ns.model('PickingBatchInput', picking_batch_inpu
 # ---------------------------------------------------------------------------------
 picking_pagination_parser = pagination_parser.copy()
 picking_pagination_parser.add_argument('dn_id',type=int,help='Filter by delivery notice ID',location='args')
+picking_pagination_parser.add_argument('wave_id',type=int,help='Filter by picking wave ID',location='args')
 picking_pagination_parser.add_argument('status',type=str,choices=PickingTask.PICKING_TASK_STATUSES,help='Filter by status',location='args')
 picking_pagination_parser.add_argument('is_active',type=inputs.boolean,help='Is the task active?',location='args')
 picking_pagination_parser.add_argument('warehouse_id', type=int, help='Filter by Warehouse ID')
@@ -158,3 +162,114 @@ pagination_model = create_pagination_model(api_ns, picking_task_base_model)
 picking_monthly_stats_parser =  reqparse.RequestParser()
 picking_monthly_stats_parser.add_argument('months', type=int, help='Number of months to look back', default=6)
 picking_monthly_stats_parser.add_argument('warehouse_id', type=int, help='Filter by Warehouse ID')
+
+# ---------------------------------------------------------------------------------
+# 拣货库位分配（FEFO / FIFO）
+# ---------------------------------------------------------------------------------
+picking_allocation_parser = reqparse.RequestParser()
+picking_allocation_parser.add_argument('strategy', type=str, choices=ALLOCATION_STRATEGIES, default='fefo', help='Allocation strategy', location='args')
+
+picking_allocation_line_model = api_ns.model('PickingAllocationLine', {
+    'goods_id': fields.Integer(description='Goods ID'),
+    'location_id': fields.Integer(description='Location ID'),
+    'location_code': fields.String(description='Location code'),
+    'quantity': fields.Integer(description='Quantity to pick from the location'),
+})
+
+picking_allocation_shortage_model = api_ns.model('PickingAllocationShortage', {
+    'goods_id': fields.Integer(description='Goods ID'),
+    'quantity': fields.Integer(description='Quantity that could not be allocated'),
+})
+
+picking_allocation_model = api_ns.model('PickingAllocation', {
+    'dn_id': fields.Integer(description='DN ID'),
+    'warehouse_id': fields.Integer(description='Warehouse ID'),
+    'strategy': fields.String(description='Allocation strategy', enum=ALLOCATION_STRATEGIES),
+    'lines': fields.List(fields.Nested(picking_allocation_line_model), description='Per-location pick lines'),
+    'shortages': fields.List(fields.Nested(picking_allocation_shortage_model), description='Unallocated quantities'),
+})
+
+# ---------------------------------------------------------------------------------
+# 拣货波次
+# ---------------------------------------------------------------------------------
+picking_wave_input_model = api_ns.model('PickingWaveInput', {
+    'warehouse_id': fields.Integer(required=True, description='Warehouse ID'),
+    'carrier_id': fields.Integer(description='Only DNs of this carrier'),
+    'cutoff_date': fields.String(description='Only DNs expected to ship on or before this date (YYYY-MM-DD)'),
+    'zone': fields.String(description='Zone (location code prefix) to pick from'),
+    'max_orders': fields.Integer(description='Maximum DNs per wave', default=20),
+    'strategy': fields.String(description='Allocation strategy', enum=ALLOCATION_STRATEGIES, default='fefo'),
+})
+
+picking_wave_slot_model = api_ns.model('PickingWaveSlot', {
+    'wall_slot': fields.Integer(description='Put-to-wall slot'),
+    'dn_id': fields.Integer(description='DN ID'),
+    'quantity': fields.Integer(description='Quantity to put into the slot'),
+})
+
+picking_wave_pick_model = api_ns.model('PickingWavePick', {
+    'location_id': fields.Integer(description='Location ID'),
+    'location_code': fields.String(description='Location code'),
+    'goods_id': fields.Integer(description='Goods ID'),
+    'quantity': fields.Integer(description='Total quantity to pick'),
+    'slots': fields.List(fields.Nested(picking_wave_slot_model), description='Put-to-wall breakdown'),
+})
+
+picking_wave_task_model = api_ns.model('PickingWaveTask', {
+    'id': fields.Integer(description='Picking task ID'),
+    'dn_id': fields.Integer(description='DN ID'),
+    'wall_slot': fields.Integer(description='Put-to-wall slot'),
+    'status': fields.String(enum=PickingTask.PICKING_TASK_STATUSES, description='Task status'),
+})
+
+picking_wave_model = api_ns.model('PickingWave', {
+    'id': fields.Integer(readOnly=True, description='Picking wave ID'),
+    'warehouse_id': fields.Integer(description='Warehouse ID'),
+    'carrier_id': fields.Integer(description='Carrier ID'),
+    'cutoff_date': fields.Date(description='Cut-off date'),
+    'zone': fields.String(description='Zone (location code prefix)'),
+    'strategy': fields.String(description='Allocation strategy'),
+    'created_by': fields.Integer(description='Creator ID'),
+    'created_at': fields.DateTime(readOnly=True, description='Creation time'),
+    'tasks': fields.List(fields.Nested(picking_wave_task_model), description='Per-DN picking tasks'),
+    'pick_list': fields.List(fields.Nested(picking_wave_pick_model), readOnly=True, description='Consolidated pick list ordered by location code'),
+})
+
+picking_wave_unplanned_model = api_ns.model('PickingWaveUnplanned', {
+    'dn_id': fields.Integer(description='DN ID'),
+    'shortages': fields.List(fields.Nested(picking_allocation_shortage_model), description='Unallocatable goods'),
+    'error_code': fields.Integer(description='Error code when the DN could not be started (e.g. 16037)'),
+    'error_message': fields.String(description='Error message when the DN could not be started'),
+})
+
+picking_wave_plan_model = api_ns.model('PickingWavePlan', {
+    'waves': fields.List(fields.Nested(picking_wave_model), description='Created waves'),
+    'unplanned': fields.List(fields.Nested(picking_wave_unplanned_model), description='DNs left out for lack of stock or failed to start'),
+})
+
+# ---------------------------------------------------------------------------------
+# 拣货路径
+# ---------------------------------------------------------------------------------
+picking_sequence_line_model = api_ns.model('PickingSequenceLine', {
+    'sequence': fields.Integer(description='Walk order, starting at 1'),
+    'goods_id': fields.Integer(description='Goods ID'),
+    'location_id': fields.Integer(description='Location ID'),
+    'location_code': fields.String(description='Location code'),
+    'quantity': fields.Integer(description='Quantity to pick'),
+    'aisle': fields.String(description='Aisle parsed from the location code'),
+    'bay': fields.Integer(description='Bay parsed from the location code'),
+    'level': fields.Integer(description='Level parsed from the location code'),
+    'slots': fields.List(fields.Nested(picking_wave_slot_model), skip_none=True, description='Put-to-wall breakdown (waves only)'),
+})
+
+picking_sequence_model = api_ns.model('PickingSequence', {
+    'task_id': fields.Integer(description='Picking task ID'),
+    'wave_id': fields.Integer(description='Picking wave ID'),
+    'method': fields.String(description='Routing method', enum=('exact', '2-opt', 's-shape')),
+    'total_distance': fields.Float(description='Walking distance of the route'),
+    'lines': fields.List(fields.Nested(picking_sequence_line_model), description='Lines in walk order'),
+})
+
+picking_distance_matrix_model = api_ns.model('PickingDistanceMatrix', {
+    'distances': fields.Raw(description='Location-code distance overrides: {from_code: {to_code: distance}}'),
+})
@@ -1,3 +1,4 @@
+import json
 from extensions.db import *
 from extensions.error import BadRequestException, NotFoundException
 from warehouse.dn.models import DN
@@ -6,11 +7,16 @@ from warehouse.inventory.services import InventoryService
 from warehouse.goods.models import GoodsLocation
 from warehouse.location.models import Location
 from warehouse.removal.services import RemovalService
-from .models import PickingTask, PickingTaskDetail, PickingTaskStatusLog,PickingBatch
-from extensions.transaction import transactional
+from .models import PickingTask, PickingTaskDetail, PickingTaskStatusLog,PickingBatch, PickingWave, PickingWaveLine
+from .allocation import ALLOCATION_STRATEGIES, BinIndex, committed_pick_quantities, open_pick_commitments
+from .waves import cluster_by_location_overlap
+from .path import PathPlanner, parse_location_code
+from extensions.transaction import savepoint, transactional
+from flask import current_app
+from system.settings.services import SettingsService
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import and_, func, case, extract
-from sqlalchemy.orm import lazyload
+from sqlalchemy import and_, func, case, extract, insert, select, tuple_
+from sqlalchemy.orm import lazyload, selectinload
 from datetime import datetime, timedelta
 
 from datetime import datetime
@@ -37,6 +43,8 @@ class PickingTaskService:
 
         if filters.get('dn_id'):
             query = query.filter(PickingTask.dn_id == filters['dn_id'])
+        if filters.get('wave_id'):
+            query = query.filter(PickingTask.wave_id == filters['wave_id'])
         if filters.get('status'):
             query = query.filter(PickingTask.status == filters['status'])
         
@@ -256,7 +264,13 @@ class PickingTaskService:
 
     @staticmethod
     def _assert_location_stock(task: PickingTask, details_data: list):
-        """Validate that every picked unit exists in the selected warehouse bin."""
+        """
+        Validate that every picked unit exists in the selected warehouse bin.
+
+        整批只发两条查询：按 (goods_id, location_id) 元组集合锁定并读取库位库存，
+        再按同一元组集合汇总未完成拣货任务的占用量（其他任务的波次分配量、进行中任务的已拣量，
+        与波次分配共用 committed_pick_quantities），之后在内存中逐项校验。
+        """
         requested = {}
         for item in details_data:
             goods_id = item.get('goods_id')
@@ -270,42 +284,44 @@ class PickingTaskService:
                 )
             key = (goods_id, location_id)
             requested[key] = requested.get(key, 0) + quantity
-
-        for (goods_id, location_id), quantity in requested.items():
-            # lazyload('*') 抑制模型上 lazy='joined' 的级联 eager join：
-            # 带 LEFT OUTER JOIN 的 SELECT ... FOR UPDATE 在 PostgreSQL 上直接报
-            # FeatureNotSupported（FOR UPDATE cannot be applied to the nullable
-            # side of an outer join）。of=GoodsLocation 使锁只落在库存行上，
-            # 不连带锁 join 进来的 locations 行。
-            stock = (
-                GoodsLocation.query
-                .options(lazyload('*'))
+        if not requested:
+            return
+
+        keys = list(requested)
+        # 只查询列并带 of=GoodsLocation：不会带出模型上 lazy='joined' 的 LEFT OUTER JOIN
+        #（带外连接的 SELECT ... FOR UPDATE 在 PostgreSQL 上报 FeatureNotSupported），
+        # 锁只落在库存行上，不连带锁 locations 行；按主键顺序加锁，避免并发批次互相死锁。
+        stock = {
+            (goods_id, location_id): quantity
+            for goods_id, location_id, quantity in (
+                db.session.query(GoodsLocation.goods_id, GoodsLocation.location_id, GoodsLocation.quantity)
                 .join(Location, GoodsLocation.location_id == Location.id)
                 .filter(
-                    GoodsLocation.goods_id == goods_id,
-                    GoodsLocation.location_id == location_id,
+                    tuple_(GoodsLocation.goods_id, GoodsLocation.location_id).in_(keys),
                     Location.warehouse_id == task.dn.warehouse_id,
                 )
+                .order_by(GoodsLocation.goods_id, GoodsLocation.location_id)
                 .with_for_update(of=GoodsLocation)
-                .first()
             )
-            if stock is None:
+        }
+        # 与分配共用同一套占用口径（见 committed_pick_quantities）：其他任务的波次分配量也不可拣
+        committed = committed_pick_quantities(own_task_id=task.id)
+        already_reserved = {
+            (goods_id, location_id): quantity
+            for goods_id, location_id, quantity in db.session.execute(
+                select(committed.c.goods_id, committed.c.location_id, committed.c.quantity)
+                .where(tuple_(committed.c.goods_id, committed.c.location_id).in_(keys))
+            )
+        }
+
+        for (goods_id, location_id), quantity in requested.items():
+            if (goods_id, location_id) not in stock:
                 raise BadRequestException(
                     f"Goods {goods_id} has no stock in location {location_id}.", 16035
                 )
-
-            already_reserved = (
-                db.session.query(func.coalesce(func.sum(PickingTaskDetail.picked_quantity), 0))
-                .join(PickingTask)
-                .filter(
-                    PickingTaskDetail.goods_id == goods_id,
-                    PickingTaskDetail.location_id == location_id,
-                    PickingTask.status == 'in_progress',
-                    PickingTask.is_active.is_(True),
-                )
-                .scalar()
+            available = max(
+                (stock[(goods_id, location_id)] or 0) - (already_reserved.get((goods_id, location_id)) or 0), 0
             )
-            available = max((stock.quantity or 0) - (already_reserved or 0), 0)
             if quantity > available:
                 raise BadRequestException(
                     f"Insufficient stock in location {location_id} for goods {goods_id}: "
@@ -368,18 +384,21 @@ class PickingTaskService:
         PickingTaskService._assert_within_planned(task, incoming_by_goods)
         PickingTaskService._assert_location_stock(task, details_data)
 
-        for item in details_data:
-            detail_obj = PickingTaskDetail(
-                picking_task_id=task.id,
-                batch_id=new_batch.id,
-                location_id=item['location_id'],
-                goods_id=item['goods_id'],
-                picked_quantity=item.get('picked_quantity', 0),
-                operator_id=operator_id
-            )
-            db.session.add(detail_obj)
-
-        
+        # 明细以一条多行 INSERT 写入；已加载的明细集合随后过期，下次访问时重新读取
+        if details_data:
+            db.session.execute(insert(PickingTaskDetail), [
+                {
+                    'picking_task_id': task.id,
+                    'batch_id': new_batch.id,
+                    'location_id': item['location_id'],
+                    'goods_id': item['goods_id'],
+                    'picked_quantity': item.get('picked_quantity', 0),
+                    'operator_id': operator_id,
+                }
+                for item in details_data
+            ])
+            db.session.expire(task, ['task_details'])
+            db.session.expire(new_batch, ['details'])
 
         # db.session.commit()
         return new_batch
@@ -536,6 +555,85 @@ class PickingTaskService:
         # db.session.commit()
         return picking_task
 
+    @staticmethod
+    def allocate_dns(dns: list, strategy: str = 'fefo', zone: str = None, indexes: dict = None) -> list:
+        """
+        为多张 DN 分配拣货库位（服务端决定从哪些库位拣货）
+
+        每个仓库一次查询构建 BinIndex，之后按 dns 顺序逐行在内存中分配，
+        同一批次中前面的 DN 已分配的库存不会再分配给后面的 DN。
+        待分配量 = DN 明细计划量 - 已拣量 - 未完成拣货任务占用量（波次分配量 / 进行中已拣量）。
+        :param dns: DN 对象列表
+        :param strategy: fefo 或 fifo，见 BinIndex
+        :param zone: 库区（库位代码前缀），只从该库区的库位分配
+        :param indexes: 可选，{warehouse_id: BinIndex}，传入时复用（并扣减）已有索引
+        :return: list，与 dns 顺序一致，每项为
+                 {'dn_id', 'warehouse_id', 'strategy', 'lines': [...], 'shortages': [...]}
+        """
+        if strategy not in ALLOCATION_STRATEGIES:
+            raise BadRequestException(f"Invalid allocation strategy: {strategy}", 16047)
+        if not dns:
+            return []
+
+        commitments = open_pick_commitments()
+        in_progress = {
+            (row.dn_id, row.goods_id): row.quantity
+            for row in db.session.query(
+                commitments.c.dn_id,
+                commitments.c.goods_id,
+                func.sum(commitments.c.quantity).label('quantity'),
+            ).filter(
+                commitments.c.dn_id.in_([dn.id for dn in dns])
+            ).group_by(commitments.c.dn_id, commitments.c.goods_id)
+        }
+
+        indexes = indexes if indexes is not None else {}
+        goods_by_warehouse = {}
+        for dn in dns:
+            goods_by_warehouse.setdefault(dn.warehouse_id, set()).update(
+                detail.goods_id for detail in dn.details
+            )
+        for warehouse_id, goods_ids in goods_by_warehouse.items():
+            if warehouse_id not in indexes:
+                indexes[warehouse_id] = BinIndex(warehouse_id, goods_ids, strategy, zone)
+
+        results = []
+        for dn in dns:
+            index = indexes[dn.warehouse_id]
+            remaining = {}
+            for detail in dn.details:
+                remaining[detail.goods_id] = remaining.get(detail.goods_id, 0) + (
+                    (detail.quantity or 0) - (detail.picked_quantity or 0)
+                )
+            lines, shortages = [], []
+            for goods_id, quantity in remaining.items():
+                quantity -= in_progress.get((dn.id, goods_id)) or 0
+                if quantity <= 0:
+                    continue
+                allocated, shortage = index.allocate(goods_id, quantity)
+                lines.extend(
+                    {'goods_id': goods_id, 'location_id': location_id, 'location_code': code, 'quantity': take}
+                    for location_id, code, take in allocated
+                )
+                if shortage:
+                    shortages.append({'goods_id': goods_id, 'quantity': shortage})
+            results.append({
+                'dn_id': dn.id,
+                'warehouse_id': dn.warehouse_id,
+                'strategy': strategy,
+                'lines': lines,
+                'shortages': shortages,
+            })
+        return results
+
+    @staticmethod
+    def allocate_dn(dn_or_id: int | DN, strategy: str = 'fefo') -> dict:
+        """
+        为单张 DN 分配拣货库位，见 allocate_dns
+        """
+        dn = DNService.get_dn(dn_or_id) if isinstance(dn_or_id, int) else dn_or_id
+        return PickingTaskService.allocate_dns([dn], strategy)[0]
+
     @staticmethod
     def get_picking_monthly_stats(months=6, filters=None):
         """获取最近N个月各状态Picking统计（支持仓库过滤）
@@ -669,3 +767,257 @@ class PickingTaskService:
             "previous_month": getattr(raw_data.get(status), 'previous_month', 0),
             "last_year": getattr(raw_data.get(status), 'last_year', 0)
         } for status in PickingTask.PICKING_TASK_STATUSES]
+
+
+class PickingWaveService:
+
+    @staticmethod
+    def get_wave(wave_id: int) -> PickingWave:
+        """
+        根据 wave_id 获取单个 PickingWave，不存在时抛出 404
+        """
+        return get_object_or_404(PickingWave, wave_id)
+
+    @staticmethod
+    def select_candidates(filters: dict) -> list:
+        """
+        选取可进入波次的 DN：pending、有效、指定仓库，可按承运商与截单日期过滤，
+        按 expected_shipping_date、id 排序（截单早的优先成波）
+        """
+        query = DN.query.options(lazyload('*'), selectinload(DN.details)).filter(
+            DN.warehouse_id == filters['warehouse_id'],
+            DN.status == 'pending',
+            DN.is_active.is_(True),
+        )
+        if filters.get('carrier_id'):
+            query = query.filter(DN.carrier_id == filters['carrier_id'])
+        if filters.get('cutoff_date'):
+            query = query.filter(DN.expected_shipping_date <= filters['cutoff_date'])
+        return query.order_by(DN.expected_shipping_date, DN.id).all()
+
+    @staticmethod
+    @transactional
+    def plan_waves(data: dict, created_by_id: int) -> dict:
+        """
+        把待处理的 DN 按库位重叠度聚类成多订单拣货波次
+
+        :param data: dict，warehouse_id（必填）、carrier_id、cutoff_date、zone（库位代码前缀）、
+                     max_orders（每波最多订单数，默认 20）、strategy（fefo/fifo）
+        :return: {'waves': [PickingWave], 'unplanned': [{'dn_id', 'shortages'}]}
+
+        1. 一次查询取候选 DN，一次查询构建仓库（库区）的 BinIndex，得到每个商品的库位集合；
+        2. 每张 DN 的库位集合 = 其商品库位集合的并集，cluster_by_location_overlap 在内存中聚类；
+        3. 逐个波次在同一个 BinIndex 上分配库位，库存不足的 DN 归还已分配数量并移出波次；
+        4. 波次内每张 DN 照常 progress_dn（生成各自的拣货任务，分拣/打包仍按 DN 进行），
+           拣货任务记录所属波次和播种墙格口，分配结果写入 PickingWaveLine；
+           progress_dn 失败（如实物库存不足 16037）的 DN 只回滚自身并归还分配量，带错误码进入 unplanned。
+        """
+        if not data.get('warehouse_id'):
+            raise BadRequestException("warehouse_id is required", 16038)
+        strategy = data.get('strategy') or 'fefo'
+        if strategy not in ALLOCATION_STRATEGIES:
+            raise BadRequestException(f"Invalid allocation strategy: {strategy}", 16047)
+        max_orders = data.get('max_orders') or 20
+        if max_orders < 1:
+            raise BadRequestException("max_orders must be at least 1", 16039)
+        cutoff_date = data.get('cutoff_date')
+        if isinstance(cutoff_date, str):
+            try:
+                cutoff_date = datetime.strptime(cutoff_date, '%Y-%m-%d').date()
+            except ValueError:
+                raise BadRequestException(f"Invalid cutoff_date: {cutoff_date}", 16048)
+        warehouse_id = data['warehouse_id']
+        zone = data.get('zone') or None
+
+        dns = PickingWaveService.select_candidates({
+            'warehouse_id': warehouse_id,
+            'carrier_id': data.get('carrier_id'),
+            'cutoff_date': cutoff_date,
+        })
+        index = BinIndex(
+            warehouse_id, {detail.goods_id for dn in dns for detail in dn.details}, strategy, zone
+        )
+
+        unplanned = []
+        location_sets = {}
+        dns_by_id = {}
+        goods_locations = {}
+        for dn in dns:
+            goods_ids = {detail.goods_id for detail in dn.details}
+            for goods_id in goods_ids - goods_locations.keys():
+                goods_locations[goods_id] = frozenset(index.locations(goods_id))
+            missing = [goods_id for goods_id in sorted(goods_ids) if not goods_locations[goods_id]]
+            if not goods_ids or missing:
+                unplanned.append({'dn_id': dn.id, 'shortages': [{'goods_id': goods_id} for goods_id in missing]})
+                continue
+            dns_by_id[dn.id] = dn
+            location_sets[dn.id] = frozenset().union(*(goods_locations[goods_id] for goods_id in goods_ids))
+
+        waves = []
+        for cluster in cluster_by_location_overlap(location_sets, max_orders):
+            cluster_dns = [dns_by_id[dn_id] for dn_id in cluster]
+            allocations = []
+            for dn, result in zip(cluster_dns, PickingTaskService.allocate_dns(
+                cluster_dns, strategy, indexes={warehouse_id: index}
+            )):
+                if result['shortages']:
+                    for line in result['lines']:
+                        index.release(line['goods_id'], [(line['location_id'], line['location_code'], line['quantity'])])
+                    unplanned.append({'dn_id': dn.id, 'shortages': result['shortages']})
+                else:
+                    allocations.append((dn, result['lines']))
+            if allocations:
+                wave, failed = PickingWaveService._create_wave(
+                    allocations, index, warehouse_id, data.get('carrier_id'), cutoff_date, zone, strategy, created_by_id
+                )
+                unplanned.extend(failed)
+                if wave is not None:
+                    waves.append(wave)
+
+        return {'waves': waves, 'unplanned': unplanned}
+
+    @staticmethod
+    def _create_wave(allocations: list, index: BinIndex, warehouse_id: int, carrier_id, cutoff_date, zone, strategy,
+                     created_by_id) -> tuple:
+        """
+        创建波次：各 DN 依次 progress_dn，生成的拣货任务挂到波次并分配格口，分配明细批量写入
+        :param allocations: [(DN, lines)]，lines 为 allocate_dns 返回的库位分配
+        :return: (wave, failed)，每张 DN 在各自的 SAVEPOINT 中 progress_dn，失败的 DN 回滚自身（含其待重算标记）、
+                 在 index 中归还分配量并放入 failed（[{'dn_id', 'shortages', 'error_code', 'error_message'}]）；
+                 没有 DN 成功时不创建波次，wave 为 None
+        """
+        wave = PickingWave(
+            warehouse_id=warehouse_id,
+            carrier_id=carrier_id,
+            cutoff_date=cutoff_date,
+            zone=zone,
+            strategy=strategy,
+            created_by=created_by_id,
+        )
+        db.session.add(wave)
+        db.session.flush()
+
+        rows = []
+        failed = []
+        wall_slot = 0
+        for dn, lines in allocations:
+            try:
+                with savepoint():
+                    DNService.progress_dn(dn)
+            except BadRequestException as e:
+                db.session.expire(dn)
+                for line in lines:
+                    index.release(line['goods_id'], [(line['location_id'], line['location_code'], line['quantity'])])
+                failed.append({'dn_id': dn.id, 'shortages': [], 'error_code': e.biz_code, 'error_message': e.message})
+                continue
+            wall_slot += 1
+            task = PickingTask.query.options(lazyload('*')).filter_by(
+                dn_id=dn.id, status='pending'
+            ).order_by(PickingTask.id.desc()).first()
+            task.wave_id = wave.id
+            task.wall_slot = wall_slot
+            rows.extend(
+                {
+                    'wave_id': wave.id,
+                    'picking_task_id': task.id,
+                    'dn_id': dn.id,
+                    'wall_slot': wall_slot,
+                    'goods_id': line['goods_id'],
+                    'location_id': line['location_id'],
+                    'quantity': line['quantity'],
+                }
+                for line in lines
+            )
+        if not rows:
+            db.session.delete(wave)
+            db.session.flush()
+            return None, failed
+        db.session.flush()
+        db.session.execute(insert(PickingWaveLine), rows)
+        return wave, failed
+
+
+class PickPathService:
+
+    @staticmethod
+    def _setting_key(warehouse_id: int) -> str:
+        return f'pick_path_distances:{warehouse_id}'
+
+    @staticmethod
+    def get_distance_matrix(warehouse_id: int) -> dict:
+        """
+        获取仓库配置的库位距离矩阵 {from_code: {to_code: 距离}}，未配置时返回空 dict
+        """
+        value = SettingsService.get(PickPathService._setting_key(warehouse_id), '')
+        return json.loads(value) if value else {}
+
+    @staticmethod
+    def save_distance_matrix(warehouse_id: int, matrix: dict) -> dict:
+        """
+        保存仓库的库位距离矩阵（覆盖原配置，传空 dict 表示清除）
+        """
+        if not isinstance(matrix, dict):
+            raise BadRequestException("Distance matrix must be an object", 16040)
+        for from_code, targets in matrix.items():
+            if not isinstance(targets, dict):
+                raise BadRequestException(f"Distances from {from_code} must be an object", 16040)
+            for to_code, distance in targets.items():
+                if not isinstance(distance, (int, float)) or distance < 0:
+                    raise BadRequestException(f"Invalid distance from {from_code} to {to_code}", 16040)
+        SettingsService.set(PickPathService._setting_key(warehouse_id), json.dumps(matrix) if matrix else '')
+        return matrix
+
+    @staticmethod
+    def sequence_lines(warehouse_id: int, lines: list) -> dict:
+        """
+        按拣货路径排列拣货行
+        :param lines: list[dict]，每项至少包含 location_code
+        :return: {'method', 'total_distance', 'lines'}，lines 按行走顺序排列并带 sequence（从 1 开始）、
+                 aisle / bay / level（同一库位的多行相邻，保持原有相对顺序）
+        """
+        planner = PathPlanner(
+            [line['location_code'] for line in lines],
+            PickPathService.get_distance_matrix(warehouse_id),
+            exact_max_stops=current_app.config['PICK_PATH_EXACT_MAX_STOPS'],
+            two_opt_max_stops=current_app.config['PICK_PATH_TWO_OPT_MAX_STOPS'],
+        )
+        route, method = planner.sequence(line['location_code'] for line in lines)
+        position = {code: index for index, code in enumerate(route)}
+        ordered = sorted(lines, key=lambda line: position[line['location_code']])
+        sequenced = []
+        for index, line in enumerate(ordered, start=1):
+            aisle, bay, level = parse_location_code(line['location_code'])
+            sequenced.append({**line, 'sequence': index, 'aisle': str(aisle), 'bay': bay, 'level': level})
+        return {
+            'method': method,
+            'total_distance': round(planner.route_length(route), 2),
+            'lines': sequenced,
+        }
+
+    @staticmethod
+    def sequence_task(task_or_id: int | PickingTask) -> dict:
+        """
+        拣货任务的行走顺序：波次任务用波次分配明细，否则按 DN 剩余待拣量现场分配库位
+        """
+        task = PickingTaskService._get_instance(task_or_id)
+        if task.wave_id:
+            lines = [
+                {
+                    'goods_id': line.goods_id,
+                    'location_id': line.location_id,
+                    'location_code': line.location.code,
+                    'quantity': line.quantity,
+                }
+                for line in PickingWaveLine.query.filter_by(picking_task_id=task.id).order_by(PickingWaveLine.id)
+            ]
+        else:
+            lines = PickingTaskService.allocate_dn(task.dn)['lines']
+        return {'task_id': task.id, **PickPathService.sequence_lines(task.dn.warehouse_id, lines)}
+
+    @staticmethod
+    def sequence_wave(wave_or_id: int | PickingWave) -> dict:
+        """
+        波次合并拣货单的行走顺序（每行附格口播种数量）
+        """
+        wave = PickingWaveService.get_wave(wave_or_id) if isinstance(wave_or_id, int) else wave_or_id
+        return {'wave_id': wave.id, **PickPathService.sequence_lines(wave.warehouse_id, wave.pick_list)}
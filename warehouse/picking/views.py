@@ -14,10 +14,18 @@ from .schemas import (
     picking_task_detail_input_model,
     picking_batch_model,
     picking_batch_input_model,
-    picking_monthly_stats_parser
+    picking_monthly_stats_parser,
+    picking_allocation_parser,
+    picking_allocation_model,
+    picking_wave_input_model,
+    picking_wave_model,
+    picking_wave_plan_model,
+    picking_sequence_model,
+    picking_distance_matrix_model
 )
 
-from .services import PickingTaskService
+from warehouse.dn.services import DNService
+from .services import PickingTaskService, PickingWaveService, PickPathService
 
 @api_ns.doc(security="jsonWebToken")
 @api_ns.route('/')
@@ -38,6 +46,7 @@ class PickingTaskList(Resource):
         # 将筛选参数打包
         filters = {
             'dn_id': args.get('dn_id'),
+            'wave_id': args.get('wave_id'),
             'status': args.get('status'),
             'is_active': args.get('is_active'),
             'keyword': args.get('keyword')
@@ -270,6 +279,123 @@ class PickingBatchItem(Resource):
     
 
 
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/dn/<int:dn_id>/allocation')
+class PickingAllocationView(Resource):
+
+    @permission_required(["all_access","company_all_access","picking_read"])
+    @warehouse_required()
+    @api_ns.expect(picking_allocation_parser)
+    @api_ns.marshal_with(picking_allocation_model)
+    def get(self, dn_id):
+        """
+        Allocate pick locations for a DN (FEFO / FIFO over standard locations)
+        """
+        args = picking_allocation_parser.parse_args()
+        dn = DNService.get_dn(dn_id)
+        if not check_warehouse_access(dn.warehouse_id):
+            raise ForbiddenException("You do not have access to this DN", 12001)
+        return PickingTaskService.allocate_dn(dn, args.get('strategy') or 'fefo'), 200
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/waves/')
+class PickingWaveList(Resource):
+
+    @permission_required(["all_access","company_all_access","picking_edit"])
+    @warehouse_required()
+    @api_ns.expect(picking_wave_input_model)
+    @api_ns.marshal_with(picking_wave_plan_model)
+    def post(self):
+        """
+        Plan multi-order picking waves from pending DNs (by carrier, cut-off date and zone)
+        """
+        data = api_ns.payload
+        if not check_warehouse_access(data.get('warehouse_id')):
+            raise ForbiddenException("You do not have access to this warehouse", 12001)
+        return PickingWaveService.plan_waves(data, g.current_user.id), 201
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/waves/<int:wave_id>')
+class PickingWaveDetailView(Resource):
+
+    @permission_required(["all_access","company_all_access","picking_read"])
+    @warehouse_required()
+    @api_ns.marshal_with(picking_wave_model)
+    def get(self, wave_id):
+        """
+        Get a picking wave with its consolidated pick list
+        """
+        wave = PickingWaveService.get_wave(wave_id)
+        if not check_warehouse_access(wave.warehouse_id):
+            raise ForbiddenException("You do not have access to this picking wave", 12001)
+        return wave, 200
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/<int:task_id>/sequence')
+class PickingTaskSequenceView(Resource):
+
+    @permission_required(["all_access","company_all_access","picking_read"])
+    @warehouse_required()
+    @api_ns.marshal_with(picking_sequence_model, skip_none=True)
+    def get(self, task_id):
+        """
+        Get the pick lines of a Picking Task in walking order
+        """
+        task = PickingTaskService.get_task(task_id)
+        if not check_warehouse_access(task.dn.warehouse_id):
+            raise ForbiddenException("You do not have access to this Picking Task", 12001)
+        return PickPathService.sequence_task(task), 200
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/waves/<int:wave_id>/sequence')
+class PickingWaveSequenceView(Resource):
+
+    @permission_required(["all_access","company_all_access","picking_read"])
+    @warehouse_required()
+    @api_ns.marshal_with(picking_sequence_model, skip_none=True)
+    def get(self, wave_id):
+        """
+        Get the consolidated pick list of a picking wave in walking order
+        """
+        wave = PickingWaveService.get_wave(wave_id)
+        if not check_warehouse_access(wave.warehouse_id):
+            raise ForbiddenException("You do not have access to this picking wave", 12001)
+        return PickPathService.sequence_wave(wave), 200
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/warehouses/<int:warehouse_id>/distance-matrix')
+class PickingDistanceMatrixView(Resource):
+
+    @permission_required(["all_access","company_all_access","picking_read"])
+    @warehouse_required()
+    @api_ns.marshal_with(picking_distance_matrix_model)
+    def get(self, warehouse_id):
+        """
+        Get the location distance overrides used for pick-path sequencing
+        """
+        if not check_warehouse_access(warehouse_id):
+            raise ForbiddenException("You do not have access to this warehouse", 12001)
+        return {'distances': PickPathService.get_distance_matrix(warehouse_id)}, 200
+
+    @permission_required(["all_access","company_all_access","picking_edit"])
+    @warehouse_required()
+    @api_ns.expect(picking_distance_matrix_model)
+    @api_ns.marshal_with(picking_distance_matrix_model)
+    def put(self, warehouse_id):
+        """
+        Replace the location distance overrides of a warehouse
+        """
+        if not check_warehouse_access(warehouse_id):
+            raise ForbiddenException("You do not have access to this warehouse", 12001)
+        distances = (api_ns.payload or {}).get('distances') or {}
+        return {'distances': PickPathService.save_distance_matrix(warehouse_id, distances)}, 200
+
+
 @api_ns.doc(security="jsonWebToken")
 @api_ns.route('/monthly-stats')
 class PickingMonthlyStats(Resource):
@@ -0,0 +1,43 @@
+def cluster_by_location_overlap(location_sets: dict, max_orders: int) -> list:
+    """
+    按库位重叠度把订单贪心聚类成波次
+
+    :param location_sets: dict，{dn_id: frozenset(location_id)}，按优先级（截单日期等）排好序
+    :param max_orders: 每个波次最多包含的订单数
+    :return: list[list[dn_id]]，每个波次内按加入顺序排列
+
+    以优先级最高的未分配订单为种子，每次加入与波次已覆盖库位重叠最多（重叠相同时新增库位最少）的订单，
+    没有任何重叠的订单不会被拉进当前波次。重叠计数通过 库位 -> 订单 的倒排索引在加入订单时增量累加，
+    不做订单两两比较，数千张订单也只需线性扫描候选集。
+    """
+    by_location = {}
+    for dn_id, locations in location_sets.items():
+        for location_id in locations:
+            by_location.setdefault(location_id, []).append(dn_id)
+
+    unassigned = dict.fromkeys(location_sets)
+    waves = []
+    for seed in location_sets:
+        if seed not in unassigned:
+            continue
+        wave, covered, overlap = [], set(), {}
+        candidate = seed
+        while candidate is not None:
+            wave.append(candidate)
+            del unassigned[candidate]
+            overlap.pop(candidate, None)
+            for location_id in location_sets[candidate] - covered:
+                covered.add(location_id)
+                for dn_id in by_location[location_id]:
+                    if dn_id in unassigned:
+                        overlap[dn_id] = overlap.get(dn_id, 0) + 1
+            if len(wave) >= max_orders:
+                break
+
+            candidate, best = None, None
+            for dn_id, shared in overlap.items():
+                key = (shared, shared - len(location_sets[dn_id]))
+                if best is None or key > best:
+                    candidate, best = dn_id, key
+        waves.append(wave)
+    return waves
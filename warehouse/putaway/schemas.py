@@ -1,4 +1,4 @@
-from flask_restx import Namespace, fields, inputs
+from flask_restx import Namespace, fields, inputs, reqparse
 from extensions import authorizations
 from system.common import pagination_parser, create_pagination_model,generate_input_fields
 from system.user.schemas import user_simple_model as original_user_model
@@ -58,3 +58,30 @@ putaway_pagination_parser.add_argument('keyword', type=str, help='Search by keyw
 putaway_pagination_parser.add_argument('warehouse_id', type=int, help='Filter by Warehouse ID', location='args')
 
 putaway_pagination_model = create_pagination_model(api_ns, putaway_record_model)
+
+# -----------------------------
+# 上架库位推荐
+# -----------------------------
+putaway_suggestion_parser = reqparse.RequestParser()
+putaway_suggestion_parser.add_argument('goods_id', type=int, required=True, help='ID of the Goods to put away', location='args')
+putaway_suggestion_parser.add_argument('warehouse_id', type=int, required=True, help='Warehouse to put away into', location='args')
+putaway_suggestion_parser.add_argument('quantity', type=int, required=True, help='Quantity to put away', location='args')
+putaway_suggestion_parser.add_argument('limit', type=int, default=5, help='Maximum number of suggested locations', location='args')
+
+putaway_suggestion_line_model = api_ns.model('PutawaySuggestionLine', {
+    'location_id': fields.Integer(description='Suggested location ID'),
+    'location_code': fields.String(description='Suggested location code'),
+    'quantity': fields.Integer(description='Quantity to put away into this location'),
+    'free_volume': fields.Float(description='Free volume of the location before this putaway (cm³), null when capacity is unknown'),
+    'current_quantity': fields.Integer(description='Quantity of the same goods already in the location'),
+    'reason': fields.String(description='consolidate: same goods already stored; best_fit: tightest free volume', enum=('consolidate', 'best_fit')),
+})
+
+putaway_suggestion_model = api_ns.model('PutawaySuggestion', {
+    'goods_id': fields.Integer(description='Goods ID'),
+    'warehouse_id': fields.Integer(description='Warehouse ID'),
+    'quantity': fields.Integer(description='Requested quantity'),
+    'unit_volume': fields.Float(description='Volume of one unit (cm³)'),
+    'suggestions': fields.List(fields.Nested(putaway_suggestion_line_model), description='Suggested locations in order'),
+    'unassigned': fields.Integer(description='Quantity that does not fit into the suggested locations'),
+})
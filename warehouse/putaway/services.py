@@ -1,11 +1,15 @@
-from sqlalchemy import or_
+from sqlalchemy import or_, insert
+from sqlalchemy.orm import lazyload
 from extensions.db import *
+from extensions.error import BadRequestException, NotFoundException
 from extensions.transaction import transactional
+from warehouse.goods.capacity import get_capacity_store, goods_unit_volume
 from warehouse.goods.models import Goods, GoodsLocation
 from warehouse.goods.services import GoodsLocationService
 from warehouse.inventory.services import InventoryService
 from warehouse.location.models import Location
 from .models import PutawayRecord
+from .slotting import suggest_bins
 
 
 class PutawayService:
@@ -90,24 +94,12 @@ class PutawayService:
         db.session.add(new_record)
         db.session.flush()
 
-        goods_location_record = GoodsLocationService.get_goods_location_record(new_record.goods_id, new_record.location_id)
-        if goods_location_record is None:
-            # 创建新的库存信息
-            data = {
-                'goods_id': new_record.goods_id,
-                'location_id': new_record.location_id,
-                'quantity': new_record.quantity
-            }
-            goods_location_record = GoodsLocationService.create_goods_location(data)
-        else:
-            # 更新库存信息
-            goods_location_record.quantity += new_record.quantity
-        
-        db.session.add(goods_location_record)
-        db.session.flush()
+        # 一条 upsert 语句：不存在则创建商品库位记录，存在则原子累加
+        GoodsLocationService.add_quantity(new_record.goods_id, new_record.location_id, new_record.quantity)
 
         #更新库存信息
-        InventoryService.putaway_completed(new_record.goods_id, new_record.location.warehouse_id,new_record.quantity)
+        InventoryService.putaway_completed(new_record.goods_id, new_record.location.warehouse_id,new_record.quantity, new_record.location,
+                                           source=('putaway', new_record.id))
 
         # db.session.commit()
         return new_record
@@ -123,16 +115,99 @@ class PutawayService:
     @transactional
     def bulk_create_putaway_records(data_list: list, created_by_id: int) -> list:
         """
-        批量创建上架记录
+        批量创建上架记录（集合式处理，整批成功或整批失败）
         :param data_list: list，每个元素为 dict，包含 goods_id, location_id, quantity, remark 等字段
         :param created_by_id: 创建者的用户ID
-        :return: 创建成功的 PutawayRecord 实例列表
+        :return: 创建成功的 PutawayRecord 实例列表（与 data_list 顺序一致）
+
+        库位一次查询预取；商品库位数量按 (商品, 库位) 合并后由一条 upsert 语句累加；
+        上架记录以一条多行 INSERT 写入；库存按商品合并后通过 bulk_putaway_completed 一次变更。
         """
-        new_records = []
+        if not data_list:
+            return []
+
         for data in data_list:
-            new_record = PutawayService.create_putaway_record(data, created_by_id)
-            new_records.append(new_record)
-            db.session.flush()
-        
-        # 装饰器 transactional 会在函数退出后自动提交事务
-        return new_records
+            if data['quantity'] <= 0:
+                raise BadRequestException("Putaway quantity must be positive", 15025)
+
+        location_ids = {data['location_id'] for data in data_list}
+        locations = {
+            location.id: location
+            for location in Location.query.options(lazyload('*')).filter(Location.id.in_(location_ids))
+        }
+        missing = location_ids - locations.keys()
+        if missing:
+            raise NotFoundException(f"Location with id {min(missing)} not found", 13001)
+
+        # 同一商品库位的多行合并为一次数量变化
+        quantities = {}
+        for data in data_list:
+            key = (data['goods_id'], data['location_id'])
+            quantities[key] = quantities.get(key, 0) + data['quantity']
+
+        if not GoodsLocationService.apply_quantity_changes(quantities):
+            raise BadRequestException("Stock is not enough", 15001)
+
+        record_ids = db.session.scalars(
+            insert(PutawayRecord).returning(PutawayRecord.id, sort_by_parameter_order=True),
+            [
+                {
+                    'goods_id': data['goods_id'],
+                    'location_id': data['location_id'],
+                    'quantity': data['quantity'],
+                    'remark': data.get('remark', ''),
+                    'operator_id': created_by_id,
+                }
+                for data in data_list
+            ],
+        ).all()
+
+        # 更新库存信息：bulk_putaway_completed 按商品合并增量，全量重算在提交前每个商品只执行一次
+        InventoryService.bulk_putaway_completed(
+            [
+                (goods_id, locations[location_id].warehouse_id, quantity, locations[location_id])
+                for (goods_id, location_id), quantity in quantities.items()
+            ],
+            source=('putaway', None),
+        )
+
+        records = {
+            record.id: record
+            for record in PutawayRecord.query.filter(PutawayRecord.id.in_(record_ids))
+        }
+        return [records[record_id] for record_id in record_ids]
+
+    @staticmethod
+    def suggest_locations(goods_id: int, warehouse_id: int, quantity: int, limit: int = 5) -> dict:
+        """
+        推荐上架库位：先合并到已有同商品的库位，再按剩余体积最佳适配
+        :param limit: 最多推荐的库位数
+        :return: {goods_id, warehouse_id, quantity, unit_volume, suggestions, unassigned}
+
+        启用 PUTAWAY_CAPACITY_INDEX 时使用 Redis 中的剩余容量索引，否则直接查询数据库。
+        """
+        if quantity <= 0:
+            raise BadRequestException("Putaway quantity must be positive", 15025)
+        if limit <= 0:
+            raise BadRequestException("Suggestion limit must be positive", 15026)
+        goods = get_object_or_404(Goods, goods_id)
+
+        unit_volume = goods_unit_volume(goods.length, goods.width, goods.height)
+        suggestions, unassigned = suggest_bins(
+            get_capacity_store(warehouse_id), goods_id, quantity, unit_volume, limit
+        )
+        codes = dict(
+            db.session.query(Location.id, Location.code).filter(
+                Location.id.in_([suggestion['location_id'] for suggestion in suggestions])
+            ).all()
+        ) if suggestions else {}
+        for suggestion in suggestions:
+            suggestion['location_code'] = codes.get(suggestion['location_id'])
+        return {
+            'goods_id': goods_id,
+            'warehouse_id': warehouse_id,
+            'quantity': quantity,
+            'unit_volume': unit_volume,
+            'suggestions': suggestions,
+            'unassigned': unassigned,
+        }
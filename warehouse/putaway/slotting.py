@@ -0,0 +1,68 @@
+import math
+
+
+def suggest_bins(store, goods_id: int, quantity: int, unit_volume: float, limit: int) -> tuple:
+    """
+    上架库位推荐
+    :param store: 容量索引（warehouse.goods.capacity 中的 RedisCapacityStore / DatabaseCapacityStore）
+    :return: (suggestions, unassigned)，suggestions 为
+             [{location_id, quantity, free_volume, current_quantity, reason}, ...]，
+             unassigned 为 limit 个库位内放不下的数量
+
+    先放已有同商品的库位（按可放入数量从多到少，容量未知的库位视为可全部放入），
+    剩余数量再按体积最佳适配：取剩余体积不小于所需体积的最小库位；没有能一次放下的库位时
+    先填入剩余体积最大的库位，再对余量重复最佳适配。
+    """
+    remaining = quantity
+    suggestions = []
+    used = set()
+
+    def fits(free):
+        if free is None:
+            return remaining
+        if unit_volume <= 0:
+            return remaining if free > 0 else 0
+        return min(remaining, math.floor(free / unit_volume + 1e-9))
+
+    def take(location_id, free, current, reason):
+        nonlocal remaining
+        count = fits(free)
+        if count <= 0:
+            return
+        suggestions.append({
+            'location_id': location_id,
+            'quantity': count,
+            'free_volume': free,
+            'current_quantity': current,
+            'reason': reason,
+        })
+        used.add(location_id)
+        remaining -= count
+
+    bins = store.goods_bins(goods_id)
+    if bins:
+        free_volumes = store.free_volumes(list(bins))
+        candidates = sorted(
+            bins.items(),
+            key=lambda item: (-fits(free_volumes.get(item[0])), -item[1], item[0]),
+        )
+        for location_id, current in candidates:
+            if remaining <= 0 or len(suggestions) >= limit:
+                break
+            take(location_id, free_volumes.get(location_id), current, 'consolidate')
+
+    while remaining > 0 and len(suggestions) < limit:
+        # 索引里已推荐过的库位最多 len(used) 个，多取一个即可保证拿到未推荐的库位
+        best = next(
+            (item for item in store.smallest_fitting(remaining * unit_volume, len(used) + 1) if item[0] not in used),
+            None,
+        )
+        if best is not None:
+            take(best[0], best[1], bins.get(best[0], 0), 'best_fit')
+            break
+        # 没有能一次放下的库位：先填入剩余体积最大的库位
+        largest = next((item for item in store.largest(len(used) + 1) if item[0] not in used), None)
+        if largest is None or fits(largest[1]) <= 0:
+            break
+        take(largest[0], largest[1], bins.get(largest[0], 0), 'best_fit')
+    return suggestions, max(remaining, 0)
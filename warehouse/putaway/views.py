@@ -2,14 +2,16 @@ from flask import g
 from flask_restx import Resource,abort
 from extensions.error import ForbiddenException
 from system.common import permission_required
-from warehouse.common import warehouse_required,add_warehouse_filter,check_goods_access, check_location_access
+from warehouse.common import warehouse_required,add_warehouse_filter,check_goods_access, check_location_access, check_warehouse_access
 
 from .schemas import (
     api_ns, 
     putaway_record_model, 
     putaway_record_input_model, 
     putaway_pagination_parser,
-    putaway_pagination_model
+    putaway_pagination_model,
+    putaway_suggestion_parser,
+    putaway_suggestion_model
 )
 from system.common import paginate
 from .services import PutawayService
@@ -71,6 +73,28 @@ class PutawayRecordList(Resource):
         return new_record, 201
 
 
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/suggestions')
+class PutawaySuggestion(Resource):
+
+    @permission_required(["all_access","company_all_access","putaway_read"])
+    @warehouse_required()
+    @api_ns.expect(putaway_suggestion_parser)
+    @api_ns.marshal_with(putaway_suggestion_model)
+    def get(self):
+        """推荐上架库位（同商品库位合并优先，其次按剩余体积最佳适配）"""
+        args = putaway_suggestion_parser.parse_args()
+
+        if not check_goods_access(args['goods_id']):
+            raise ForbiddenException("You do not have access to this Goods", 12001)
+        if not check_warehouse_access(args['warehouse_id']):
+            raise ForbiddenException("You do not have access to this Warehouse", 12001)
+
+        return PutawayService.suggest_locations(
+            args['goods_id'], args['warehouse_id'], args['quantity'], args['limit']
+        )
+
+
 @api_ns.doc(security="jsonWebToken")
 @api_ns.route('/<int:record_id>')
 class PutawayRecordDetail(Resource):
@@ -99,12 +123,11 @@ class PutawayRecordBulk(Resource):
         data_list = api_ns.payload  # 预期 payload 是一个列表
         created_by = g.current_user.id
 
-        # 验证每个记录的商品和库位访问权限
-        for data in data_list:
-            goods_id = data.get('goods_id')
-            location_id = data.get('location_id')
+        # 验证商品和库位访问权限（同一商品/库位只验证一次）
+        for goods_id in {data.get('goods_id') for data in data_list}:
             if not check_goods_access(goods_id):
                 raise ForbiddenException("You do not have access to this Goods", 12001)
+        for location_id in {data.get('location_id') for data in data_list}:
             if not check_location_access(location_id):
                 raise ForbiddenException("You do not have access to this Location", 12001)
 
@@ -1,5 +1,6 @@
 from flask_restx import abort
-from sqlalchemy import or_
+from sqlalchemy import or_, insert
+from sqlalchemy.orm import lazyload
 from extensions.db import *
 from extensions.error import BadRequestException, NotFoundException
 from extensions.transaction import transactional
@@ -88,11 +89,12 @@ class RemovalService:
         location_id=data['location_id']
         quantity=data['quantity']
 
-        # 先去获取商品库位GoodsLocation信息，如果找不到到会抛出404错误，捕获这个错误，并更新库存信息，同时还需要判断库存是否足够
-        goods_location_record = GoodsLocationService.get_goods_location_record(goods_id, location_id)
-        if goods_location_record is None:
-            raise NotFoundException("GoodsLocation not found", 13004)
-        
+        # 带条件的原子扣减（数量不足或记录不存在时不修改），扣减到 0 时删除商品库位记录
+        if not GoodsLocationService.deduct_quantity(goods_id, location_id, quantity):
+            if GoodsLocationService.get_goods_location_record(goods_id, location_id) is None:
+                raise NotFoundException("GoodsLocation not found", 13004)
+            raise BadRequestException("Stock is not enough", 15001)
+
         new_record = RemovalRecord(
             goods_id=goods_id,
             location_id=location_id,
@@ -103,18 +105,10 @@ class RemovalService:
         )
         db.session.add(new_record)
         db.session.flush()
-        
-        goods_location_record.quantity -= new_record.quantity
-        if goods_location_record.quantity < 0:
-            raise BadRequestException("Stock is not enough", 15001)
-        elif goods_location_record.quantity == 0:           
-            db.session.delete(goods_location_record)
-        else:
-            db.session.add(goods_location_record)
-        db.session.flush()
 
         #更新库存信息
-        InventoryService.removal_completed(new_record.goods_id, new_record.location.warehouse_id, new_record.quantity)
+        InventoryService.removal_completed(new_record.goods_id, new_record.location.warehouse_id, new_record.quantity, new_record.location,
+                                           source=('removal', new_record.id))
 
         # db.session.commit()
         return new_record
@@ -131,17 +125,69 @@ class RemovalService:
     @transactional
     def bulk_create_removal_records(data_list: list, created_by_id: int) -> list:
         """
-        批量创建下架记录
+        批量创建下架记录（集合式处理，整批成功或整批失败）
 
         :param data_list: list，每个元素为 dict，包含 goods_id, location_id, quantity, reason, remark 等字段
         :param created_by_id: 创建者的用户ID
-        :return: 创建成功的 RemovalRecord 实例列表
+        :return: 创建成功的 RemovalRecord 实例列表（与 data_list 顺序一致）
+
+        商品库位记录一次查询预取并加锁，按请求顺序在内存中逐行扣减校验（错误码与逐条下架一致），
+        合并后的扣减量由 apply_quantity_changes 以原子语句写回；下架记录以一条多行 INSERT 写入；
+        库存按商品合并后通过 bulk_removal_completed 一次变更。
         """
-        new_records = []
+        if not data_list:
+            return []
+
+        records = GoodsLocationService.get_goods_location_records_for_update(
+            (data['goods_id'], data['location_id']) for data in data_list
+        )
+        quantities = {key: record.quantity for key, record in records.items()}
+        removed = {}
         for data in data_list:
-            new_record = RemovalService.create_removal_record(data, created_by_id)
-            new_records.append(new_record)
-            db.session.flush()
+            key = (data['goods_id'], data['location_id'])
+            if quantities.get(key, 0) <= 0:
+                # 不存在，或已被本批次前面的行扣减为 0 并删除
+                raise NotFoundException("GoodsLocation not found", 13004)
+            quantities[key] -= data['quantity']
+            if quantities[key] < 0:
+                raise BadRequestException("Stock is not enough", 15001)
+            removed[key] = removed.get(key, 0) + data['quantity']
+
+        locations = {
+            location.id: location
+            for location in Location.query.options(lazyload('*')).filter(
+                Location.id.in_({location_id for _, location_id in removed})
+            )
+        }
+        if not GoodsLocationService.apply_quantity_changes({key: -quantity for key, quantity in removed.items()}):
+            raise BadRequestException("Stock is not enough", 15001)
+
+        record_ids = db.session.scalars(
+            insert(RemovalRecord).returning(RemovalRecord.id, sort_by_parameter_order=True),
+            [
+                {
+                    'goods_id': data['goods_id'],
+                    'location_id': data['location_id'],
+                    'quantity': data['quantity'],
+                    'reason': data['reason'],
+                    'remark': data.get('remark', ''),
+                    'operator_id': created_by_id,
+                }
+                for data in data_list
+            ],
+        ).all()
+
+        #更新库存信息
+        InventoryService.bulk_removal_completed(
+            [
+                (goods_id, locations[location_id].warehouse_id, quantity, locations[location_id])
+                for (goods_id, location_id), quantity in removed.items()
+            ],
+            source=('removal', None),
+        )
 
-        # transactional 装饰器会在函数退出后统一提交
-        return new_records
\ No newline at end of file
+        new_records = {
+            record.id: record
+            for record in RemovalRecord.query.filter(RemovalRecord.id.in_(record_ids))
+        }
+        return [new_records[record_id] for record_id in record_ids]
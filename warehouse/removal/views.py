@@ -97,14 +97,23 @@ class RemovalRecordBulk(Resource):
         created_by = g.current_user.id
 
         # 对每条记录进行基础验证，例如判断商品是否在指定库位中存在及权限验证
+        # 商品库位一次批量查询，同一商品/库位的权限只验证一次
+        existing = GoodsLocationService.existing_goods_location_keys(
+            (data.get('goods_id'), data.get('location_id')) for data in data_list
+        )
+        goods_access, location_access = {}, {}
         for data in data_list:
             goods_id = data.get('goods_id')
             location_id = data.get('location_id')
-            if not GoodsLocationService.is_goods_in_location(goods_id, location_id):
+            if (goods_id, location_id) not in existing:
                 raise NotFoundException("Goods not found in the specified location", 13003)
-            if not check_goods_access(goods_id):
+            if goods_id not in goods_access:
+                goods_access[goods_id] = check_goods_access(goods_id)
+            if not goods_access[goods_id]:
                 raise ForbiddenException("You do not have access to this Goods", 12001)
-            if not check_location_access(location_id):
+            if location_id not in location_access:
+                location_access[location_id] = check_location_access(location_id)
+            if not location_access[location_id]:
                 raise ForbiddenException("You do not have access to this Location", 12001)
 
         new_records = RemovalService.bulk_create_removal_records(data_list, created_by)
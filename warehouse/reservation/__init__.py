@@ -0,0 +1,3 @@
+from .models import *
+from .schemas import *
+from .views import *
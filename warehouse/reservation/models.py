@@ -0,0 +1,73 @@
+from extensions.db import *
+
+
+class InventoryReservation(db.Model):
+    """库存预留表（带持有者令牌与过期时间的 locked_stock 锁定记录）
+
+    Attributes:
+        token: 预留令牌，同一次预留（如一个购物车）的多行共用
+        owner: 持有者标识（如会话 ID、订单号）
+        status: active / released / consumed / expired / orphaned（库存记录已删除，无锁定量可归还）
+        expires_at: 过期时间，到期后由定时任务释放锁定库存
+    """
+    __tablename__ = 'inventory_reservations'
+
+    STATUSES = ('active', 'released', 'consumed', 'expired', 'orphaned')
+
+    __table_args__ = (
+        db.Index('idx_reservation_status_expires', 'status', 'expires_at'),  # 回收任务按过期时间范围扫描
+        db.Index('idx_reservation_token', 'token'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(
+        db.String(64),
+        nullable=False,
+        info={'description': '预留令牌'}
+    )
+    owner = db.Column(
+        db.String(100),
+        nullable=True,
+        info={'description': '持有者标识'}
+    )
+    goods_id = db.Column(
+        db.Integer,
+        db.ForeignKey('goods.id', ondelete='RESTRICT'),
+        nullable=False,
+        info={'description': '商品ID'}
+    )
+    warehouse_id = db.Column(
+        db.Integer,
+        db.ForeignKey('warehouses.id', ondelete='RESTRICT'),
+        nullable=False,
+        info={'description': '仓库ID'}
+    )
+    quantity = db.Column(
+        db.Integer,
+        nullable=False,
+        info={'description': '锁定数量'}
+    )
+    status = db.Column(
+        db.String(20),
+        nullable=False,
+        default='active',
+        info={'description': '状态（active、released、consumed、expired、orphaned）'}
+    )
+    expires_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        info={'description': '过期时间'}
+    )
+    created_at = db.Column(
+        db.DateTime,
+        default=db.func.now(),
+        info={'description': '创建时间'}
+    )
+    released_at = db.Column(
+        db.DateTime,
+        nullable=True,
+        info={'description': '释放时间（释放、确认或过期）'}
+    )
+
+    def __repr__(self):
+        return f"<InventoryReservation {self.token} {self.goods_id}@{self.warehouse_id} x{self.quantity} {self.status}>"
@@ -0,0 +1,33 @@
+from flask_restx import Namespace, fields
+
+# 初始化 Namespace
+api_ns = Namespace('reservation', description='Expiring inventory reservations')
+
+reservation_item_model = api_ns.model('ReservationItem', {
+    'goods_id': fields.Integer(required=True, description='Goods ID'),
+    'warehouse_id': fields.Integer(required=True, description='Warehouse ID'),
+    'quantity': fields.Integer(required=True, description='Quantity to lock'),
+})
+
+reservation_line_model = api_ns.inherit('ReservationLine', reservation_item_model, {
+    'id': fields.Integer(readOnly=True, description='Reservation line ID'),
+    'status': fields.String(readOnly=True, description='active / released / consumed / expired / orphaned'),
+    'expires_at': fields.DateTime(readOnly=True, description='Expiry time'),
+    'released_at': fields.DateTime(readOnly=True, description='Release time'),
+})
+
+reservation_model = api_ns.model('Reservation', {
+    'token': fields.String(readOnly=True, description='Reservation token'),
+    'owner': fields.String(readOnly=True, description='Owner identifier'),
+    'items': fields.List(fields.Nested(reservation_line_model), description='Reserved lines'),
+})
+
+reservation_input_model = api_ns.model('ReservationInput', {
+    'owner': fields.String(description='Owner identifier, e.g. cart or session ID'),
+    'ttl_seconds': fields.Integer(description='Time to live in seconds (default from RESERVATION_DEFAULT_TTL)'),
+    'items': fields.List(fields.Nested(reservation_item_model), required=True, description='Goods to lock'),
+})
+
+reservation_extend_model = api_ns.model('ReservationExtend', {
+    'ttl_seconds': fields.Integer(description='New time to live in seconds, counted from now'),
+})
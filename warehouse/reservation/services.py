@@ -0,0 +1,158 @@
+import secrets
+from datetime import datetime, timedelta
+from flask import current_app
+from extensions.db import *
+from extensions.error import BadRequestException, NotFoundException
+from extensions.transaction import transactional
+from warehouse.inventory.locks import lock_inventories
+from warehouse.inventory.services import InventoryService
+from .models import InventoryReservation
+
+
+class ReservationService:
+
+    @staticmethod
+    def _ttl(ttl_seconds: int = None) -> int:
+        """校验并返回预留有效期（秒），为空时使用 RESERVATION_DEFAULT_TTL"""
+        ttl = ttl_seconds or current_app.config.get('RESERVATION_DEFAULT_TTL', 900)
+        max_ttl = current_app.config.get('RESERVATION_MAX_TTL', 86400)
+        if ttl <= 0 or ttl > max_ttl:
+            raise BadRequestException(f"ttl_seconds must be between 1 and {max_ttl}", 15020)
+        return ttl
+
+    @staticmethod
+    def get_reservation(token: str) -> list:
+        """
+        根据令牌获取预留的全部明细，不存在时抛出 404
+        :return: list[InventoryReservation]
+        """
+        lines = InventoryReservation.query.filter_by(token=token).order_by(InventoryReservation.id).all()
+        if not lines:
+            raise NotFoundException(f"Reservation {token} not found", 43002)
+        return lines
+
+    @staticmethod
+    def _get_active_for_update(token: str) -> list:
+        """锁定令牌下仍有效的预留明细；令牌不存在抛出 404，已全部释放抛出 400"""
+        lines = InventoryReservation.query.filter_by(
+            token=token, status='active'
+        ).order_by(InventoryReservation.id).with_for_update().all()
+        if not lines:
+            ReservationService.get_reservation(token)
+            raise BadRequestException(f"Reservation {token} is no longer active", 15022)
+        return lines
+
+    @staticmethod
+    def _release(lines: list, status: str):
+        """
+        释放预留：按批量变更接口一次性扣减 locked_stock，并更新预留状态
+
+        locked_stock 按 0 截断：库存被人工解锁等原因提前归零时不阻塞释放。
+        库存记录已被删除的明细没有可归还的锁定量，直接标记为 orphaned，不影响同批其他明细。
+        库存流水按预留明细记录来源（source_id 为明细 ID，可追溯到令牌）。
+        """
+        existing = lock_inventories(
+            ((line.goods_id, line.warehouse_id) for line in lines), missing_ok=True
+        )
+        releasable = [line for line in lines if (line.goods_id, line.warehouse_id) in existing]
+        InventoryService.apply_stock_deltas(
+            [(line.goods_id, line.warehouse_id, {'locked_stock': -line.quantity}) for line in releasable],
+            clamp=('locked_stock',),
+            recalculate_total=False,
+            sources=[('reservation', line.id) for line in releasable],
+        )
+        now = datetime.now()
+        for line in lines:
+            line.status = status if (line.goods_id, line.warehouse_id) in existing else 'orphaned'
+            line.released_at = now
+        db.session.flush()
+
+    @staticmethod
+    @transactional
+    def create_reservation(items: list, owner: str = None, ttl_seconds: int = None) -> list:
+        """
+        创建预留：锁定库存并记录持有者令牌与过期时间
+        :param items: list，每个元素为 {goods_id, warehouse_id, quantity}
+        :param owner: 持有者标识
+        :param ttl_seconds: 有效期（秒）
+        :return: list[InventoryReservation]，同一令牌下的预留明细
+        """
+        if not items:
+            raise BadRequestException("Reservation items are required", 15021)
+        for item in items:
+            if not item.get('quantity') or item['quantity'] <= 0:
+                raise BadRequestException("Reservation quantity must be positive", 15021)
+
+        ttl = ReservationService._ttl(ttl_seconds)
+        token = secrets.token_hex(16)
+        expires_at = datetime.now() + timedelta(seconds=ttl)
+        lines = [
+            InventoryReservation(
+                token=token,
+                owner=owner,
+                goods_id=item['goods_id'],
+                warehouse_id=item['warehouse_id'],
+                quantity=item['quantity'],
+                status='active',
+                expires_at=expires_at,
+            )
+            for item in items
+        ]
+        db.session.add_all(lines)
+        db.session.flush()
+        # 明细先写入以取得 ID，库存流水按明细记录来源
+        InventoryService.bulk_lock_inventory(
+            [(line.goods_id, line.warehouse_id, line.quantity) for line in lines],
+            sources=[('reservation', line.id) for line in lines],
+        )
+        return lines
+
+    @staticmethod
+    @transactional
+    def extend_reservation(token: str, ttl_seconds: int = None) -> list:
+        """延长预留有效期（从当前时间起重新计算）"""
+        lines = ReservationService._get_active_for_update(token)
+        expires_at = datetime.now() + timedelta(seconds=ReservationService._ttl(ttl_seconds))
+        for line in lines:
+            line.expires_at = expires_at
+        db.session.flush()
+        return lines
+
+    @staticmethod
+    @transactional
+    def release_reservation(token: str) -> list:
+        """主动释放预留（如购物车清空），归还锁定库存"""
+        lines = ReservationService._get_active_for_update(token)
+        ReservationService._release(lines, 'released')
+        return lines
+
+    @staticmethod
+    @transactional
+    def consume_reservation(token: str) -> list:
+        """确认预留（如已下单生成 DN），释放锁定库存，后续由 DN 的 dn_stock 预扣"""
+        lines = ReservationService._get_active_for_update(token)
+        ReservationService._release(lines, 'consumed')
+        return lines
+
+    @staticmethod
+    @transactional
+    def reap_expired_reservations(batch_size: int = None, now: datetime = None) -> int:
+        """
+        回收一批已过期的预留
+        :param batch_size: 每批最多处理的预留明细数，默认 RESERVATION_REAP_BATCH_SIZE
+        :param now: 当前时间（测试用）
+        :return: int，本批释放的明细数
+
+        按 (status, expires_at) 索引只读取已到期的最早一批，不扫描仍有效的预留；
+        SKIP LOCKED 使并发的回收任务或正在释放的请求互不阻塞。
+        """
+        batch_size = batch_size or current_app.config.get('RESERVATION_REAP_BATCH_SIZE', 500)
+        lines = InventoryReservation.query.filter(
+            InventoryReservation.status == 'active',
+            InventoryReservation.expires_at <= (now or datetime.now()),
+        ).order_by(
+            InventoryReservation.expires_at
+        ).limit(batch_size).with_for_update(skip_locked=True).all()
+        if lines:
+            ReservationService._release(lines, 'expired')
+        return len(lines)
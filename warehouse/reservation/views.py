@@ -0,0 +1,91 @@
+from flask_restx import Resource
+from extensions.error import ForbiddenException
+from system.common import permission_required
+from warehouse.common import warehouse_required
+from warehouse.common.utils import add_warehouse_filter
+from .schemas import api_ns, reservation_model, reservation_input_model, reservation_extend_model
+from .services import ReservationService
+
+
+def _serialize(lines):
+    return {'token': lines[0].token, 'owner': lines[0].owner, 'items': lines}
+
+
+def _check_warehouse_access(warehouse_ids):
+    """预留涉及的仓库必须在当前用户可访问的仓库范围内"""
+    scope = add_warehouse_filter({})
+    if 'warehouse_id' in scope:
+        allowed = {scope['warehouse_id']}
+    elif 'warehouse_ids' in scope:
+        allowed = set(scope['warehouse_ids'])
+    else:
+        return
+    if not set(warehouse_ids) <= allowed:
+        raise ForbiddenException("Warehouse is not accessible to the current user", 12001)
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/')
+class ReservationList(Resource):
+
+    @permission_required(["all_access","company_all_access","reservation_edit"])
+    @warehouse_required()
+    @api_ns.expect(reservation_input_model)
+    @api_ns.marshal_with(reservation_model)
+    def post(self):
+        """Lock stock for an owner with an expiry; the returned token releases, extends or consumes it"""
+        data = api_ns.payload or {}
+        items = data.get('items') or []
+        _check_warehouse_access([item.get('warehouse_id') for item in items])
+        lines = ReservationService.create_reservation(items, data.get('owner'), data.get('ttl_seconds'))
+        return _serialize(lines), 201
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/<string:token>')
+class ReservationDetail(Resource):
+
+    @permission_required(["all_access","company_all_access","reservation_read"])
+    @warehouse_required()
+    @api_ns.marshal_with(reservation_model)
+    def get(self, token):
+        """Get a reservation by token"""
+        lines = ReservationService.get_reservation(token)
+        _check_warehouse_access([line.warehouse_id for line in lines])
+        return _serialize(lines), 200
+
+    @permission_required(["all_access","company_all_access","reservation_edit"])
+    @warehouse_required()
+    @api_ns.marshal_with(reservation_model)
+    def delete(self, token):
+        """Release a reservation and unlock its stock"""
+        _check_warehouse_access([line.warehouse_id for line in ReservationService.get_reservation(token)])
+        return _serialize(ReservationService.release_reservation(token)), 200
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/<string:token>/extend')
+class ReservationExtend(Resource):
+
+    @permission_required(["all_access","company_all_access","reservation_edit"])
+    @warehouse_required()
+    @api_ns.expect(reservation_extend_model)
+    @api_ns.marshal_with(reservation_model)
+    def put(self, token):
+        """Extend a reservation's expiry, counted from now"""
+        _check_warehouse_access([line.warehouse_id for line in ReservationService.get_reservation(token)])
+        data = api_ns.payload or {}
+        return _serialize(ReservationService.extend_reservation(token, data.get('ttl_seconds'))), 200
+
+
+@api_ns.doc(security="jsonWebToken")
+@api_ns.route('/<string:token>/consume')
+class ReservationConsume(Resource):
+
+    @permission_required(["all_access","company_all_access","reservation_edit"])
+    @warehouse_required()
+    @api_ns.marshal_with(reservation_model)
+    def post(self, token):
+        """Confirm a reservation (e.g. order placed) and unlock its stock"""
+        _check_warehouse_access([line.warehouse_id for line in ReservationService.get_reservation(token)])
+        return _serialize(ReservationService.consume_reservation(token)), 200
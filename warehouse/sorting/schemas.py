@@ -46,13 +46,20 @@ sorting_task_detail_for_batch_model = api_ns.model('SortingTaskDetailForBatch',
 # 3. Sorting Batch 的输出模型
 #    - 可直接查看对应的 detail 列表（details）
 # ---------------------------------------------------------------------------------
-sorting_batch_model = api_ns.model('SortingBatch', {
+sorting_batch_header_fields = {
     'id': fields.Integer(readOnly=True, description='Sorting Batch ID'),
     'sorting_task_id': fields.Integer(required=True, description='Associated Sorting Task ID'),
     'operator_id': fields.Integer(description='Operator who performed the sorting batch'),
     'operation_time': fields.DateTime(description='Time of the sorting batch'),
     'remark': fields.String(description='Remark for the sorting batch'),
     'operator': fields.Nested(user_model, readOnly=True, description='Operator details'),
+}
+
+# 只含批次本身（创建批次时的默认返回，不读取明细）
+sorting_batch_header_model = api_ns.model('SortingBatchHeader', sorting_batch_header_fields)
+
+sorting_batch_model = api_ns.model('SortingBatch', {
+    **sorting_batch_header_fields,
     'details': fields.List(
         fields.Nested(sorting_task_detail_for_batch_model),
         readOnly=True, 
@@ -154,6 +161,11 @@ sorting_batch_input_fields['details'] = fields.List(
 )
 sorting_batch_input_model = api_ns.model('SortingBatchInput', sorting_batch_input_fields)
 
+# 创建批次的查询参数：expand=details 时返回批次及其明细
+sorting_batch_create_parser = reqparse.RequestParser()
+sorting_batch_create_parser.add_argument('expand', type=str, location='args', choices=('details',),
+                                         help='Return the created details along with the batch')
+
 # ---------------------------------------------------------------------------------
 # 10. 分页解析器 & 分页模型
 # ---------------------------------------------------------------------------------
@@ -6,7 +6,7 @@ from .models import SortingTask, SortingTaskDetail, SortingTaskStatusLog, Sortin
 from datetime import datetime, timedelta
 from warehouse.asn.services import ASNService
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import and_, func, case, extract
+from sqlalchemy import and_, func, case, extract, insert
 
 class SortingTaskService:
 
@@ -293,7 +293,7 @@ class SortingTaskService:
                 ]
             }
         如果 data 内部没有 "details" 或其为空数组，表示仅创建批次。
-        返回: (batch, [list_of_details]) 
+        返回: 新建的批次（明细按需通过 batch.details 读取）
         """
 
         task = SortingTaskService._get_instance(task_or_id)
@@ -307,6 +307,11 @@ class SortingTaskService:
             op_time = datetime.fromisoformat(op_time)
             # 否则使用 datetime.strptime(op_time, '%Y-%m-%dT%H:%M:%S') 等
 
+        # 强制校验类型（若存在且非列表则报错）
+        details_data = data.get("details", [])
+        if details_data is not None and not isinstance(details_data, list):
+            raise BadRequestException("'details' must be a list (empty is allowed)", 16015)
+
         # 1) 创建批次
         new_batch = SortingBatch(
             sorting_task_id=task.id,
@@ -317,27 +322,25 @@ class SortingTaskService:
         db.session.add(new_batch)
         db.session.flush()  # 为了获取新批次的 ID
 
-        # 2) 如果有 details，就批量创建 detail
-        details_data = data.get("details", [])
-        # 2. 强制校验类型（若存在且非列表则报错）
-        if details_data is not None and not isinstance(details_data, list):
-            raise BadRequestException("'details' must be a list (empty is allowed)", 16015)
-
-        for item in details_data:
-            detail_obj = SortingTaskDetail(
-                sorting_task_id=task.id,
-                batch_id=new_batch.id,  
-                goods_id=item['goods_id'],
-                sorted_quantity=item.get('sorted_quantity', 0),
-                damage_quantity=item.get('damage_quantity', 0),
-                operator_id=operator_id
-            )
-            db.session.add(detail_obj)
+        # 2) 明细以一条多行 INSERT 写入；已加载的明细集合随后过期，下次访问时重新读取
+        if details_data:
+            db.session.execute(insert(SortingTaskDetail), [
+                {
+                    'sorting_task_id': task.id,
+                    'batch_id': new_batch.id,
+                    'goods_id': item['goods_id'],
+                    'sorted_quantity': item.get('sorted_quantity', 0),
+                    'damage_quantity': item.get('damage_quantity', 0),
+                    'operator_id': operator_id,
+                }
+                for item in details_data
+            ])
+            db.session.expire(task, ['task_details'])
+            db.session.expire(new_batch, ['details'])
 
         # 3) 一次性提交
         # db.session.commit()
 
-        # 返回批次对象和所创建的明细列表
         return new_batch
 
 
@@ -432,6 +435,19 @@ class SortingTaskService:
         db.session.add(sorting_task)
         # db.session.commit()
         return sorting_task
+
+    @staticmethod
+    def create_sorting_tasks_from_asns(asns: list):
+        """
+        为多张 ASN 各生成一个 Sorting Task（一条多行 INSERT）。
+        调用方需保证每张 ASN 都有明细（见 ASNService.bulk_receive_asns）。
+        """
+        if not asns:
+            return
+        db.session.execute(insert(SortingTask), [
+            {'asn_id': asn.id, 'status': 'pending', 'created_by': asn.created_by} for asn in asns
+        ])
+        # db.session.commit()
     
     @staticmethod
     def get_sorting_monthly_stats(months=6, filters=None):
@@ -1,5 +1,5 @@
 from flask import g
-from flask_restx import Resource
+from flask_restx import Resource, marshal
 from extensions.error import ForbiddenException
 from warehouse.common import warehouse_required,add_warehouse_filter,check_warehouse_access
 
@@ -13,6 +13,8 @@ from .schemas import (
     sorting_task_detail_input_model,
     sorting_batch_input_model,
     sorting_batch_model,
+    sorting_batch_header_model,
+    sorting_batch_create_parser,
     sorting_monthly_stats_parser
 )
 from .services import SortingTaskService
@@ -209,14 +211,16 @@ class SortingBatchList(Resource):
 
     @permission_required(["all_access","company_all_access","sorting_edit"])
     @warehouse_required()
-    @api_ns.expect(sorting_batch_input_model)
-    @api_ns.marshal_with(sorting_batch_model)
+    @api_ns.expect(sorting_batch_input_model, sorting_batch_create_parser)
+    @api_ns.response(201, 'Created', sorting_batch_header_model)
     def post(self, task_id):
         """
         创建新的 SortingBatch
         - 如果传入 data['details']，则同时批量创建 SortingTaskDetail
+        - 默认只返回批次本身，`?expand=details` 时同时返回本批次明细
         - 要求对应的 SortingTask 必须是 in_progress 状态
         """
+        args = sorting_batch_create_parser.parse_args()
         data = api_ns.payload or {}
         operator_id = g.current_user.id
 
@@ -227,7 +231,9 @@ class SortingBatchList(Resource):
 
         new_batch = SortingTaskService.create_batch(task_id, data, operator_id)
 
-        return new_batch, 201
+        # 默认只返回批次本身；expand=details 时再读取并返回本批次明细
+        model = sorting_batch_model if args.get('expand') == 'details' else sorting_batch_header_model
+        return marshal(new_batch, model), 201
 
 
 @api_ns.doc(security="jsonWebToken")
@@ -6,8 +6,8 @@ from warehouse.goods.models import Goods
 from warehouse.goods.services import GoodsLocationService
 from warehouse.inventory.services import InventoryService
 from warehouse.location.models import Location
-from sqlalchemy import or_
-from sqlalchemy.orm import aliased
+from sqlalchemy import or_, insert
+from sqlalchemy.orm import aliased, lazyload
 from .models import TransferRecord
 
 class TransferService:
@@ -100,14 +100,13 @@ class TransferService:
         to_location_id=data['to_location_id']
         quantity=data['quantity']
         
-        # 先去获取商品库位GoodsLocation信息，如果找不到会抛出404错误，捕获这个错误，并创建新的库存信息
-        from_goods_location_record = GoodsLocationService.get_goods_location_record(goods_id, from_location_id)
-        to_goods_location_record = GoodsLocationService.get_goods_location_record(goods_id, to_location_id)
-        if from_goods_location_record is None:
-            raise NotFoundException("Goods not found in the specified from_location", 14003)
-        if from_goods_location_record.quantity < data['quantity']:
+        # 源库位带条件原子扣减（数量不足或记录不存在时不修改），目标库位一条 upsert 语句累加
+        if not GoodsLocationService.deduct_quantity(goods_id, from_location_id, quantity):
+            if GoodsLocationService.get_goods_location_record(goods_id, from_location_id) is None:
+                raise NotFoundException("Goods not found in the specified from_location", 14003)
             raise BadRequestException("Insufficient inventory in the specified location", 15001)
-        
+        GoodsLocationService.add_quantity(goods_id, to_location_id, quantity)
+
         new_record = TransferRecord(
             goods_id=goods_id,
             from_location_id=from_location_id,
@@ -118,30 +117,12 @@ class TransferService:
         )
         db.session.add(new_record)
         db.session.flush()
-        
-        from_goods_location_record.quantity -= quantity
-        if from_goods_location_record.quantity == 0:
-            db.session.delete(from_goods_location_record)
-        else:
-            db.session.add(from_goods_location_record)
-        
-
-        if to_goods_location_record is None:
-            # 创建新的库存信息
-            data = {
-                'goods_id': new_record.goods_id,
-                'location_id': new_record.to_location_id,
-                'quantity': new_record.quantity
-            }
-            to_goods_location_record = GoodsLocationService.create_goods_location(data)
-        else:
-            to_goods_location_record.quantity += new_record.quantity
-
-        db.session.add(to_goods_location_record)        
-        db.session.flush()   
 
         #更新库存信息
-        InventoryService.update_and_calculate_stock(new_record.goods_id, new_record.to_location.warehouse_id)
+        InventoryService.bulk_location_stock_changed([
+            (new_record.goods_id, new_record.from_location, -quantity),
+            (new_record.goods_id, new_record.to_location, quantity),
+        ], source=('transfer', new_record.id))
         # db.session.commit()
         return new_record
 
@@ -160,17 +141,79 @@ class TransferService:
     @transactional
     def bulk_create_transfer_records(data_list: list, created_by_id: int) -> list:
         """
-        批量创建移库记录
+        批量创建移库记录（集合式处理，整批成功或整批失败）
         
         :param data_list: list，每个元素为 dict，包含 goods_id, from_location_id, to_location_id, quantity, remark 等字段
         :param created_by_id: 创建者的用户ID
-        :return: 创建成功的 TransferRecord 实例列表
+        :return: 创建成功的 TransferRecord 实例列表（与 data_list 顺序一致）
+
+        引用的库位一次查询预取（不存在时返回 13001），源、目标商品库位记录一次查询预取并加锁，按请求顺序在内存中逐行移动并校验（错误码与逐条移库一致，
+        前面的行移入的数量可供后面的行移出），净变化由 apply_quantity_changes 以原子语句写回；
+        移库记录以一条多行 INSERT 写入；库存按 (商品, 库位) 合并净变化后一次同步。
         """
-        new_records = []
+        if not data_list:
+            return []
+
+        location_ids = {
+            location_id for data in data_list for location_id in (data['from_location_id'], data['to_location_id'])
+        }
+        locations = {
+            location.id: location
+            for location in Location.query.options(lazyload('*')).filter(Location.id.in_(location_ids))
+        }
+        missing = location_ids - locations.keys()
+        if missing:
+            raise NotFoundException(f"Location with id {min(missing)} not found", 13001)
+
+        records = GoodsLocationService.get_goods_location_records_for_update(
+            key
+            for data in data_list
+            for key in ((data['goods_id'], data['from_location_id']), (data['goods_id'], data['to_location_id']))
+        )
+        quantities = {key: record.quantity for key, record in records.items()}
+        changes = {}
         for data in data_list:
-            new_record = TransferService.create_transfer_record(data, created_by_id)
-            new_records.append(new_record)
-            db.session.flush()
+            quantity = data['quantity']
+            from_key = (data['goods_id'], data['from_location_id'])
+            to_key = (data['goods_id'], data['to_location_id'])
+            if quantities.get(from_key, 0) <= 0:
+                raise NotFoundException("Goods not found in the specified from_location", 14003)
+            if quantities[from_key] < quantity:
+                raise BadRequestException("Insufficient inventory in the specified location", 15001)
+            quantities[from_key] -= quantity
+            quantities[to_key] = quantities.get(to_key, 0) + quantity
+            changes[from_key] = changes.get(from_key, 0) - quantity
+            changes[to_key] = changes.get(to_key, 0) + quantity
+
+        if not GoodsLocationService.apply_quantity_changes(changes):
+            raise BadRequestException("Insufficient inventory in the specified location", 15001)
 
-        
-        return new_records
+        record_ids = db.session.scalars(
+            insert(TransferRecord).returning(TransferRecord.id, sort_by_parameter_order=True),
+            [
+                {
+                    'goods_id': data['goods_id'],
+                    'from_location_id': data['from_location_id'],
+                    'to_location_id': data['to_location_id'],
+                    'quantity': data['quantity'],
+                    'operator_id': created_by_id,
+                    'remark': data.get('remark', ''),
+                }
+                for data in data_list
+            ],
+        ).all()
+
+        #更新库存信息
+        InventoryService.bulk_location_stock_changed(
+            [
+                (goods_id, locations[location_id], quantity)
+                for (goods_id, location_id), quantity in changes.items() if quantity
+            ],
+            source=('transfer', None),
+        )
+
+        new_records = {
+            record.id: record
+            for record in TransferRecord.query.filter(TransferRecord.id.in_(record_ids))
+        }
+        return [new_records[record_id] for record_id in record_ids]
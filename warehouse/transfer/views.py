@@ -113,7 +113,15 @@ class TransferRecordBulk(Resource):
         data_list = api_ns.payload  # payload 预期为列表
         created_by = g.current_user.id
 
-        # 对每条记录进行基础验证，例如验证商品和库位的存在及访问权限
+        # 对每条记录进行基础验证（访问权限），同一商品/库位的权限只验证一次；
+        # 源库位库存由服务按批次顺序校验（前面的行移入的数量可供后面的行移出）
+        goods_access, location_access = {}, {}
+
+        def has_location_access(location_id):
+            if location_id not in location_access:
+                location_access[location_id] = check_location_access(location_id)
+            return location_access[location_id]
+
         for data in data_list:
             goods_id = data.get('goods_id')
             from_location_id = data.get('from_location_id')
@@ -122,15 +130,14 @@ class TransferRecordBulk(Resource):
             if from_location_id == to_location_id:
                 raise BadRequestException("The from_location_id and to_location_id cannot be the same", 14006)
 
-            if not GoodsLocationService.is_goods_in_location(goods_id, from_location_id):
-                raise NotFoundException("Goods not found in the specified from_location", 14003)
-            
             # 验证对指定商品和库位的访问权限
-            if not check_goods_access(goods_id):
+            if goods_id not in goods_access:
+                goods_access[goods_id] = check_goods_access(goods_id)
+            if not goods_access[goods_id]:
                 raise ForbiddenException("You do not have access to this Goods", 12001)
-            if not check_location_access(from_location_id):
+            if not has_location_access(from_location_id):
                 raise ForbiddenException("You do not have access to this From Location", 12001)
-            if not check_location_access(to_location_id):
+            if not has_location_access(to_location_id):
                 raise ForbiddenException("You do not have access to this To Location", 12001)
         
         new_records = TransferService.bulk_create_transfer_records(data_list, created_by)